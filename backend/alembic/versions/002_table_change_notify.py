@@ -0,0 +1,42 @@
+"""Notify on data table changes for query-cache invalidation
+
+Revision ID: 002
+Revises: 001
+Create Date: 2024-06-01 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+# Tables whose writes invalidate cached query results
+NOTIFY_TABLES = ['customers', 'products', 'orders']
+
+
+def upgrade() -> None:
+    # One notification per statement, carrying the table name
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_table_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('table_changed', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    for table in NOTIFY_TABLES:
+        op.execute(f"""
+            CREATE TRIGGER {table}_notify_changed
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed()
+        """)
+
+
+def downgrade() -> None:
+    for table in NOTIFY_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_notify_changed ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS notify_table_changed()")
@@ -0,0 +1,114 @@
+"""Month-grain revenue rollups with dirty-month tracking
+
+Revision ID: 003
+Revises: 002
+Create Date: 2024-06-15 00:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+# Rollup table -> dimension columns (every rollup also has month_start and the measures)
+ROLLUPS = {
+    'rollup_orders_region_month': ['o.region'],
+    'rollup_orders_product_month': ['p.product_line', 'p.category'],
+    'rollup_orders_customer_month': ['c.segment', 'c.country'],
+    'rollup_orders_month': ['o.region', 'p.product_line', 'p.category', 'c.segment', 'c.country'],
+}
+
+
+def upgrade() -> None:
+    # Column types follow the source expressions exactly, so rewritten queries return the same types
+    for name, dimensions in ROLLUPS.items():
+        columns = [dimension.split('.')[1] for dimension in dimensions]
+        op.execute(f"""
+            CREATE TABLE {name} AS
+            SELECT {', '.join(dimensions + [''])}DATE_TRUNC('month', o.order_date) AS month_start,
+                   SUM(o.quantity * o.unit_price) AS revenue,
+                   SUM(o.quantity) AS quantity,
+                   COUNT(*) AS order_count
+            FROM orders o
+            JOIN customers c ON o.customer_id = c.customer_id
+            JOIN products p ON o.product_id = p.product_id
+            GROUP BY {', '.join(dimensions + [''])}DATE_TRUNC('month', o.order_date)
+            WITH NO DATA
+        """)
+        op.execute(f"CREATE INDEX ix_{name} ON {name} ({', '.join(columns + ['month_start'])})")
+        op.execute(f"CREATE INDEX ix_{name}_month_start ON {name} (month_start)")
+
+    # Months whose rollup rows need recomputing; NULL means every month
+    op.execute("CREATE TABLE rollup_dirty_months (month_start TIMESTAMPTZ)")
+    op.execute("INSERT INTO rollup_dirty_months VALUES (NULL)")
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION rollup_mark_orders_dirty() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO rollup_dirty_months
+                SELECT DISTINCT DATE_TRUNC('month', order_date) FROM new_rows;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                INSERT INTO rollup_dirty_months
+                SELECT DISTINCT DATE_TRUNC('month', order_date) FROM old_rows;
+            END IF;
+            IF TG_OP = 'TRUNCATE' THEN
+                INSERT INTO rollup_dirty_months VALUES (NULL);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION rollup_mark_all_dirty() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO rollup_dirty_months VALUES (NULL);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    # Transition tables can only be declared on single-event triggers
+    op.execute("""
+        CREATE TRIGGER orders_rollup_insert AFTER INSERT ON orders
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_orders_dirty()
+    """)
+    op.execute("""
+        CREATE TRIGGER orders_rollup_update AFTER UPDATE ON orders
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_orders_dirty()
+    """)
+    op.execute("""
+        CREATE TRIGGER orders_rollup_delete AFTER DELETE ON orders
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_orders_dirty()
+    """)
+    op.execute("""
+        CREATE TRIGGER orders_rollup_truncate AFTER TRUNCATE ON orders
+        FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_orders_dirty()
+    """)
+
+    # New customers or products change no totals until orders reference them
+    for table in ['customers', 'products']:
+        op.execute(f"""
+            CREATE TRIGGER {table}_rollup_changed
+            AFTER UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION rollup_mark_all_dirty()
+        """)
+
+
+def downgrade() -> None:
+    for table in ['customers', 'products']:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_rollup_changed ON {table}")
+    for event in ['insert', 'update', 'delete', 'truncate']:
+        op.execute(f"DROP TRIGGER IF EXISTS orders_rollup_{event} ON orders")
+    op.execute("DROP FUNCTION IF EXISTS rollup_mark_all_dirty()")
+    op.execute("DROP FUNCTION IF EXISTS rollup_mark_orders_dirty()")
+    op.execute("DROP TABLE IF EXISTS rollup_dirty_months")
+    for name in ROLLUPS:
+        op.execute(f"DROP TABLE IF EXISTS {name}")
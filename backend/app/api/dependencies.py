@@ -1,22 +1,33 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import AsyncSessionLocal
 from app.core.security import verify_token
 from app.models.conversation import User
 
 router = APIRouter()
 security = HTTPBearer()
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
 ) -> User:
-    """Get current authenticated user"""
+    """Get current authenticated user
+    
+    The lookup uses its own short-lived session. A yield dependency would
+    keep its pooled connection checked out until the response has been sent,
+    across the LLM call, the query and any stream.
+    """
     token = credentials.credentials
     payload = verify_token(token)
     
-    user = db.query(User).filter(User.id == payload.get("sub")).first()
+    try:
+        user_id = int(payload.get("sub"))
+    except (TypeError, ValueError):
+        user_id = None
+    
+    user = None
+    if user_id is not None:
+        async with AsyncSessionLocal() as db:
+            user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,34 @@
+"""
+NDJSON helpers
+Turns an async stream of JSON-serializable records into an application/x-ndjson response
+"""
+
+from typing import Any, AsyncIterator, Dict, Tuple
+from fastapi.responses import StreamingResponse
+from app.core.exceptions import NLQException
+from app.core.serialization import json_dumps
+
+def ndjson_response(records: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    """Stream one JSON document per line as records become available"""
+    
+    async def body() -> AsyncIterator[str]:
+        async for record in records:
+            yield json_dumps(record) + "\n"
+    
+    return StreamingResponse(
+        body(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def ndjson_event_response(events: AsyncIterator[Tuple[str, Dict[str, Any]]]) -> StreamingResponse:
+    """Stream pipeline events as {"event": ..., **data} lines; failures become a terminal error line"""
+    
+    async def records() -> AsyncIterator[Dict[str, Any]]:
+        try:
+            async for event, data in events:
+                yield {"event": event, **data}
+        except NLQException as e:
+            yield {"event": "error", "detail": str(e)}
+    
+    return ndjson_response(records())
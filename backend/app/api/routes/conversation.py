@@ -1,12 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.core.database import get_db
 from app.api.dependencies import get_current_user
 from app.models.conversation import User
 from app.services.nlq_parser import nlq_parser
 from app.core.exceptions import NLQException
+from app.core.config import settings
+from app.api.sse import sse_response
+from app.api.ndjson import ndjson_event_response
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
 
 router = APIRouter()
 
@@ -14,25 +15,51 @@ class ConversationRefineRequest(BaseModel):
     conversation_id: str
     followup: str
 
+class ConversationRefineStreamRequest(ConversationRefineRequest):
+    format: Literal["sse", "ndjson"] = "sse"
+
 class ConversationRefineResponse(BaseModel):
     columns: List[str]
     rows: List[List[Any]]
     inferred_chart: Optional[str]
+    # Per column: kind (numeric, date, categorical), count, nulls, cardinality, min, max, monotonic
+    profile: Optional[List[Dict[str, Any]]] = None
     explain: Dict[str, Any]
     sql: str
+    warnings: List[str] = []
+    parse_cache: Optional[str] = None
+    parser: Optional[str] = None
+    conversation_id: Optional[str] = None
+    speculative: Optional[bool] = None
+    reduction: Optional[Dict[str, Any]] = None
 
 @router.post("/refine", response_model=ConversationRefineResponse)
 async def refine_conversation(
     request: ConversationRefineRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
     """Handle follow-up queries in conversation context"""
     try:
-        result = nlq_parser.refine_conversation(request.conversation_id, request.followup, current_user.id)
+        result = await nlq_parser.refine_conversation_async(request.conversation_id, request.followup, current_user.id)
         return ConversationRefineResponse(**result)
     except NLQException as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+
+@router.post("/refine/stream")
+async def refine_conversation_stream(
+    request: ConversationRefineStreamRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Handle follow-up queries, streamed as Server-Sent Events or NDJSON"""
+    events = nlq_parser.stream_refine_conversation(
+        request.conversation_id,
+        request.followup,
+        current_user.id,
+        stream_tokens=True,
+        row_batch_size=settings.STREAM_ROW_BATCH_SIZE,
+        stream_execution=True
+    )
+    return ndjson_event_response(events) if request.format == "ndjson" else sse_response(events)
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from app.api.dependencies import get_current_user
 from app.models.conversation import User
 from app.services.nlq_parser import nlq_parser
 from app.core.exceptions import NLQException
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from app.core.config import settings
+from app.services.batch_runner import batch_runner
+from app.api.sse import sse_response
+from app.api.ndjson import ndjson_event_response, ndjson_response
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, List, Literal, Optional, Dict, Any
+import json
+import time
 
 router = APIRouter()
 
@@ -19,36 +23,90 @@ class NLQParseResponse(BaseModel):
     warnings: List[str]
     explain: Dict[str, Any]
     conversation_id: str
+    parse_cache: Optional[str] = None
+    parser: Optional[str] = None
 
 class NLQExecuteRequest(BaseModel):
     sql: str
-    result_format: str = "table"
+    result_format: Literal["table", "series", "arrow"] = "table"
+    # Keyset pagination: set either to get one page and a next_cursor
+    page_size: Optional[int] = Field(None, ge=1, le=settings.PAGE_SIZE_MAX)
+    cursor: Optional[str] = None
+    # "auto" buckets and downsamples long time series for charting; "full" returns every row
+    resolution: Literal["auto", "full"] = "auto"
 
 class NLQExecuteResponse(BaseModel):
     columns: List[str]
-    rows: List[List[Any]]
+    rows: Optional[List[List[Any]]] = None
+    series: Optional[List[List[Any]]] = None
+    row_count: Optional[int] = None
     inferred_chart: Optional[str]
+    # Per column: kind (numeric, date, categorical), count, nulls, cardinality, min, max, monotonic
+    profile: Optional[List[Dict[str, Any]]] = None
+    warnings: List[str] = []
+    next_cursor: Optional[str] = None
+    reduction: Optional[Dict[str, Any]] = None
 
 class NLQQueryRequest(BaseModel):
     prompt: str
     conversation_id: Optional[str] = None
+    page_size: Optional[int] = Field(None, ge=1, le=settings.PAGE_SIZE_MAX)
+    cursor: Optional[str] = None
+    resolution: Literal["auto", "full"] = "auto"
 
 class NLQQueryResponse(BaseModel):
     columns: List[str]
     rows: List[List[Any]]
     inferred_chart: Optional[str]
+    profile: Optional[List[Dict[str, Any]]] = None
     explain: Dict[str, Any]
     sql: str
+    warnings: List[str] = []
+    parse_cache: Optional[str] = None
+    parser: Optional[str] = None
+    conversation_id: Optional[str] = None
+    speculative: Optional[bool] = None
+    next_cursor: Optional[str] = None
+    reduction: Optional[Dict[str, Any]] = None
+
+class NLQStreamRequest(NLQQueryRequest):
+    format: Literal["sse", "ndjson"] = "sse"
+
+class NLQExecuteStreamRequest(BaseModel):
+    sql: str
+
+class NLQBatchItem(BaseModel):
+    prompt: str
+    conversation_id: Optional[str] = None
+
+class NLQBatchRequest(BaseModel):
+    items: List[NLQBatchItem] = Field(..., min_length=1)
+    format: Literal["json", "ndjson"] = "json"
+    llm_concurrency: Optional[int] = Field(None, ge=1)
+    db_concurrency: Optional[int] = Field(None, ge=1)
+
+class NLQBatchItemResult(BaseModel):
+    index: int
+    prompt: str
+    conversation_id: Optional[str]
+    status: str
+    result: Optional[Dict[str, Any]]
+    error: Optional[str]
+    timing: Dict[str, float]
+    duplicate_of: Optional[int] = None
+
+class NLQBatchResponse(BaseModel):
+    results: List[NLQBatchItemResult]
+    summary: Dict[str, Any]
 
 @router.post("/parse", response_model=NLQParseResponse)
 async def parse_nlq(
     request: NLQParseRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
     """Parse natural language query to SQL"""
     try:
-        result = nlq_parser.parse_only(request.prompt, request.conversation_id)
+        result = await nlq_parser.parse_only_async(request.prompt, request.conversation_id)
         return NLQParseResponse(**result)
     except NLQException as e:
         raise HTTPException(
@@ -59,12 +117,27 @@ async def parse_nlq(
 @router.post("/execute", response_model=NLQExecuteResponse)
 async def execute_sql(
     request: NLQExecuteRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
-    """Execute SQL query"""
+    """Execute SQL query
+    
+    result_format=table returns rows, series returns one value list per column
+    (aligned with columns), and arrow returns an Apache Arrow IPC stream.
+    """
     try:
-        result = nlq_parser.execute_sql(request.sql)
+        result = await nlq_parser.execute_sql_async(
+            request.sql, request.result_format, current_user.id, request.page_size, request.cursor, request.resolution
+        )
+        if request.result_format == "arrow":
+            return Response(
+                content=result["arrow"],
+                media_type="application/vnd.apache.arrow.stream",
+                headers={
+                    "X-Row-Count": str(result["row_count"]),
+                    "X-Inferred-Chart": result["inferred_chart"] or "",
+                    "X-Warnings": json.dumps(result["warnings"])
+                }
+            )
         return NLQExecuteResponse(**result)
     except NLQException as e:
         raise HTTPException(
@@ -75,15 +148,88 @@ async def execute_sql(
 @router.post("/query", response_model=NLQQueryResponse)
 async def query_nlq(
     request: NLQQueryRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
     """Combined parse and execute endpoint"""
     try:
-        result = nlq_parser.parse_and_execute(request.prompt, request.conversation_id, current_user.id)
+        result = await nlq_parser.parse_and_execute_async(
+            request.prompt, request.conversation_id, current_user.id, request.page_size, request.cursor, request.resolution
+        )
         return NLQQueryResponse(**result)
     except NLQException as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+
+@router.post("/query/stream")
+async def query_nlq_stream(
+    request: NLQStreamRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Combined parse and execute endpoint, streamed as Server-Sent Events or NDJSON
+    
+    Events: token, sql, columns, rows (batched), warnings (if truncated),
+    inferred_chart, reduction (if time-bucketed), explain, done, error. Rows
+    come from a server-side cursor. With page_size or cursor only one keyset
+    page is streamed and done carries next_cursor.
+    """
+    events = nlq_parser.stream_parse_and_execute(
+        request.prompt,
+        request.conversation_id,
+        current_user.id,
+        stream_tokens=True,
+        row_batch_size=settings.STREAM_ROW_BATCH_SIZE,
+        stream_execution=True,
+        page_size=request.page_size,
+        cursor=request.cursor,
+        resolution=request.resolution
+    )
+    return ndjson_event_response(events) if request.format == "ndjson" else sse_response(events)
+
+@router.post("/execute/stream")
+async def execute_sql_stream(
+    request: NLQExecuteStreamRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Execute SQL on a server-side cursor, streamed as NDJSON
+    
+    Lines: columns, rows (batched), inferred_chart, done (row_count, truncated, warnings), error
+    """
+    return ndjson_event_response(nlq_parser.stream_execute_sql(request.sql, settings.STREAM_ROW_BATCH_SIZE, current_user.id))
+
+@router.post("/batch", response_model=NLQBatchResponse)
+async def batch_nlq(
+    request: NLQBatchRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Run many prompts with bounded LLM and DB concurrency
+    
+    format=json returns results in submission order with a summary.
+    format=ndjson streams one result line per item as it completes,
+    followed by a final {"summary": ...} line.
+    """
+    if len(request.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch exceeds the maximum of {settings.BATCH_MAX_ITEMS} items"
+        )
+    
+    items = [item.model_dump() for item in request.items]
+    limits = {
+        "llm_concurrency": request.llm_concurrency,
+        "db_concurrency": request.db_concurrency
+    }
+    
+    if request.format == "ndjson":
+        async def records() -> AsyncIterator[Dict[str, Any]]:
+            started = time.perf_counter()
+            results = []
+            async for result in batch_runner.run(items, current_user.id, **limits):
+                results.append(result)
+                yield result
+            yield {"summary": batch_runner.summarize(results, started)}
+        
+        return ndjson_response(records())
+    
+    return await batch_runner.run_ordered(items, current_user.id, **limits)
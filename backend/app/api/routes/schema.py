@@ -1,6 +1,4 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.core.database import get_db
 from app.api.dependencies import get_current_user
 from app.models.conversation import User
 from pydantic import BaseModel
@@ -17,8 +15,7 @@ class SchemaResponse(BaseModel):
 
 @router.get("/describe", response_model=SchemaResponse)
 async def describe_schema(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
     """Get schema metadata for all tables"""
     # This will be implemented to return actual schema information
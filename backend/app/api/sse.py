@@ -0,0 +1,29 @@
+"""
+Server-Sent Events helpers
+Turns NLQ pipeline stage events into a text/event-stream response
+"""
+
+from typing import Any, AsyncIterator, Dict, Tuple
+from fastapi.responses import StreamingResponse
+from app.core.exceptions import NLQException
+from app.core.serialization import json_dumps
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one SSE message"""
+    return f"event: {event}\ndata: {json_dumps(data)}\n\n"
+
+def sse_response(events: AsyncIterator[Tuple[str, Dict[str, Any]]]) -> StreamingResponse:
+    """Stream pipeline events; failures become a terminal 'error' event"""
+    
+    async def body() -> AsyncIterator[str]:
+        try:
+            async for event, data in events:
+                yield format_sse(event, data)
+        except NLQException as e:
+            yield format_sse("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
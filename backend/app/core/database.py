@@ -1,26 +1,67 @@
+from typing import AsyncIterator
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
-# Create SQLAlchemy engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=300,
-    echo=settings.DEBUG
-)
+# Async drivers for the sync URLs in DATABASE_URL
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+def async_database_url(url: str) -> str:
+    """Rewrite a sync database URL to use the matching async driver"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS or parsed.drivername == ASYNC_DRIVERS[backend]:
+        return url
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+def make_engine(url: str):
+    """Sync engine (seeding, indexing, server-side cursor streaming)"""
+    return create_engine(
+        url,
+        pool_pre_ping=True,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        echo=settings.DEBUG
+    )
+
+def make_async_engine(url: str):
+    """Async engine for request handling; pool size bounds concurrent queries per worker"""
+    parsed = make_url(url)
+    if parsed.drivername == ASYNC_DRIVERS["postgresql"] and "prepared_statement_cache_size" not in parsed.query:
+        # Parameterized query shapes are prepared once per connection and reused
+        url = parsed.update_query_dict({"prepared_statement_cache_size": str(settings.DB_PREPARED_STATEMENT_CACHE_SIZE)})
+    # SQLite (tests, local runs) gets its dialect's default pool, which takes no sizing
+    pool_sizing = {} if make_url(url).get_backend_name() == "sqlite" else {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS
+    }
+    return create_async_engine(
+        url,
+        **pool_sizing,
+        pool_pre_ping=True,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        echo=settings.DEBUG
+    )
+
+# Create SQLAlchemy engine for the primary
+engine = make_engine(settings.DATABASE_URL)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine for the primary
+async_engine = make_async_engine(settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL))
+
+# Create AsyncSessionLocal class
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Create Base class for models
 Base = declarative_base()
 
-def get_db():
+async def get_db() -> AsyncIterator[AsyncSession]:
     """Dependency to get database session"""
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -16,10 +16,22 @@ class LLMError(NLQException):
     """Raised when LLM operations fail"""
     pass
 
+class CircuitOpenError(NLQException):
+    """Raised when a circuit breaker is rejecting calls"""
+    pass
+
 class ConversationNotFoundError(NLQException):
     """Raised when conversation is not found"""
     pass
 
+class PaginationError(NLQException):
+    """Raised when a page cursor is invalid or a result cannot be paged"""
+    pass
+
 class QueryExecutionError(NLQException):
     """Raised when query execution fails"""
     pass
+
+class QueryCostError(QueryExecutionError):
+    """Raised when a query's planner estimates exceed the cost threshold"""
+    pass
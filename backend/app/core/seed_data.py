@@ -8,6 +8,7 @@ from datetime import datetime, date, timedelta
 from sqlalchemy.orm import Session
 from app.core.database import SessionLocal
 from app.models import Customer, Product, Order
+from app.services.table_versions import table_versions
 
 def generate_sample_data():
     """Generate sample data for the database"""
@@ -78,6 +79,9 @@ def generate_sample_data():
             db.add(order)
         
         db.commit()
+        
+        # Cached query results over these tables are now stale
+        table_versions.bump(["customers", "products", "orders"])
         print("Sample data generated successfully!")
         
     except Exception as e:
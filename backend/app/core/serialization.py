@@ -0,0 +1,16 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+
+def json_default(value: Any) -> Any:
+    """Encode database values the same way the API responses do"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return str(value)
+
+def json_dumps(value: Any) -> str:
+    """JSON-encode results that may contain dates and decimals from the database"""
+    return json.dumps(value, default=json_default)
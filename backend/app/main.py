@@ -1,11 +1,30 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 
 from app.core.config import settings
-from app.core.database import engine
+from app.core.database import async_engine, engine
 from app.models import Base
 from app.api.routes import auth, nlq, conversation, schema
+from app.services.llm_client import llm_client
+from app.services.query_executor import query_executor
+from app.services.sessions import conversation_manager
+from app.services.parse_cache import parse_cache
+from app.services.nlq_parser import nlq_parser
+from app.services.coalescing import llm_singleflight, query_singleflight
+from app.services.vector_index import vector_index
+from app.services.prefetch import speculative_prefetcher
+from app.services.fewshot import few_shot_store
+from app.services.table_versions import table_versions
+from app.services.cost_guard import cost_guard
+from app.services.rollups import rollup_manager
+from app.services.replicas import replica_router
+from app.services.parameterizer import sql_parameterizer
+from app.services.chart_reduction import chart_reducer
+from app.services.stale_cache import stale_cache
+from app.services.local_cache import local_result_cache
+from app.services.column_profiler import column_profiler
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
@@ -39,11 +58,88 @@ app.include_router(nlq.router, prefix="/api/nlq", tags=["nlq"])
 app.include_router(conversation.router, prefix="/api/conversation", tags=["conversation"])
 app.include_router(schema.router, prefix="/api/schema", tags=["schema"])
 
+@app.on_event("startup")
+async def build_vector_index():
+    """Refresh the grounding index with current categorical values and load few-shot examples"""
+    await asyncio.to_thread(vector_index.build)
+    await asyncio.to_thread(few_shot_store.load)
+
+@app.on_event("startup")
+async def start_table_version_listener():
+    """Invalidate cached query results when Postgres reports table changes"""
+    if settings.TABLE_VERSION_LISTEN:
+        table_versions.start_listener()
+
+@app.on_event("startup")
+async def start_local_cache_subscriber():
+    """Drop in-process query results other workers have recomputed"""
+    local_result_cache.start_subscriber()
+
+@app.on_event("startup")
+async def start_rollup_refresher():
+    """Keep aggregate rollups current with their dirty months"""
+    rollup_manager.start_refresher()
+
+@app.on_event("startup")
+async def start_replica_lag_monitor():
+    """Route analytical reads to replicas once their lag has been checked"""
+    replica_router.start_monitor()
+
+@app.on_event("shutdown")
+async def close_async_clients():
+    """Release pooled HTTP and Redis connections held by async clients"""
+    await llm_client.async_client.close()
+    await query_executor.async_redis_client.close()
+    await conversation_manager.async_redis_client.close()
+    await parse_cache.async_redis_client.close()
+    await llm_singleflight.async_redis_client.close()
+    await query_singleflight.async_redis_client.close()
+    await speculative_prefetcher.async_redis_client.close()
+    await asyncio.to_thread(table_versions.stop_listener)
+    await asyncio.to_thread(local_result_cache.stop_subscriber)
+    await asyncio.to_thread(rollup_manager.stop_refresher)
+    await asyncio.to_thread(replica_router.stop_monitor)
+    await replica_router.dispose()
+    await table_versions.async_redis_client.close()
+    await local_result_cache.async_redis_client.close()
+    await async_engine.dispose()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "version": "1.0.0"}
 
+@app.get("/metrics")
+async def metrics():
+    """Cache and pipeline counters"""
+    if not settings.ENABLE_METRICS:
+        return {}
+    return {
+        "parse_cache": parse_cache.stats(),
+        "parser": nlq_parser.parser_counts,
+        "llm": llm_client.stats(),
+        "vector_index": vector_index.stats(),
+        "few_shot": few_shot_store.stats(),
+        "table_versions": table_versions.stats(),
+        "cost_guard": cost_guard.stats(),
+        "rollups": rollup_manager.stats(),
+        "replicas": replica_router.stats(),
+        "query_shapes": sql_parameterizer.stats(),
+        "chart_reduction": chart_reducer.stats(),
+        "column_profiler": column_profiler.stats(),
+        "query_cache": {**stale_cache.stats(), "tiers": local_result_cache.stats()},
+        "database_pool": {
+            "size": async_engine.pool.size(),
+            "checked_out": async_engine.pool.checkedout(),
+            "overflow": async_engine.pool.overflow()
+        },
+        "prefetch": speculative_prefetcher.stats(),
+        "coalescing": {
+            "llm": llm_singleflight.stats(),
+            "query": query_singleflight.stats()
+        }
+    }
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -0,0 +1,147 @@
+"""
+Batch Runner Service
+Runs many NLQ prompts concurrently with separate LLM and database concurrency limits
+"""
+
+import time
+import asyncio
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
+from app.core.config import settings
+from app.services.nlq_parser import nlq_parser
+from app.services.parse_cache import parse_cache
+
+class BatchRunner:
+    """Bounded-concurrency executor for lists of prompts"""
+    
+    def __init__(self):
+        self.nlq_parser = nlq_parser
+        self.parse_cache = parse_cache
+        self.llm_concurrency = settings.BATCH_LLM_CONCURRENCY
+        self.db_concurrency = settings.BATCH_DB_CONCURRENCY
+    
+    async def run(
+        self,
+        items: List[Dict[str, Any]],
+        user_id: int = 1,
+        llm_concurrency: Optional[int] = None,
+        db_concurrency: Optional[int] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield one result per item as it completes
+        
+        Identical prompts in the same conversation run once and are reported for
+        every index that asked for them. Items sharing a conversation_id run in
+        submission order so follow-ups see earlier turns. A failing item is
+        reported with its error and never aborts the rest of the batch.
+        """
+        # Callers may lower the configured limits but never raise them
+        llm_limit = asyncio.Semaphore(min(llm_concurrency or self.llm_concurrency, self.llm_concurrency))
+        db_limit = asyncio.Semaphore(min(db_concurrency or self.db_concurrency, self.db_concurrency))
+        conversation_locks: Dict[str, asyncio.Lock] = {}
+        
+        # Deduplicate on normalized prompt within a conversation
+        groups: Dict[Tuple[str, Optional[str]], List[int]] = {}
+        for index, item in enumerate(items):
+            key = (self.parse_cache.normalize_prompt(item["prompt"]), item.get("conversation_id"))
+            groups.setdefault(key, []).append(index)
+        
+        for _, conversation_id in groups:
+            if conversation_id and conversation_id not in conversation_locks:
+                conversation_locks[conversation_id] = asyncio.Lock()
+        
+        async def run_group(indexes: List[int]) -> List[Dict[str, Any]]:
+            item = items[indexes[0]]
+            conversation_id = item.get("conversation_id")
+            lock = conversation_locks.get(conversation_id)
+            
+            if lock:
+                async with lock:
+                    outcome = await self._run_item(item, user_id, llm_limit, db_limit)
+            else:
+                outcome = await self._run_item(item, user_id, llm_limit, db_limit)
+            
+            results = []
+            for position, index in enumerate(indexes):
+                result = {"index": index, "prompt": items[index]["prompt"], **outcome}
+                if position:
+                    result["duplicate_of"] = indexes[0]
+                results.append(result)
+            return results
+        
+        # Groups are started in submission order so conversation locks are taken in that order
+        tasks = []
+        for indexes in groups.values():
+            tasks.append(asyncio.create_task(run_group(indexes)))
+            await asyncio.sleep(0)
+        
+        try:
+            for completed in asyncio.as_completed(tasks):
+                for result in await completed:
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def run_ordered(self, items: List[Dict[str, Any]], user_id: int = 1, **limits: Optional[int]) -> Dict[str, Any]:
+        """Run a batch and return results in submission order with a summary"""
+        started = time.perf_counter()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        async for result in self.run(items, user_id, **limits):
+            results[result["index"]] = result
+        return {"results": results, "summary": self.summarize(results, started)}
+    
+    def summarize(self, results: List[Dict[str, Any]], started: float) -> Dict[str, Any]:
+        """Counts and wall-clock time for a finished batch"""
+        return {
+            "total": len(results),
+            "succeeded": sum(1 for result in results if result["status"] == "ok"),
+            "failed": sum(1 for result in results if result["status"] == "error"),
+            "deduplicated": sum(1 for result in results if "duplicate_of" in result),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+    
+    async def _run_item(
+        self,
+        item: Dict[str, Any],
+        user_id: int,
+        llm_limit: asyncio.Semaphore,
+        db_limit: asyncio.Semaphore
+    ) -> Dict[str, Any]:
+        """Run one prompt, recording per-stage timing and converting failures to an error entry"""
+        started = time.perf_counter()
+        timing: Dict[str, float] = {}
+        result: Dict[str, Any] = {}
+        
+        try:
+            async for event, data in self.nlq_parser.stream_parse_and_execute(
+                item["prompt"],
+                item.get("conversation_id"),
+                user_id,
+                llm_limit=llm_limit,
+                db_limit=db_limit,
+                prefetch=False
+            ):
+                result.update(data)
+                if event == "sql":
+                    timing["parse_ms"] = self._elapsed_ms(started)
+                elif event == "rows":
+                    timing["execute_ms"] = round(self._elapsed_ms(started) - timing["parse_ms"], 2)
+            
+            status, error = "ok", None
+        except Exception as e:
+            status, error, result = "error", str(e), None
+        
+        timing["total_ms"] = self._elapsed_ms(started)
+        return {
+            "conversation_id": (result or {}).get("conversation_id", item.get("conversation_id")),
+            "status": status,
+            "result": result,
+            "error": error,
+            "timing": timing
+        }
+    
+    def _elapsed_ms(self, started: float) -> float:
+        """Milliseconds since started"""
+        return round((time.perf_counter() - started) * 1000, 2)
+
+# Global batch runner instance
+batch_runner = BatchRunner()
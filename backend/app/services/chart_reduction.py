@@ -0,0 +1,320 @@
+"""
+Chart Reduction
+Bounds the points sent for time-series charts: coarser date buckets for raw order_date queries, LTTB downsampling for line charts
+"""
+
+import re
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.query_executor import query_executor
+
+# Coarsest first-fit grain for a date span, with its approximate length in days
+GRANULARITIES = (("day", 1), ("week", 7), ("month", 30.44), ("quarter", 91.31), ("year", 365.25))
+
+# Span of the data when a query leaves order_date unbounded (cached under the orders table version)
+DATE_RANGE_SQL = "SELECT MIN(order_date) AS first_date, MAX(order_date) AS last_date FROM orders"
+
+# Literal placeholders are \x00<n>\x00, as in the rollup rewriter
+UNSUPPORTED = re.compile(r"\b(WITH|UNION|INTERSECT|EXCEPT|OVER|WINDOW)\b|\(\s*SELECT\b|--|/\*", re.IGNORECASE)
+GROUPED_QUERY = re.compile(
+    r"^\s*SELECT\s+(?P<select>.+?)\s+FROM\s+(?P<source>.+?)\s+GROUP\s+BY\s+(?P<group>.+?)"
+    r"(?P<tail>\s+(?:HAVING|ORDER\s+BY|LIMIT|OFFSET)\b.*)?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+RAW_DATE = re.compile(r"^\s*(?:(?P<qualifier>\w+)\.)?order_date(?:\s+(?:AS\s+)?(?P<alias>\w+))?\s*$", re.IGNORECASE)
+LOWER_BOUND = re.compile(r"\border_date\s*(?:>=|>)\s*(?:DATE\s+)?\x00(?P<lit>\d+)\x00", re.IGNORECASE)
+UPPER_BOUND = re.compile(r"\border_date\s*(?:<=|<)\s*(?:DATE\s+)?\x00(?P<lit>\d+)\x00", re.IGNORECASE)
+BETWEEN_BOUNDS = re.compile(r"\border_date\s+BETWEEN\s+(?:DATE\s+)?\x00(?P<low>\d+)\x00\s+AND\s+(?:DATE\s+)?\x00(?P<high>\d+)\x00", re.IGNORECASE)
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+# Leading rows inspected to tell date, numeric and categorical columns apart
+PROFILE_ROWS = 50
+
+class ChartReducer:
+    """Keeps time-series results within CHART_MAX_POINTS points
+
+    Grouped queries over a bare order_date are rewritten to the finest
+    DATE_TRUNC grain whose bucket count over the filtered (or stored) date
+    span fits the budget, so the database aggregates once per bucket. Line
+    chart results still over the budget keep the rows Largest-Triangle-
+    Three-Buckets picks, per series when categorical columns split them.
+    """
+    
+    def __init__(self):
+        self.max_points = settings.CHART_MAX_POINTS
+        self.query_executor = query_executor
+        self.counters = {"bucketed": 0, "downsampled": 0}
+    
+    def bucket(self, sql: str) -> Tuple[str, Optional[str]]:
+        """SQL grouped by a date_trunc grain that bounds the points, and the grain, or the SQL unchanged and None"""
+        query = self._match(sql)
+        if query is None:
+            return sql, None
+        first, last = query["bounds"]
+        if first is None or last is None:
+            try:
+                stored_first, stored_last = self._stored_range(self.query_executor.execute_query(DATE_RANGE_SQL))
+            except Exception:
+                return sql, None  # Bucketing is an optimization; run the query as written
+            first, last = first or stored_first, last or stored_last
+        return self._rewrite(query, first, last) or (sql, None)
+    
+    async def bucket_async(self, sql: str) -> Tuple[str, Optional[str]]:
+        """Bucketing with a non-blocking lookup of the stored date range"""
+        query = self._match(sql)
+        if query is None:
+            return sql, None
+        first, last = query["bounds"]
+        if first is None or last is None:
+            try:
+                stored_first, stored_last = self._stored_range(await self.query_executor.execute_query_async(DATE_RANGE_SQL))
+            except Exception:
+                return sql, None
+            first, last = first or stored_first, last or stored_last
+        return self._rewrite(query, first, last) or (sql, None)
+    
+    def downsample(self, result: Dict[str, Any], chart_type: Optional[str]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Result with a line chart's rows (or series) reduced to the point budget, and what was done"""
+        if chart_type != "line":
+            return result, None
+        if "rows" in result:
+            rows = result["rows"]
+        elif "series" in result:
+            rows = [list(row) for row in zip(*result["series"])]
+        else:
+            return result, None
+        if len(rows) <= self.max_points:
+            return result, None
+        
+        keep = self.select_rows(rows, result.get("profile"))
+        if keep is None:
+            return result, None
+        reduced = dict(result)
+        if "rows" in result:
+            reduced["rows"] = [rows[index] for index in keep]
+        else:
+            reduced["series"] = [[values[index] for index in keep] for values in result["series"]]
+            reduced["row_count"] = len(keep)
+        self.counters["downsampled"] += 1
+        return reduced, {"method": "lttb", "source_rows": len(rows), "rows": len(keep)}
+    
+    def select_rows(self, rows: List[List[Any]], profile: Optional[List[Dict[str, Any]]] = None) -> Optional[List[int]]:
+        """Indices of the rows to keep, or None unless the rows are date-indexed series of a numeric value
+        
+        Column kinds come from the executor's column profile when given, else
+        from the leading rows.
+        """
+        if profile:
+            kinds = [column["kind"] for column in profile]
+            x_column = next((index for index, kind in enumerate(kinds) if kind == "date"), None)
+            y_column = next((index for index, kind in enumerate(kinds) if index != x_column and kind == "numeric"), None)
+            keys = [index for index, kind in enumerate(kinds) if index not in (x_column, y_column) and kind != "numeric"]
+        else:
+            leading = rows[:PROFILE_ROWS]
+            columns = range(len(rows[0]))
+            x_column = next((index for index in columns if self._all(leading, index, self._as_date) is not None), None)
+            y_column = next((index for index in columns if index != x_column and self._is_numeric(leading, index)), None)
+            keys = [index for index in columns if index not in (x_column, y_column) and not self._is_numeric(leading, index)]
+        if x_column is None or y_column is None:
+            return None
+        
+        # One LTTB pass per series (combination of categorical values), sharing the point budget
+        series: Dict[Tuple[Any, ...], List[int]] = {}
+        for index, row in enumerate(rows):
+            series.setdefault(tuple(row[key] for key in keys), []).append(index)
+        threshold = self.max_points // len(series)
+        if threshold < 3:
+            return None
+        
+        keep: List[int] = []
+        for indices in series.values():
+            xs = [self._x_value(rows[index][x_column], position) for position, index in enumerate(indices)]
+            ys = [float(rows[index][y_column] or 0) for index in indices]
+            keep.extend(indices[position] for position in self.lttb(xs, ys, threshold))
+        return sorted(keep)
+    
+    def lttb(self, xs: List[float], ys: List[float], threshold: int) -> List[int]:
+        """Largest-Triangle-Three-Buckets: positions of threshold points that keep the line's shape"""
+        count = len(xs)
+        if threshold >= count or threshold < 3:
+            return list(range(count))
+        
+        # First and last points are kept; the rest are split into threshold - 2 buckets
+        every = (count - 2) / (threshold - 2)
+        selected = [0]
+        previous = 0
+        for bucket in range(threshold - 2):
+            # Average of the next bucket is the triangle's third vertex
+            next_start = int((bucket + 1) * every) + 1
+            next_end = min(int((bucket + 2) * every) + 1, count)
+            average_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+            average_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+            
+            best, best_area = None, -1.0
+            for position in range(int(bucket * every) + 1, int((bucket + 1) * every) + 1):
+                area = abs(
+                    (xs[previous] - average_x) * (ys[position] - ys[previous])
+                    - (xs[previous] - xs[position]) * (average_y - ys[previous])
+                )
+                if area > best_area:
+                    best, best_area = position, area
+            selected.append(best)
+            previous = best
+        selected.append(count - 1)
+        return selected
+    
+    def stats(self) -> Dict[str, Any]:
+        """Queries bucketed and results downsampled"""
+        return dict(self.counters)
+    
+    def _match(self, sql: str) -> Optional[Dict[str, Any]]:
+        """Pieces of a grouped query keyed by a bare order_date, with its literal date bounds"""
+        literals: List[str] = []
+        
+        def protect(match: re.Match) -> str:
+            literals.append(match.group(0))
+            return f"\x00{len(literals) - 1}\x00"
+        
+        text = re.sub(r"'(?:[^']|'')*'", protect, sql)
+        if UNSUPPORTED.search(text):
+            return None
+        match = GROUPED_QUERY.match(text)
+        if match is None:
+            return None
+        
+        select = self._split_top_level(match.group("select"))
+        dates = [(position, RAW_DATE.match(item)) for position, item in enumerate(select) if RAW_DATE.match(item)]
+        if len(dates) != 1:
+            return None
+        position, date_item = dates[0]
+        alias = date_item.group("alias")
+        # The day key must be grouped on: by expression, output position or a distinct alias
+        group = self._split_top_level(match.group("group"))
+        references = {item.strip().lower() for item in group}
+        raw_references = {"order_date", f"{(date_item.group('qualifier') or '').lower()}.order_date"}
+        if not (references & raw_references or str(position + 1) in references or (alias and alias.lower() in references)):
+            return None
+        tail = match.group("tail") or ""
+        # HAVING cannot see output names, so a day reference there has nothing to map to
+        if re.search(r"\border_date\b", re.split(r"\bORDER\s+BY\b", tail, flags=re.IGNORECASE)[0], re.IGNORECASE):
+            return None
+        
+        source = match.group("source")
+        lower = [self._literal_date(literals, found.group("lit")) for found in LOWER_BOUND.finditer(source)]
+        upper = [self._literal_date(literals, found.group("lit")) for found in UPPER_BOUND.finditer(source)]
+        for found in BETWEEN_BOUNDS.finditer(source):
+            lower.append(self._literal_date(literals, found.group("low")))
+            upper.append(self._literal_date(literals, found.group("high")))
+        return {
+            "literals": literals,
+            "select": select,
+            "position": position,
+            "qualifier": date_item.group("qualifier"),
+            "alias": alias,
+            "source": source,
+            "group": group,
+            "tail": tail,
+            "bounds": (
+                max((bound for bound in lower if bound), default=None),
+                min((bound for bound in upper if bound), default=None)
+            )
+        }
+    
+    def _rewrite(self, query: Dict[str, Any], first: Optional[date], last: Optional[date]) -> Optional[Tuple[str, str]]:
+        """Query grouped by the finest grain that fits the span in the point budget, or None if days already fit"""
+        if first is None or last is None:
+            return None
+        span = (last - first).days + 1
+        granularity = next((name for name, days in GRANULARITIES if span / days <= self.max_points), GRANULARITIES[-1][0])
+        if granularity == "day":
+            return None
+        
+        column = f"{query['qualifier']}.order_date" if query["qualifier"] else "order_date"
+        bucket = f"DATE_TRUNC('{granularity}', {column})::date"
+        select = [item.strip() for item in query["select"]]
+        select[query["position"]] = f"{bucket} AS {query['alias'] or 'order_date'}"
+        raw = re.compile(rf"^\s*(?:{re.escape(query['qualifier'] or '')}\.)?order_date\s*$", re.IGNORECASE)
+        group = [bucket if raw.match(item) else item.strip() for item in query["group"]]
+        # Output names win in ORDER BY, so only qualified or shadowed references need the bucket
+        tail = query["tail"]
+        if query["qualifier"]:
+            tail = re.sub(rf"\b{re.escape(query['qualifier'])}\.order_date\b", bucket, tail, flags=re.IGNORECASE)
+        if (query["alias"] or "order_date").lower() != "order_date":
+            tail = re.sub(r"(?<![.\w])order_date\b", bucket, tail, flags=re.IGNORECASE)
+        
+        self.counters["bucketed"] += 1
+        sql = f"SELECT {', '.join(select)} FROM {query['source']} GROUP BY {', '.join(group)}{tail}"
+        return self._restore(query, sql), granularity
+    
+    def _restore(self, query: Dict[str, Any], sql: str) -> str:
+        """Put the protected literals back"""
+        return re.sub(r"\x00(\d+)\x00", lambda match: query["literals"][int(match.group(1))], sql)
+    
+    def _split_top_level(self, text: str) -> List[str]:
+        """Split a list on commas outside parentheses (literals are already placeholders)"""
+        parts = []
+        depth = 0
+        start = 0
+        for index, char in enumerate(text):
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+            elif char == "," and depth == 0:
+                parts.append(text[start:index])
+                start = index + 1
+        parts.append(text[start:])
+        return parts
+    
+    def _literal_date(self, literals: List[str], index: str) -> Optional[date]:
+        """Date in a protected literal, or None"""
+        return self._as_date(literals[int(index)][1:-1])
+    
+    def _stored_range(self, result: Dict[str, Any]) -> Tuple[Optional[date], Optional[date]]:
+        """First and last order dates from the date range query"""
+        if not result["rows"]:
+            return None, None
+        first, last = result["rows"][0]
+        return self._as_date(first), self._as_date(last)
+    
+    def _as_date(self, value: Any) -> Optional[date]:
+        """Date for a date, timestamp or ISO string (cached results hold strings), else None"""
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        if isinstance(value, str) and ISO_DATE.match(value):
+            try:
+                return datetime.fromisoformat(value.replace("Z", "+00:00")).date()
+            except ValueError:
+                return None
+        return None
+    
+    def _all(self, rows: List[List[Any]], column: int, convert) -> Optional[List[Any]]:
+        """Converted non-null values of a column, or None if any fails to convert or all are null"""
+        values = [convert(row[column]) for row in rows if row[column] is not None]
+        if not values or any(value is None for value in values):
+            return None
+        return values
+    
+    def _is_numeric(self, rows: List[List[Any]], column: int) -> bool:
+        """Whether a column's non-null values are all numbers"""
+        return self._all(rows, column, lambda value: value if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool) else None) is not None
+    
+    def _x_value(self, value: Any, position: int) -> float:
+        """Seconds since year 1 for a date or timestamp value, falling back to the row's position"""
+        if isinstance(value, str) and ISO_DATE.match(value):
+            try:
+                value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            except ValueError:
+                return float(position)
+        if isinstance(value, datetime):
+            return value.toordinal() * 86400.0 + value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1e6
+        if isinstance(value, date):
+            return value.toordinal() * 86400.0
+        return float(position)
+
+# Global chart reducer instance
+chart_reducer = ChartReducer()
@@ -0,0 +1,213 @@
+"""
+Request Coalescing Service
+Singleflight for identical in-flight work, in-process and across workers via Redis locks
+"""
+
+import asyncio
+import json
+import time
+import uuid
+import threading
+import redis
+import redis.asyncio as aioredis
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from app.core.config import settings
+from app.core.serialization import json_dumps
+
+class _Call:
+    """An in-flight synchronous call that followers can wait on"""
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into a single upstream call
+    
+    Within a worker, duplicates wait on the leader's call. Across workers, the
+    leader holds a Redis lock and publishes its result under a short-lived key
+    that other workers poll for instead of repeating the call.
+    """
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.async_redis_client = aioredis.from_url(settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS)
+        self.across_workers = settings.COALESCE_ACROSS_WORKERS
+        self.lock_ttl_ms = int(settings.COALESCE_LOCK_TTL_SECONDS * 1000)
+        self.result_ttl_ms = int(settings.COALESCE_RESULT_TTL_SECONDS * 1000)
+        self.wait_timeout = settings.COALESCE_LOCK_TTL_SECONDS
+        self.poll_interval = 0.05
+        self._sync_calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.leader_calls = 0
+        self.local_coalesced = 0
+        self.remote_coalesced = 0
+    
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run fn once for all concurrent callers with the same key"""
+        with self._lock:
+            call = self._sync_calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._sync_calls[key] = call
+            else:
+                self.local_coalesced += 1
+        
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = self._lead(key, fn)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._sync_calls.pop(key, None)
+            call.event.set()
+    
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await fn once for all concurrent callers with the same key
+        
+        The call runs as its own task and every caller, the first included,
+        awaits it through a shield, so cancelling one caller (a disconnected
+        client) does not cancel the call the others are waiting on.
+        """
+        task = self._async_calls.get(key)
+        if task is not None:
+            self.local_coalesced += 1
+            return await asyncio.shield(task)
+        
+        task = asyncio.ensure_future(self._lead_async(key, fn))
+        self._async_calls[key] = task
+        task.add_done_callback(lambda done: self._finish_async(key, done))
+        return await asyncio.shield(task)
+    
+    def stats(self) -> Dict[str, int]:
+        """Coalescing counters for monitoring"""
+        return {
+            "leader_calls": self.leader_calls,
+            "local_coalesced": self.local_coalesced,
+            "remote_coalesced": self.remote_coalesced,
+            "coalesced": self.local_coalesced + self.remote_coalesced,
+            "in_flight": len(self._sync_calls) + len(self._async_calls)
+        }
+    
+    def _finish_async(self, key: str, task: asyncio.Task) -> None:
+        """Forget a finished async call, marking its error retrieved in case nobody was still waiting"""
+        if self._async_calls.get(key) is task:
+            del self._async_calls[key]
+        if not task.cancelled():
+            task.exception()
+    
+    def _lead(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run as the in-process leader, deferring to another worker's in-flight call if there is one"""
+        lock_key, result_key = self._redis_keys(key)
+        token = str(uuid.uuid4())
+        
+        if self.across_workers and not self._try_lock(lock_key, token):
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                try:
+                    shared = self.redis_client.get(result_key)
+                    if shared:
+                        self.remote_coalesced += 1
+                        return json.loads(shared)
+                    if not self.redis_client.exists(lock_key):
+                        break  # Leader finished without publishing (it failed) - run it ourselves
+                except Exception:
+                    break
+                time.sleep(self.poll_interval)
+            token = None
+        
+        self.leader_calls += 1
+        try:
+            result = fn()
+            if self.across_workers:
+                try:
+                    self.redis_client.set(result_key, json_dumps(result), px=self.result_ttl_ms)
+                except Exception:
+                    pass  # Result sharing is best effort
+            return result
+        finally:
+            if token:
+                self._release(lock_key, token)
+    
+    async def _lead_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await as the in-process leader, deferring to another worker's in-flight call if there is one"""
+        lock_key, result_key = self._redis_keys(key)
+        token = str(uuid.uuid4())
+        
+        if self.across_workers and not await self._try_lock_async(lock_key, token):
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                try:
+                    shared = await self.async_redis_client.get(result_key)
+                    if shared:
+                        self.remote_coalesced += 1
+                        return json.loads(shared)
+                    if not await self.async_redis_client.exists(lock_key):
+                        break  # Leader finished without publishing (it failed) - run it ourselves
+                except Exception:
+                    break
+                await asyncio.sleep(self.poll_interval)
+            token = None
+        
+        self.leader_calls += 1
+        try:
+            result = await fn()
+            if self.across_workers:
+                try:
+                    await self.async_redis_client.set(result_key, json_dumps(result), px=self.result_ttl_ms)
+                except Exception:
+                    pass  # Result sharing is best effort
+            return result
+        finally:
+            if token:
+                await self._release_async(lock_key, token)
+    
+    def _redis_keys(self, key: str) -> Tuple[str, str]:
+        """Lock and shared-result keys for a coalescing key"""
+        return f"singleflight:{self.name}:lock:{key}", f"singleflight:{self.name}:result:{key}"
+    
+    def _try_lock(self, lock_key: str, token: str) -> bool:
+        """Acquire the cross-worker lock; without Redis every worker leads"""
+        try:
+            return bool(self.redis_client.set(lock_key, token, nx=True, px=self.lock_ttl_ms))
+        except Exception:
+            return True
+    
+    async def _try_lock_async(self, lock_key: str, token: str) -> bool:
+        """Acquire the cross-worker lock without blocking the event loop"""
+        try:
+            return bool(await self.async_redis_client.set(lock_key, token, nx=True, px=self.lock_ttl_ms))
+        except Exception:
+            return True
+    
+    def _release(self, lock_key: str, token: str) -> None:
+        """Release the cross-worker lock if we still own it"""
+        try:
+            if self.redis_client.get(lock_key) == token.encode():
+                self.redis_client.delete(lock_key)
+        except Exception:
+            pass
+    
+    async def _release_async(self, lock_key: str, token: str) -> None:
+        """Release the cross-worker lock without blocking the event loop"""
+        try:
+            if await self.async_redis_client.get(lock_key) == token.encode():
+                await self.async_redis_client.delete(lock_key)
+        except Exception:
+            pass
+
+# Global singleflight groups: LLM calls keyed on parse cache key, queries keyed on SQL hash
+llm_singleflight = SingleFlight("llm")
+query_singleflight = SingleFlight("query")
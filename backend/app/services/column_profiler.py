@@ -0,0 +1,150 @@
+"""
+Column Profiler
+Single-pass per-column statistics of a query result from cursor type metadata and NumPy, shared by chart inference and responses
+"""
+
+import re
+import warnings
+import numpy as np
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# Postgres type OIDs (psycopg2 and asyncpg both report them in cursor.description)
+NUMERIC_TYPE_OIDS = {20, 21, 23, 26, 700, 701, 790, 1700}  # int8, int2, int4, oid, float4, float8, money, numeric
+DATE_TYPE_OIDS = {1082, 1114, 1184}  # date, timestamp, timestamptz
+
+# Dates and timestamps as ISO strings, the form cached results and SQLite hold them in
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}(?::?\d{2})?)?)?$")
+
+class ColumnProfiler:
+    """Profiles each result column once: kind, cardinality, nulls, min/max and monotonicity
+
+    The kind comes from the driver's type code when the cursor reports one
+    (so a text column of digits stays categorical and an empty date column is
+    still a date) and otherwise from the Python types of every value. Stats
+    are computed over all values, with NumPy for numeric and date columns.
+    """
+    
+    def __init__(self):
+        self.counters = {"profiles": 0, "typed_columns": 0, "inferred_columns": 0}
+    
+    def type_codes(self, result: Any) -> Optional[List[Any]]:
+        """Driver type codes from a SQLAlchemy result's cursor description, if it has one"""
+        try:
+            description = result.cursor.description
+        except Exception:
+            return None
+        return [column[1] for column in description] if description else None
+    
+    def profile_rows(self, columns: List[str], rows: List[List[Any]], type_codes: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        """Profile of a row-major result"""
+        series = list(zip(*rows)) if rows else [() for _ in columns]
+        return self.profile(columns, series, type_codes)
+    
+    def profile(self, columns: List[str], series: Iterable[Sequence[Any]], type_codes: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        """Profile of a column-major result, one entry per column"""
+        self.counters["profiles"] += 1
+        return [
+            self.profile_column(name, values, type_codes[index] if type_codes and index < len(type_codes) else None)
+            for index, (name, values) in enumerate(zip(columns, series))
+        ]
+    
+    def profile_column(self, name: str, values: Sequence[Any], type_code: Any = None) -> Dict[str, Any]:
+        """Kind and statistics of one column's values"""
+        array = np.fromiter(values, dtype=object, count=len(values))
+        present = array[~np.equal(array, None)]
+        kind = self._kind(type_code, present)
+        profile = {
+            "name": name,
+            "kind": kind,
+            "count": int(array.size),
+            "nulls": int(array.size - present.size),
+            "cardinality": 0,
+            "min": None,
+            "max": None,
+            "monotonic": None
+        }
+        if present.size == 0:
+            return profile
+        
+        ordered = self._numbers(present) if kind == "numeric" else self._timestamps(present) if kind == "date" else None
+        if ordered is None:
+            profile["cardinality"] = self._distinct(present)
+            return profile
+        profile["cardinality"] = int(np.unique(ordered).size)
+        # The stored values themselves, so dates stay dates and decimals stay exact
+        profile["min"] = present[int(np.argmin(ordered))]
+        profile["max"] = present[int(np.argmax(ordered))]
+        profile["monotonic"] = self._monotonic(ordered)
+        return profile
+    
+    def kinds(self, profile: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+        """Column indexes grouped by kind"""
+        grouped: Dict[str, List[int]] = {"numeric": [], "date": [], "categorical": []}
+        for index, column in enumerate(profile):
+            grouped[column["kind"]].append(index)
+        return grouped
+    
+    def stats(self) -> Dict[str, Any]:
+        """How many results and columns were profiled, and how column kinds were decided"""
+        return dict(self.counters)
+    
+    def _kind(self, type_code: Any, present: np.ndarray) -> str:
+        """numeric, date or categorical, from the type code when known, else from the values"""
+        if isinstance(type_code, int) and not isinstance(type_code, bool):
+            self.counters["typed_columns"] += 1
+            if type_code in NUMERIC_TYPE_OIDS:
+                return "numeric"
+            return "date" if type_code in DATE_TYPE_OIDS else "categorical"
+        
+        self.counters["inferred_columns"] += 1
+        if present.size == 0:
+            return "categorical"
+        types = set(map(type, present))
+        if all(issubclass(kind, (int, float, Decimal)) and not issubclass(kind, bool) for kind in types):
+            return "numeric"
+        if all(issubclass(kind, date) for kind in types):
+            return "date"
+        if types == {str} and all(ISO_DATE.match(value) for value in present):
+            return "date"
+        return "categorical"
+    
+    def _numbers(self, present: np.ndarray) -> Optional[np.ndarray]:
+        """Values as floats, or None if a value is not numeric after all"""
+        try:
+            return present.astype(float)
+        except (TypeError, ValueError):
+            return None
+    
+    def _timestamps(self, present: np.ndarray) -> Optional[np.ndarray]:
+        """Dates, timestamps or ISO strings as datetime64 (UTC for aware values), or None if any fails"""
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")  # NumPy warns that it drops time zones after converting to UTC
+                return present.astype("datetime64[us]")
+        except (TypeError, ValueError):
+            return None
+    
+    def _distinct(self, present: np.ndarray) -> int:
+        """Distinct non-null values, comparing unhashable ones (arrays, JSON) by their repr"""
+        try:
+            return len(set(present))
+        except TypeError:
+            return len(set(map(repr, present)))
+    
+    def _monotonic(self, ordered: np.ndarray) -> Optional[str]:
+        """increasing or decreasing if the non-null values never step the other way, else None"""
+        if ordered.size < 2:
+            return None
+        steps = np.diff(ordered)
+        if ordered.dtype.kind == "M":
+            steps = steps.astype(np.int64)
+        if (steps >= 0).all():
+            return "increasing"
+        if (steps <= 0).all():
+            return "decreasing"
+        return None
+
+# Global column profiler instance
+column_profiler = ColumnProfiler()
@@ -0,0 +1,114 @@
+"""
+Query Cost Guard
+Checks planner estimates from EXPLAIN against per-user thresholds before a query runs
+"""
+
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.exceptions import QueryCostError
+
+ORDER_BY = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+# A LIMIT ending the query, with the OFFSET that may follow it
+TRAILING_LIMIT = re.compile(r"\s+LIMIT\s+(\d+|ALL)(\s+OFFSET\s+\d+)?$", re.IGNORECASE)
+TRAILING_FETCH = re.compile(r"\b(FETCH|FOR)\b[^()']*$", re.IGNORECASE)
+
+class CostGuard:
+    """Refuses queries the planner expects to be too expensive and limits ones expected to return too many rows"""
+    
+    def __init__(self):
+        self.enabled = settings.COST_GUARD_ENABLED
+        self.max_cost = settings.COST_GUARD_MAX_COST
+        self.max_rows = settings.COST_GUARD_MAX_ROWS
+        self.downgrade_limit = settings.COST_GUARD_DOWNGRADE_LIMIT
+        self.user_thresholds = settings.COST_GUARD_USER_THRESHOLDS
+        self.counters = {"checked": 0, "downgraded": 0, "rejected": 0}
+    
+    def thresholds(self, user_id: Optional[int] = None) -> Dict[str, float]:
+        """Cost and row thresholds for a user, falling back to the defaults"""
+        overrides = self.user_thresholds.get(str(user_id), {}) if user_id is not None else {}
+        return {
+            "max_cost": overrides.get("max_cost", self.max_cost),
+            "max_rows": overrides.get("max_rows", self.max_rows)
+        }
+    
+    def profile(self, user_id: Optional[int] = None) -> str:
+        """Cache key component for users whose thresholds differ from the defaults"""
+        if user_id is not None and str(user_id) in self.user_thresholds:
+            return f"user{user_id}"
+        return ""
+    
+    def explain_sql(self, sql: str) -> str:
+        """EXPLAIN statement that returns the plan estimates without running the query"""
+        return f"EXPLAIN (FORMAT JSON) {sql.strip().rstrip(';')}"
+    
+    def read_plan(self, explain_output: Any) -> Dict[str, Any]:
+        """Top plan node from EXPLAIN (FORMAT JSON) output, decoded if the driver returned text"""
+        if isinstance(explain_output, str):
+            explain_output = json.loads(explain_output)
+        return explain_output[0]["Plan"]
+    
+    def review(self, sql: str, plan: Dict[str, Any], user_id: Optional[int] = None) -> Tuple[str, List[str]]:
+        """SQL to run and warnings explaining any downgrade; raises QueryCostError when over the cost threshold"""
+        cost = float(plan["Total Cost"])
+        rows = int(plan["Plan Rows"])
+        limits = self.thresholds(user_id)
+        estimate = f"planner estimate of cost {cost:,.0f} and {rows:,} rows"
+        self.counters["checked"] += 1
+        
+        if cost > limits["max_cost"]:
+            self.counters["rejected"] += 1
+            raise QueryCostError(
+                f"Query refused: {estimate} exceeds the cost limit of {limits['max_cost']:,.0f}; "
+                "add filters or aggregate further"
+            )
+        
+        if rows > limits["max_rows"]:
+            self.counters["downgraded"] += 1
+            return self._limit(sql, self.downgrade_limit), [
+                f"Result limited to {self.downgrade_limit} rows: {estimate} exceeds the row limit of {limits['max_rows']:,.0f}"
+            ]
+        
+        return sql, []
+    
+    def _limit(self, sql: str, limit: int) -> str:
+        """sql returning at most limit rows
+        
+        An ordered query gets the limit on its own top-level LIMIT, appended
+        or lowered, since the order of a subquery's rows does not survive an
+        outer SELECT. Other queries (and ordered ones ending in FETCH or FOR)
+        are wrapped as a subquery under the LIMIT.
+        """
+        sql = sql.strip().rstrip(";").rstrip()
+        if not self._is_ordered(sql) or TRAILING_FETCH.search(sql):
+            return f"SELECT * FROM ({sql}) AS cost_guarded LIMIT {limit}"
+        match = TRAILING_LIMIT.search(sql)
+        if match is None:
+            return f"{sql} LIMIT {limit}"
+        if match.group(1).isdigit():
+            limit = min(limit, int(match.group(1)))
+        return f"{sql[:match.start()]} LIMIT {limit}{match.group(2) or ''}"
+    
+    def _is_ordered(self, sql: str) -> bool:
+        """Whether sql has an ORDER BY outside parentheses and string literals"""
+        depth = 0
+        in_string = False
+        for index, char in enumerate(sql):
+            if char == "'":
+                in_string = not in_string
+            elif not in_string:
+                if char == "(":
+                    depth += 1
+                elif char == ")":
+                    depth -= 1
+                elif depth == 0 and ORDER_BY.match(sql, index):
+                    return True
+        return False
+    
+    def stats(self) -> Dict[str, Any]:
+        """Guard decision counters"""
+        return dict(self.counters)
+
+# Global cost guard instance
+cost_guard = CostGuard()
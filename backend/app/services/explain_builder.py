@@ -22,7 +22,7 @@ class ExplainBuilder:
         filters = self._extract_filters(sql)
         group_by = self._extract_group_by(sql)
         aggregates = self._extract_aggregates(sql)
-        source_tables = self._extract_source_tables(sql)
+        source_tables = self.extract_source_tables(sql)
         
         return {
             "filters": filters,
@@ -106,25 +106,22 @@ class ExplainBuilder:
         
         return aggregates
     
-    def _extract_source_tables(self, sql: str) -> List[str]:
-        """Extract source tables from FROM and JOIN clauses"""
+    def extract_source_tables(self, sql: str) -> List[str]:
+        """Extract source tables from FROM and JOIN clauses, including subqueries and comma joins"""
         tables = []
         
-        # Extract FROM clause
-        from_match = re.search(r'FROM\s+(\w+)', sql, re.IGNORECASE)
-        if from_match:
-            table_name = from_match.group(1).lower()
-            if self.schema_registry.validate_table(table_name):
-                tables.append(table_name)
+        # Every FROM clause (outer query, subqueries and CTE bodies), with comma-separated tables
+        for from_clause in re.findall(r'\bFROM\s+(.*?)(?=\bWHERE\b|\bGROUP\b|\bORDER\b|\bLIMIT\b|\bJOIN\b|\bUNION\b|\)|;|$)', sql, re.IGNORECASE | re.DOTALL):
+            for item in from_clause.split(","):
+                table_match = re.match(r'\s*(\w+)', item)
+                if table_match:
+                    tables.append(table_match.group(1).lower())
         
         # Extract JOIN clauses
-        join_matches = re.findall(r'JOIN\s+(\w+)', sql, re.IGNORECASE)
-        for table_name in join_matches:
-            table_name = table_name.lower()
-            if self.schema_registry.validate_table(table_name):
-                tables.append(table_name)
+        tables.extend(table_name.lower() for table_name in re.findall(r'\bJOIN\s+(\w+)', sql, re.IGNORECASE))
         
-        return list(set(tables))  # Remove duplicates
+        # Remove duplicates and unknown names (CTE aliases, functions)
+        return sorted({table_name for table_name in tables if self.schema_registry.validate_table(table_name)})
     
     def _make_condition_human_readable(self, condition: str) -> str:
         """Convert SQL condition to human-readable format"""
@@ -0,0 +1,210 @@
+"""
+Few-Shot Example Store
+Keeps (prompt, SQL) pairs that validated and executed cleanly and retrieves the nearest ones as prompt examples
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+from app.core.config import settings
+from app.services.vector_index import vector_index
+from app.services.parse_cache import parse_cache
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows, where compaction is only safe with a single worker
+    fcntl = None
+
+class FewShotStore:
+    """Append-only JSONL log of successful pairs with an in-memory similarity matrix
+    
+    Rows of matrix beyond len(examples) are spare capacity. Log writes run in
+    order on one background thread, so callers on the event loop never touch
+    the file, and every write holds an exclusive lock shared by all workers.
+    """
+    
+    def __init__(self, path: Optional[str] = None, max_examples: Optional[int] = None):
+        self.path = path or settings.FEWSHOT_STORE_PATH
+        self.max_examples = max_examples or settings.FEWSHOT_MAX_EXAMPLES
+        self.top_k = settings.FEWSHOT_TOP_K
+        self.min_score = settings.FEWSHOT_MIN_SCORE
+        self.token_budget = settings.FEWSHOT_TOKEN_BUDGET
+        self.vectorizer = vector_index
+        self.examples: List[Dict[str, Any]] = []
+        self.matrix = np.zeros((0, self.vectorizer.dim), dtype=np.float32)
+        self._rows: Dict[str, int] = {}  # normalized prompt -> row
+        self._loaded = False
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fewshot-writer")
+        self.counters = {"recorded": 0, "lookups": 0, "hits": 0}
+    
+    def load(self) -> int:
+        """Read the persisted log, keeping the newest pair per prompt"""
+        latest, log_lines = self._read_log()
+        examples = list(latest.values())[-self.max_examples:]
+        with self._lock:
+            self.examples = examples
+            self.matrix = self._vectorize_all(examples)
+            self._rows = {example["key"]: row for row, example in enumerate(examples)}
+            self._log_lines = log_lines
+            self._loaded = True
+        return len(examples)
+    
+    def record(self, prompt: str, sql: str) -> None:
+        """Add or replace the pair for this prompt"""
+        self._ensure_loaded()
+        key = parse_cache.normalize_prompt(prompt)
+        example = {"key": key, "prompt": prompt.strip(), "sql": sql, "recorded_at": time.time()}
+        vector = self.vectorizer.vectorize(key)
+        
+        with self._lock:
+            row = self._rows.get(key)
+            if row is not None:
+                if self.examples[row]["sql"] == sql:
+                    return
+                self.examples[row] = example
+                self.matrix[row] = vector
+            else:
+                if len(self.examples) == len(self.matrix):
+                    # Grow geometrically so appends stay amortized O(1)
+                    grown = np.zeros((max(16, 2 * len(self.matrix)), self.vectorizer.dim), dtype=np.float32)
+                    grown[:len(self.examples)] = self.matrix
+                    self.matrix = grown
+                self.matrix[len(self.examples)] = vector
+                self._rows[key] = len(self.examples)
+                self.examples.append(example)
+            self.counters["recorded"] += 1
+            
+            evicted = len(self.examples) > self.max_examples
+            if evicted:
+                self._evict_oldest()
+            # Replaced pairs leave stale lines behind; compact once they dominate the log
+            if evicted or self._log_lines >= 2 * self.max_examples:
+                self._log_lines = len(self.examples)
+                self._writer.submit(self._rewrite, list(self.examples))
+            else:
+                self._log_lines += 1
+                self._writer.submit(self._append, example)
+    
+    def flush(self) -> None:
+        """Wait until queued log writes are on disk"""
+        self._writer.submit(lambda: None).result()
+    
+    def search(self, prompt: str, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Most similar stored pairs above the similarity threshold, best first"""
+        self._ensure_loaded()
+        self.counters["lookups"] += 1
+        with self._lock:
+            if not self.examples:
+                return []
+            scores = self.matrix[:len(self.examples)] @ self.vectorizer.vectorize(parse_cache.normalize_prompt(prompt))
+            order = np.argsort(-scores)[:k or self.top_k]
+            results = [
+                {"prompt": self.examples[row]["prompt"], "sql": self.examples[row]["sql"], "score": round(float(scores[row]), 4)}
+                for row in order
+                if scores[row] >= self.min_score
+            ]
+        if results:
+            self.counters["hits"] += 1
+        return results
+    
+    def render_examples(self, prompt: str, token_budget: Optional[int] = None) -> List[str]:
+        """Example lines for the system prompt, most similar first, within the token budget"""
+        budget = token_budget if token_budget is not None else self.token_budget
+        lines = []
+        used = 0
+        for example in self.search(prompt):
+            line = f"- \"{example['prompt']}\" -> {' '.join(example['sql'].split())}"
+            cost = len(line) // 4 + 1
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+        return lines
+    
+    def stats(self) -> Dict[str, Any]:
+        """Store size and retrieval counters"""
+        return {**self.counters, "examples": len(self.examples)}
+    
+    def _ensure_loaded(self) -> None:
+        """Load the log on first use"""
+        if not self._loaded:
+            self.load()
+    
+    def _vectorize_all(self, examples: List[Dict[str, Any]]) -> np.ndarray:
+        """Similarity matrix for a list of examples"""
+        if not examples:
+            return np.zeros((0, self.vectorizer.dim), dtype=np.float32)
+        return np.stack([self.vectorizer.vectorize(example["key"]) for example in examples])
+    
+    def _evict_oldest(self) -> None:
+        """Drop the oldest pairs beyond max_examples"""
+        excess = len(self.examples) - self.max_examples
+        self.examples = self.examples[excess:]
+        self.matrix[:len(self.examples)] = self.matrix[excess:excess + len(self.examples)]
+        self._rows = {example["key"]: row for row, example in enumerate(self.examples)}
+    
+    def _read_log(self) -> Tuple[Dict[str, Dict[str, Any]], int]:
+        """Newest pair per prompt in log order, and the number of lines read"""
+        latest: Dict[str, Dict[str, Any]] = {}
+        log_lines = 0
+        try:
+            with open(self.path) as log_file:
+                for line in log_file:
+                    log_lines += 1
+                    try:
+                        example = json.loads(line)
+                    except ValueError:
+                        continue  # Torn write from a crash
+                    latest.pop(example["key"], None)
+                    latest[example["key"]] = example
+        except OSError:
+            pass
+        return latest, log_lines
+    
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Exclusive lock on the log across workers; released when the lock file closes"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+    
+    def _append(self, example: Dict[str, Any]) -> None:
+        """Append one pair to the log (writer thread)"""
+        try:
+            with self._file_lock(), open(self.path, "a") as log_file:
+                log_file.write(json.dumps(example) + "\n")
+        except OSError:
+            pass  # The in-memory store still serves this process
+    
+    def _rewrite(self, examples: List[Dict[str, Any]]) -> None:
+        """Compact the log to the newest max_examples pairs (writer thread)
+        
+        The log is re-read under the lock, so pairs other workers appended
+        since this one loaded are kept rather than replaced by its own list.
+        """
+        try:
+            with self._file_lock():
+                latest, _ = self._read_log()
+                for example in examples:
+                    stored = latest.get(example["key"])
+                    if stored is None or stored.get("recorded_at", 0) <= example["recorded_at"]:
+                        latest[example["key"]] = example
+                kept = sorted(latest.values(), key=lambda example: example.get("recorded_at", 0))[-self.max_examples:]
+                with open(f"{self.path}.tmp", "w") as log_file:
+                    for example in kept:
+                        log_file.write(json.dumps(example) + "\n")
+                os.replace(f"{self.path}.tmp", self.path)
+        except OSError:
+            pass
+
+# Global few-shot example store
+few_shot_store = FewShotStore()
@@ -4,50 +4,162 @@ Handles prompt construction and API calls for NLQ to SQL conversion
 """
 
 import json
-from typing import Dict, List, Any, Optional
-from openai import OpenAI
+import httpx
+from typing import Callable, Dict, List, Any, Optional
+from openai import OpenAI, AsyncOpenAI
 from app.core.config import settings
+from app.core.exceptions import CircuitOpenError, LLMError
 from app.services.schema_registry import schema_registry
+from app.services.vector_index import vector_index
+from app.services.resilience import llm_resilience
+from app.services.fewshot import few_shot_store
+
+# Used when no stored example is similar enough to the prompt
+DEFAULT_EXAMPLES = [
+    "- \"revenue by region\" -> SELECT region, SUM(quantity * unit_price) as revenue FROM orders GROUP BY region",
+    "- \"orders in Q2 2024\" -> SELECT * FROM orders WHERE order_date >= '2024-04-01' AND order_date < '2024-07-01'",
+    "- \"top customers by revenue\" -> SELECT c.name, SUM(o.quantity * o.unit_price) as revenue FROM orders o JOIN customers c ON o.customer_id = c.customer_id GROUP BY c.customer_id, c.name ORDER BY revenue DESC LIMIT 10"
+]
 
 class LLMClient:
     """Client for OpenAI API integration"""
     
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = OpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+            max_retries=settings.LLM_MAX_RETRIES
+        )
+        # Async client shares one pooled HTTP connection set across all in-flight requests
+        self.async_client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+            max_retries=settings.LLM_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS
+                )
+            )
+        )
         self.model = settings.OPENAI_MODEL
+        self.resilience = llm_resilience
+        self.few_shot_store = few_shot_store
     
     def generate_sql(self, prompt: str, conversation_context: Optional[str] = None) -> Dict[str, Any]:
         """Generate SQL from natural language prompt"""
         
-        system_prompt = self._build_system_prompt()
-        user_prompt = self._build_user_prompt(prompt, conversation_context)
+        messages = self._build_messages(prompt, conversation_context)
         
-        try:
+        def complete() -> Dict[str, Any]:
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=messages,
                 temperature=0.1,
                 max_tokens=1000
             )
-            
-            content = response.choices[0].message.content
-            return self._parse_response(content)
-            
+            return self._parse_response(response.choices[0].message.content)
+        
+        try:
+            return self.resilience.call_sync(complete)
+        except CircuitOpenError as e:
+            raise LLMError(f"LLM unavailable: {str(e)}")
         except Exception as e:
-            raise Exception(f"LLM API error: {str(e)}")
+            raise LLMError(f"LLM API error: {str(e)}")
+    
+    async def generate_sql_async(
+        self,
+        prompt: str,
+        conversation_context: Optional[str] = None,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
+        """Generate SQL from natural language prompt without blocking the event loop
+        
+        Slow calls are hedged with a duplicate request and the first valid answer
+        wins. When on_token is given, the primary request is streamed and each
+        content delta is passed to it as it arrives.
+        """
+        
+        messages = self._build_messages(prompt, conversation_context)
+        
+        try:
+            return await self.resilience.call(
+                lambda attempt: self._complete_async(messages, on_token if attempt == 0 else None),
+                is_valid=self._is_valid_response
+            )
+        except CircuitOpenError as e:
+            raise LLMError(f"LLM unavailable: {str(e)}")
+        except Exception as e:
+            raise LLMError(f"LLM API error: {str(e) or type(e).__name__}")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Breaker state, hedge counts and latency for monitoring"""
+        return self.resilience.stats()
+    
+    async def _complete_async(
+        self,
+        messages: List[Dict[str, str]],
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
+        """One chat completion request, streamed when on_token is given"""
+        if on_token is None:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.1,
+                max_tokens=1000
+            )
+            content = response.choices[0].message.content
+        else:
+            stream = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=0.1,
+                max_tokens=1000,
+                stream=True
+            )
+            parts = []
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    on_token(delta)
+            content = "".join(parts)
+        
+        return self._parse_response(content)
+    
+    def _is_valid_response(self, response: Dict[str, Any]) -> bool:
+        """A usable answer contains a SELECT (or WITH) statement"""
+        sql = (response.get("sql") or "").lstrip().upper()
+        return sql.startswith("SELECT") or sql.startswith("WITH")
     
-    def _build_system_prompt(self) -> str:
-        """Build system prompt with schema context"""
-        schema_context = schema_registry.serialize_for_llm()
+    def _build_messages(self, prompt: str, conversation_context: Optional[str] = None) -> List[Dict[str, str]]:
+        """Build chat messages for a completion request"""
+        return [
+            {"role": "system", "content": self._build_system_prompt(prompt, conversation_context)},
+            {"role": "user", "content": self._build_user_prompt(prompt, conversation_context)}
+        ]
+    
+    def _build_system_prompt(self, prompt: str = "", conversation_context: Optional[str] = None) -> str:
+        """Build system prompt with the schema context relevant to the prompt"""
+        value_matches = vector_index.ground_values(prompt)
+        
+        # Follow-ups may rely on tables named only in earlier turns
+        relevance_text = f"{conversation_context or ''} {prompt}"
+        relevance_text += "".join(f" {match['table']} {match['column']}" for match in value_matches)
+        schema_context = schema_registry.serialize_for_prompt(
+            relevance_text,
+            token_budget=settings.SCHEMA_PROMPT_TOKEN_BUDGET
+        )
+        examples = "\n".join(self._select_examples(prompt))
         
         return f"""You are a SQL expert that converts natural language queries to SQL.
 
 Database Schema:
 {schema_context}
-
+{self._build_value_hints(value_matches)}
 Rules:
 1. Only use SELECT statements
 2. Always include proper JOINs when accessing related tables
@@ -58,9 +170,7 @@ Rules:
 7. Return valid SQL only, no explanations
 
 Examples:
-- "revenue by region" -> SELECT region, SUM(quantity * unit_price) as revenue FROM orders GROUP BY region
-- "orders in Q2 2024" -> SELECT * FROM orders WHERE order_date >= '2024-04-01' AND order_date < '2024-07-01'
-- "top customers by revenue" -> SELECT c.name, SUM(o.quantity * o.unit_price) as revenue FROM orders o JOIN customers c ON o.customer_id = c.customer_id GROUP BY c.customer_id, c.name ORDER BY revenue DESC LIMIT 10
+{examples}
 
 Return your response as JSON with this structure:
 {{
@@ -73,6 +183,23 @@ Return your response as JSON with this structure:
     }}
 }}"""
     
+    def _select_examples(self, prompt: str) -> List[str]:
+        """Nearest previously successful (prompt, SQL) pairs, or the defaults when none are close"""
+        if not settings.FEWSHOT_ENABLED or not prompt:
+            return DEFAULT_EXAMPLES
+        return self.few_shot_store.render_examples(prompt) or DEFAULT_EXAMPLES
+    
+    def _build_value_hints(self, value_matches: List[Dict[str, Any]]) -> str:
+        """List grounded literals so the model filters on exact stored values"""
+        if not value_matches:
+            return ""
+        
+        lines = ["", "Value hints (prompt phrase -> column literal):"]
+        for match in value_matches:
+            literals = ", ".join("'" + value.replace("'", "''") + "'" for value in match["values"])
+            lines.append(f"- \"{match['phrase']}\" -> {match['table']}.{match['column']} IN ({literals})")
+        return "\n".join(lines) + "\n"
+    
     def _build_user_prompt(self, prompt: str, conversation_context: Optional[str] = None) -> str:
         """Build user prompt with conversation context"""
         if conversation_context:
@@ -0,0 +1,184 @@
+"""
+Local Result Cache
+Byte-bounded in-process LRU of deserialized query results in front of Redis, kept coherent through Redis pub/sub
+"""
+
+import json
+import threading
+import time
+import uuid
+import redis
+import redis.asyncio as aioredis
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from app.core.config import settings
+
+# Channel a worker publishes a key on after overwriting it, so the others drop their copy
+INVALIDATE_CHANNEL = "query_cache_invalidate"
+
+class LocalResultCache:
+    """In-process tier for query results, sized by the bytes of their serialized form
+
+    Keys are the executor's cache keys, which already carry table versions, so a
+    write never makes a local entry wrong; it just stops being looked up. The
+    one case where a key's value changes is a recompute of the same version
+    (a stale-while-revalidate refresh), and those are announced on a pub/sub
+    channel. Entries also expire after QUERY_CACHE_LOCAL_MAX_AGE_SECONDS in case
+    a message is lost, and the tier is cleared whenever the subscription
+    reconnects. Results are shared between requests and must not be mutated.
+    """
+    
+    def __init__(self):
+        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.async_redis_client = aioredis.from_url(settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS)
+        self.enabled = settings.QUERY_CACHE_LOCAL_ENABLED
+        self.max_bytes = settings.QUERY_CACHE_LOCAL_MAX_BYTES
+        self.max_age = settings.QUERY_CACHE_LOCAL_MAX_AGE_SECONDS
+        self.origin = uuid.uuid4().hex
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._subscriber: Optional[threading.Thread] = None
+        self.counters = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "oversized": 0,
+            "subscriber_errors": 0
+        }
+    
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Result held locally for this key, if any and not expired"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                self._drop(cache_key)
+                self.counters["expirations"] += 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.counters["local_hits"] += 1
+            return entry[0]
+    
+    def promote(self, cache_key: str, cached: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        """Deserialize a Redis lookup, keep a hit locally, and count the outcome"""
+        if not cached:
+            self.counters["misses"] += 1
+            return None
+        self.counters["redis_hits"] += 1
+        result = json.loads(cached)
+        self.put(cache_key, result, len(cached))
+        return result
+    
+    def put(self, cache_key: str, result: Dict[str, Any], size: int, ttl: Optional[float] = None) -> None:
+        """Hold a result locally, evicting least recently used entries past the byte budget"""
+        if not self.enabled:
+            return
+        if size > self.max_bytes:
+            self.counters["oversized"] += 1
+            return
+        expires_at = time.monotonic() + min(ttl or self.max_age, self.max_age)
+        with self._lock:
+            self._drop(cache_key)
+            self._entries[cache_key] = (result, size, expires_at)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.counters["evictions"] += 1
+    
+    def store(self, cache_key: str, payload: str, ttl: Optional[float] = None) -> None:
+        """Hold a result this worker just wrote to Redis and tell other workers to drop theirs"""
+        self.put(cache_key, json.loads(payload), len(payload.encode()), ttl)
+        try:
+            self.redis_client.publish(INVALIDATE_CHANNEL, f"{self.origin}:{cache_key}")
+        except Exception:
+            pass  # Other workers fall back to the max age
+    
+    async def store_async(self, cache_key: str, payload: str, ttl: Optional[float] = None) -> None:
+        """Hold a written result and announce it without blocking the event loop"""
+        self.put(cache_key, json.loads(payload), len(payload.encode()), ttl)
+        try:
+            await self.async_redis_client.publish(INVALIDATE_CHANNEL, f"{self.origin}:{cache_key}")
+        except Exception:
+            pass
+    
+    def invalidate(self, message: str) -> None:
+        """Drop the key named in another worker's invalidation message"""
+        origin, _, cache_key = message.partition(":")
+        if origin == self.origin:
+            return
+        with self._lock:
+            if cache_key in self._entries:
+                self._drop(cache_key)
+                self.counters["invalidations"] += 1
+    
+    def clear(self) -> None:
+        """Drop every local entry"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def start_subscriber(self) -> None:
+        """Start applying other workers' invalidations in a background thread"""
+        if not self.enabled or (self._subscriber is not None and self._subscriber.is_alive()):
+            return
+        self._stop.clear()
+        self._subscriber = threading.Thread(target=self._subscribe, name="local-cache-subscriber", daemon=True)
+        self._subscriber.start()
+    
+    def stop_subscriber(self) -> None:
+        """Stop the invalidation subscriber"""
+        self._stop.set()
+        if self._subscriber is not None:
+            self._subscriber.join(timeout=2.0)
+            self._subscriber = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit rates per tier, size and invalidation counters"""
+        lookups = self.counters["local_hits"] + self.counters["redis_hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "local_hit_ratio": round(self.counters["local_hits"] / lookups, 4) if lookups else 0.0,
+            "redis_hit_ratio": round(self.counters["redis_hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "subscribed": self._subscriber is not None and self._subscriber.is_alive()
+        }
+    
+    def _drop(self, cache_key: str) -> None:
+        """Remove an entry and its bytes; caller holds the lock"""
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+    
+    def _subscribe(self) -> None:
+        """SUBSCRIBE loop; reconnects after Redis errors and clears the tier since messages may have been missed"""
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATE_CHANNEL)
+                self.clear()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        data = message["data"]
+                        self.invalidate(data.decode() if isinstance(data, bytes) else data)
+            except Exception:
+                self.counters["subscriber_errors"] += 1
+                self.clear()
+                self._stop.wait(5.0)
+            finally:
+                if pubsub is not None:
+                    pubsub.close()
+
+# Global in-process query result tier
+local_result_cache = LocalResultCache()
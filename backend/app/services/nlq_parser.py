@@ -3,14 +3,25 @@ Main NLQ Parser Service
 Orchestrates the NLQ to SQL conversion process
 """
 
-from typing import Dict, Any, Optional
+import asyncio
+from contextlib import nullcontext
+from functools import partial
+from typing import AsyncIterator, Callable, Dict, Any, List, Optional, Tuple
 from app.services.llm_client import llm_client
 from app.services.safety import safety_validator
 from app.services.query_executor import query_executor
 from app.services.explain_builder import explain_builder
 from app.services.viz_inference import chart_inference_engine
 from app.services.sessions import conversation_manager
-from app.core.exceptions import NLQException, UnsafeQueryError
+from app.services.parse_cache import parse_cache
+from app.services.rule_parser import rule_based_parser
+from app.services.coalescing import llm_singleflight
+from app.services.prefetch import speculative_prefetcher
+from app.services.fewshot import few_shot_store
+from app.services.pagination import keyset_paginator
+from app.services.chart_reduction import chart_reducer
+from app.core.config import settings
+from app.core.exceptions import LLMError, NLQException, PaginationError, UnsafeQueryError
 
 class NLQParser:
     """Main NLQ parser that orchestrates the conversion process"""
@@ -22,9 +33,24 @@ class NLQParser:
         self.explain_builder = explain_builder
         self.chart_inference_engine = chart_inference_engine
         self.conversation_manager = conversation_manager
+        self.parse_cache = parse_cache
+        self.rule_parser = rule_based_parser
+        self.parser_mode = settings.NLQ_PARSER_MODE  # "llm", "rules" or "auto"
+        self.parser_counts = {"rules": 0, "llm": 0}
+        self.llm_singleflight = llm_singleflight
+        self.prefetcher = speculative_prefetcher
+        self.few_shot_store = few_shot_store
+        self.paginator = keyset_paginator
+        self.chart_reducer = chart_reducer
     
-    def parse_and_execute(self, prompt: str, conversation_id: Optional[str] = None, user_id: int = 1) -> Dict[str, Any]:
-        """Parse NLQ and execute the resulting SQL"""
+    def parse_and_execute(
+        self,
+        prompt: str,
+        conversation_id: Optional[str] = None,
+        user_id: int = 1,
+        resolution: str = "auto"
+    ) -> Dict[str, Any]:
+        """Parse NLQ and execute the resulting SQL (resolution "full" skips chart reduction)"""
         
         try:
             # Get conversation context if available
@@ -35,29 +61,31 @@ class NLQParser:
                 except:
                     conversation_id = None  # Reset if conversation not found
             
-            # Generate SQL using LLM
-            llm_response = self.llm_client.generate_sql(prompt, context)
-            sql = llm_response["sql"]
-            explain = llm_response["explain"]
+            # Generate validated SQL (rules, parse cache, then LLM)
+            generated = self._generate_sql(prompt, context)
+            sql = generated["sql"]
+            warnings = generated["warnings"]
             
-            # Validate SQL safety
-            warnings = self.safety_validator.validate_query(sql)
-            
-            # Add LIMIT if missing
-            sql = self.safety_validator.add_limit_if_missing(sql)
-            
-            # Execute query
-            execution_result = self.query_executor.execute_query(sql)
+            # Execute query (raw order_date series at a grain that bounds the points)
+            run_sql, time_bucket = self.chart_reducer.bucket(sql) if resolution == "auto" else (sql, None)
+            execution_result = self.query_executor.execute_query(run_sql, user_id=user_id)
+            warnings = warnings + execution_result.get("warnings", [])
+            self._remember_example(prompt, generated)
             
-            # Infer chart type
+            # Infer chart type from the executor's column profile
+            profile = self._profile(execution_result)
             chart_type = self.chart_inference_engine.infer_chart_type(
                 execution_result["columns"],
                 execution_result["rows"],
-                sql
+                sql,
+                profile
             )
+            execution_result, reduction = self._reduce(execution_result, chart_type, time_bucket, resolution)
+            warnings = warnings + self._reduction_warnings(reduction)
             
             # Build explanation
             final_explain = self.explain_builder.build_explanation(sql)
+            response_explain = self._with_rollup(final_explain, execution_result.get("rollup"))
             
             # Update conversation if applicable
             if conversation_id:
@@ -71,10 +99,14 @@ class NLQParser:
                 "columns": execution_result["columns"],
                 "rows": execution_result["rows"],
                 "inferred_chart": chart_type,
-                "explain": final_explain,
+                "profile": profile,
+                "explain": response_explain,
                 "sql": sql,
                 "warnings": warnings,
-                "conversation_id": conversation_id
+                "conversation_id": conversation_id,
+                "parse_cache": generated["parse_cache"],
+                "parser": generated["parser"],
+                "reduction": reduction
             }
             
         except UnsafeQueryError as e:
@@ -94,16 +126,10 @@ class NLQParser:
                 except:
                     conversation_id = None
             
-            # Generate SQL using LLM
-            llm_response = self.llm_client.generate_sql(prompt, context)
-            sql = llm_response["sql"]
-            explain = llm_response["explain"]
-            
-            # Validate SQL safety
-            warnings = self.safety_validator.validate_query(sql)
-            
-            # Add LIMIT if missing
-            sql = self.safety_validator.add_limit_if_missing(sql)
+            # Generate validated SQL (rules, parse cache, then LLM)
+            generated = self._generate_sql(prompt, context)
+            sql = generated["sql"]
+            warnings = generated["warnings"]
             
             # Build explanation
             final_explain = self.explain_builder.build_explanation(sql)
@@ -112,7 +138,9 @@ class NLQParser:
                 "sql": sql,
                 "warnings": warnings,
                 "explain": final_explain,
-                "conversation_id": conversation_id or "new"
+                "conversation_id": conversation_id or "new",
+                "parse_cache": generated["parse_cache"],
+                "parser": generated["parser"]
             }
             
         except UnsafeQueryError as e:
@@ -120,32 +148,65 @@ class NLQParser:
         except Exception as e:
             raise NLQException(f"NLQ parsing failed: {str(e)}")
     
-    def execute_sql(self, sql: str) -> Dict[str, Any]:
-        """Execute SQL query directly"""
+    def execute_sql(
+        self,
+        sql: str,
+        result_format: str = "table",
+        user_id: Optional[int] = None,
+        page_size: Optional[int] = None,
+        cursor: Optional[str] = None,
+        resolution: str = "auto"
+    ) -> Dict[str, Any]:
+        """Execute SQL query directly, one keyset page at a time when page_size or cursor is given
+        
+        Unpaged table and series results are reduced for charting unless
+        resolution is "full"; "reduction" then says how.
+        """
         
         try:
             # Validate SQL safety
             warnings = self.safety_validator.validate_query(sql)
             
-            # Add LIMIT if missing
-            sql = self.safety_validator.add_limit_if_missing(sql)
+            page = None
+            if page_size is not None or cursor is not None:
+                # The page size bounds the rows instead of the default LIMIT
+                columns = None if cursor else self.query_executor.result_columns(sql)
+                page = self._plan_page(sql, result_format, page_size, cursor, columns)
+                warnings = [warning for warning in warnings if "missing LIMIT" not in warning] + page["warnings"]
+                sql = page["sql"]
+            else:
+                # Add LIMIT if missing
+                sql = self.safety_validator.add_limit_if_missing(sql)
             
-            # Execute query
-            execution_result = self.query_executor.execute_query(sql)
+            # Execute query (raw order_date series at a grain that bounds the points)
+            resolution = self._chart_resolution(resolution, result_format, page)
+            sql, time_bucket = self.chart_reducer.bucket(sql) if resolution == "auto" else (sql, None)
+            execution_result = self.query_executor.execute_query(sql, result_format, user_id)
             
-            # Infer chart type
+            # Infer chart type from the executor's column profile
+            profile = self._profile(execution_result)
             chart_type = self.chart_inference_engine.infer_chart_type(
                 execution_result["columns"],
-                execution_result["rows"],
-                sql
+                self.query_executor.sample_rows(execution_result),
+                sql,
+                profile
             )
+            execution_result, reduction = self._reduce(execution_result, chart_type, time_bucket, resolution)
             
-            return {
+            response = {
                 "columns": execution_result["columns"],
-                "rows": execution_result["rows"],
                 "inferred_chart": chart_type,
-                "warnings": warnings
+                "profile": profile,
+                "warnings": warnings + execution_result.get("warnings", []) + self._reduction_warnings(reduction),
+                "reduction": reduction
             }
+            # rows (table), series or arrow depending on result_format, plus row_count for the columnar shapes
+            for field in ("rows", "series", "arrow", "row_count"):
+                if field in execution_result:
+                    response[field] = execution_result[field]
+            if page is not None:
+                response["next_cursor"] = self._next_cursor(page, execution_result)
+            return response
             
         except UnsafeQueryError as e:
             raise NLQException(f"Unsafe query detected: {str(e)}")
@@ -168,6 +229,620 @@ class NLQParser:
             
         except Exception as e:
             raise NLQException(f"Conversation refinement failed: {str(e)}")
+    
+    async def parse_and_execute_async(
+        self,
+        prompt: str,
+        conversation_id: Optional[str] = None,
+        user_id: int = 1,
+        page_size: Optional[int] = None,
+        cursor: Optional[str] = None,
+        resolution: str = "auto"
+    ) -> Dict[str, Any]:
+        """Parse NLQ and execute the resulting SQL without blocking the event loop"""
+        
+        result: Dict[str, Any] = {}
+        async for event, data in self.stream_parse_and_execute(
+            prompt, conversation_id, user_id, page_size=page_size, cursor=cursor, resolution=resolution
+        ):
+            result.update(data)
+        return result
+    
+    async def stream_parse_and_execute(
+        self,
+        prompt: str,
+        conversation_id: Optional[str] = None,
+        user_id: int = 1,
+        stream_tokens: bool = False,
+        row_batch_size: Optional[int] = None,
+        llm_limit: Optional[asyncio.Semaphore] = None,
+        db_limit: Optional[asyncio.Semaphore] = None,
+        prefetch: bool = True,
+        pregenerated: Optional[Dict[str, Any]] = None,
+        stream_execution: bool = False,
+        page_size: Optional[int] = None,
+        cursor: Optional[str] = None,
+        resolution: str = "auto"
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Run the parse and execute stages, yielding (event, data) as each one finishes
+        
+        Merging every event's data in order gives the parse_and_execute response.
+        Row batches are only split when row_batch_size is set. llm_limit and
+        db_limit bound concurrent LLM calls and query executions across callers
+        that share them. pregenerated skips SQL generation (speculative refine
+        hits); prefetch schedules speculative follow-ups once the turn is saved.
+        stream_execution reads rows from a server-side cursor under the
+        response byte budget, adding a warnings event if the result is cut short.
+        page_size or cursor runs one keyset page of the result instead of the
+        row-capped whole; done then carries next_cursor, and pages after the
+        first are not recorded as new conversation turns. Unless resolution is
+        "full", unpaged results are reduced for charting (time buckets, and
+        LTTB when not streaming) and a reduction event says how.
+        """
+        
+        self.prefetcher.foreground_in_flight += 1
+        try:
+            # Get conversation context if available
+            context = None
+            if conversation_id:
+                try:
+                    context = await self.conversation_manager.get_context_for_followup_async(conversation_id)
+                except Exception:
+                    conversation_id = None  # Reset if conversation not found
+            
+            # Generate validated SQL (rules, parse cache, then LLM), relaying LLM tokens as they arrive
+            if pregenerated is not None:
+                generated = pregenerated
+            elif stream_tokens:
+                tokens: asyncio.Queue = asyncio.Queue()
+                
+                async def generate() -> Dict[str, Any]:
+                    try:
+                        return await self._generate_sql_async(prompt, context, on_token=tokens.put_nowait, llm_limit=llm_limit)
+                    finally:
+                        tokens.put_nowait(None)
+                
+                generation = asyncio.create_task(generate())
+                try:
+                    while (token := await tokens.get()) is not None:
+                        yield "token", {"token": token}
+                finally:
+                    # A client that disconnects mid-stream must not leave generation holding its llm_limit slot
+                    if not generation.done():
+                        generation.cancel()
+                    elif not generation.cancelled():
+                        generation.exception()
+                generated = await generation
+            else:
+                generated = await self._generate_sql_async(prompt, context, llm_limit=llm_limit)
+            sql = generated["sql"]
+            paged = page_size is not None or cursor is not None
+            warnings = generated["warnings"]
+            if paged:
+                # Pages drop the default LIMIT the warning announces
+                warnings = [warning for warning in warnings if "missing LIMIT" not in warning]
+            
+            yield "sql", {
+                "sql": sql,
+                "warnings": warnings,
+                "parse_cache": generated["parse_cache"],
+                "parser": generated["parser"],
+                "speculative": pregenerated is not None
+            }
+            
+            # Execute query (or one keyset page of it)
+            page = None
+            run_sql = sql
+            if paged:
+                base_sql = self.safety_validator.remove_default_limit(sql)
+                async with db_limit or nullcontext():
+                    page_columns = None if cursor else await self.query_executor.result_columns_async(base_sql)
+                page = self._plan_page(base_sql, "table", page_size, cursor, page_columns)
+                run_sql = page["sql"]
+            page_warnings = page["warnings"] if page else []
+            rollup = None
+            
+            # Raw order_date series run at a grain that bounds the points
+            resolution = self._chart_resolution(resolution, "table", page)
+            run_sql, time_bucket = await self.chart_reducer.bucket_async(run_sql) if resolution == "auto" else (run_sql, None)
+            
+            if stream_execution:
+                # Server-side cursor: rows are relayed batch by batch and only the first is kept
+                reduction = {"time_bucket": time_bucket, "downsampled": None} if time_bucket else None
+                columns: List[str] = []
+                rows: List[List[Any]] = []
+                row_count = 0
+                last_row = None
+                repeats = 0
+                async with db_limit or nullcontext():
+                    async for event, data in self.query_executor.stream_query_async(run_sql, row_batch_size, user_id=user_id):
+                        if event == "summary":
+                            rollup = data.get("rollup")
+                            if data["warnings"] or page_warnings or time_bucket:
+                                yield "warnings", {
+                                    "warnings": warnings + page_warnings + data["warnings"] + self._reduction_warnings(reduction),
+                                    "truncated": data["truncated"]
+                                }
+                            continue
+                        if event == "columns":
+                            columns = data["columns"]
+                        else:
+                            if not rows:
+                                rows = data["rows"]
+                            row_count += len(data["rows"])
+                            for row in data["rows"]:
+                                repeats = repeats + 1 if row == last_row else 1
+                                last_row = row
+                        yield event, data
+                if page is not None:
+                    next_cursor = self.paginator.next_cursor(page, columns, row_count, last_row, repeats)
+                
+                # Infer chart type from the first batch
+                profile = self.chart_inference_engine.profiler.profile_rows(columns, rows)
+                chart_type = self.chart_inference_engine.infer_chart_type(columns, rows, sql, profile)
+            else:
+                async with db_limit or nullcontext():
+                    execution_result = await self.query_executor.execute_query_async(run_sql, user_id=user_id)
+                
+                # Infer chart type, then reduce a long line chart before sending any rows
+                profile = self._profile(execution_result)
+                chart_type = self.chart_inference_engine.infer_chart_type(execution_result["columns"], execution_result["rows"], sql, profile)
+                execution_result, reduction = self._reduce(execution_result, chart_type, time_bucket, resolution)
+                columns = execution_result["columns"]
+                rows = execution_result["rows"]
+                rollup = execution_result.get("rollup")
+                if page_warnings or execution_result.get("warnings") or reduction:
+                    # Page ordering fallback, cost guard limits or chart reduction
+                    yield "warnings", {
+                        "warnings": warnings + page_warnings + execution_result.get("warnings", []) + self._reduction_warnings(reduction)
+                    }
+                if page is not None:
+                    next_cursor = self._next_cursor(page, execution_result)
+                
+                yield "columns", {"columns": columns}
+                if row_batch_size:
+                    for offset in range(0, len(rows), row_batch_size):
+                        yield "rows", {"rows": rows[offset:offset + row_batch_size]}
+                else:
+                    yield "rows", {"rows": rows}
+            self._remember_example(prompt, generated)
+            
+            yield "inferred_chart", {"inferred_chart": chart_type, "profile": profile}
+            if reduction:
+                yield "reduction", {"reduction": reduction}
+            
+            # Build explanation
+            final_explain = self.explain_builder.build_explanation(sql)
+            yield "explain", {"explain": self._with_rollup(final_explain, rollup)}
+            
+            # Update conversation if applicable (later pages of a result are not new turns)
+            if cursor is None:
+                if not conversation_id:
+                    conversation_id = await self.conversation_manager.create_conversation_async(user_id)
+                await self.conversation_manager.add_turn_async(conversation_id, prompt, sql, final_explain)
+                
+                if prefetch:
+                    self.prefetcher.schedule(conversation_id, prompt, sql, final_explain, partial(self._speculate, user_id=user_id))
+            
+            done: Dict[str, Any] = {"conversation_id": conversation_id}
+            if page is not None:
+                done["next_cursor"] = next_cursor
+            yield "done", done
+            
+        except UnsafeQueryError as e:
+            raise NLQException(f"Unsafe query detected: {str(e)}")
+        except Exception as e:
+            raise NLQException(f"NLQ processing failed: {str(e)}")
+        finally:
+            self.prefetcher.foreground_in_flight -= 1
+    
+    async def parse_only_async(self, prompt: str, conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        """Parse NLQ to SQL without execution, without blocking the event loop"""
+        
+        try:
+            # Get conversation context if available
+            context = None
+            if conversation_id:
+                try:
+                    context = await self.conversation_manager.get_context_for_followup_async(conversation_id)
+                except Exception:
+                    conversation_id = None
+            
+            # Generate validated SQL (rules, parse cache, then LLM)
+            generated = await self._generate_sql_async(prompt, context)
+            sql = generated["sql"]
+            warnings = generated["warnings"]
+            
+            # Build explanation
+            final_explain = self.explain_builder.build_explanation(sql)
+            
+            return {
+                "sql": sql,
+                "warnings": warnings,
+                "explain": final_explain,
+                "conversation_id": conversation_id or "new",
+                "parse_cache": generated["parse_cache"],
+                "parser": generated["parser"]
+            }
+            
+        except UnsafeQueryError as e:
+            raise NLQException(f"Unsafe query detected: {str(e)}")
+        except Exception as e:
+            raise NLQException(f"NLQ parsing failed: {str(e)}")
+    
+    async def execute_sql_async(
+        self,
+        sql: str,
+        result_format: str = "table",
+        user_id: Optional[int] = None,
+        page_size: Optional[int] = None,
+        cursor: Optional[str] = None,
+        resolution: str = "auto"
+    ) -> Dict[str, Any]:
+        """Execute SQL query directly without blocking the event loop"""
+        
+        try:
+            # Validate SQL safety
+            warnings = self.safety_validator.validate_query(sql)
+            
+            page = None
+            if page_size is not None or cursor is not None:
+                # The page size bounds the rows instead of the default LIMIT
+                columns = None if cursor else await self.query_executor.result_columns_async(sql)
+                page = self._plan_page(sql, result_format, page_size, cursor, columns)
+                warnings = [warning for warning in warnings if "missing LIMIT" not in warning] + page["warnings"]
+                sql = page["sql"]
+            else:
+                # Add LIMIT if missing
+                sql = self.safety_validator.add_limit_if_missing(sql)
+            
+            # Execute query (raw order_date series at a grain that bounds the points)
+            resolution = self._chart_resolution(resolution, result_format, page)
+            sql, time_bucket = await self.chart_reducer.bucket_async(sql) if resolution == "auto" else (sql, None)
+            execution_result = await self.query_executor.execute_query_async(sql, result_format, user_id)
+            
+            # Infer chart type from the executor's column profile
+            profile = self._profile(execution_result)
+            chart_type = self.chart_inference_engine.infer_chart_type(
+                execution_result["columns"],
+                self.query_executor.sample_rows(execution_result),
+                sql,
+                profile
+            )
+            execution_result, reduction = self._reduce(execution_result, chart_type, time_bucket, resolution)
+            
+            response = {
+                "columns": execution_result["columns"],
+                "inferred_chart": chart_type,
+                "profile": profile,
+                "warnings": warnings + execution_result.get("warnings", []) + self._reduction_warnings(reduction),
+                "reduction": reduction
+            }
+            # rows (table), series or arrow depending on result_format, plus row_count for the columnar shapes
+            for field in ("rows", "series", "arrow", "row_count"):
+                if field in execution_result:
+                    response[field] = execution_result[field]
+            if page is not None:
+                response["next_cursor"] = self._next_cursor(page, execution_result)
+            return response
+            
+        except UnsafeQueryError as e:
+            raise NLQException(f"Unsafe query detected: {str(e)}")
+        except Exception as e:
+            raise NLQException(f"SQL execution failed: {str(e)}")
+    
+    async def stream_execute_sql(
+        self,
+        sql: str,
+        row_batch_size: Optional[int] = None,
+        user_id: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Execute SQL directly on a server-side cursor, yielding columns, row batches, inferred_chart and done"""
+        
+        try:
+            # Validate SQL safety
+            warnings = self.safety_validator.validate_query(sql)
+            
+            # Add LIMIT if missing
+            sql = self.safety_validator.add_limit_if_missing(sql)
+            
+            columns: List[str] = []
+            sample: List[List[Any]] = []
+            summary: Dict[str, Any] = {}
+            async for event, data in self.query_executor.stream_query_async(sql, row_batch_size, user_id=user_id):
+                if event == "summary":
+                    summary = data
+                    continue
+                if event == "columns":
+                    columns = data["columns"]
+                elif not sample:
+                    sample = data["rows"]
+                yield event, data
+            
+            # Infer chart type from the first batch
+            profile = self.chart_inference_engine.profiler.profile_rows(columns, sample)
+            chart_type = self.chart_inference_engine.infer_chart_type(columns, sample, sql, profile)
+            yield "inferred_chart", {"inferred_chart": chart_type, "profile": profile}
+            
+            yield "done", {
+                "row_count": summary["row_count"],
+                "truncated": summary["truncated"],
+                "warnings": warnings + summary["warnings"]
+            }
+            
+        except UnsafeQueryError as e:
+            raise NLQException(f"Unsafe query detected: {str(e)}")
+        except Exception as e:
+            raise NLQException(f"SQL execution failed: {str(e)}")
+    
+    async def refine_conversation_async(self, conversation_id: str, followup: str, user_id: int = 1) -> Dict[str, Any]:
+        """Handle follow-up query in conversation context without blocking the event loop"""
+        
+        try:
+            # Get refinement context
+            refinement_context = await self.conversation_manager.refine_query_async(conversation_id, followup)
+            
+            # Build refined prompt
+            original_query = refinement_context["original_query"]
+            refined_prompt = f"{original_query}. {followup}"
+            
+            # Serve a speculative result for this drill-down if one was prefetched
+            speculative = await self._speculative_result(conversation_id, refinement_context, followup)
+            
+            # Parse and execute refined query
+            result: Dict[str, Any] = {}
+            async for event, data in self.stream_parse_and_execute(
+                refined_prompt, conversation_id, user_id, pregenerated=speculative
+            ):
+                result.update(data)
+            return result
+            
+        except Exception as e:
+            raise NLQException(f"Conversation refinement failed: {str(e)}")
+    
+    async def stream_refine_conversation(
+        self,
+        conversation_id: str,
+        followup: str,
+        user_id: int = 1,
+        stream_tokens: bool = False,
+        row_batch_size: Optional[int] = None,
+        stream_execution: bool = False
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Handle follow-up query in conversation context, yielding stage events"""
+        
+        try:
+            # Get refinement context
+            refinement_context = await self.conversation_manager.refine_query_async(conversation_id, followup)
+        except Exception as e:
+            raise NLQException(f"Conversation refinement failed: {str(e)}")
+        
+        # Build refined prompt
+        refined_prompt = f"{refinement_context['original_query']}. {followup}"
+        speculative = await self._speculative_result(conversation_id, refinement_context, followup)
+        
+        async for event, data in self.stream_parse_and_execute(
+            refined_prompt, conversation_id, user_id, stream_tokens, row_batch_size,
+            pregenerated=speculative, stream_execution=stream_execution
+        ):
+            yield event, data
+    
+    def _generate_sql(self, prompt: str, context: Optional[str]) -> Dict[str, Any]:
+        """Resolve a prompt to validated SQL via the rule-based fast path, parse cache or LLM"""
+        rule_response = self._parse_with_rules(prompt)
+        if rule_response:
+            return self._served_by_rules(rule_response)
+        
+        cache_key = self.parse_cache.make_key(prompt, context)
+        cached = self.parse_cache.get(cache_key)
+        try:
+            llm_response = cached or self.llm_singleflight.do(
+                cache_key, lambda: self.llm_client.generate_sql(prompt, context)
+            )
+        except LLMError as e:
+            return self._degraded_to_rules(prompt, e)
+        
+        validated = self._validate_generated(llm_response)
+        
+        # Only cache responses that passed validation
+        if not cached:
+            self.parse_cache.set(cache_key, llm_response)
+        
+        return self._served_by_llm(validated, cached is not None)
+    
+    async def _generate_sql_async(
+        self,
+        prompt: str,
+        context: Optional[str],
+        on_token: Optional[Callable[[str], None]] = None,
+        llm_limit: Optional[asyncio.Semaphore] = None,
+        llm_gate: Optional[Callable[[], bool]] = None
+    ) -> Dict[str, Any]:
+        """Resolve a prompt to validated SQL without blocking the event loop"""
+        rule_response = self._parse_with_rules(prompt)
+        if rule_response:
+            return self._served_by_rules(rule_response)
+        
+        cache_key = self.parse_cache.make_key(prompt, context)
+        cached = await self.parse_cache.get_async(cache_key)
+        if not cached:
+            if llm_gate and not llm_gate():
+                raise NLQException("LLM call not permitted for this request")
+            
+            # Only the LLM call itself counts against the limit; rules and cache hits bypass it
+            try:
+                async with llm_limit or nullcontext():
+                    llm_response = await self.llm_singleflight.do_async(
+                        cache_key, lambda: self.llm_client.generate_sql_async(prompt, context, on_token)
+                    )
+            except LLMError as e:
+                return self._degraded_to_rules(prompt, e)
+        else:
+            llm_response = cached
+        
+        validated = self._validate_generated(llm_response)
+        
+        # Only cache responses that passed validation
+        if not cached:
+            await self.parse_cache.set_async(cache_key, llm_response)
+        
+        return self._served_by_llm(validated, cached is not None)
+    
+    async def _speculative_result(
+        self,
+        conversation_id: str,
+        refinement_context: Dict[str, Any],
+        followup: str
+    ) -> Optional[Dict[str, Any]]:
+        """Prefetched SQL for this follow-up, if any, and learn from the follow-up either way"""
+        self.prefetcher.record_followup(followup)
+        return await self.prefetcher.lookup_async(conversation_id, refinement_context["original_sql"], followup)
+    
+    async def _speculate(
+        self,
+        conversation_id: str,
+        refined_prompt: str,
+        llm_gate: Callable[[], bool],
+        user_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Resolve and execute a candidate follow-up to warm the parse and query caches, as the turn's user"""
+        context = await self.conversation_manager.get_context_for_followup_async(conversation_id)
+        generated = await self._generate_sql_async(refined_prompt, context, llm_gate=llm_gate)
+        run_sql, _ = await self.chart_reducer.bucket_async(generated["sql"])
+        await self.query_executor.execute_query_async(run_sql, user_id=user_id)
+        return generated
+    
+    def _parse_with_rules(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """Try the deterministic parser according to the configured parser mode"""
+        if self.parser_mode == "llm":
+            return None
+        
+        rule_response = self.rule_parser.parse(prompt)
+        
+        if self.parser_mode == "rules":
+            if rule_response is None:
+                raise NLQException("Rule-based parser could not interpret the prompt")
+            return rule_response
+        
+        # Auto mode: hand off to the LLM when confidence is low
+        if rule_response and rule_response["confidence"] >= settings.RULE_PARSER_MIN_CONFIDENCE:
+            return rule_response
+        return None
+    
+    def _plan_page(
+        self,
+        sql: str,
+        result_format: str,
+        page_size: Optional[int],
+        cursor: Optional[str],
+        columns: Optional[List[str]]
+    ) -> Dict[str, Any]:
+        """Keyset page of sql, for the row-major and columnar formats"""
+        if result_format == "arrow":
+            raise PaginationError("Pagination supports the table and series result formats")
+        return self.paginator.plan_page(sql, cursor, columns, page_size)
+    
+    def _next_cursor(self, page: Dict[str, Any], execution_result: Dict[str, Any]) -> Optional[str]:
+        """Cursor for the page after the one in execution_result"""
+        columns = execution_result["columns"]
+        rows = list(zip(*execution_result["series"])) if "series" in execution_result else execution_result["rows"]
+        row_count = len(rows)
+        last_row = list(rows[-1]) if row_count else None
+        return self.paginator.next_cursor(page, columns, row_count, last_row, self.paginator.trailing_repeats(rows))
+    
+    def _chart_resolution(self, resolution: str, result_format: str, page: Optional[Dict[str, Any]]) -> str:
+        """Requested resolution, or "full" where reduction does not apply (Arrow exports and keyset pages)"""
+        return "full" if result_format == "arrow" or page is not None else resolution
+    
+    def _profile(self, execution_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """The executor's column profile, or one from the rows for results cached before profiles were stored"""
+        if "profile" in execution_result:
+            return execution_result["profile"]
+        return self.chart_inference_engine.profiler.profile_rows(
+            execution_result["columns"], self.query_executor.sample_rows(execution_result)
+        )
+    
+    def _reduce(
+        self,
+        execution_result: Dict[str, Any],
+        chart_type: Optional[str],
+        time_bucket: Optional[str],
+        resolution: str
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Downsample a long line chart unless resolution is "full"; returns the result and what was reduced, if anything"""
+        downsampled = None
+        if resolution == "auto":
+            execution_result, downsampled = self.chart_reducer.downsample(execution_result, chart_type)
+        if time_bucket is None and downsampled is None:
+            return execution_result, None
+        return execution_result, {"time_bucket": time_bucket, "downsampled": downsampled}
+    
+    def _reduction_warnings(self, reduction: Optional[Dict[str, Any]]) -> List[str]:
+        """Notices that the result was reduced for charting and how to get every row"""
+        if not reduction:
+            return []
+        warnings = []
+        if reduction["time_bucket"]:
+            warnings.append(
+                f"Grouped by {reduction['time_bucket']} instead of day to stay within {self.chart_reducer.max_points} "
+                f"chart points; request resolution 'full' for daily rows"
+            )
+        if reduction["downsampled"]:
+            downsampled = reduction["downsampled"]
+            warnings.append(
+                f"Showing {downsampled['rows']} of {downsampled['source_rows']} rows, chosen to keep the line's shape; "
+                f"request resolution 'full' for every row"
+            )
+        return warnings
+    
+    def _with_rollup(self, explain: Dict[str, Any], rollup: Optional[str]) -> Dict[str, Any]:
+        """Explain object naming the rollup that answered the query, if one did (turns keep the plain one)"""
+        return {**explain, "rollup": rollup} if rollup else explain
+    
+    def _remember_example(self, prompt: str, generated: Dict[str, Any]) -> None:
+        """Keep a cleanly validated and executed pair as a future few-shot example"""
+        # The default LIMIT is added to most generated SQL and says nothing about its quality
+        warnings = [warning for warning in generated["warnings"] if "missing LIMIT" not in warning]
+        if settings.FEWSHOT_ENABLED and not warnings:
+            self.few_shot_store.record(prompt, generated["sql"])
+    
+    def _served_by_rules(self, rule_response: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate a rule-based parse and tag its path"""
+        validated = self._validate_generated(rule_response)
+        validated["parse_cache"] = None
+        validated["parser"] = "rules"
+        self.parser_counts["rules"] += 1
+        return validated
+    
+    def _degraded_to_rules(self, prompt: str, error: LLMError) -> Dict[str, Any]:
+        """Answer with the rule-based parser at any confidence when the LLM is unavailable"""
+        rule_response = self.rule_parser.parse(prompt)
+        if rule_response is None:
+            raise error
+        
+        validated = self._served_by_rules(rule_response)
+        validated["warnings"] = validated["warnings"] + ["LLM unavailable; answered by the rule-based parser"]
+        return validated
+    
+    def _served_by_llm(self, validated: Dict[str, Any], cache_hit: bool) -> Dict[str, Any]:
+        """Tag an LLM (or cached LLM) parse with its path"""
+        validated["parse_cache"] = "hit" if cache_hit else "miss"
+        validated["parser"] = "llm"
+        if not cache_hit:
+            self.parser_counts["llm"] += 1
+        return validated
+    
+    def _validate_generated(self, llm_response: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate generated SQL and enforce the row limit"""
+        sql = llm_response["sql"]
+        
+        # Validate SQL safety
+        warnings = self.safety_validator.validate_query(sql)
+        
+        # Add LIMIT if missing
+        sql = self.safety_validator.add_limit_if_missing(sql)
+        
+        return {"sql": sql, "warnings": warnings}
 
 # Global NLQ parser instance
 nlq_parser = NLQParser()
@@ -0,0 +1,367 @@
+"""
+Keyset Pagination
+Pages through query results with opaque cursors over the query's ORDER BY, so every page costs the same
+"""
+
+import re
+import hmac
+import json
+import base64
+import hashlib
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from app.core.config import settings
+from app.core.exceptions import PaginationError
+from app.core.serialization import json_default
+
+# Clause keywords that end a top-level ORDER BY
+ORDER_BY_END = re.compile(r"\b(LIMIT|OFFSET|FETCH|FOR)\b", re.IGNORECASE)
+ORDER_ITEM = re.compile(r"^(.*?)(?:\s+(ASC|DESC))?(?:\s+NULLS\s+(?:FIRST|LAST))?$", re.IGNORECASE | re.DOTALL)
+SELECT_ALIAS = re.compile(r"^(.*?)\s+(?:AS\s+)?(\"[^\"]+\"|[A-Za-z_][A-Za-z0-9_]*)$", re.IGNORECASE | re.DOTALL)
+
+class KeysetPaginator:
+    """Rewrites a query into one page of itself and encodes where the next page starts
+    
+    Sort keys are (column, descending) pairs over the result columns: the
+    query's ORDER BY, then every other column as a tie-breaker. Each page is
+    the query wrapped as a subquery, filtered to rows at or after the previous
+    page's last key and limited to the page size, so earlier pages are never
+    re-read through OFFSET however deep the page. Rows that tie on every key
+    are identical, so the cursor also counts the copies of its last row
+    already sent and the next page's OFFSET skips just those; duplicates are
+    neither dropped nor repeated at a page boundary.
+    """
+    
+    def __init__(self):
+        self.default_page_size = settings.PAGE_SIZE_DEFAULT
+        self.max_page_size = settings.PAGE_SIZE_MAX
+    
+    def page_size(self, requested: Optional[int] = None) -> int:
+        """Requested page size clamped to the allowed range"""
+        return max(1, min(requested or self.default_page_size, self.max_page_size))
+    
+    def plan_page(
+        self,
+        sql: str,
+        cursor: Optional[str] = None,
+        columns: Optional[List[str]] = None,
+        page_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """SQL for one page plus the state needed to build the next cursor
+        
+        The first page needs the query's result columns to choose sort keys;
+        later pages take them from the cursor.
+        """
+        warnings: List[str] = []
+        if cursor:
+            keys, after, sent = self.decode_cursor(sql, cursor)
+        else:
+            if columns is None:
+                raise PaginationError("Result columns are required for the first page")
+            keys, warnings = self.sort_keys(sql, columns)
+            after, sent = None, 0
+        
+        size = self.page_size(page_size)
+        return {
+            "sql": self.page_sql(sql, keys, after, size, sent),
+            "base_sql": sql,
+            "keys": keys,
+            "after": after,
+            "sent": sent,
+            "page_size": size,
+            "warnings": warnings
+        }
+    
+    def next_cursor(
+        self,
+        page: Dict[str, Any],
+        columns: List[str],
+        row_count: int,
+        last_row: Optional[List[Any]],
+        repeats: int = 1
+    ) -> Optional[str]:
+        """Cursor for the page after this one, or None when this page was the last
+        
+        repeats is how many copies of last_row end this page (see trailing_repeats).
+        """
+        if row_count < page["page_size"] or last_row is None:
+            return None
+        values = [last_row[columns.index(column)] for column, _ in page["keys"]]
+        if repeats >= row_count and page["after"] is not None and self._same_values(values, page["after"]):
+            repeats += page["sent"]  # The whole page was more copies of the previous cursor's row
+        return self.encode_cursor(page["base_sql"], page["keys"], values, repeats)
+    
+    def trailing_repeats(self, rows: Sequence[Sequence[Any]]) -> int:
+        """Copies of the last row at the end of a page; identical rows are adjacent in page order"""
+        count = 0
+        for row in reversed(rows):
+            if list(row) != list(rows[-1]):
+                break
+            count += 1
+        return count
+    
+    def sort_keys(self, sql: str, columns: List[str]) -> Tuple[List[Tuple[str, bool]], List[str]]:
+        """Total ordering over the result columns, starting with the query's ORDER BY"""
+        if not columns:
+            raise PaginationError("Result has no columns to page on")
+        if len(set(columns)) != len(columns):
+            # Rows could then tie on every key without being identical
+            raise PaginationError("Result column names must be distinct to page; alias the repeated columns")
+        
+        keys: List[Tuple[str, bool]] = []
+        warnings: List[str] = []
+        aliases = self._select_aliases(sql)
+        for expression, descending in self._order_by_items(sql):
+            column = self._resolve(expression, columns, aliases)
+            if column is None:
+                warnings.append(
+                    f"Pages are ordered by the result columns because ORDER BY {expression} is not a result column"
+                )
+                keys = []
+                break
+            if column not in {key for key, _ in keys}:
+                keys.append((column, descending))
+        
+        # Remaining columns break ties so page boundaries are stable
+        ordered = {key for key, _ in keys}
+        keys += [(column, False) for column in columns if column not in ordered]
+        return keys, warnings
+    
+    def page_sql(
+        self,
+        sql: str,
+        keys: List[Tuple[str, bool]],
+        after: Optional[List[Any]],
+        page_size: int,
+        sent: int = 0
+    ) -> str:
+        """Wrap sql as one keyset page starting at after, skipping the sent copies of that row"""
+        order_by = ", ".join(
+            f"{self._quote(column)} {'DESC NULLS FIRST' if descending else 'ASC NULLS LAST'}"
+            for column, descending in keys
+        )
+        where = f" WHERE {self._from_predicate(keys, after)}" if after is not None else ""
+        # Copies of the cursor row sort before every later row, so OFFSET skips exactly the ones sent
+        offset = f" OFFSET {int(sent)}" if after is not None and sent else ""
+        return f"SELECT * FROM ({self._strip_order_by(sql)}) AS page_source{where} ORDER BY {order_by} LIMIT {int(page_size)}{offset}"
+    
+    def encode_cursor(self, sql: str, keys: List[Tuple[str, bool]], values: List[Any], sent: int = 1) -> str:
+        """Opaque cursor holding the sort keys, the last row's key values and how many copies of it were sent"""
+        payload = {
+            "k": [[column, descending] for column, descending in keys],
+            "v": self._cursor_values(values),
+            "d": sent,
+            "q": self._digest(sql, keys)
+        }
+        return base64.urlsafe_b64encode(json.dumps(payload, default=json_default).encode()).decode().rstrip("=")
+    
+    def decode_cursor(self, sql: str, cursor: str) -> Tuple[List[Tuple[str, bool]], List[Any], int]:
+        """Sort keys, last key values and copies sent from a cursor issued for this query"""
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            keys = [(str(column), bool(descending)) for column, descending in payload["k"]]
+            values = [
+                Decimal(value["decimal"]) if isinstance(value, dict) else value
+                for value in payload["v"]
+            ]
+            sent = payload["d"]
+        except (ValueError, TypeError, KeyError, InvalidOperation):
+            raise PaginationError("Invalid page cursor")
+        
+        if len(keys) != len(values) or any(not self._is_literal(value) for value in values):
+            raise PaginationError("Invalid page cursor")
+        if not isinstance(sent, int) or isinstance(sent, bool) or sent < 1:
+            raise PaginationError("Invalid page cursor")
+        if not hmac.compare_digest(str(payload.get("q")), self._digest(sql, keys)):
+            raise PaginationError("Page cursor does not belong to this query; request the first page again")
+        return keys, values, sent
+    
+    def _from_predicate(self, keys: List[Tuple[str, bool]], after: List[Any]) -> str:
+        """Rows that equal the given key values or sort after them"""
+        equal = " AND ".join(self._equals(self._quote(column), value) for (column, _), value in zip(keys, after))
+        return f"({equal}) OR {self._after_predicate(keys, after)}"
+    
+    def _after_predicate(self, keys: List[Tuple[str, bool]], after: List[Any]) -> str:
+        """Rows that sort after the given key values, with NULLs last ascending and first descending"""
+        disjuncts = []
+        for index, (column, descending) in enumerate(keys):
+            step = self._after_column(self._quote(column), after[index], descending)
+            if step is None:
+                continue
+            equal = [self._equals(self._quote(key), value) for (key, _), value in zip(keys[:index], after[:index])]
+            disjuncts.append("(" + " AND ".join(equal + [step]) + ")")
+        return " OR ".join(disjuncts) if disjuncts else "1 = 0"
+    
+    def _after_column(self, column: str, value: Any, descending: bool) -> Optional[str]:
+        """Condition for a column value sorting strictly after value, or None if nothing can"""
+        if value is None:
+            return f"{column} IS NOT NULL" if descending else None
+        if descending:
+            return f"{column} < {self._literal(value)}"
+        return f"({column} > {self._literal(value)} OR {column} IS NULL)"
+    
+    def _equals(self, column: str, value: Any) -> str:
+        """NULL-safe equality with a literal"""
+        return f"{column} IS NULL" if value is None else f"{column} = {self._literal(value)}"
+    
+    def _literal(self, value: Any) -> str:
+        """SQL literal for a cursor value"""
+        if isinstance(value, bool):
+            return "TRUE" if value else "FALSE"
+        if isinstance(value, (int, float)):
+            return repr(value)
+        if isinstance(value, Decimal):
+            return format(value, "f")
+        return "'" + str(value).replace("'", "''") + "'"
+    
+    def _is_literal(self, value: Any) -> bool:
+        """Whether a decoded cursor value can be rendered as a literal"""
+        if isinstance(value, float):
+            return value == value and value not in (float("inf"), float("-inf"))
+        if isinstance(value, Decimal):
+            return value.is_finite()
+        return value is None or isinstance(value, (bool, int, str))
+    
+    def _quote(self, column: str) -> str:
+        """Quoted identifier for a result column"""
+        return '"' + column.replace('"', '""') + '"'
+    
+    def _same_values(self, values: List[Any], cursor_values: List[Any]) -> bool:
+        """Whether row key values equal decoded cursor values, compared in their cursor form"""
+        encoded = [json.loads(json.dumps(self._cursor_values(side), default=json_default)) for side in (values, cursor_values)]
+        return encoded[0] == encoded[1]
+    
+    def _cursor_values(self, values: List[Any]) -> List[Any]:
+        """Key values for a cursor, with decimals kept exact (as floats they would no longer equal the row)"""
+        return [{"decimal": format(value, "f")} if isinstance(value, Decimal) else value for value in values]
+    
+    def _digest(self, sql: str, keys: List[Tuple[str, bool]]) -> str:
+        """Ties a cursor to the query and sort keys it was issued for; keyed so clients cannot forge one"""
+        message = json.dumps([" ".join(sql.split()), keys]).encode()
+        return hmac.new(settings.JWT_SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()[:32]
+    
+    def _order_by_items(self, sql: str) -> List[Tuple[str, bool]]:
+        """(expression, descending) for each item of the query's top-level ORDER BY"""
+        span = self._order_by_span(sql)
+        if span is None:
+            return []
+        items = []
+        for item in self._split_top_level(sql[span[1]:span[2]]):
+            match = ORDER_ITEM.match(item.strip())
+            items.append((match.group(1).strip(), (match.group(2) or "").upper() == "DESC"))
+        return items
+    
+    def _order_by_span(self, sql: str) -> Optional[Tuple[int, int, int]]:
+        """(clause start, items start, items end) of the top-level ORDER BY"""
+        depth = 0
+        in_string = False
+        span = None
+        index = 0
+        while index < len(sql):
+            char = sql[index]
+            if char == "'":
+                in_string = not in_string
+            elif not in_string:
+                if char == "(":
+                    depth += 1
+                elif char == ")":
+                    depth -= 1
+                elif depth == 0:
+                    match = re.match(r"ORDER\s+BY\b", sql[index:], re.IGNORECASE)
+                    if match and (index == 0 or not (sql[index - 1].isalnum() or sql[index - 1] == "_")):
+                        span = (index, index + match.end())
+                        index += match.end()
+                        continue
+            index += 1
+        if span is None:
+            return None
+        
+        end = len(sql.rstrip().rstrip(";"))
+        for match in ORDER_BY_END.finditer(sql, span[1]):
+            if self._depth_at(sql, match.start()) == 0:
+                end = match.start()
+                break
+        return span[0], span[1], end
+    
+    def _strip_order_by(self, sql: str) -> str:
+        """Query without a top-level ORDER BY the page ordering replaces (kept when it feeds a LIMIT)"""
+        sql = sql.strip().rstrip(";")
+        span = self._order_by_span(sql)
+        if span is None or sql[span[2]:].strip():
+            return sql
+        return sql[:span[0]].rstrip()
+    
+    def _select_aliases(self, sql: str) -> Dict[str, str]:
+        """Normalized select-list expression -> output alias, for ORDER BY expressions that repeat them"""
+        match = re.match(r"\s*SELECT\s+(?:DISTINCT\s+)?", sql, re.IGNORECASE)
+        if not match:
+            return {}
+        end = len(sql)
+        for from_match in re.finditer(r"\bFROM\b", sql, re.IGNORECASE):
+            if self._depth_at(sql, from_match.start()) == 0:
+                end = from_match.start()
+                break
+        
+        aliases = {}
+        for item in self._split_top_level(sql[match.end():end]):
+            alias_match = SELECT_ALIAS.match(item.strip())
+            if alias_match and not alias_match.group(1).strip().endswith((".", "(")):
+                aliases[self._normalize(alias_match.group(1))] = alias_match.group(2).strip('"')
+        return aliases
+    
+    def _resolve(self, expression: str, columns: List[str], aliases: Dict[str, str]) -> Optional[str]:
+        """Result column an ORDER BY expression refers to"""
+        if expression.isdigit():
+            position = int(expression) - 1
+            return columns[position] if 0 <= position < len(columns) else None
+        
+        candidates = [aliases.get(self._normalize(expression), "")]
+        if re.fullmatch(r"(?:[A-Za-z_][A-Za-z0-9_]*\.)?(?:\"[^\"]+\"|[A-Za-z_][A-Za-z0-9_]*)", expression):
+            candidates.append(expression.split(".")[-1])
+        for candidate in candidates:
+            if candidate.startswith('"'):
+                if candidate.strip('"') in columns:
+                    return candidate.strip('"')
+                continue
+            for column in columns:
+                if candidate and column.lower() == candidate.lower():
+                    return column
+        return None
+    
+    def _split_top_level(self, text: str) -> List[str]:
+        """Split on commas outside parentheses and string literals"""
+        parts = []
+        depth = 0
+        in_string = False
+        start = 0
+        for index, char in enumerate(text):
+            if char == "'":
+                in_string = not in_string
+            elif not in_string:
+                if char == "(":
+                    depth += 1
+                elif char == ")":
+                    depth -= 1
+                elif char == "," and depth == 0:
+                    parts.append(text[start:index])
+                    start = index + 1
+        parts.append(text[start:])
+        return [part for part in parts if part.strip()]
+    
+    def _depth_at(self, sql: str, position: int) -> int:
+        """Parenthesis depth at a position, ignoring string literals"""
+        depth = 0
+        in_string = False
+        for char in sql[:position]:
+            if char == "'":
+                in_string = not in_string
+            elif not in_string:
+                depth += {"(": 1, ")": -1}.get(char, 0)
+        return depth if not in_string else -1
+    
+    def _normalize(self, expression: str) -> str:
+        """Case- and whitespace-insensitive form of an expression"""
+        return " ".join(expression.lower().split())
+
+# Global keyset paginator instance
+keyset_paginator = KeysetPaginator()
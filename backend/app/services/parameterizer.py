@@ -0,0 +1,181 @@
+"""
+SQL Parameterizer
+Lifts literals out of generated SQL into bound parameters, so equivalent queries share a shape, a cache entry and a plan
+"""
+
+import re
+import hashlib
+from collections import Counter
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+from app.services.schema_registry import schema_registry
+
+TOKEN = re.compile(
+    r"(?P<string>'(?:[^']|'')*')"
+    r"|(?P<number>(?<![\w.])\d+(?:\.\d+)?(?![\w.]))"
+    r"|(?P<word>[A-Za-z_][\w$]*)"
+    r"|(?P<op><>|!=|<=|>=|::|[=<>(),;])"
+    r"|(?P<space>\s+)"
+    r"|(?P<other>.)",
+    re.DOTALL
+)
+
+# Literals are only lifted from filters; elsewhere (select list, GROUP BY, function arguments)
+# a parameter would make expressions that must match differ
+FILTER_CLAUSES = {"WHERE", "HAVING"}
+CLAUSE_KEYWORDS = {"SELECT", "FROM", "JOIN", "ON", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "OFFSET", "FETCH", "WINDOW", "UNION", "INTERSECT", "EXCEPT", "WITH"}
+COMPARISONS = {"=", "<>", "!=", "<", "<=", ">", ">=", "LIKE", "ILIKE"}
+# Tokens after which the column just before them is the one a literal is compared to
+SUBJECT_OPERATORS = COMPARISONS | {"IN", "BETWEEN"}
+# Tokens that may follow a lifted literal; anything else (arithmetic, casts, ||) needs the literal's own type
+OPERAND_ENDS = {"", ")", ",", ";", "AND", "OR", "THEN", "ELSE", "END", "WHEN", "ESCAPE"} | CLAUSE_KEYWORDS
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+ISO_DATETIME = re.compile(r"^\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?$")
+INTEGER = re.compile(r"^-?\d+$")
+
+# Distinct shapes tracked for metrics before new ones are only counted in aggregate
+MAX_TRACKED_SHAPES = 1000
+# Characters of each tracked shape's SQL shown in metrics
+SAMPLE_LENGTH = 300
+
+class SQLParameterizer:
+    """Rewrites filter literals as :p0, :p1, ... and tracks how often each query shape runs
+
+    Values take the type of the registry column they are compared to, since
+    asyncpg binds each parameter as that column's type: strings against
+    string columns, ISO dates against date columns, integers against int
+    and float columns. Integers compared to an expression (an aggregate,
+    say) are bound as ints; anything else is left inline for Postgres to
+    read in context, notably decimals, which an integer comparison would
+    otherwise truncate, and strings whose column type is unknown.
+    """
+    
+    def __init__(self):
+        self.schema = schema_registry
+        self.shape_counts: Counter = Counter()
+        self.shape_samples: Dict[str, str] = {}
+        self.untracked_executions = 0
+    
+    def parameterize(self, sql: str) -> Tuple[str, Dict[str, Any]]:
+        """Shape with filter literals replaced by bind parameters, and the parameter values"""
+        tokens = [(match.lastgroup, match.group()) for match in TOKEN.finditer(sql.strip().rstrip(";").strip())]
+        significant = [index for index, (kind, _) in enumerate(tokens) if kind != "space"]
+        
+        params: Dict[str, Any] = {}
+        column_types = self._column_types()
+        # Per parenthesis depth: current clause, whether it is an IN list, whether BETWEEN awaits its AND,
+        # and the type of the column the next literal is compared to
+        clauses: List[str] = [""]
+        in_lists: List[bool] = [False]
+        between: List[bool] = [False]
+        subjects: List[Optional[str]] = [None]
+        previous = ""
+        for position, index in enumerate(significant):
+            kind, value = tokens[index]
+            upper = value.upper() if kind in ("word", "op") else kind
+            
+            if kind in ("string", "number"):
+                following = tokens[significant[position + 1]][1].upper() if position + 1 < len(significant) else ""
+                lifts = clauses[-1] in FILTER_CLAUSES and following in OPERAND_ENDS and (
+                    previous in COMPARISONS
+                    or previous in ("BETWEEN", "BETWEEN AND")
+                    or (previous in ("(", ",") and in_lists[-1])
+                )
+                bound = self._value(kind, value, subjects[-1]) if lifts else None
+                if bound is not None:
+                    name = f"p{len(params)}"
+                    params[name] = bound
+                    tokens[index] = ("param", f":{name}")
+            elif upper == "(":
+                clauses.append(clauses[-1])
+                in_lists.append(previous == "IN")
+                between.append(False)
+                subjects.append(subjects[-1] if previous == "IN" else None)
+            elif upper == ")" and len(clauses) > 1:
+                clauses.pop()
+                in_lists.pop()
+                between.pop()
+                subjects.pop()
+            elif upper in CLAUSE_KEYWORDS:
+                clauses[-1] = upper
+            elif upper == "BETWEEN":
+                between[-1] = True
+            elif upper == "AND" and between[-1]:
+                between[-1] = False
+                upper = "BETWEEN AND"
+            if upper in SUBJECT_OPERATORS:
+                subjects[-1] = self._subject_type(tokens, significant[:position], column_types)
+            previous = upper
+        
+        return "".join(" " if kind == "space" else value for kind, value in tokens), params
+    
+    def shape_key(self, shape: str, params: Dict[str, Any]) -> Tuple[str, str]:
+        """Hashes of a parameterized query's shape and of its parameter values, for cache keys and metrics"""
+        values = repr(sorted((name, type(value).__name__, str(value)) for name, value in params.items()))
+        return self._hash(shape), self._hash(values)
+    
+    def record(self, shape: str) -> None:
+        """Count one execution request of a parameterized query's shape"""
+        shape_hash = self._hash(shape)
+        if shape_hash in self.shape_counts or len(self.shape_counts) < MAX_TRACKED_SHAPES:
+            self.shape_counts[shape_hash] += 1
+            self.shape_samples.setdefault(shape_hash, shape[:SAMPLE_LENGTH])
+        else:
+            self.untracked_executions += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Distinct shapes and the most frequent ones"""
+        return {
+            "distinct_shapes": len(self.shape_counts),
+            "untracked_executions": self.untracked_executions,
+            "top_shapes": [
+                {"shape": shape_hash, "sql": self.shape_samples[shape_hash], "executions": count}
+                for shape_hash, count in self.shape_counts.most_common(10)
+            ]
+        }
+    
+    def _value(self, kind: str, literal: str, column_type: Optional[str]) -> Any:
+        """Python value for a literal compared to a column of column_type, or None to leave it inline"""
+        text = literal[1:-1].replace("''", "'") if kind == "string" else literal
+        if column_type == "string":
+            return text if kind == "string" else None
+        if column_type in ("int", "float"):
+            # A quoted integer against a numeric column is read as the number
+            if not INTEGER.match(text):
+                return None
+            return float(text) if column_type == "float" else int(text)
+        if column_type is None:
+            return int(text) if kind == "number" and text.isdigit() else None
+        try:
+            if column_type == "date" and ISO_DATE.match(text):
+                return date.fromisoformat(text)
+            if column_type in ("datetime", "timestamp") and ISO_DATETIME.match(text):
+                return datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        return None
+    
+    def _subject_type(self, tokens: List[Tuple[str, str]], before: List[int], column_types: Dict[str, str]) -> Optional[str]:
+        """Registry type of the column named just before an operator (skipping NOT), or None for any other operand"""
+        while before and tokens[before[-1]][1].upper() == "NOT":
+            before = before[:-1]
+        if before and tokens[before[-1]][0] == "word":
+            return column_types.get(tokens[before[-1]][1].lower())
+        return None
+    
+    def _column_types(self) -> Dict[str, str]:
+        """Type of each registry column name, leaving out names whose type differs between tables"""
+        types: Dict[str, str] = {}
+        ambiguous = set()
+        for table in self.schema.get_all_tables().values():
+            for column in table.columns:
+                if types.setdefault(column.name.lower(), column.type) != column.type:
+                    ambiguous.add(column.name.lower())
+        return {name: column_type for name, column_type in types.items() if name not in ambiguous}
+    
+    def _hash(self, text: str) -> str:
+        """Short stable digest"""
+        return hashlib.md5(text.encode()).hexdigest()[:12]
+
+# Global SQL parameterizer instance
+sql_parameterizer = SQLParameterizer()
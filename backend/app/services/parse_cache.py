@@ -0,0 +1,231 @@
+"""
+Parse Cache Service
+Memoizes prompt to SQL results keyed on normalized prompt, schema hash and conversation context
+"""
+
+import re
+import json
+import hashlib
+import threading
+import redis
+import redis.asyncio as aioredis
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from app.core.config import settings
+from app.services.schema_registry import schema_registry
+
+MONTHS = {
+    "jan": 1, "january": 1, "feb": 2, "february": 2, "mar": 3, "march": 3,
+    "apr": 4, "april": 4, "may": 5, "jun": 6, "june": 6, "jul": 7, "july": 7,
+    "aug": 8, "august": 8, "sep": 9, "sept": 9, "september": 9, "oct": 10, "october": 10,
+    "nov": 11, "november": 11, "dec": 12, "december": 12
+}
+
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+    "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18,
+    "nineteen": 19, "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "hundred": 100
+}
+
+MONTH_NAMES = [
+    "january", "february", "march", "april", "may", "june",
+    "july", "august", "september", "october", "november", "december"
+]
+
+ORDINAL_WORDS = {"first": 1, "second": 2, "third": 3, "fourth": 4}
+
+# Conversational lead-ins that never change the meaning of a query
+FILLER_PREFIXES = (
+    "please ", "can you ", "could you ", "show me ", "give me ", "tell me ",
+    "what is ", "what are ", "what was ", "what were ", "list ", "show ", "get "
+)
+
+_MONTH_PATTERN = "|".join(sorted(MONTHS, key=len, reverse=True))
+
+class ParseCache:
+    """Two-tier (in-process LRU + Redis) cache for parsed SQL"""
+    
+    def __init__(self):
+        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.async_redis_client = aioredis.from_url(settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS)
+        self.cache_ttl = settings.PARSE_CACHE_TTL_SECONDS
+        self.max_entries = settings.PARSE_CACHE_MAX_ENTRIES
+        self._local: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._schema_hash: Optional[str] = None
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+    
+    def normalize_prompt(self, prompt: str) -> str:
+        """Canonicalize case, whitespace, punctuation, numbers and dates"""
+        text = prompt.lower().strip()
+        text = text.replace("’", "'").replace("“", '"').replace("”", '"')
+        
+        # Thousands separators: 1,000 -> 1000
+        text = re.sub(r"(?<=\d),(?=\d{3}\b)", "", text)
+        
+        # Dates -> ISO format
+        text = re.sub(r"\b(\d{4})/(\d{1,2})/(\d{1,2})\b", lambda m: self._iso(m.group(1), m.group(2), m.group(3)), text)
+        text = re.sub(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b", lambda m: self._iso(m.group(3), m.group(1), m.group(2)), text)
+        text = re.sub(
+            rf"\b({_MONTH_PATTERN})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b",
+            lambda m: self._iso(m.group(3), MONTHS[m.group(1)], m.group(2)),
+            text
+        )
+        text = re.sub(
+            rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?({_MONTH_PATTERN})\.?,?\s+(\d{{4}})\b",
+            lambda m: self._iso(m.group(3), MONTHS[m.group(2)], m.group(1)),
+            text
+        )
+        text = re.sub(rf"\b({_MONTH_PATTERN})\.?\s+(\d{{4}})\b", lambda m: f"{MONTH_NAMES[MONTHS[m.group(1)] - 1]} {m.group(2)}", text)
+        
+        # Quarters -> "q<n> <year>"
+        ordinal_pattern = "|".join(ORDINAL_WORDS)
+        text = re.sub(
+            rf"\b(?:({ordinal_pattern})|([1-4])(?:st|nd|rd|th))\s+quarter(?:\s+of)?\s+(\d{{4}})\b",
+            lambda m: f"q{ORDINAL_WORDS.get(m.group(1), m.group(2))} {m.group(3)}",
+            text
+        )
+        text = re.sub(r"\bquarter\s+([1-4])(?:\s+of)?\s+(\d{4})\b", r"q\1 \2", text)
+        text = re.sub(r"\b(\d{4})\s*-?\s*q([1-4])\b", r"q\2 \1", text)
+        text = re.sub(r"\bq([1-4])\s*[-']?\s*(\d{4})\b", r"q\1 \2", text)
+        
+        # Number words -> digits
+        text = re.sub(
+            r"\b(" + "|".join(NUMBER_WORDS) + r")\b",
+            lambda m: str(NUMBER_WORDS[m.group(1)]),
+            text
+        )
+        
+        # Punctuation -> whitespace, keeping date dashes and decimal points
+        text = re.sub(r"(?<!\d)[.\-]|[.\-](?!\d)", " ", text)
+        text = re.sub(r"[^\w\s.\-]", " ", text)
+        text = re.sub(r"\s+", " ", text).strip()
+        
+        # Strip conversational lead-ins
+        stripped = True
+        while stripped:
+            stripped = False
+            for prefix in FILLER_PREFIXES:
+                if text.startswith(prefix):
+                    text = text[len(prefix):]
+                    stripped = True
+        if text.startswith("the "):
+            text = text[4:]
+        
+        return text
+    
+    def schema_hash(self) -> str:
+        """Hash of the schema version the LLM sees"""
+        return schema_registry.schema_hash()
+    
+    def make_key(self, prompt: str, conversation_context: Optional[str] = None) -> str:
+        """Build the cache key for a prompt in its conversation context"""
+        schema_hash = self.schema_hash()
+        self._check_schema(schema_hash)
+        
+        payload = f"{self.normalize_prompt(prompt)}\n{conversation_context or ''}"
+        prompt_hash = hashlib.md5(payload.encode()).hexdigest()
+        return f"parse:{schema_hash}:{prompt_hash}"
+    
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Look up a parse result, checking the local tier before Redis"""
+        local = self._get_local(cache_key)
+        if local is not None:
+            return local
+        
+        try:
+            cached = self.redis_client.get(cache_key)
+        except Exception:
+            cached = None
+        return self._record_redis_lookup(cache_key, cached)
+    
+    async def get_async(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Look up a parse result without blocking the event loop"""
+        local = self._get_local(cache_key)
+        if local is not None:
+            return local
+        
+        try:
+            cached = await self.async_redis_client.get(cache_key)
+        except Exception:
+            cached = None
+        return self._record_redis_lookup(cache_key, cached)
+    
+    def set(self, cache_key: str, result: Dict[str, Any]) -> None:
+        """Store a parse result in both tiers"""
+        self._set_local(cache_key, result)
+        try:
+            self.redis_client.setex(cache_key, self.cache_ttl, json.dumps(result))
+        except Exception:
+            pass  # Cache failures shouldn't break the app
+    
+    async def set_async(self, cache_key: str, result: Dict[str, Any]) -> None:
+        """Store a parse result in both tiers without blocking the event loop"""
+        self._set_local(cache_key, result)
+        try:
+            await self.async_redis_client.setex(cache_key, self.cache_ttl, json.dumps(result))
+        except Exception:
+            pass  # Cache failures shouldn't break the app
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        hits = self.local_hits + self.redis_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "local_entries": len(self._local),
+            "schema_hash": self._schema_hash
+        }
+    
+    def clear(self) -> None:
+        """Drop the in-process tier"""
+        with self._lock:
+            self._local.clear()
+    
+    def _check_schema(self, schema_hash: str) -> None:
+        """Invalidate the local tier when the schema changes"""
+        if schema_hash != self._schema_hash:
+            with self._lock:
+                self._local.clear()
+                self._schema_hash = schema_hash
+    
+    def _get_local(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Get result from the in-process LRU tier"""
+        with self._lock:
+            result = self._local.get(cache_key)
+            if result is not None:
+                self._local.move_to_end(cache_key)
+                self.local_hits += 1
+        return result
+    
+    def _set_local(self, cache_key: str, result: Dict[str, Any]) -> None:
+        """Store result in the in-process LRU tier"""
+        with self._lock:
+            self._local[cache_key] = result
+            self._local.move_to_end(cache_key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+    
+    def _record_redis_lookup(self, cache_key: str, cached: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        """Promote a Redis hit into the local tier and update counters"""
+        if cached:
+            result = json.loads(cached)
+            self._set_local(cache_key, result)
+            self.redis_hits += 1
+            return result
+        self.misses += 1
+        return None
+    
+    def _iso(self, year: Any, month: Any, day: Any) -> str:
+        """Format date parts as YYYY-MM-DD"""
+        return f"{int(year):04d}-{int(month):02d}-{int(day):02d}"
+
+# Global parse cache instance
+parse_cache = ParseCache()
@@ -0,0 +1,263 @@
+"""
+Speculative Prefetch Service
+Precomputes likely drill-down follow-ups after each turn to warm the parse and query caches
+"""
+
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import redis.asyncio as aioredis
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.services.schema_registry import schema_registry
+from app.services.parse_cache import parse_cache
+from app.services.rule_parser import DIMENSIONS, PERIOD_ADJECTIVES, STOPWORDS, TABLE_ALIASES
+
+# Phrase used when speculating on each drill-down dimension
+DRILLDOWN_PHRASES = {
+    "product_line": "product line",
+    "month": "month",
+    "region": "region",
+    "segment": "customer segment",
+    "category": "product category",
+    "country": "country",
+    "quarter": "quarter",
+    "name": "customer"
+}
+
+# Default ranking before any follow-ups have been observed
+DRILLDOWN_PRIOR = ["product_line", "month", "region", "segment", "category", "country", "quarter", "name"]
+
+TIME_DIMENSIONS = {"day", "week", "month", "quarter", "year"}
+
+# Words that can surround a dimension in a pure drill-down ("now break it down by month")
+DRILLDOWN_WORDS = STOPWORDS | {"break", "it", "this", "that", "now", "then", "also", "instead", "about", "can", "you", "please"}
+
+class TokenBucket:
+    """Rate limiter for speculative LLM calls"""
+    
+    def __init__(self, per_minute: float):
+        self.capacity = max(per_minute, 1.0)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def try_acquire(self) -> bool:
+        """Take one token if available"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+class SpeculativePrefetcher:
+    """Picks, budgets and runs likely follow-ups, and serves their results to /refine"""
+    
+    def __init__(self):
+        self.async_redis_client = aioredis.from_url(settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS)
+        self.enabled = settings.PREFETCH_ENABLED
+        self.top_k = settings.PREFETCH_TOP_K
+        self.delay_seconds = settings.PREFETCH_DELAY_SECONDS
+        self.max_foreground_in_flight = settings.PREFETCH_MAX_FOREGROUND_IN_FLIGHT
+        self.result_ttl = settings.PREFETCH_RESULT_TTL_SECONDS
+        self.llm_budget = TokenBucket(settings.PREFETCH_LLM_CALLS_PER_MINUTE)
+        self._slots = settings.PREFETCH_MAX_CONCURRENT
+        self._local: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self.followup_counts: Counter = Counter()
+        self.foreground_in_flight = 0
+        self.counters = {"scheduled": 0, "skipped_busy": 0, "skipped_budget": 0, "prefetched": 0, "failed": 0, "served": 0}
+        
+        self.dimensions = self._available_dimensions()
+        phrases = sorted(
+            (phrase for phrase, dimension in DIMENSIONS.items() if dimension[3] in self.dimensions),
+            key=len, reverse=True
+        ) + [adjective for adjective, period in PERIOD_ADJECTIVES.items() if period in self.dimensions]
+        self._dimension_pattern = re.compile(r"\b(" + "|".join(map(re.escape, phrases)) + r")\b")
+    
+    def drilldown_intent(self, followup: str) -> Optional[str]:
+        """Canonical dimension label(s) for a pure drill-down follow-up, else None"""
+        text = parse_cache.normalize_prompt(followup)
+        labels = []
+        for match in self._dimension_pattern.finditer(text):
+            phrase = PERIOD_ADJECTIVES.get(match.group(1), match.group(1))
+            label = DIMENSIONS[phrase][3]
+            if label not in labels:
+                labels.append(label)
+        
+        remaining = self._dimension_pattern.sub(" ", text).split()
+        if not labels or any(word not in DRILLDOWN_WORDS for word in remaining):
+            return None
+        return "+".join(sorted(labels))
+    
+    def candidates(self, explain: Dict[str, Any], k: Optional[int] = None) -> List[str]:
+        """Top-K follow-up phrases for a finished turn
+        
+        Dimensions already grouped on are excluded, a second time grain is never
+        suggested, and a time filter without a time grouping promotes "by month".
+        Observed follow-up frequency outranks the static prior.
+        """
+        grouped = {column.split(".")[-1].lower() for column in explain.get("groupBy", [])}
+        has_time_group = bool(grouped & TIME_DIMENSIONS) or any("order_date" in column for column in grouped)
+        has_time_filter = any("order_date" in condition for condition in explain.get("filters", []))
+        
+        scored = []
+        for label in self.dimensions:
+            if label in grouped or (label in TIME_DIMENSIONS and has_time_group):
+                continue
+            if label == "name" and "customer_id" in grouped:
+                continue
+            score = self.followup_counts[label] * 10.0 + (len(DRILLDOWN_PRIOR) - DRILLDOWN_PRIOR.index(label))
+            if label == "month" and has_time_filter:
+                score += 5.0
+            scored.append((score, label))
+        
+        scored.sort(reverse=True)
+        return [f"break it down by {DRILLDOWN_PHRASES[label]}" for _, label in scored[:k or self.top_k]]
+    
+    def record_followup(self, followup: str) -> None:
+        """Learn which drill-downs users actually ask for"""
+        intent = self.drilldown_intent(followup)
+        if intent:
+            for label in intent.split("+"):
+                self.followup_counts[label] += 1
+    
+    def schedule(
+        self,
+        conversation_id: str,
+        prompt: str,
+        sql: str,
+        explain: Dict[str, Any],
+        run_candidate: Callable[[str, str, Callable[[], bool]], Awaitable[Dict[str, Any]]]
+    ) -> Optional[asyncio.Task]:
+        """Start background speculation for a finished turn without delaying the response
+        
+        run_candidate(conversation_id, refined_prompt, llm_gate) must resolve the
+        prompt to validated SQL and execute it, calling llm_gate() before any LLM
+        request and giving up if it returns False.
+        """
+        if not self.enabled or self.top_k <= 0:
+            return None
+        if self._slots <= 0 or self.foreground_in_flight > self.max_foreground_in_flight:
+            self.counters["skipped_busy"] += 1
+            return None
+        
+        self._slots -= 1
+        self.counters["scheduled"] += 1
+        task = asyncio.create_task(self._speculate(conversation_id, prompt, sql, explain, run_candidate))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+    
+    async def lookup_async(self, conversation_id: str, last_sql: str, followup: str) -> Optional[Dict[str, Any]]:
+        """Speculative result for this follow-up on the conversation's current last turn"""
+        intent = self.drilldown_intent(followup)
+        if not intent:
+            return None
+        
+        key = self._result_key(conversation_id, last_sql, intent)
+        entry = self._get_local(key)
+        if entry is None:
+            try:
+                cached = await self.async_redis_client.get(key)
+                entry = json.loads(cached) if cached else None
+            except Exception:
+                entry = None
+        if entry is not None:
+            self.counters["served"] += 1
+        return entry
+    
+    def stats(self) -> Dict[str, Any]:
+        """Prefetch counters for monitoring"""
+        return {
+            **self.counters,
+            "in_flight": len(self._tasks),
+            "followup_counts": dict(self.followup_counts)
+        }
+    
+    async def _speculate(
+        self,
+        conversation_id: str,
+        prompt: str,
+        sql: str,
+        explain: Dict[str, Any],
+        run_candidate: Callable[[str, str, Callable[[], bool]], Awaitable[Dict[str, Any]]]
+    ) -> None:
+        """Run candidates one at a time, yielding to foreground traffic between them"""
+        await asyncio.sleep(self.delay_seconds)
+        
+        def llm_gate() -> bool:
+            if self.llm_budget.try_acquire():
+                return True
+            self.counters["skipped_budget"] += 1
+            return False
+        
+        for followup in self.candidates(explain):
+            if self.foreground_in_flight > self.max_foreground_in_flight:
+                self.counters["skipped_busy"] += 1
+                return
+            
+            refined_prompt = f"{prompt}. {followup}"
+            try:
+                generated = await run_candidate(conversation_id, refined_prompt, llm_gate)
+            except Exception:
+                self.counters["failed"] += 1
+                continue
+            
+            key = self._result_key(conversation_id, sql, self.drilldown_intent(followup))
+            await self._store(key, generated)
+            self.counters["prefetched"] += 1
+    
+    async def _store(self, key: str, generated: Dict[str, Any]) -> None:
+        """Keep a speculative result in both tiers"""
+        entry = {field: generated.get(field) for field in ("sql", "warnings", "parse_cache", "parser")}
+        self._local[key] = (time.monotonic() + self.result_ttl, entry)
+        self._local.move_to_end(key)
+        while len(self._local) > 1024:
+            self._local.popitem(last=False)
+        try:
+            await self.async_redis_client.setex(key, int(self.result_ttl), json.dumps(entry))
+        except Exception:
+            pass  # Cache failures shouldn't break the app
+    
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        """Unexpired entry from the in-process tier"""
+        item = self._local.get(key)
+        if item is None:
+            return None
+        expires, entry = item
+        if expires < time.monotonic():
+            self._local.pop(key, None)
+            return None
+        return entry
+    
+    def _result_key(self, conversation_id: str, last_sql: str, intent: str) -> str:
+        """Key tying a speculative result to the turn it refines"""
+        turn_hash = hashlib.md5(last_sql.encode()).hexdigest()[:12]
+        return f"prefetch:{conversation_id}:{turn_hash}:{intent}"
+    
+    def _task_done(self, task: asyncio.Task) -> None:
+        """Release the speculation slot"""
+        self._tasks.discard(task)
+        self._slots += 1
+    
+    def _available_dimensions(self) -> List[str]:
+        """Drill-down labels whose columns exist in the schema registry"""
+        labels = []
+        for label in DRILLDOWN_PRIOR:
+            dimension = DIMENSIONS[DRILLDOWN_PHRASES[label]]
+            columns = re.findall(r"\b([ocp])\.(\w+)", dimension[1])
+            if all(schema_registry.validate_column(TABLE_ALIASES[alias], column) for alias, column in columns):
+                labels.append(label)
+        return labels
+
+# Global speculative prefetcher instance
+speculative_prefetcher = SpeculativePrefetcher()
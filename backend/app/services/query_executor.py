@@ -3,117 +3,658 @@ Query Executor Service
 Handles SQL query execution with proper error handling and result formatting
 """
 
+import asyncio
+import time
 import redis
-from typing import List, Dict, Any, Optional
+import redis.asyncio as aioredis
+from typing import AsyncIterator, Iterable, Iterator, List, Dict, Any, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from app.core.database import SessionLocal
+from app.core.database import AsyncSessionLocal, SessionLocal
 from app.core.config import settings
 from app.core.exceptions import QueryExecutionError
-import json
+from app.core.serialization import json_dumps
+from app.services.coalescing import query_singleflight
+from app.services.column_profiler import column_profiler
+from app.services.cost_guard import cost_guard
+from app.services.explain_builder import explain_builder
+from app.services.local_cache import local_result_cache
+from app.services.parameterizer import sql_parameterizer
+from app.services.replicas import replica_router
+from app.services.rollups import rollup_manager
+from app.services.stale_cache import stale_cache
+from app.services.table_versions import table_versions
 import hashlib
 
+try:
+    import pyarrow as pa
+except ImportError:  # Optional: only needed for result_format="arrow"
+    pa = None
+
+# Result shapes accepted by execute_query
+RESULT_FORMATS = ("table", "series", "arrow")
+
+# Leading rows kept for chart inference on columnar results (size thresholds go up to 20)
+CHART_SAMPLE_ROWS = 21
+
 class QueryExecutor:
     """Executes SQL queries with caching and error handling"""
     
     def __init__(self):
         self.redis_client = redis.from_url(settings.REDIS_URL)
-        self.cache_ttl = 3600  # 1 hour
+        self.async_redis_client = aioredis.from_url(settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS)
+        # Entries are keyed by the versions of the tables they read, so they can live long
+        self.cache_ttl = settings.QUERY_CACHE_TTL_SECONDS
+        self.untagged_cache_ttl = settings.QUERY_CACHE_UNTAGGED_TTL_SECONDS
+        self.singleflight = query_singleflight
+        self.explain_builder = explain_builder
+        self.table_versions = table_versions
+        self.cost_guard = cost_guard
+        self.rollups = rollup_manager
+        self.replicas = replica_router
+        self.parameterizer = sql_parameterizer
+        self.stale_cache = stale_cache
+        self.local_cache = local_result_cache
+        self.profiler = column_profiler
+        self.statement_timeout_ms = settings.STATEMENT_TIMEOUT_MS
+    
+    def execute_query(self, sql: str, result_format: str = "table", user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Execute SQL query and return formatted results
+        
+        result_format "table" returns row-major rows, "series" one value list
+        per column, and "arrow" an Apache Arrow IPC stream under "arrow"
+        (requires pyarrow; not cached or coalesced since it is binary) with
+        its leading rows under "sample". On Postgres the query first passes
+        the cost guard under user_id's thresholds: QueryCostError if refused,
+        "warnings" in the result if it was limited. Aggregates a fresh rollup
+        can answer are run against it, named under "rollup". Cached results
+        past their soft TTL are served while one request refreshes them; the
+        result from before the tables' last write stands in (with a warning)
+        while another request recomputes it or if the database fails.
+        """
+        self._check_format(result_format)
+        parameterized = self.parameterizer.parameterize(sql)
+        self.parameterizer.record(parameterized[0])
+        if result_format == "arrow":
+            try:
+                return self._run_query_arrow(sql, user_id, parameterized)
+            except QueryExecutionError:
+                raise
+            except Exception as e:
+                raise QueryExecutionError(f"Query execution failed: {str(e)}")
+        
+        # Check cache first
+        versions = self.table_versions.fingerprint(self.explain_builder.extract_source_tables(sql))
+        profile = self.cost_guard.profile(user_id)
+        cache_key = self._get_cache_key(sql, result_format, versions, profile, parameterized)
+        latest_key = self._latest_key(sql, result_format, profile, parameterized)
+        
+        def run() -> Dict[str, Any]:
+            started = time.perf_counter()
+            formatted_result = self._run_query(sql, result_format, user_id, parameterized)
+            if versions is not None:
+                self._store(cache_key, latest_key, formatted_result, self._cache_ttl_for(versions), time.perf_counter() - started)
+            return formatted_result
+        
+        stored = self._get_from_cache(cache_key) if versions is not None else None
+        if stored:
+            cached_result, age, compute_seconds = self.stale_cache.unwrap(stored)
+            if self.stale_cache.due(age, compute_seconds, self._soft_ttl_for(versions)) and self.stale_cache.claim(cache_key):
+                self.stale_cache.refresh_in_background(cache_key, run)
+            return cached_result
+        
+        # The result from before the last write stands in unless this request wins the recompute
+        previous = self._previous_entry(latest_key, cache_key) if versions is not None else None
+        claimed = previous is not None and self.stale_cache.claim(cache_key)
+        if previous is not None and not claimed:
+            return self.stale_cache.stale_result(*previous, "refreshing")
+        
+        # Execute query once for all concurrent identical requests
+        try:
+            return self.singleflight.do(cache_key, run)
+        except QueryExecutionError:
+            raise
+        except Exception as e:
+            if previous is not None and self.stale_cache.unavailable(e):
+                return self.stale_cache.stale_result(*previous, "unavailable")
+            raise QueryExecutionError(f"Query execution failed: {str(e)}")
+        finally:
+            if claimed:
+                self.stale_cache.release(cache_key)
     
-    def execute_query(self, sql: str, result_format: str = "table") -> Dict[str, Any]:
-        """Execute SQL query and return formatted results"""
+    async def execute_query_async(self, sql: str, result_format: str = "table", user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Execute SQL query without blocking the event loop"""
+        self._check_format(result_format)
+        parameterized = self.parameterizer.parameterize(sql)
+        self.parameterizer.record(parameterized[0])
+        if result_format == "arrow":
+            try:
+                return await asyncio.to_thread(self._run_query_arrow, sql, user_id, parameterized)
+            except QueryExecutionError:
+                raise
+            except Exception as e:
+                raise QueryExecutionError(f"Query execution failed: {str(e)}")
         
         # Check cache first
-        cache_key = self._get_cache_key(sql)
-        cached_result = self._get_from_cache(cache_key)
-        if cached_result:
+        versions = await self.table_versions.fingerprint_async(self.explain_builder.extract_source_tables(sql))
+        profile = self.cost_guard.profile(user_id)
+        cache_key = self._get_cache_key(sql, result_format, versions, profile, parameterized)
+        latest_key = self._latest_key(sql, result_format, profile, parameterized)
+        
+        async def run() -> Dict[str, Any]:
+            started = time.perf_counter()
+            formatted_result = await self._run_query_async(sql, result_format, user_id, parameterized)
+            if versions is not None:
+                await self._store_async(cache_key, latest_key, formatted_result, self._cache_ttl_for(versions), time.perf_counter() - started)
+            return formatted_result
+        
+        stored = await self._get_from_cache_async(cache_key) if versions is not None else None
+        if stored:
+            cached_result, age, compute_seconds = self.stale_cache.unwrap(stored)
+            if self.stale_cache.due(age, compute_seconds, self._soft_ttl_for(versions)) and await self.stale_cache.claim_async(cache_key):
+                self.stale_cache.refresh_in_background_async(cache_key, run)
             return cached_result
         
-        # Execute query
+        # The result from before the last write stands in unless this request wins the recompute
+        previous = await self._previous_entry_async(latest_key, cache_key) if versions is not None else None
+        claimed = previous is not None and await self.stale_cache.claim_async(cache_key)
+        if previous is not None and not claimed:
+            return self.stale_cache.stale_result(*previous, "refreshing")
+        
+        # Execute query once for all concurrent identical requests
         try:
-            db = SessionLocal()
-            result = db.execute(text(sql))
+            return await self.singleflight.do_async(cache_key, run)
+        except QueryExecutionError:
+            raise
+        except Exception as e:
+            if previous is not None and self.stale_cache.unavailable(e):
+                return self.stale_cache.stale_result(*previous, "unavailable")
+            raise QueryExecutionError(f"Query execution failed: {str(e)}")
+        finally:
+            if claimed:
+                await self.stale_cache.release_async(cache_key)
+    
+    def result_columns(self, sql: str) -> List[str]:
+        """Column names sql would return, without fetching any rows"""
+        db = self._read_session(sql)
+        try:
+            return list(db.execute(*self._bound(self._columns_sql(sql))).keys())
+        except Exception as e:
+            raise QueryExecutionError(f"Query execution failed: {str(e)}")
+        finally:
+            db.close()
+    
+    async def result_columns_async(self, sql: str) -> List[str]:
+        """Column names sql would return, from an async session"""
+        try:
+            async with await self._read_session_async(sql) as db:
+                return list((await db.execute(*self._bound(self._columns_sql(sql)))).keys())
+        except Exception as e:
+            raise QueryExecutionError(f"Query execution failed: {str(e)}")
+    
+    def stream_query(
+        self,
+        sql: str,
+        batch_size: Optional[int] = None,
+        byte_budget: Optional[int] = None,
+        user_id: Optional[int] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Run SQL on a server-side cursor and yield its result in row batches
+        
+        Yields ("columns", ...), one ("rows", ...) per batch and a final
+        ("summary", ...) with row and byte counts. Only one batch is held in
+        memory; once the encoded rows would exceed byte_budget the result is
+        truncated and the summary carries a warning, as do cost guard limits,
+        and the rollup that answered the query if any. Cached results are
+        replayed through the same budget.
+        """
+        batch_size = batch_size or settings.STREAM_ROW_BATCH_SIZE
+        byte_budget = byte_budget or settings.STREAM_BYTE_BUDGET
+        
+        parameterized = self.parameterizer.parameterize(sql)
+        self.parameterizer.record(parameterized[0])
+        versions = self.table_versions.fingerprint(self.explain_builder.extract_source_tables(sql))
+        cache_key = self._get_cache_key(sql, versions=versions, profile=self.cost_guard.profile(user_id), parameterized=parameterized)
+        stored = self._get_from_cache(cache_key) if versions is not None else None
+        if stored:
+            cached_result = self.stale_cache.unwrap(stored)[0]
+            rows = cached_result["rows"]
+            batches = (rows[offset:offset + batch_size] for offset in range(0, len(rows), batch_size))
+            yield from self._budget_batches(cached_result["columns"], batches, byte_budget, cached_result.get("warnings", []))
+            return
+        
+        run_sql, rollup = self.rollups.route(sql)
+        db = self._read_session(sql, rollup)
+        try:
+            prepared, warnings = self._prepare(db, run_sql, user_id)
+            result = db.execute(
+                *self._bound(prepared, parameterized if prepared == sql else None),
+                execution_options={"stream_results": True, "yield_per": batch_size}
+            )
+            batches = ([list(row) for row in partition] for partition in result.partitions(batch_size))
+            for event, data in self._budget_batches(list(result.keys()), batches, byte_budget, warnings):
+                if event == "summary" and rollup:
+                    data["rollup"] = rollup
+                yield event, data
+        except QueryExecutionError:
+            raise
+        except Exception as e:
+            raise QueryExecutionError(f"Query execution failed: {str(e)}")
+        finally:
+            db.close()
+    
+    async def stream_query_async(
+        self,
+        sql: str,
+        batch_size: Optional[int] = None,
+        byte_budget: Optional[int] = None,
+        user_id: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Stream a query without blocking the event loop, fetching each batch in a worker thread"""
+        events = self.stream_query(sql, batch_size, byte_budget, user_id)
+        finished = object()
+        try:
+            while True:
+                item = await asyncio.to_thread(next, events, finished)
+                if item is finished:
+                    break
+                yield item
+        finally:
+            # Releases the cursor and connection when the client goes away mid-stream
+            await asyncio.to_thread(events.close)
+    
+    def _budget_batches(
+        self,
+        columns: List[str],
+        batches: Iterable[List[List[Any]]],
+        byte_budget: int,
+        warnings: Optional[List[str]] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield columns and row batches until the encoded size reaches the byte budget"""
+        yield "columns", {"columns": columns}
+        
+        row_count = 0
+        sent_bytes = 0
+        truncated = False
+        for batch in batches:
+            batch_bytes = len(json_dumps(batch))
+            if sent_bytes + batch_bytes > byte_budget:
+                # Send the rows of this batch that still fit, then stop reading
+                fitting = []
+                for row in batch:
+                    row_bytes = len(json_dumps(row)) + 1
+                    if sent_bytes + row_bytes > byte_budget:
+                        break
+                    fitting.append(row)
+                    sent_bytes += row_bytes
+                if fitting:
+                    row_count += len(fitting)
+                    yield "rows", {"rows": fitting}
+                truncated = True
+                break
             
-            # Get column names
-            columns = list(result.keys())
+            row_count += len(batch)
+            sent_bytes += batch_bytes
+            yield "rows", {"rows": batch}
+        
+        warnings = list(warnings or [])
+        if truncated:
+            warnings.append(f"Result truncated after {row_count} rows: the {byte_budget}-byte response budget was reached")
+        yield "summary", {"row_count": row_count, "bytes": sent_bytes, "truncated": truncated, "warnings": warnings}
+    
+    def _run_query(
+        self,
+        sql: str,
+        result_format: str = "table",
+        user_id: Optional[int] = None,
+        parameterized: Optional[Tuple[str, Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Run SQL against the database and format the results"""
+        run_sql, rollup = self.rollups.route(sql)
+        db = self._read_session(sql, rollup)
+        try:
+            prepared, warnings = self._prepare(db, run_sql, user_id)
+            result = db.execute(*self._bound(prepared, parameterized if prepared == sql else None))
             
-            # Get rows
-            rows = [list(row) for row in result.fetchall()]
+            # Get column names and the driver's type for each
+            columns = list(result.keys())
+            type_codes = self.profiler.type_codes(result)
             
+            if result_format == "series":
+                # Fill one list per column straight from the cursor, a batch at a time
+                series: List[List[Any]] = [[] for _ in columns]
+                for partition in result.partitions(settings.STREAM_ROW_BATCH_SIZE):
+                    for column_values, values in zip(series, zip(*partition)):
+                        column_values.extend(values)
+            else:
+                # Get rows (iterating the result avoids an intermediate fetchall() list)
+                rows = [list(row) for row in result]
+        finally:
             db.close()
+        
+        if result_format == "series":
+            return self._format_series(columns, series, warnings, rollup, type_codes)
+        return self._format_rows(columns, rows, warnings, rollup, type_codes)
+    
+    async def _run_query_async(
+        self,
+        sql: str,
+        result_format: str = "table",
+        user_id: Optional[int] = None,
+        parameterized: Optional[Tuple[str, Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Run SQL on a pooled async connection and format the results"""
+        run_sql, rollup = await self.rollups.route_async(sql)
+        async with await self._read_session_async(sql, rollup) as db:
+            prepared, warnings = await self._prepare_async(db, run_sql, user_id)
+            result = await db.execute(*self._bound(prepared, parameterized if prepared == sql else None))
+            columns = list(result.keys())
+            type_codes = self.profiler.type_codes(result)
+            if result_format == "series":
+                # As in _run_query: one list per column filled a batch at a time, with no row-major copy
+                series: List[List[Any]] = [[] for _ in columns]
+                for partition in result.partitions(settings.STREAM_ROW_BATCH_SIZE):
+                    for column_values, values in zip(series, zip(*partition)):
+                        column_values.extend(values)
+            else:
+                rows = [list(row) for row in result]
+        
+        if result_format == "series":
+            return self._format_series(columns, series, warnings, rollup, type_codes)
+        return self._format_rows(columns, rows, warnings, rollup, type_codes)
+    
+    def _bound(self, sql: str, parameterized: Optional[Tuple[str, Dict[str, Any]]] = None) -> Tuple[Any, Dict[str, Any]]:
+        """Statement with sql's filter literals as bind parameters, and their values (parameterized if already computed)"""
+        shape, params = parameterized or self.parameterizer.parameterize(sql)
+        return text(shape), params
+    
+    def _read_session(self, sql: str, rollup: Optional[str] = None) -> Session:
+        """Session on a caught-up replica for the tables sql (and the rollup answering it) reads, else on the primary"""
+        replica = self.replicas.choose(self._read_tables(sql, rollup))
+        return replica.session_factory() if replica else SessionLocal()
+    
+    async def _read_session_async(self, sql: str, rollup: Optional[str] = None) -> AsyncSession:
+        """Async session on a caught-up replica, else on the primary"""
+        replica = await self.replicas.choose_async(self._read_tables(sql, rollup))
+        return replica.async_session_factory() if replica else AsyncSessionLocal()
+    
+    def _read_tables(self, sql: str, rollup: Optional[str] = None) -> List[str]:
+        """Tables whose recent writes a replica must have replayed to answer sql"""
+        return self.explain_builder.extract_source_tables(sql) + ([rollup] if rollup else [])
+    
+    def _prepare(self, db: Session, sql: str, user_id: Optional[int] = None) -> Tuple[str, List[str]]:
+        """Set statement_timeout and run the cost guard on this session; returns the SQL to run and its warnings"""
+        if db.get_bind().dialect.name == "postgresql":
+            # SET LOCAL lasts until the session's transaction ends with the query
+            db.execute(text(f"SET LOCAL statement_timeout = {int(self.statement_timeout_ms)}"))
+        plan = self._plan(db, sql) if self.cost_guard.enabled else None
+        if plan is None:
+            return sql, []
+        return self.cost_guard.review(sql, plan, user_id)
+    
+    async def _prepare_async(self, db: AsyncSession, sql: str, user_id: Optional[int] = None) -> Tuple[str, List[str]]:
+        """Set statement_timeout and run the cost guard on this async session"""
+        if db.bind.dialect.name == "postgresql":
+            await db.execute(text(f"SET LOCAL statement_timeout = {int(self.statement_timeout_ms)}"))
+        plan = await self._plan_async(db, sql) if self.cost_guard.enabled else None
+        if plan is None:
+            return sql, []
+        return self.cost_guard.review(sql, plan, user_id)
+    
+    def _plan(self, db: Session, sql: str) -> Optional[Dict[str, Any]]:
+        """Planner estimates for sql, or None where EXPLAIN (FORMAT JSON) is unavailable"""
+        if db.get_bind().dialect.name != "postgresql":
+            return None
+        return self.cost_guard.read_plan(db.execute(text(self.cost_guard.explain_sql(sql))).scalar())
+    
+    async def _plan_async(self, db: AsyncSession, sql: str) -> Optional[Dict[str, Any]]:
+        """Planner estimates for sql from an async session"""
+        if db.bind.dialect.name != "postgresql":
+            return None
+        result = await db.execute(text(self.cost_guard.explain_sql(sql)))
+        return self.cost_guard.read_plan(result.scalar())
+    
+    def _format_rows(
+        self,
+        columns: List[str],
+        rows: List[List[Any]],
+        warnings: Optional[List[str]] = None,
+        rollup: Optional[str] = None,
+        type_codes: Optional[List[Any]] = None
+    ) -> Dict[str, Any]:
+        """Row-major result with its column profile"""
+        profile = self.profiler.profile_rows(columns, rows, type_codes)
+        formatted_result = {
+            "columns": columns,
+            "rows": rows,
+            "profile": profile
+        }
+        if warnings:
+            formatted_result["warnings"] = warnings
+        if rollup:
+            formatted_result["rollup"] = rollup
+        return formatted_result
+    
+    def _format_series(
+        self,
+        columns: List[str],
+        series: List[List[Any]],
+        warnings: Optional[List[str]] = None,
+        rollup: Optional[str] = None,
+        type_codes: Optional[List[Any]] = None
+    ) -> Dict[str, Any]:
+        """Column-major result with its column profile"""
+        profile = self.profiler.profile(columns, series, type_codes)
+        formatted_result = {
+            "columns": columns,
+            "series": series,
+            "row_count": len(series[0]) if series else 0,
+            "profile": profile
+        }
+        if warnings:
+            formatted_result["warnings"] = warnings
+        if rollup:
+            formatted_result["rollup"] = rollup
+        return formatted_result
+    
+    def _run_query_arrow(
+        self,
+        sql: str,
+        user_id: Optional[int] = None,
+        parameterized: Optional[Tuple[str, Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Run SQL on a server-side cursor and encode the result as an Arrow IPC stream"""
+        if pa is None:
+            raise QueryExecutionError("result_format 'arrow' requires the optional pyarrow package")
+        
+        run_sql, rollup = self.rollups.route(sql)
+        db = self._read_session(sql, rollup)
+        try:
+            prepared, warnings = self._prepare(db, run_sql, user_id)
+            batch_size = settings.STREAM_ROW_BATCH_SIZE
+            result = db.execute(*self._bound(prepared, parameterized if prepared == sql else None), execution_options={"stream_results": True, "yield_per": batch_size})
+            columns = list(result.keys())
+            type_codes = self.profiler.type_codes(result)
             
-            # Format results
-            formatted_result = {
-                "columns": columns,
-                "rows": rows,
-                "inferred_chart": self._infer_chart_type(columns, rows)
-            }
-            
-            # Cache result
-            self._cache_result(cache_key, formatted_result)
-            
-            return formatted_result
+            sink = pa.BufferOutputStream()
+            writer = None
+            schema = None
+            row_count = 0
+            sample_rows: List[List[Any]] = []
+            for partition in result.partitions(batch_size):
+                if len(sample_rows) < CHART_SAMPLE_ROWS:
+                    sample_rows.extend(list(row) for row in partition[:CHART_SAMPLE_ROWS - len(sample_rows)])
+                column_values = list(zip(*partition))
+                if schema is None:
+                    arrays = [pa.array(values) for values in column_values]
+                    schema = pa.schema([pa.field(name, array.type) for name, array in zip(columns, arrays)])
+                    writer = pa.ipc.new_stream(sink, schema)
+                else:
+                    # Later batches keep the types inferred from the first one
+                    arrays = [pa.array(values, type=field.type) for values, field in zip(column_values, schema)]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                row_count += len(partition)
             
-        except Exception as e:
-            raise QueryExecutionError(f"Query execution failed: {str(e)}")
+            if writer is None:
+                writer = pa.ipc.new_stream(sink, pa.schema([pa.field(name, pa.null()) for name in columns]))
+            writer.close()
+        finally:
+            db.close()
+        
+        # Only the leading rows are kept in memory, so they are what gets profiled
+        profile = self.profiler.profile_rows(columns, sample_rows, type_codes)
+        formatted_result = {
+            "columns": columns,
+            "arrow": sink.getvalue().to_pybytes(),
+            "row_count": row_count,
+            "sample": sample_rows,
+            "profile": profile
+        }
+        if warnings:
+            formatted_result["warnings"] = warnings
+        if rollup:
+            formatted_result["rollup"] = rollup
+        return formatted_result
+    
+    def _columns_sql(self, sql: str) -> str:
+        """Zero-row wrapper exposing a query's result columns"""
+        return f"SELECT * FROM ({sql.strip().rstrip(';')}) AS columns_source LIMIT 0"
+    
+    def sample_rows(self, execution_result: Dict[str, Any]) -> List[List[Any]]:
+        """Row-major rows for chart inference from any result format"""
+        if "rows" in execution_result:
+            return execution_result["rows"]
+        if "series" in execution_result:
+            leading = (column_values[:CHART_SAMPLE_ROWS] for column_values in execution_result["series"])
+            return [list(row) for row in zip(*leading)]
+        return execution_result.get("sample", [])
+    
+    def _check_format(self, result_format: str) -> None:
+        """Reject unknown result formats"""
+        if result_format not in RESULT_FORMATS:
+            raise QueryExecutionError(f"Unsupported result_format '{result_format}'; expected one of {', '.join(RESULT_FORMATS)}")
+    
+    def _get_cache_key(
+        self,
+        sql: str,
+        result_format: str = "table",
+        versions: Optional[str] = "",
+        profile: str = "",
+        parameterized: Optional[Tuple[str, Dict[str, Any]]] = None
+    ) -> str:
+        """Generate cache key for SQL query and the versions of the tables it reads
+        
+        A write bumps a table's version, so later lookups use a new key and the
+        old entries are never read again; they simply expire. profile separates
+        users whose cost guard thresholds could produce a different result.
+        The query part is its shape plus parameter values, so formatting
+        differences between otherwise identical queries share an entry;
+        parameterized passes sql's shape and values when already computed.
+        """
+        shape_hash, values_hash = self.parameterizer.shape_key(*(parameterized or self.parameterizer.parameterize(sql)))
+        key = f"query:{shape_hash}:{values_hash}"
+        if result_format != "table":
+            key += f":{result_format}"
+        if versions:
+            key += f":{hashlib.md5(versions.encode()).hexdigest()[:12]}"
+        if profile:
+            key += f":{profile}"
+        return key
+    
+    def _cache_ttl_for(self, versions: str) -> int:
+        """Long TTL for version-tagged entries, the short legacy TTL when no source table was recognised"""
+        return self.cache_ttl if versions else self.untagged_cache_ttl
+    
+    def _soft_ttl_for(self, versions: str) -> float:
+        """Age after which an entry is refreshed in the background (never beyond its hard TTL)"""
+        return min(self.stale_cache.soft_ttl, self._cache_ttl_for(versions))
+    
+    def _latest_key(self, sql: str, result_format: str, profile: str, parameterized: Optional[Tuple[str, Dict[str, Any]]] = None) -> str:
+        """Key pointing at the most recently stored entry for this query, whatever the table versions"""
+        return "latest:" + self._get_cache_key(sql, result_format, profile=profile, parameterized=parameterized)
+    
+    def _store(self, cache_key: str, latest_key: str, result: Dict[str, Any], ttl: int, compute_seconds: float) -> None:
+        """Cache a result with its compute time and make it the query's latest entry"""
+        self._cache_result(cache_key, self.stale_cache.wrap(result, compute_seconds), ttl)
+        try:
+            self.redis_client.setex(latest_key, ttl, cache_key)
+        except Exception:
+            pass
     
-    def _get_cache_key(self, sql: str) -> str:
-        """Generate cache key for SQL query"""
-        sql_hash = hashlib.md5(sql.encode()).hexdigest()
-        return f"query:{sql_hash}"
+    async def _store_async(self, cache_key: str, latest_key: str, result: Dict[str, Any], ttl: int, compute_seconds: float) -> None:
+        """Cache a result and update the latest pointer without blocking the event loop"""
+        await self._cache_result_async(cache_key, self.stale_cache.wrap(result, compute_seconds), ttl)
+        try:
+            await self.async_redis_client.setex(latest_key, ttl, cache_key)
+        except Exception:
+            pass
+    
+    def _previous_entry(self, latest_key: str, cache_key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Result and age of the query's entry under older table versions, if one is still cached"""
+        if not self.stale_cache.enabled:
+            return None
+        try:
+            previous_key = self.redis_client.get(latest_key)
+        except Exception:
+            return None
+        if not previous_key or previous_key.decode() == cache_key:
+            return None
+        stored = self._get_from_cache(previous_key.decode())
+        return self.stale_cache.unwrap(stored)[:2] if stored else None
+    
+    async def _previous_entry_async(self, latest_key: str, cache_key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Older-version entry for the query, read without blocking the event loop"""
+        if not self.stale_cache.enabled:
+            return None
+        try:
+            previous_key = await self.async_redis_client.get(latest_key)
+        except Exception:
+            return None
+        if not previous_key or previous_key.decode() == cache_key:
+            return None
+        stored = await self._get_from_cache_async(previous_key.decode())
+        return self.stale_cache.unwrap(stored)[:2] if stored else None
     
     def _get_from_cache(self, cache_key: str) -> Optional[Dict[str, Any]]:
-        """Get result from cache"""
+        """Get result from cache, checking the in-process tier before Redis"""
+        local = self.local_cache.get(cache_key)
+        if local is not None:
+            return local
         try:
-            cached = self.redis_client.get(cache_key)
-            if cached:
-                return json.loads(cached)
+            return self.local_cache.promote(cache_key, self.redis_client.get(cache_key))
         except Exception:
             pass
         return None
     
-    def _cache_result(self, cache_key: str, result: Dict[str, Any]) -> None:
-        """Cache query result"""
+    async def _get_from_cache_async(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Get result from cache without blocking the event loop"""
+        local = self.local_cache.get(cache_key)
+        if local is not None:
+            return local
         try:
-            self.redis_client.setex(
-                cache_key,
-                self.cache_ttl,
-                json.dumps(result)
-            )
+            return self.local_cache.promote(cache_key, await self.async_redis_client.get(cache_key))
+        except Exception:
+            pass
+        return None
+    
+    def _cache_result(self, cache_key: str, result: Dict[str, Any], ttl: Optional[int] = None) -> None:
+        """Cache query result in Redis and the in-process tier"""
+        try:
+            payload = json_dumps(result)
+            self.redis_client.setex(cache_key, ttl or self.cache_ttl, payload)
+            self.local_cache.store(cache_key, payload, ttl or self.cache_ttl)
         except Exception:
             pass  # Cache failures shouldn't break the app
     
-    def _infer_chart_type(self, columns: List[str], rows: List[List[Any]]) -> Optional[str]:
-        """Infer chart type from query results"""
-        if not rows or len(rows) < 2:
-            return None
-        
-        # Check if we have numeric data for charting
-        numeric_columns = []
-        for i, col in enumerate(columns):
-            if self._is_numeric_column(rows, i):
-                numeric_columns.append(i)
-        
-        if len(numeric_columns) == 0:
-            return None
-        
-        # Determine chart type based on data characteristics
-        if len(rows) <= 10 and len(numeric_columns) == 1:
-            return "pie"
-        elif len(rows) > 10:
-            return "line"
-        else:
-            return "bar"
-    
-    def _is_numeric_column(self, rows: List[List[Any]], column_index: int) -> bool:
-        """Check if column contains numeric data"""
-        try:
-            for row in rows[:5]:  # Check first 5 rows
-                if row[column_index] is not None:
-                    float(row[column_index])
-            return True
-        except (ValueError, TypeError):
-            return False
+    async def _cache_result_async(self, cache_key: str, result: Dict[str, Any], ttl: Optional[int] = None) -> None:
+        """Cache query result without blocking the event loop"""
+        try:
+            payload = json_dumps(result)
+            await self.async_redis_client.setex(cache_key, ttl or self.cache_ttl, payload)
+            await self.local_cache.store_async(cache_key, payload, ttl or self.cache_ttl)
+        except Exception:
+            pass  # Cache failures shouldn't break the app
 
 # Global query executor instance
 query_executor = QueryExecutor()
@@ -0,0 +1,174 @@
+"""
+Replica Router
+Spreads read-only query traffic across read replicas that are caught up, falling back to the primary
+"""
+
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.core.database import async_database_url, make_async_engine, make_engine
+from app.services.table_versions import table_versions
+
+# Seconds of replay lag, zero when everything received has been replayed since an idle primary sends
+# nothing new, and whether the WAL receiver is streaming. A replica whose receiver has disconnected has
+# also replayed all it received, so it only shows up in the second column. Reading the receiver status
+# needs pg_read_all_stats (granted by pg_monitor); without it the replica counts as not streaming.
+LAG_SQL = """
+SELECT
+    CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END AS lag,
+    NOT pg_is_in_recovery() OR EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') AS streaming
+"""
+
+@dataclass
+class Replica:
+    """A read replica's engines and its last lag check"""
+    name: str
+    engine: Engine
+    async_engine: AsyncEngine
+    session_factory: sessionmaker
+    async_session_factory: async_sessionmaker
+    lag: Optional[float] = None
+    streaming: Optional[bool] = None
+    healthy: bool = False
+    queries: int = 0
+    errors: int = 0
+
+class ReplicaRouter:
+    """Chooses a replica for a read, or None for the primary
+
+    A replica is used only when its last measured lag plus the check
+    interval is within REPLICA_MAX_LAG_SECONDS and none of the tables the
+    query reads were written more recently than that, so results (and the
+    result cache, keyed by table versions) never miss a confirmed write.
+    """
+    
+    def __init__(self, urls: Optional[List[str]] = None):
+        self.max_lag = settings.REPLICA_MAX_LAG_SECONDS
+        self.check_interval = settings.REPLICA_LAG_CHECK_INTERVAL_SECONDS
+        self.table_versions = table_versions
+        self.replicas = [self._connect(url) for url in (settings.DATABASE_REPLICA_URLS if urls is None else urls)]
+        self._turn = itertools.count()
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+        self.counters = {"replica_reads": 0, "primary_reads": 0, "recent_write_fallbacks": 0, "lag_fallbacks": 0}
+    
+    def choose(self, tables: Iterable[str]) -> Optional[Replica]:
+        """Replica to read the tables from, or None to use the primary"""
+        healthy = self._healthy()
+        if not healthy:
+            return None
+        return self._pick(healthy, self.table_versions.last_changed(tables))
+    
+    async def choose_async(self, tables: Iterable[str]) -> Optional[Replica]:
+        """Replica choice with a non-blocking lookup of recent writes"""
+        healthy = self._healthy()
+        if not healthy:
+            return None
+        return self._pick(healthy, await self.table_versions.last_changed_async(tables))
+    
+    def check_lag(self) -> None:
+        """Measure every replica's replication lag and mark which ones may serve reads"""
+        for replica in self.replicas:
+            try:
+                with replica.session_factory() as db:
+                    postgres = db.get_bind().dialect.name == "postgresql"
+                    lag, streaming = db.execute(text(LAG_SQL)).one() if postgres else (0.0, True)
+                replica.lag = float(lag or 0)
+                replica.streaming = bool(streaming)
+                # Lag can grow until the next check; a disconnected replica falls behind while reporting none
+                replica.healthy = replica.streaming and replica.lag + self.check_interval <= self.max_lag
+            except Exception:
+                replica.errors += 1
+                replica.lag = None
+                replica.streaming = None
+                replica.healthy = False
+    
+    def start_monitor(self) -> None:
+        """Start checking replica lag in a background thread"""
+        if not self.replicas or (self._monitor is not None and self._monitor.is_alive()):
+            return
+        self._stop.clear()
+        self._monitor = threading.Thread(target=self._monitor_loop, name="replica-lag-monitor", daemon=True)
+        self._monitor.start()
+    
+    def stop_monitor(self) -> None:
+        """Stop the lag monitor"""
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join(timeout=2.0)
+            self._monitor = None
+    
+    async def dispose(self) -> None:
+        """Close every replica connection pool"""
+        for replica in self.replicas:
+            replica.engine.dispose()
+            await replica.async_engine.dispose()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Routing counters and each replica's lag"""
+        return {
+            **self.counters,
+            "replicas": [
+                {
+                    "name": replica.name,
+                    "lag_seconds": replica.lag,
+                    "streaming": replica.streaming,
+                    "healthy": replica.healthy,
+                    "queries": replica.queries,
+                    "errors": replica.errors
+                }
+                for replica in self.replicas
+            ]
+        }
+    
+    def _healthy(self) -> List[Replica]:
+        """Replicas whose last lag check passed (counting a primary read when there are none)"""
+        if not self.replicas:
+            return []
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            self.counters["lag_fallbacks"] += 1
+            self.counters["primary_reads"] += 1
+        return healthy
+    
+    def _pick(self, healthy: List[Replica], last_changed: Optional[float]) -> Optional[Replica]:
+        """Round-robin over healthy replicas unless the tables were written within the lag bound"""
+        if last_changed is None or time.time() - last_changed <= self.max_lag:
+            self.counters["recent_write_fallbacks"] += 1
+            self.counters["primary_reads"] += 1
+            return None
+        replica = healthy[next(self._turn) % len(healthy)]
+        replica.queries += 1
+        self.counters["replica_reads"] += 1
+        return replica
+    
+    def _monitor_loop(self) -> None:
+        """Check lag every interval"""
+        while not self._stop.is_set():
+            self.check_lag()
+            self._stop.wait(self.check_interval)
+    
+    def _connect(self, url: str) -> Replica:
+        """Sync and async engines for one replica"""
+        sync_engine = make_engine(url)
+        async_engine = make_async_engine(async_database_url(url))
+        return Replica(
+            name=make_url(url).render_as_string(hide_password=True),
+            engine=sync_engine,
+            async_engine=async_engine,
+            session_factory=sessionmaker(autocommit=False, autoflush=False, bind=sync_engine),
+            async_session_factory=async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+        )
+
+# Global replica router
+replica_router = ReplicaRouter()
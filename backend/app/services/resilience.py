@@ -0,0 +1,280 @@
+"""
+Resilience Service
+Per-call deadlines, latency-based request hedging and a circuit breaker for upstream calls
+"""
+
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+from app.core.config import settings
+from app.core.exceptions import CircuitOpenError
+
+T = TypeVar("T")
+
+class CircuitBreaker:
+    """Failure-rate breaker over a rolling window of call outcomes
+    
+    closed -> open when the failure rate over the window reaches the threshold;
+    open -> half_open after open_seconds, letting one probe call through;
+    half_open -> closed on success, back to open on failure. A probe that ends
+    without an outcome (cancelled) is released so the next call can probe.
+    """
+    
+    def __init__(self, failure_rate: float, window: int, min_calls: int, open_seconds: float):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Whether a call may proceed"""
+        return self.acquire() is not None
+    
+    def acquire(self) -> Optional[str]:
+        """"call" or "probe" if a call may proceed, None if it must short-circuit"""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "closed":
+                return "call"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return "probe"
+            return None
+    
+    def release_probe(self) -> None:
+        """Let another call probe after this probe ended without recording an outcome"""
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+    
+    def record_success(self) -> None:
+        """Record a successful call"""
+        with self._lock:
+            self.outcomes.append(True)
+            if self.state == "half_open":
+                self.state = "closed"
+                self.outcomes.clear()
+    
+    def record_failure(self) -> None:
+        """Record a failed call, opening the breaker when the failure rate is too high"""
+        with self._lock:
+            self.outcomes.append(False)
+            if self.state == "half_open":
+                self._open()
+                return
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.failure_rate:
+                self._open()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Breaker state for monitoring"""
+        calls = len(self.outcomes)
+        return {
+            "state": self.state,
+            "times_opened": self.times_opened,
+            "window_calls": calls,
+            "window_failure_rate": round(self.outcomes.count(False) / calls, 4) if calls else 0.0
+        }
+    
+    def _open(self) -> None:
+        """Trip the breaker"""
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._probe_in_flight = False
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+    
+    def __init__(self, window: int = 200):
+        self.samples: Deque[float] = deque(maxlen=window)
+    
+    def record(self, seconds: float) -> None:
+        """Add a latency sample"""
+        self.samples.append(seconds)
+    
+    def percentile(self, pct: float) -> Optional[float]:
+        """Nearest-rank percentile, or None without samples"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+class ResilientCaller:
+    """Runs upstream calls with deadlines, hedged duplicates and a circuit breaker"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.attempt_timeout = settings.LLM_TIMEOUT_SECONDS
+        self.deadline = settings.LLM_DEADLINE_SECONDS
+        self.hedge_enabled = settings.LLM_HEDGE_ENABLED
+        self.max_hedges = settings.LLM_MAX_HEDGES
+        self.hedge_percentile = settings.LLM_HEDGE_PERCENTILE
+        self.default_hedge_delay = settings.LLM_HEDGE_DELAY_SECONDS
+        self.min_hedge_delay = settings.LLM_HEDGE_MIN_DELAY_SECONDS
+        self.min_samples = 20
+        self.breaker = CircuitBreaker(
+            failure_rate=settings.BREAKER_FAILURE_RATE,
+            window=settings.BREAKER_WINDOW,
+            min_calls=settings.BREAKER_MIN_CALLS,
+            open_seconds=settings.BREAKER_OPEN_SECONDS
+        )
+        self.latency = LatencyTracker()
+        self.counters = {
+            "calls": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "short_circuited": 0,
+            "hedges_fired": 0,
+            "hedges_won": 0
+        }
+    
+    def hedge_delay(self) -> float:
+        """Seconds to wait before firing a duplicate; tracks the observed tail latency"""
+        observed = self.latency.percentile(self.hedge_percentile) if len(self.latency.samples) >= self.min_samples else None
+        delay = observed if observed is not None else self.default_hedge_delay
+        return min(max(delay, self.min_hedge_delay), self.attempt_timeout)
+    
+    async def call(
+        self,
+        make_attempt: Callable[[int], Awaitable[T]],
+        is_valid: Callable[[T], bool] = lambda result: True
+    ) -> T:
+        """Return the first valid result among the primary attempt and its hedges
+        
+        make_attempt(n) starts attempt n (0 is the primary). A hedge is fired when
+        the outstanding attempts exceed the hedge delay, or immediately when all
+        of them have failed. Every attempt has its own timeout and the whole call
+        has a deadline; losers are cancelled.
+        """
+        probe = self._admit()
+        try:
+            return await self._call(make_attempt, is_valid)
+        except BaseException:
+            # Failures were recorded and reopened the breaker; a cancelled probe recorded nothing
+            if probe:
+                self.breaker.release_probe()
+            raise
+    
+    async def _call(self, make_attempt: Callable[[int], Awaitable[T]], is_valid: Callable[[T], bool]) -> T:
+        """Hedged attempts for one admitted call"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.deadline
+        max_hedges = self.max_hedges if self.hedge_enabled else 0
+        
+        attempts: Dict[asyncio.Task, int] = {}
+        fired = 0
+        last_error: Optional[BaseException] = None
+        
+        def launch(index: int) -> None:
+            task = asyncio.ensure_future(asyncio.wait_for(make_attempt(index), self.attempt_timeout))
+            attempts[task] = index
+        
+        launch(0)
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                if not attempts:
+                    if fired >= max_hedges:
+                        break
+                    # Every attempt failed quickly; hedge immediately
+                    fired += 1
+                    self.counters["hedges_fired"] += 1
+                    launch(fired)
+                    continue
+                
+                wait_for = min(self.hedge_delay(), remaining) if fired < max_hedges else remaining
+                done, _ = await asyncio.wait(list(attempts), timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    if fired < max_hedges and deadline - loop.time() > 0:
+                        fired += 1
+                        self.counters["hedges_fired"] += 1
+                        launch(fired)
+                    continue
+                
+                for task in done:
+                    index = attempts.pop(task)
+                    try:
+                        result = task.result()
+                    except asyncio.TimeoutError as e:
+                        self.counters["timeouts"] += 1
+                        last_error = e
+                        continue
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if not is_valid(result):
+                        last_error = ValueError("invalid response")
+                        continue
+                    
+                    self.latency.record(loop.time() - started)
+                    self.breaker.record_success()
+                    if index > 0:
+                        self.counters["hedges_won"] += 1
+                    return result
+        finally:
+            for task in attempts:
+                task.cancel()
+        
+        self.counters["failures"] += 1
+        self.breaker.record_failure()
+        if last_error is None:
+            self.counters["timeouts"] += 1
+            last_error = asyncio.TimeoutError(f"{self.name} deadline of {self.deadline}s exceeded")
+        raise last_error
+    
+    def call_sync(self, fn: Callable[[], T]) -> T:
+        """Run a blocking call through the breaker (timeouts are enforced by the client)"""
+        probe = self._admit()
+        started = time.monotonic()
+        try:
+            result = fn()
+        except Exception:
+            self.counters["failures"] += 1
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            if probe:
+                self.breaker.release_probe()
+            raise
+        self.latency.record(time.monotonic() - started)
+        self.breaker.record_success()
+        return result
+    
+    def stats(self) -> Dict[str, Any]:
+        """Breaker state, hedge counts and latency percentiles"""
+        p50 = self.latency.percentile(50)
+        p95 = self.latency.percentile(95)
+        return {
+            **self.counters,
+            "breaker": self.breaker.stats(),
+            "hedge_delay_seconds": round(self.hedge_delay(), 3),
+            "latency_p50_seconds": round(p50, 3) if p50 is not None else None,
+            "latency_p95_seconds": round(p95, 3) if p95 is not None else None
+        }
+    
+    def _admit(self) -> bool:
+        """Count the call and fail fast while the breaker is open; True if the call is the half-open probe"""
+        self.counters["calls"] += 1
+        admission = self.breaker.acquire()
+        if admission is None:
+            self.counters["short_circuited"] += 1
+            raise CircuitOpenError(f"{self.name} circuit breaker is open")
+        return admission == "probe"
+
+# Global resilient caller for LLM requests
+llm_resilience = ResilientCaller("llm")
@@ -0,0 +1,385 @@
+"""
+Aggregate Rollups
+Month-grain revenue rollups over orders, kept fresh from dirty months and used to answer matching aggregate queries
+"""
+
+import re
+import threading
+import redis
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from app.core.config import settings
+from app.services.table_versions import table_versions
+
+@dataclass(frozen=True)
+class RollupDefinition:
+    """A rollup table: the dimensions it is grouped by (besides month_start) and the tables it reads"""
+    name: str
+    dimensions: Tuple[str, ...]
+    sources: Tuple[str, ...]
+
+# Smallest first, so a query is answered by the narrowest rollup that covers it (migration 003 creates them)
+ROLLUPS = (
+    RollupDefinition("rollup_orders_region_month", ("region",), ("orders",)),
+    RollupDefinition("rollup_orders_product_month", ("product_line", "category"), ("orders", "products")),
+    RollupDefinition("rollup_orders_customer_month", ("segment", "country"), ("customers", "orders")),
+    RollupDefinition(
+        "rollup_orders_month",
+        ("region", "product_line", "category", "segment", "country"),
+        ("customers", "orders", "products")
+    )
+)
+
+# Dimension column -> (table, alias used when building the rollup)
+DIMENSION_TABLES = {
+    "region": ("orders", "o"),
+    "segment": ("customers", "c"),
+    "country": ("customers", "c"),
+    "product_line": ("products", "p"),
+    "category": ("products", "p")
+}
+
+# Every column of the source tables; bare names outside this set are aliases or keywords
+SOURCE_COLUMNS = {
+    "orders": {"order_id", "customer_id", "product_id", "order_date", "quantity", "unit_price", "region", "created_at"},
+    "customers": {"customer_id", "name", "segment", "country", "created_at"},
+    "products": {"product_id", "product_line", "category", "created_at"}
+}
+
+# Join key each dimension table must be joined to orders on
+JOIN_KEYS = {"customers": "customer_id", "products": "product_id"}
+
+# Supported orders aggregate -> (equivalent over a rollup, the column name Postgres gives the original)
+REVENUE = r"(?:(?P<q1>\w+)\.)?quantity\s*\*\s*(?:(?P<q2>\w+)\.)?unit_price|(?:(?P<q3>\w+)\.)?unit_price\s*\*\s*(?:(?P<q4>\w+)\.)?quantity"
+MEASURES = [
+    (re.compile(rf"\bSUM\s*\(\s*(?:{REVENUE})\s*\)", re.IGNORECASE), "SUM(r.revenue)", "sum"),
+    (re.compile(rf"\bAVG\s*\(\s*(?:{REVENUE})\s*\)", re.IGNORECASE), "(SUM(r.revenue) / NULLIF(SUM(r.order_count), 0))", "avg"),
+    (re.compile(r"\bSUM\s*\(\s*(?:(?P<q1>\w+)\.)?quantity\s*\)", re.IGNORECASE), "SUM(r.quantity)::bigint", "sum"),
+    (re.compile(r"\bCOUNT\s*\(\s*(?:\*|(?:(?P<q1>\w+)\.)?order_id)\s*\)", re.IGNORECASE), "COALESCE(SUM(r.order_count), 0)::bigint", "count")
+]
+# Literal placeholders are \x00<n>\x00; order_date at month grain or coarser maps to month_start
+DATE_TRUNC = re.compile(r"\bDATE_TRUNC\s*\(\s*\x00(?P<lit>\d+)\x00\s*,\s*(?:(?P<q1>\w+)\.)?order_date\s*\)", re.IGNORECASE)
+EXTRACT = re.compile(r"\bEXTRACT\s*\(\s*(?P<field>YEAR|QUARTER|MONTH)\s+FROM\s+(?:(?P<q1>\w+)\.)?order_date\s*\)", re.IGNORECASE)
+DATE_BOUND = re.compile(r"(?:(?P<q1>\w+)\.)?order_date\s*(?P<op>>=|<)\s*(?:DATE\s+)?\x00(?P<lit>\d+)\x00(?:\s*::\s*date\b)?", re.IGNORECASE)
+MONTH_START = re.compile(r"^\d{4}-\d{2}-01$")
+
+# Anything that could make rollup rows count differently from order rows
+UNSUPPORTED = re.compile(
+    r"\b(WITH|UNION|INTERSECT|EXCEPT|DISTINCT|OVER|WINDOW|LATERAL|FILTER|COUNT|SUM|AVG|STDDEV\w*|VAR_\w+|VARIANCE"
+    r"|ARRAY_AGG|STRING_AGG|JSONB?_AGG|PERCENTILE_\w+|MODE|BOOL_AND|BOOL_OR|EVERY|CORR|COVAR_\w+|REGR_\w+)\b|\(\s*SELECT\b|--|/\*|\"|\*",
+    re.IGNORECASE
+)
+# FROM orders [o] [[INNER] JOIN customers|products <alias> ON a.x = b.y]... followed by the remaining clauses
+QUERY_SHAPE = re.compile(
+    r"^\s*SELECT\s+(?P<select>.+?)\s+FROM\s+orders(?:\s+(?:AS\s+)?(?P<alias>(?!(?:WHERE|GROUP|ORDER|LIMIT|OFFSET|HAVING|JOIN|INNER|LEFT|RIGHT|FULL|CROSS)\b)\w+))?"
+    r"(?P<joins>(?:\s+(?:INNER\s+)?JOIN\s+\w+(?:\s+(?:AS\s+)?\w+)?\s+ON\s+\w+\.\w+\s*=\s*\w+\.\w+)*)"
+    r"(?P<rest>\s+(?:WHERE|GROUP|ORDER|LIMIT|OFFSET|HAVING)\b.*)?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+JOIN = re.compile(r"JOIN\s+(?P<table>\w+)(?:\s+(?:AS\s+)?(?P<alias>(?!ON\b)\w+))?\s+ON\s+(?P<left>\w+\.\w+)\s*=\s*(?P<right>\w+\.\w+)", re.IGNORECASE)
+PAGE_WRAPPER = re.compile(r"^\s*SELECT \* FROM \((?P<inner>.*)\) AS page_source(?P<outer>(?: WHERE .*)? ORDER BY .*)$", re.DOTALL)
+# Keywords after which a bare name is a column reference rather than an output alias
+COLUMN_CONTEXT = {"SELECT", "WHERE", "AND", "OR", "NOT", "BY", "ON", "HAVING", "WHEN", "THEN", "ELSE", "IN", "IS", "CASE", "LIKE", "ILIKE", "BETWEEN"}
+
+# Redis keys shared by every worker
+VERSIONS_KEY = "rollup:versions"
+LOCK_KEY = "rollup:refresh_lock"
+
+class RollupManager:
+    """Rewrites orders aggregates onto rollups refreshed at the current table versions, and refreshes them
+
+    A rollup only answers a query when the table versions recorded at its
+    last refresh equal the versions the query would be cached under, so a
+    rewritten result is never staler than a cached one.
+    """
+    
+    def __init__(self):
+        self.enabled = settings.ROLLUPS_ENABLED
+        self.refresh_interval = settings.ROLLUP_REFRESH_INTERVAL_SECONDS
+        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.table_versions = table_versions
+        self.rollups = ROLLUPS
+        # Rollup name -> source table fingerprint at its last refresh, polled from Redis by the refresher
+        self.refreshed_versions: Dict[str, str] = {}
+        self._stop = threading.Event()
+        self._refresher: Optional[threading.Thread] = None
+        self.counters = {"rewrites": 0, "stale": 0, "refreshes": 0, "refreshed_months": 0, "refresh_errors": 0}
+    
+    def route(self, sql: str) -> Tuple[str, Optional[str]]:
+        """SQL to run and the rollup answering it, or the SQL unchanged and None"""
+        rewritten = self.rewrite(sql) if self.enabled else None
+        if rewritten is None:
+            return sql, None
+        rollup_sql, rollup = rewritten
+        return self._if_fresh(sql, rollup_sql, rollup, self.table_versions.fingerprint(rollup.sources))
+    
+    async def route_async(self, sql: str) -> Tuple[str, Optional[str]]:
+        """Rollup routing with a non-blocking version lookup"""
+        rewritten = self.rewrite(sql) if self.enabled else None
+        if rewritten is None:
+            return sql, None
+        rollup_sql, rollup = rewritten
+        return self._if_fresh(sql, rollup_sql, rollup, await self.table_versions.fingerprint_async(rollup.sources))
+    
+    def rewrite(self, sql: str) -> Optional[Tuple[str, RollupDefinition]]:
+        """Equivalent query over the narrowest covering rollup, ignoring freshness; None if none can answer it"""
+        literals: List[str] = []
+        
+        def protect(match: re.Match) -> str:
+            literals.append(match.group(0))
+            return f"\x00{len(literals) - 1}\x00"
+        
+        protected = re.sub(r"'(?:[^']|'')*'", protect, sql.strip().rstrip(";"))
+        if "'" in protected:
+            return None
+        
+        # Keyset pages wrap the query; only the wrapped query reads the base tables
+        wrapper = PAGE_WRAPPER.match(protected)
+        inner = wrapper.group("inner") if wrapper else protected
+        rewritten = self._rewrite_query(inner, literals)
+        if rewritten is None:
+            return None
+        
+        rollup_sql, rollup = rewritten
+        if wrapper:
+            rollup_sql = f"SELECT * FROM ({rollup_sql}) AS page_source{wrapper.group('outer')}"
+        return re.sub(r"\x00(\d+)\x00", lambda match: literals[int(match.group(1))], rollup_sql), rollup
+    
+    def refresh(self, engine=None) -> Optional[Dict[str, Any]]:
+        """Recompute the dirty months of every rollup in one transaction
+
+        Returns what was refreshed, or None when another worker holds the
+        refresh lock or Redis is unavailable (versions could not be recorded).
+        """
+        if engine is None:
+            from app.core.database import engine
+        try:
+            if not self.redis_client.set(LOCK_KEY, "1", nx=True, ex=max(60, self.refresh_interval * 4)):
+                return None
+        except Exception:
+            return None
+        
+        try:
+            # Versions are read before the dirty months are claimed, so they never claim more than the rollup holds
+            versions = {rollup.name: self.table_versions.fingerprint(rollup.sources) for rollup in self.rollups}
+            if any(fingerprint is None for fingerprint in versions.values()):
+                return None
+            
+            with engine.begin() as connection:
+                claimed = [row[0] for row in connection.execute(text("DELETE FROM rollup_dirty_months RETURNING month_start"))]
+                full = any(month is None for month in claimed)
+                months = [] if full else sorted(set(claimed))
+                for rollup in self.rollups:
+                    if full:
+                        connection.execute(text(f"DELETE FROM {rollup.name}"))
+                        connection.execute(text(self.build_sql(rollup)))
+                        continue
+                    for month in months:
+                        connection.execute(text(f"DELETE FROM {rollup.name} WHERE month_start = :month"), {"month": month})
+                        connection.execute(
+                            text(self.build_sql(rollup, "o.order_date >= :month AND o.order_date < :month + INTERVAL '1 month'")),
+                            {"month": month}
+                        )
+            
+            if full or months:
+                # Replicas serve rollups only once they can have replayed this refresh
+                self.table_versions.bump([rollup.name for rollup in self.rollups])
+            self.redis_client.hset(VERSIONS_KEY, mapping=versions)
+            self.refreshed_versions.update(versions)
+            self.counters["refreshes"] += 1
+            self.counters["refreshed_months"] += len(months)
+            return {"full": full, "months": len(months)}
+        except Exception:
+            self.counters["refresh_errors"] += 1
+            raise
+        finally:
+            try:
+                self.redis_client.delete(LOCK_KEY)
+            except Exception:
+                pass
+    
+    def build_sql(self, rollup: RollupDefinition, where: Optional[str] = None) -> str:
+        """INSERT ... SELECT computing a rollup's rows, optionally for matching orders only"""
+        dimensions = [f"{DIMENSION_TABLES[dimension][1]}.{dimension}" for dimension in rollup.dimensions]
+        group_by = ", ".join(dimensions + ["DATE_TRUNC('month', o.order_date)"])
+        return (
+            f"INSERT INTO {rollup.name} ({', '.join(rollup.dimensions)}, month_start, revenue, quantity, order_count) "
+            f"SELECT {group_by}, SUM(o.quantity * o.unit_price), SUM(o.quantity), COUNT(*) "
+            "FROM orders o "
+            "JOIN customers c ON o.customer_id = c.customer_id "
+            "JOIN products p ON o.product_id = p.product_id"
+            + (f" WHERE {where}" if where else "")
+            + f" GROUP BY {group_by}"
+        )
+    
+    def load_versions(self) -> None:
+        """Pick up versions recorded by refreshes in other workers"""
+        try:
+            recorded = self.redis_client.hgetall(VERSIONS_KEY)
+        except Exception:
+            return
+        self.refreshed_versions = {name.decode(): fingerprint.decode() for name, fingerprint in recorded.items()}
+    
+    def start_refresher(self) -> None:
+        """Start refreshing rollups in a background thread"""
+        if not self.enabled or (self._refresher is not None and self._refresher.is_alive()):
+            return
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self._refresh_loop, name="rollup-refresher", daemon=True)
+        self._refresher.start()
+    
+    def stop_refresher(self) -> None:
+        """Stop the background refresher"""
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=2.0)
+            self._refresher = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """Rewrite and refresh counters"""
+        return {**self.counters, "fresh": sorted(self.refreshed_versions), "refreshing": self._refresher is not None and self._refresher.is_alive()}
+    
+    def _refresh_loop(self) -> None:
+        """Refresh, then pick up the recorded versions, every interval"""
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                pass  # Counted in refresh_errors; retried next interval
+            self.load_versions()
+            self._stop.wait(self.refresh_interval)
+    
+    def _if_fresh(self, sql: str, rollup_sql: str, rollup: RollupDefinition, versions: Optional[str]) -> Tuple[str, Optional[str]]:
+        """Use the rollup only if it was refreshed at the current source versions"""
+        if versions is None or self.refreshed_versions.get(rollup.name) != versions:
+            self.counters["stale"] += 1
+            return sql, None
+        self.counters["rewrites"] += 1
+        return rollup_sql, rollup.name
+    
+    def _rewrite_query(self, sql: str, literals: List[str]) -> Optional[Tuple[str, RollupDefinition]]:
+        """Rewrite one SELECT (literals already replaced by placeholders) onto a rollup"""
+        shape = QUERY_SHAPE.match(sql)
+        tables = self._joined_tables(shape.group("alias"), shape.group("joins")) if shape else None
+        if tables is None:
+            return None
+        
+        # Rewritten expressions are parked as \x01<n>\x01 so later passes don't see their columns
+        expressions: List[str] = []
+        default_names: Dict[int, str] = {}
+        rejected = False
+        
+        def keep(replacement: str, allowed: bool = True, default_name: Optional[str] = None) -> str:
+            nonlocal rejected
+            rejected = rejected or not allowed
+            expressions.append(replacement)
+            if default_name:
+                default_names[len(expressions) - 1] = default_name
+            return f"\x01{len(expressions) - 1}\x01"
+        
+        def on_orders(match: re.Match) -> bool:
+            qualifiers = [value for name, value in match.groupdict().items() if name.startswith("q") and value]
+            return all(tables.get(qualifier.lower()) == "orders" for qualifier in qualifiers)
+        
+        def literal(match: re.Match) -> str:
+            return literals[int(match.group("lit"))].strip("'")
+        
+        select = shape.group("select")
+        rest = shape.group("rest") or ""
+        parts = []
+        for part in (select, rest):
+            for pattern, replacement, default_name in MEASURES:
+                part = pattern.sub(lambda match: keep(replacement, on_orders(match), default_name), part)
+            part = DATE_TRUNC.sub(lambda match: keep(
+                f"DATE_TRUNC('{literal(match).lower()}', r.month_start)",
+                literal(match).lower() in ("month", "quarter", "year") and on_orders(match)
+            ), part)
+            part = EXTRACT.sub(lambda match: keep(f"EXTRACT({match.group('field').upper()} FROM r.month_start)", on_orders(match)), part)
+            part = DATE_BOUND.sub(lambda match: keep(
+                f"r.month_start {match.group('op')} \x00{match.group('lit')}\x00",
+                bool(MONTH_START.match(literal(match))) and on_orders(match)
+            ), part)
+            parts.append(part)
+        select, rest = parts
+        measured = bool(default_names)
+        if rejected or UNSUPPORTED.search(select + rest):
+            return None
+        if not measured and not re.search(r"\bGROUP\s+BY\b", rest, re.IGNORECASE):
+            return None  # Rows per order, not per group
+        
+        # Every remaining column reference must be a dimension of a joined table
+        used = set()
+        
+        def dimension(column: str, table: Optional[str]) -> str:
+            column = column.lower()
+            used.add(column)
+            return keep(f"r.{column}", table is not None and DIMENSION_TABLES.get(column, (None,))[0] == table)
+        
+        def bare(match: re.Match, text: str) -> str:
+            column = match.group(1).lower()
+            if not any(column in columns for columns in SOURCE_COLUMNS.values()):
+                return match.group(0)
+            before = text[:match.start()].rstrip()
+            previous_word = re.search(r"(\w+)$", before)
+            if before.endswith((")", "\x00", "\x01")) or (previous_word and previous_word.group(1).upper() not in COLUMN_CONTEXT):
+                return match.group(0)  # Output alias
+            table = DIMENSION_TABLES.get(column, (None,))[0]
+            return dimension(column, table if table in tables.values() else None)
+        
+        parts = []
+        for part in (select, rest):
+            part = re.sub(r"\b([A-Za-z_]\w*)\.([A-Za-z_]\w*)\b", lambda match: dimension(match.group(2), tables.get(match.group(1).lower())), part)
+            part = re.sub(r"(?<![\w.\x00\x01])([A-Za-z_]\w*)\b(?!\s*[.(])", lambda match, text=part: bare(match, text), part)
+            parts.append(part)
+        select, rest = parts
+        if rejected:
+            return None
+        
+        rollup = next((rollup for rollup in self.rollups if used <= set(rollup.dimensions)), None)
+        if rollup is None:
+            return None
+        
+        # Unaliased measures keep the column names the original aggregates had
+        items = self._split_top_level(select)
+        for position, item in enumerate(items):
+            whole = re.fullmatch(r"\s*\x01(\d+)\x01\s*", item)
+            if whole and int(whole.group(1)) in default_names:
+                items[position] = f"{item.rstrip()} AS {default_names[int(whole.group(1))]}"
+        body = f"SELECT {','.join(items)} FROM {rollup.name} r{rest}"
+        return re.sub(r"\x01(\d+)\x01", lambda match: expressions[int(match.group(1))], body), rollup
+    
+    def _split_top_level(self, text: str) -> List[str]:
+        """Split a select list on commas outside parentheses (literals are already placeholders)"""
+        parts = []
+        depth = 0
+        start = 0
+        for index, char in enumerate(text):
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+            elif char == "," and depth == 0:
+                parts.append(text[start:index])
+                start = index + 1
+        parts.append(text[start:])
+        return parts
+    
+    def _joined_tables(self, orders_alias: Optional[str], joins: str) -> Optional[Dict[str, str]]:
+        """Qualifier -> table for orders and its joins, or None unless every join is on its foreign key"""
+        orders_names = {"orders"} | ({orders_alias.lower()} if orders_alias else set())
+        tables = {name: "orders" for name in orders_names}
+        for join in JOIN.finditer(joins):
+            table = join.group("table").lower()
+            if table not in JOIN_KEYS or table in tables.values():
+                return None
+            names = {table} | ({join.group("alias").lower()} if join.group("alias") else set())
+            key = JOIN_KEYS[table]
+            sides = {join.group("left").lower(), join.group("right").lower()}
+            if not any(sides == {f"{orders_name}.{key}", f"{name}.{key}"} for orders_name in orders_names for name in names):
+                return None
+            tables.update({name: table for name in names})
+        return tables
+
+# Global rollup manager instance
+rollup_manager = RollupManager()
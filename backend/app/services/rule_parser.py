@@ -0,0 +1,318 @@
+"""
+Rule-Based Parser
+Deterministic NLQ to SQL conversion for simple metric / dimension / time-range / top-N intents
+"""
+
+import re
+from datetime import date
+from typing import Dict, List, Any, Optional, Set, Tuple
+from app.services.schema_registry import schema_registry
+from app.services.parse_cache import parse_cache, MONTHS
+from app.services.vector_index import vector_index
+
+# Table aliases used in generated SQL
+TABLE_ALIASES = {"o": "orders", "c": "customers", "p": "products"}
+ALIAS_FOR_TABLE = {table: alias for alias, table in TABLE_ALIASES.items()}
+
+JOIN_CLAUSES = {
+    "customers": "JOIN customers c ON o.customer_id = c.customer_id",
+    "products": "JOIN products p ON o.product_id = p.product_id"
+}
+
+# Phrase -> (select expression, output alias, aggregate label)
+METRICS = {
+    "average order value": ("AVG(o.quantity * o.unit_price)", "avg_order_value", "avg(revenue)"),
+    "aov": ("AVG(o.quantity * o.unit_price)", "avg_order_value", "avg(revenue)"),
+    "average price": ("AVG(o.unit_price)", "avg_unit_price", "avg(unit_price)"),
+    "average unit price": ("AVG(o.unit_price)", "avg_unit_price", "avg(unit_price)"),
+    "number of customers": ("COUNT(DISTINCT o.customer_id)", "customer_count", "count(distinct customer_id)"),
+    "customer count": ("COUNT(DISTINCT o.customer_id)", "customer_count", "count(distinct customer_id)"),
+    "number of orders": ("COUNT(*)", "order_count", "count(*)"),
+    "order count": ("COUNT(*)", "order_count", "count(*)"),
+    "how many orders": ("COUNT(*)", "order_count", "count(*)"),
+    "revenue": ("SUM(o.quantity * o.unit_price)", "revenue", "sum(revenue)"),
+    "sales": ("SUM(o.quantity * o.unit_price)", "revenue", "sum(revenue)"),
+    "units sold": ("SUM(o.quantity)", "units", "sum(quantity)"),
+    "units": ("SUM(o.quantity)", "units", "sum(quantity)"),
+    "quantity": ("SUM(o.quantity)", "units", "sum(quantity)"),
+    "orders": ("COUNT(*)", "order_count", "count(*)")
+}
+
+# Phrase -> (table, select expression, group by expression, explain label)
+DIMENSIONS = {
+    "customer segment": ("customers", "c.segment", "c.segment", "segment"),
+    "customer country": ("customers", "c.country", "c.country", "country"),
+    "product category": ("products", "p.category", "p.category", "category"),
+    "product line": ("products", "p.product_line", "p.product_line", "product_line"),
+    "product_line": ("products", "p.product_line", "p.product_line", "product_line"),
+    "category": ("products", "p.category", "p.category", "category"),
+    "categories": ("products", "p.category", "p.category", "category"),
+    "segment": ("customers", "c.segment", "c.segment", "segment"),
+    "segments": ("customers", "c.segment", "c.segment", "segment"),
+    "country": ("customers", "c.country", "c.country", "country"),
+    "countries": ("customers", "c.country", "c.country", "country"),
+    "customer": ("customers", "c.name", "c.customer_id, c.name", "name"),
+    "customers": ("customers", "c.name", "c.customer_id, c.name", "name"),
+    "region": ("orders", "o.region", "o.region", "region"),
+    "regions": ("orders", "o.region", "o.region", "region"),
+    "day": ("orders", "DATE_TRUNC('day', o.order_date) AS day", "day", "day"),
+    "week": ("orders", "DATE_TRUNC('week', o.order_date) AS week", "week", "week"),
+    "month": ("orders", "DATE_TRUNC('month', o.order_date) AS month", "month", "month"),
+    "quarter": ("orders", "DATE_TRUNC('quarter', o.order_date) AS quarter", "quarter", "quarter"),
+    "year": ("orders", "DATE_TRUNC('year', o.order_date) AS year", "year", "year")
+}
+
+# Adjective forms of time dimensions ("monthly revenue")
+PERIOD_ADJECTIVES = {"daily": "day", "weekly": "week", "monthly": "month", "quarterly": "quarter", "yearly": "year", "annual": "year"}
+
+# Words that carry no intent of their own
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "for", "by", "per", "each", "and", "with", "to", "on", "at", "from",
+    "during", "over", "across", "total", "overall", "all", "me", "show", "list", "get", "give", "what",
+    "is", "are", "was", "were", "our", "my", "please", "broken", "down", "split", "breakdown", "grouped",
+    "group", "sum", "amount", "values", "value", "data", "report", "numbers", "which", "how", "much"
+}
+
+# Words that turn a following grounded value into an exclusion ("outside the USA", "not in EMEA")
+NEGATION_CUES = [("other", "than"), ("apart", "from"), ("not",), ("except",), ("excluding",), ("exclude",), ("outside",), ("without",)]
+
+# Words allowed between a negation cue and its value, or between values in one excluded list
+NEGATION_FILLER = {"the", "in", "of", "for", "from", "and", "or", "nor", "any"}
+
+class RuleBasedParser:
+    """Deterministic parser for simple intents, with a confidence score for LLM hand-off"""
+    
+    def __init__(self):
+        self.schema_registry = schema_registry
+        self.vector_index = vector_index
+        
+        # Only keep rules whose columns exist in the registry, longest phrase first
+        metric_phrases = sorted(
+            (phrase for phrase, metric in METRICS.items() if self._columns_exist(metric[0])),
+            key=len, reverse=True
+        )
+        dimension_phrases = sorted(
+            (phrase for phrase, dimension in DIMENSIONS.items() if self._columns_exist(dimension[1])),
+            key=len, reverse=True
+        ) + list(PERIOD_ADJECTIVES)
+        self._metric_pattern = re.compile(r"\b(" + "|".join(map(re.escape, metric_phrases)) + r")\b")
+        self._dimension_pattern = re.compile(r"\b(" + "|".join(map(re.escape, dimension_phrases)) + r")\b")
+    
+    def parse(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """Parse prompt into SQL; returns None when no supported intent is found"""
+        text = parse_cache.normalize_prompt(prompt)
+        
+        # "break it down by X" adds a dimension and is not a reference to prior context
+        text = re.sub(r"\bbreak (?:it|this|that) down\b", " ", text)
+        text = re.sub(r"\bbreak down\b", " ", text)
+        
+        consumed: List[str] = []
+        
+        top_n, text = self._extract_top_n(text, consumed)
+        filters, text = self._extract_time_range(text, consumed)
+        metric, text = self._extract_metric(text, consumed)
+        dimensions, text = self._extract_dimensions(text, consumed)
+        value_filters, text = self._extract_value_filters(text, consumed)
+        
+        # A bare "orders" with nothing to group by is ambiguous (count vs. listing rows)
+        if metric is None or (metric == METRICS["orders"] and not dimensions and "orders" in consumed):
+            return None
+        
+        unknown = [token for token in text.split() if token not in STOPWORDS]
+        confidence = len(consumed) / (len(consumed) + len(unknown))
+        
+        sql, explain = self._build_sql(metric, dimensions, filters, top_n, value_filters)
+        return {
+            "sql": sql,
+            "explain": explain,
+            "confidence": round(confidence, 3),
+            "unrecognized": unknown
+        }
+    
+    def _extract_top_n(self, text: str, consumed: List[str]) -> Tuple[Optional[Tuple[int, str]], str]:
+        """Extract "top N" / "bottom N" ranking intent"""
+        match = re.search(r"\b(top|best|highest|largest|bottom|worst|lowest|smallest)\s+(\d+)?", text)
+        if not match:
+            return None, text
+        
+        direction = "DESC" if match.group(1) in ("top", "best", "highest", "largest") else "ASC"
+        limit = int(match.group(2)) if match.group(2) else 10
+        consumed.append(match.group(0).strip())
+        return (limit, direction), text[:match.start()] + " " + text[match.end():]
+    
+    def _extract_time_range(self, text: str, consumed: List[str]) -> Tuple[List[Tuple[str, str]], str]:
+        """Extract a date range on order_date; returns (start, end) pairs with an exclusive end"""
+        patterns = [
+            (r"\bbetween (\d{4}-\d{2}-\d{2}) and (\d{4}-\d{2}-\d{2})\b", lambda m: (m.group(1), m.group(2))),
+            (r"\bq([1-4]) (\d{4})\b", lambda m: self._quarter_range(int(m.group(2)), int(m.group(1)))),
+            (r"\b(?:h([12])|(first|second) half(?: of)?) (\d{4})\b", lambda m: self._half_range(int(m.group(3)), 1 if (m.group(1) == "1" or m.group(2) == "first") else 2)),
+            (r"\b(" + "|".join(k for k in MONTHS if len(k) > 3 or k == "may") + r") (\d{4})\b", lambda m: self._month_range(int(m.group(2)), MONTHS[m.group(1)])),
+            (r"\bsince (\d{4}-\d{2}-\d{2})\b", lambda m: (m.group(1), None)),
+            (r"\bbefore (\d{4}-\d{2}-\d{2})\b", lambda m: (None, m.group(1))),
+            (r"\b((?:19|20)\d{2})\b", lambda m: (f"{m.group(1)}-01-01", f"{int(m.group(1)) + 1}-01-01"))
+        ]
+        
+        for pattern, to_range in patterns:
+            match = re.search(pattern, text)
+            if match:
+                consumed.append(match.group(0))
+                start, end = to_range(match)
+                filters = []
+                if start:
+                    filters.append((">=", start))
+                if end:
+                    filters.append(("<", end))
+                return filters, text[:match.start()] + " " + text[match.end():]
+        
+        return [], text
+    
+    def _extract_metric(self, text: str, consumed: List[str]) -> Tuple[Optional[Tuple[str, str, str]], str]:
+        """Extract the measure being aggregated"""
+        match = self._metric_pattern.search(text)
+        if not match:
+            return None, text
+        
+        phrase = match.group(1)
+        consumed.append(phrase)
+        return METRICS[phrase], text[:match.start()] + " " + text[match.end():]
+    
+    def _extract_dimensions(self, text: str, consumed: List[str]) -> Tuple[List[Tuple[str, str, str, str]], str]:
+        """Extract group-by dimensions in the order they appear"""
+        found = []
+        
+        for match in self._dimension_pattern.finditer(text):
+            phrase = match.group(1)
+            consumed.append(phrase)
+            found.append(DIMENSIONS[PERIOD_ADJECTIVES.get(phrase, phrase)])
+        text = self._dimension_pattern.sub(" ", text)
+        
+        dimensions = []
+        for dimension in found:
+            if dimension not in dimensions:
+                dimensions.append(dimension)
+        return dimensions, text
+    
+    def _extract_value_filters(self, text: str, consumed: List[str]) -> Tuple[List[Tuple[str, str, List[str], bool]], str]:
+        """Ground remaining phrases ("emea", "servers") to categorical column literals, negated after "not", "except", ..."""
+        value_filters = []
+        words = self.vector_index.tokenize(text)
+        matched_positions = set()
+        negated_positions = set()
+        
+        for match in self.vector_index.ground_values(text):
+            if match["table"] not in ALIAS_FOR_TABLE:
+                continue
+            span = range(match["position"], match["position"] + len(match["phrase"].split()))
+            cue = self._negation_cue(words, match["position"], negated_positions)
+            consumed.append(match["phrase"])
+            value_filters.append((match["table"], match["column"], match["values"], cue is not None))
+            matched_positions.update(span)
+            if cue is not None:
+                negated_positions.update(span)
+            if cue:
+                consumed.append(" ".join(words[cue.start:cue.stop]))
+                matched_positions.update(cue)
+        
+        remaining = [word for position, word in enumerate(words) if position not in matched_positions]
+        return value_filters, " ".join(remaining)
+    
+    def _negation_cue(self, words: List[str], position: int, negated_positions: Set[int]) -> Optional[range]:
+        """Positions of the cue negating the value at position, if any
+        
+        Looks back over filler words only, so "outside the usa" and "not in emea"
+        are exclusions. A value listed after an excluded one ("excluding usa and
+        canada") is excluded too, with an empty cue.
+        """
+        index = position
+        while index > 0:
+            for cue in NEGATION_CUES:
+                if tuple(words[max(index - len(cue), 0):index]) == cue:
+                    return range(index - len(cue), index)
+            if index - 1 in negated_positions:
+                return range(index, index)
+            if words[index - 1] not in NEGATION_FILLER:
+                return None
+            index -= 1
+        return None
+    
+    def _build_sql(
+        self,
+        metric: Tuple[str, str, str],
+        dimensions: List[Tuple[str, str, str, str]],
+        filters: List[Tuple[str, str]],
+        top_n: Optional[Tuple[int, str]],
+        value_filters: Optional[List[Tuple[str, str, List[str], bool]]] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Assemble SQL and its explain object from the recognized intents"""
+        metric_expr, metric_alias, metric_label = metric
+        value_filters = value_filters or []
+        
+        joined = {dimension[0] for dimension in dimensions} | {table for table, _, _, _ in value_filters}
+        tables = ["orders"] + sorted(joined - {"orders"})
+        select_parts = [dimension[1] for dimension in dimensions] + [f"{metric_expr} AS {metric_alias}"]
+        
+        sql = f"SELECT {', '.join(select_parts)} FROM orders o"
+        for table in tables[1:]:
+            sql += f" {JOIN_CLAUSES[table]}"
+        
+        conditions = [f"o.order_date {operator} '{value}'" for operator, value in filters]
+        conditions += [self._value_condition(table, column, values, negated) for table, column, values, negated in value_filters]
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        
+        if dimensions:
+            sql += " GROUP BY " + ", ".join(dimension[2] for dimension in dimensions)
+        
+        if top_n:
+            limit, direction = top_n
+            sql += f" ORDER BY {metric_alias} {direction} LIMIT {limit}"
+        elif dimensions:
+            sql += " ORDER BY " + ", ".join(dimension[2].split(", ")[-1] for dimension in dimensions)
+        
+        explain = {
+            "filters": [f"order_date {operator} {value}" for operator, value in filters] + [
+                f"{column} {'<>' if negated else '='} {values[0]}" if len(values) == 1
+                else f"{column} {'not in' if negated else 'in'} ({', '.join(values)})"
+                for _, column, values, negated in value_filters
+            ],
+            "groupBy": [dimension[3] for dimension in dimensions],
+            "aggregates": [metric_label],
+            "sourceTables": tables
+        }
+        return sql, explain
+    
+    def _value_condition(self, table: str, column: str, values: List[str], negated: bool = False) -> str:
+        """Equality / IN predicate with quoted literals, or <> / NOT IN when negated"""
+        literals = [("'" + value.replace("'", "''") + "'") for value in values]
+        qualified = f"{ALIAS_FOR_TABLE[table]}.{column}"
+        if len(literals) == 1:
+            return f"{qualified} {'<>' if negated else '='} {literals[0]}"
+        return f"{qualified} {'NOT IN' if negated else 'IN'} ({', '.join(literals)})"
+    
+    def _columns_exist(self, expression: str) -> bool:
+        """Check that every alias-qualified column in an expression is in the registry"""
+        return all(
+            self.schema_registry.validate_column(TABLE_ALIASES[alias], column)
+            for alias, column in re.findall(r"\b([ocp])\.(\w+)", expression)
+        )
+    
+    def _quarter_range(self, year: int, quarter: int) -> Tuple[str, str]:
+        """Date range covering a calendar quarter"""
+        start = date(year, 3 * (quarter - 1) + 1, 1)
+        end = date(year + 1, 1, 1) if quarter == 4 else date(year, 3 * quarter + 1, 1)
+        return start.isoformat(), end.isoformat()
+    
+    def _half_range(self, year: int, half: int) -> Tuple[str, str]:
+        """Date range covering half a year"""
+        if half == 1:
+            return f"{year}-01-01", f"{year}-07-01"
+        return f"{year}-07-01", f"{year + 1}-01-01"
+    
+    def _month_range(self, year: int, month: int) -> Tuple[str, str]:
+        """Date range covering a calendar month"""
+        start = date(year, month, 1)
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        return start.isoformat(), end.isoformat()
+
+# Global rule-based parser instance
+rule_based_parser = RuleBasedParser()
@@ -4,7 +4,7 @@ Validates SQL queries for security and safety
 """
 
 import re
-from typing import List, Set
+from typing import Dict, List, Set
 from app.core.exceptions import UnsafeQueryError
 from app.services.schema_registry import schema_registry
 
@@ -18,6 +18,16 @@ class SQLSafetyValidator:
             'xp_', 'sp_', 'fn_', 'xp_cmdshell', 'sp_executesql'
         }
         
+        # Words that can appear inside SELECT expressions without being column references
+        self.sql_keywords = {
+            'SELECT', 'FROM', 'WHERE', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'OUTER', 'FULL', 'CROSS', 'ON',
+            'GROUP', 'ORDER', 'BY', 'HAVING', 'LIMIT', 'OFFSET', 'AS', 'DISTINCT', 'ALL',
+            'CASE', 'WHEN', 'THEN', 'ELSE', 'END', 'AND', 'OR', 'NOT', 'NULL', 'IS', 'IN',
+            'LIKE', 'ILIKE', 'BETWEEN', 'TRUE', 'FALSE', 'ASC', 'DESC', 'OVER', 'PARTITION',
+            'FILTER', 'INTERVAL', 'DATE', 'TIMESTAMP', 'YEAR', 'QUARTER', 'MONTH', 'WEEK', 'DAY',
+            'INTEGER', 'INT', 'BIGINT', 'NUMERIC', 'DECIMAL', 'FLOAT', 'REAL', 'TEXT', 'VARCHAR'
+        }
+        
         self.max_limit = 10000
         self.whitelist = schema_registry.get_whitelist()
     
@@ -78,14 +88,18 @@ class SQLSafetyValidator:
         if select_match:
             select_clause = select_match.group(1)
             columns = self._extract_columns_from_select(select_clause)
+            table_aliases = self._extract_table_aliases(sql)
             
             for col in columns:
                 if '.' in col:
                     table_name, column_name = col.split('.', 1)
-                    table_name = table_name.lower()
+                    table_name = table_aliases.get(table_name.lower(), table_name.lower())
                     column_name = column_name.lower()
                     
-                    if not schema_registry.validate_column(table_name, column_name):
+                    if column_name == '*':
+                        if not schema_registry.validate_table(table_name):
+                            raise UnsafeQueryError(f"Unknown table: {table_name}")
+                    elif not schema_registry.validate_column(table_name, column_name):
                         raise UnsafeQueryError(f"Unknown column: {table_name}.{column_name}")
                 else:
                     # Column without table prefix - check against all tables
@@ -100,31 +114,44 @@ class SQLSafetyValidator:
         
         return warnings
     
+    def _extract_table_aliases(self, sql: str) -> Dict[str, str]:
+        """Map table aliases (and table names) from FROM/JOIN clauses to table names"""
+        aliases = {}
+        
+        for table_name, alias in re.findall(r'(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.IGNORECASE):
+            table_name = table_name.lower()
+            aliases[table_name] = table_name
+            if alias and alias.upper() not in self.sql_keywords:
+                aliases[alias.lower()] = table_name
+        
+        return aliases
+    
     def _extract_columns_from_select(self, select_clause: str) -> List[str]:
-        """Extract column names from SELECT clause"""
+        """Extract column references from SELECT clause expressions"""
         columns = []
         
+        # Drop string literals and type casts so they aren't mistaken for identifiers
+        select_clause = re.sub(r"'[^']*'", "''", select_clause)
+        select_clause = re.sub(r'::\s*\w+', '', select_clause)
+        
         # Split by comma and clean up
         parts = select_clause.split(',')
         for part in parts:
             part = part.strip()
             
             # Handle AS clauses
-            if ' AS ' in part.upper():
-                part = part.split(' AS ')[0].strip()
+            part = re.split(r'\s+AS\s+', part, flags=re.IGNORECASE)[0].strip()
             
-            # Handle functions like SUM(), COUNT(), etc.
-            if '(' in part and ')' in part:
-                # Extract column from function
-                func_match = re.search(r'\(([^)]+)\)', part)
-                if func_match:
-                    inner_col = func_match.group(1).strip()
-                    if '.' in inner_col:
-                        columns.append(inner_col)
-                    else:
-                        columns.append(inner_col)
-            else:
-                columns.append(part)
+            if part == '*':
+                continue
+            
+            # Collect identifiers, skipping function names and SQL keywords
+            for match in re.finditer(r'\b([A-Za-z_]\w*)\b(?:\.(\*|[A-Za-z_]\w*\b))?(?!\s*\()', part):
+                name, qualified = match.group(1), match.group(2)
+                if qualified:
+                    columns.append(f"{name}.{qualified}")
+                elif name.upper() not in self.sql_keywords:
+                    columns.append(name)
         
         return columns
     
@@ -137,6 +164,11 @@ class SQLSafetyValidator:
             sql = sql.rstrip(';') + f' LIMIT {self.max_limit}'
         
         return sql
+    
+    def remove_default_limit(self, sql: str) -> str:
+        """Drop the LIMIT add_limit_if_missing appended, for callers that bound rows themselves"""
+        suffix = f' LIMIT {self.max_limit}'
+        return sql[:-len(suffix)] if sql.endswith(suffix) else sql
 
 # Global safety validator instance
 safety_validator = SQLSafetyValidator()
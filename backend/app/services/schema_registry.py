@@ -3,9 +3,12 @@ Schema Registry System
 Manages table/column metadata, validation, and LLM context serialization
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set, Tuple
+from collections import deque
 from pydantic import BaseModel
+import hashlib
 import json
+import re
 
 class ColumnMetadata(BaseModel):
     name: str
@@ -21,11 +24,43 @@ class TableMetadata(BaseModel):
     columns: List[ColumnMetadata]
     relationships: List[str] = []
 
+# Business vocabulary that points at columns without sharing a word with them
+TERM_SYNONYMS = {
+    "revenue": ["quantity", "unit_price", "price"],
+    "sales": ["revenue", "quantity", "unit_price"],
+    "aov": ["revenue", "quantity", "unit_price"],
+    "units": ["quantity"],
+    "volume": ["quantity"],
+    "client": ["customer"],
+    "company": ["customer", "name"],
+    "account": ["customer"],
+    "geo": ["region", "country"],
+    "market": ["region", "country"],
+    "month": ["order_date"],
+    "quarter": ["order_date"],
+    "year": ["order_date"],
+    "week": ["order_date"],
+    "date": ["order_date"],
+    "trend": ["order_date"],
+    "sku": ["product"],
+    "item": ["product"]
+}
+
+def _terms(text: str) -> Set[str]:
+    """Lower-cased word terms with a naive plural strip"""
+    terms = set()
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        terms.add(word)
+        if len(word) > 3 and word.endswith("s"):
+            terms.add(word[:-1])
+    return terms
+
 class SchemaRegistry:
     """Registry for database schema metadata"""
     
     def __init__(self):
         self.tables: Dict[str, TableMetadata] = {}
+        self._compiled: Optional[Dict[str, Any]] = None
         self._load_default_schema()
     
     def _load_default_schema(self):
@@ -70,6 +105,15 @@ class SchemaRegistry:
             ]
         )
     
+    def register_table(self, table: TableMetadata) -> None:
+        """Add or replace a table; precompiled serializations are rebuilt on next use"""
+        self.tables[table.name] = table
+        self._compiled = None
+    
+    def schema_hash(self) -> str:
+        """Stable hash identifying the current schema version"""
+        return self._get_compiled()["hash"]
+    
     def get_table(self, table_name: str) -> Optional[TableMetadata]:
         """Get table metadata by name"""
         return self.tables.get(table_name)
@@ -98,6 +142,62 @@ class SchemaRegistry:
     
     def serialize_for_llm(self) -> str:
         """Serialize schema for LLM context injection"""
+        return self._get_compiled()["full_json"]
+    
+    def serialize_for_prompt(self, prompt: str, token_budget: int = 1500) -> str:
+        """Compact schema context limited to what the prompt needs
+        
+        Picks the tables whose names, columns or descriptions match the prompt,
+        adds the tables and key columns on the foreign-key join paths between
+        them, and drops the least relevant columns until the estimated token
+        count fits the budget. Falls back to every table when nothing matches.
+        """
+        compiled = self._get_compiled()
+        column_scores = self._score_columns(prompt, compiled)
+        
+        table_scores: Dict[str, float] = {}
+        for (table_name, _), score in column_scores.items():
+            table_scores[table_name] = table_scores.get(table_name, 0) + score
+        
+        selected = set(table_scores) or set(self.tables)
+        join_edges = self._join_paths(selected, compiled["fk_graph"])
+        for left, _, right, _ in join_edges:
+            selected.update((left, right))
+        
+        # Columns needed to express the joins are never pruned
+        required = {(left, left_col) for left, left_col, _, _ in join_edges}
+        required |= {(right, right_col) for _, _, right, right_col in join_edges}
+        
+        columns = {
+            table_name: [column.name for column in self.tables[table_name].columns]
+            for table_name in selected
+        }
+        join_lines = [f"{left}.{left_col} = {right}.{right_col}" for left, left_col, right, right_col in join_edges]
+        
+        # Prune lowest-scoring optional columns until within budget
+        prunable = sorted(
+            (
+                (column_scores.get((table_name, column_name), 0), table_name, column_name)
+                for table_name, names in columns.items()
+                for column_name in names
+                if (table_name, column_name) not in required
+                and not compiled["columns"][(table_name, column_name)]["primary_key"]
+            ),
+            reverse=True
+        )
+        context = self._render_compact(columns, join_lines, compiled)
+        while self._estimate_tokens(context) > token_budget and prunable:
+            _, table_name, column_name = prunable.pop()
+            columns[table_name].remove(column_name)
+            context = self._render_compact(columns, join_lines, compiled)
+        
+        return context
+    
+    def _get_compiled(self) -> Dict[str, Any]:
+        """Precompile serializations and lookup structures once per schema version"""
+        if self._compiled is not None:
+            return self._compiled
+        
         schema_info = {
             "tables": {}
         }
@@ -110,14 +210,120 @@ class SchemaRegistry:
                         "type": col.type,
                         "description": col.description,
                         "nullable": col.nullable,
-                        "primary_key": col.primary_key
+                        "primary_key": col.primary_key,
+                        "foreign_key": col.foreign_key
                     }
                     for col in table.columns
                 },
                 "relationships": table.relationships
             }
         
-        return json.dumps(schema_info, indent=2)
+        full_json = json.dumps(schema_info, indent=2)
+        
+        columns: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        term_index: Dict[str, List[Tuple[str, str, float]]] = {}
+        fk_graph: Dict[str, List[Tuple[str, str, str]]] = {name: [] for name in self.tables}
+        
+        for table_name, table in self.tables.items():
+            for term in _terms(table_name.replace("_", " ")):
+                for col in table.columns:
+                    term_index.setdefault(term, []).append((table_name, col.name, 1.0))
+            
+            for col in table.columns:
+                marker = " PK" if col.primary_key else ""
+                if col.foreign_key:
+                    marker += f" FK->{col.foreign_key}"
+                columns[(table_name, col.name)] = {
+                    "text": f"{col.name} {col.type}{marker} ({col.description})",
+                    "primary_key": col.primary_key
+                }
+                
+                for term in _terms(col.name.replace("_", " ")) | {col.name}:
+                    term_index.setdefault(term, []).append((table_name, col.name, 3.0))
+                for term in _terms(col.description):
+                    term_index.setdefault(term, []).append((table_name, col.name, 1.0))
+                
+                if col.foreign_key and "." in col.foreign_key:
+                    target_table, target_column = col.foreign_key.split(".", 1)
+                    if target_table in fk_graph:
+                        fk_graph[table_name].append((col.name, target_table, target_column))
+                        fk_graph[target_table].append((target_column, table_name, col.name))
+        
+        self._compiled = {
+            "hash": hashlib.md5(full_json.encode()).hexdigest()[:12],
+            "full_json": full_json,
+            "descriptions": {name: table.description for name, table in self.tables.items()},
+            "columns": columns,
+            "term_index": term_index,
+            "fk_graph": fk_graph
+        }
+        return self._compiled
+    
+    def _score_columns(self, prompt: str, compiled: Dict[str, Any]) -> Dict[Tuple[str, str], float]:
+        """Relevance score per (table, column) from prompt terms and synonyms"""
+        terms = _terms(prompt)
+        for term in list(terms):
+            terms.update(TERM_SYNONYMS.get(term, []))
+        
+        scores: Dict[Tuple[str, str], float] = {}
+        for term in terms:
+            for table_name, column_name, weight in compiled["term_index"].get(term, []):
+                key = (table_name, column_name)
+                scores[key] = scores.get(key, 0) + weight
+        return scores
+    
+    def _join_paths(self, tables: Set[str], fk_graph: Dict[str, List[Tuple[str, str, str]]]) -> List[Tuple[str, str, str, str]]:
+        """Foreign-key edges on the shortest paths connecting the given tables"""
+        edges: List[Tuple[str, str, str, str]] = []
+        ordered = sorted(tables)
+        if not ordered:
+            return edges
+        
+        connected = {ordered[0]}
+        for target in ordered[1:]:
+            # BFS from the already-connected set to the next table
+            previous: Dict[str, Tuple[str, str, str]] = {}
+            queue = deque(connected)
+            seen = set(connected)
+            while queue:
+                current = queue.popleft()
+                if current == target:
+                    break
+                for column, neighbour, neighbour_column in fk_graph.get(current, []):
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        previous[neighbour] = (current, column, neighbour_column)
+                        queue.append(neighbour)
+            
+            if target not in seen:
+                continue  # No join path; table is included on its own
+            
+            node = target
+            while node not in connected:
+                parent, column, neighbour_column = previous[node]
+                edge = (parent, column, node, neighbour_column)
+                if edge not in edges:
+                    edges.append(edge)
+                connected.add(node)
+                node = parent
+        
+        return edges
+    
+    def _render_compact(self, columns: Dict[str, List[str]], join_lines: List[str], compiled: Dict[str, Any]) -> str:
+        """Render selected tables and columns in the compact prompt format"""
+        lines = []
+        for table_name in sorted(columns):
+            lines.append(f"{table_name}: {compiled['descriptions'][table_name]}")
+            for column_name in columns[table_name]:
+                lines.append(f"  - {compiled['columns'][(table_name, column_name)]['text']}")
+        if join_lines:
+            lines.append("Joins:")
+            lines.extend(f"  - {line}" for line in join_lines)
+        return "\n".join(lines)
+    
+    def _estimate_tokens(self, text: str) -> int:
+        """Rough token estimate (~4 characters per token)"""
+        return len(text) // 4 + 1
     
     def get_human_readable_schema(self) -> str:
         """Get human-readable schema description"""
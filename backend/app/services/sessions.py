@@ -4,6 +4,7 @@ Handles conversation state and context for follow-up queries
 """
 
 import redis
+import redis.asyncio as aioredis
 import json
 import uuid
 from typing import Dict, List, Any, Optional
@@ -16,26 +17,20 @@ class ConversationManager:
     
     def __init__(self):
         self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.async_redis_client = aioredis.from_url(settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS)
         self.conversation_ttl = 3600  # 1 hour
         self.max_turns = 10  # Maximum turns per conversation
     
     def create_conversation(self, user_id: int) -> str:
         """Create a new conversation"""
         conversation_id = str(uuid.uuid4())
-        
-        conversation_data = {
-            "id": conversation_id,
-            "user_id": user_id,
-            "created_at": datetime.utcnow().isoformat(),
-            "turns": [],
-            "context": {
-                "last_query": None,
-                "last_sql": None,
-                "last_explain": None
-            }
-        }
-        
-        self._save_conversation(conversation_id, conversation_data)
+        self._save_conversation(conversation_id, self._new_conversation_data(conversation_id, user_id))
+        return conversation_id
+    
+    async def create_conversation_async(self, user_id: int) -> str:
+        """Create a new conversation without blocking the event loop"""
+        conversation_id = str(uuid.uuid4())
+        await self._save_conversation_async(conversation_id, self._new_conversation_data(conversation_id, user_id))
         return conversation_id
     
     def get_conversation(self, conversation_id: str) -> Dict[str, Any]:
@@ -46,10 +41,58 @@ class ConversationManager:
         
         return conversation_data
     
+    async def get_conversation_async(self, conversation_id: str) -> Dict[str, Any]:
+        """Get conversation by ID without blocking the event loop"""
+        conversation_data = await self._get_conversation_async(conversation_id)
+        if not conversation_data:
+            raise ConversationNotFoundError(f"Conversation {conversation_id} not found")
+        
+        return conversation_data
+    
     def add_turn(self, conversation_id: str, prompt: str, sql: str, explain: Dict[str, Any]) -> None:
         """Add a turn to the conversation"""
         conversation_data = self.get_conversation(conversation_id)
-        
+        self._append_turn(conversation_data, prompt, sql, explain)
+        self._save_conversation(conversation_id, conversation_data)
+    
+    async def add_turn_async(self, conversation_id: str, prompt: str, sql: str, explain: Dict[str, Any]) -> None:
+        """Add a turn to the conversation without blocking the event loop"""
+        conversation_data = await self.get_conversation_async(conversation_id)
+        self._append_turn(conversation_data, prompt, sql, explain)
+        await self._save_conversation_async(conversation_id, conversation_data)
+    
+    def get_context_for_followup(self, conversation_id: str) -> Optional[str]:
+        """Get context string for follow-up queries"""
+        return self._build_followup_context(self.get_conversation(conversation_id))
+    
+    async def get_context_for_followup_async(self, conversation_id: str) -> Optional[str]:
+        """Get context string for follow-up queries without blocking the event loop"""
+        return self._build_followup_context(await self.get_conversation_async(conversation_id))
+    
+    def refine_query(self, conversation_id: str, followup: str) -> Dict[str, Any]:
+        """Handle follow-up query refinement"""
+        return self._build_refinement_context(self.get_conversation(conversation_id), followup)
+    
+    async def refine_query_async(self, conversation_id: str, followup: str) -> Dict[str, Any]:
+        """Handle follow-up query refinement without blocking the event loop"""
+        return self._build_refinement_context(await self.get_conversation_async(conversation_id), followup)
+    
+    def _new_conversation_data(self, conversation_id: str, user_id: int) -> Dict[str, Any]:
+        """Build the initial state for a conversation"""
+        return {
+            "id": conversation_id,
+            "user_id": user_id,
+            "created_at": datetime.utcnow().isoformat(),
+            "turns": [],
+            "context": {
+                "last_query": None,
+                "last_sql": None,
+                "last_explain": None
+            }
+        }
+    
+    def _append_turn(self, conversation_data: Dict[str, Any], prompt: str, sql: str, explain: Dict[str, Any]) -> None:
+        """Append a turn to conversation data and update its context"""
         turn = {
             "turn_number": len(conversation_data["turns"]) + 1,
             "prompt": prompt,
@@ -68,13 +111,9 @@ class ConversationManager:
         # Limit number of turns
         if len(conversation_data["turns"]) > self.max_turns:
             conversation_data["turns"] = conversation_data["turns"][-self.max_turns:]
-        
-        self._save_conversation(conversation_id, conversation_data)
     
-    def get_context_for_followup(self, conversation_id: str) -> Optional[str]:
-        """Get context string for follow-up queries"""
-        conversation_data = self.get_conversation(conversation_id)
-        
+    def _build_followup_context(self, conversation_data: Dict[str, Any]) -> Optional[str]:
+        """Build context string from the most recent turns"""
         if not conversation_data["turns"]:
             return None
         
@@ -90,10 +129,8 @@ class ConversationManager:
         
         return "\n".join(context_parts)
     
-    def refine_query(self, conversation_id: str, followup: str) -> Dict[str, Any]:
-        """Handle follow-up query refinement"""
-        conversation_data = self.get_conversation(conversation_id)
-        
+    def _build_refinement_context(self, conversation_data: Dict[str, Any], followup: str) -> Dict[str, Any]:
+        """Build refinement context from the last turn"""
         if not conversation_data["turns"]:
             raise ConversationNotFoundError("No previous query to refine")
         
@@ -123,6 +160,17 @@ class ConversationManager:
         except Exception as e:
             print(f"Failed to save conversation: {e}")
     
+    async def _save_conversation_async(self, conversation_id: str, conversation_data: Dict[str, Any]) -> None:
+        """Save conversation to Redis without blocking the event loop"""
+        try:
+            await self.async_redis_client.setex(
+                f"conversation:{conversation_id}",
+                self.conversation_ttl,
+                json.dumps(conversation_data)
+            )
+        except Exception as e:
+            print(f"Failed to save conversation: {e}")
+    
     def _get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """Get conversation from Redis"""
         try:
@@ -133,6 +181,16 @@ class ConversationManager:
             print(f"Failed to get conversation: {e}")
         return None
     
+    async def _get_conversation_async(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Get conversation from Redis without blocking the event loop"""
+        try:
+            cached = await self.async_redis_client.get(f"conversation:{conversation_id}")
+            if cached:
+                return json.loads(cached)
+        except Exception as e:
+            print(f"Failed to get conversation: {e}")
+        return None
+    
     def cleanup_expired_conversations(self) -> None:
         """Clean up expired conversations (called periodically)"""
         # Redis TTL handles this automatically
@@ -0,0 +1,155 @@
+"""
+Stale-While-Revalidate Cache Policy
+Soft and hard TTLs for query results, probabilistic early refresh, and one recompute per entry across workers
+"""
+
+import asyncio
+import math
+import random
+import time
+import redis
+import redis.asyncio as aioredis
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from app.core.config import settings
+
+# SQLSTATEs meaning the database is overloaded, restarting or gave up on the statement, not that the query is wrong
+UNAVAILABLE_SQLSTATES = {"57014", "57P01", "57P02", "57P03", "53300", "08000", "08001", "08003", "08006"}
+
+class StaleWhileRevalidate:
+    """Decides when a cached result is served, refreshed, or stands in for a failed query
+
+    Entries are stored with the time they were computed and how long that
+    took. Past the soft TTL (or earlier, with a probability that grows with
+    age and compute cost, so popular entries rarely expire under load) the
+    stale value is still returned while the one request that claims the
+    entry's Redis refresh lock recomputes it in the background. Redis drops
+    entries at the hard TTL.
+    """
+    
+    def __init__(self):
+        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.async_redis_client = aioredis.from_url(settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS)
+        self.enabled = settings.QUERY_CACHE_SERVE_STALE
+        self.soft_ttl = settings.QUERY_CACHE_SOFT_TTL_SECONDS
+        self.beta = settings.QUERY_CACHE_EARLY_REFRESH_BETA
+        self.lock_ttl_ms = int(settings.QUERY_CACHE_REFRESH_LOCK_SECONDS * 1000)
+        self._pool = ThreadPoolExecutor(max_workers=settings.QUERY_CACHE_REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+        self._tasks: Set[asyncio.Task] = set()
+        self.counters = {
+            "fresh_hits": 0,
+            "stale_hits": 0,
+            "early_refreshes": 0,
+            "background_refreshes": 0,
+            "refresh_errors": 0,
+            "stale_after_write": 0,
+            "stale_on_error": 0
+        }
+    
+    def wrap(self, result: Dict[str, Any], compute_seconds: float) -> Dict[str, Any]:
+        """Stored form of a result: the value plus when and how expensively it was computed"""
+        return {"result": result, "stored_at": time.time(), "compute_seconds": compute_seconds}
+    
+    def unwrap(self, stored: Dict[str, Any]) -> Tuple[Dict[str, Any], float, float]:
+        """Result, age in seconds and compute cost of a stored entry (bare results count as just computed)"""
+        if "stored_at" not in stored or "result" not in stored:
+            return stored, 0.0, 0.0
+        return stored["result"], max(time.time() - stored["stored_at"], 0.0), stored.get("compute_seconds", 0.0)
+    
+    def due(self, age: float, compute_seconds: float, soft_ttl: Optional[float] = None) -> bool:
+        """Whether an entry should be recomputed: past the soft TTL, or early with XFetch probability"""
+        if not self.enabled:
+            return False
+        soft_ttl = self.soft_ttl if soft_ttl is None else soft_ttl
+        if age >= soft_ttl:
+            self.counters["stale_hits"] += 1
+            return True
+        # -log(U) is exponential: costlier entries start refreshing further ahead of the soft TTL
+        if compute_seconds and age + compute_seconds * self.beta * -math.log(1.0 - random.random()) >= soft_ttl:
+            self.counters["early_refreshes"] += 1
+            return True
+        self.counters["fresh_hits"] += 1
+        return False
+    
+    def claim(self, cache_key: str) -> bool:
+        """Take the entry's refresh lock; True if this caller should recompute it"""
+        try:
+            return bool(self.redis_client.set(self._lock_key(cache_key), "1", nx=True, px=self.lock_ttl_ms))
+        except Exception:
+            return True  # Without Redis there is nobody to coordinate with
+    
+    async def claim_async(self, cache_key: str) -> bool:
+        """Take the refresh lock without blocking the event loop"""
+        try:
+            return bool(await self.async_redis_client.set(self._lock_key(cache_key), "1", nx=True, px=self.lock_ttl_ms))
+        except Exception:
+            return True
+    
+    def release(self, cache_key: str) -> None:
+        """Drop the refresh lock"""
+        try:
+            self.redis_client.delete(self._lock_key(cache_key))
+        except Exception:
+            pass
+    
+    async def release_async(self, cache_key: str) -> None:
+        """Drop the refresh lock without blocking the event loop"""
+        try:
+            await self.async_redis_client.delete(self._lock_key(cache_key))
+        except Exception:
+            pass
+    
+    def refresh_in_background(self, cache_key: str, fn: Callable[[], Any]) -> None:
+        """Run a claimed recompute on the refresh pool, releasing the lock when it ends"""
+        def refresh() -> None:
+            try:
+                fn()
+                self.counters["background_refreshes"] += 1
+            except Exception:
+                self.counters["refresh_errors"] += 1
+            finally:
+                self.release(cache_key)
+        
+        self._pool.submit(refresh)
+    
+    def refresh_in_background_async(self, cache_key: str, fn: Callable[[], Awaitable[Any]]) -> None:
+        """Run a claimed recompute as a task on the event loop"""
+        async def refresh() -> None:
+            try:
+                await fn()
+                self.counters["background_refreshes"] += 1
+            except Exception:
+                self.counters["refresh_errors"] += 1
+            finally:
+                await self.release_async(cache_key)
+        
+        task = asyncio.create_task(refresh())
+        # Keep a reference so the task is not garbage collected mid-refresh
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    def unavailable(self, error: BaseException) -> bool:
+        """Whether a query failure means the database is down, overloaded or too slow"""
+        if isinstance(error, (OperationalError, InterfaceError, PoolTimeoutError, OSError, asyncio.TimeoutError)):
+            return True
+        original = getattr(error, "orig", None)
+        return (getattr(original, "sqlstate", None) or getattr(original, "pgcode", None)) in UNAVAILABLE_SQLSTATES
+    
+    def stale_result(self, result: Dict[str, Any], age: float, reason: str) -> Dict[str, Any]:
+        """Copy of a stale result carrying a warning about its age"""
+        self.counters["stale_after_write" if reason == "refreshing" else "stale_on_error"] += 1
+        why = "a newer result is being computed" if reason == "refreshing" else "the database is unavailable or timed out"
+        warning = f"Served a cached result from {int(age)}s ago because {why}; it may not include the latest writes"
+        return {**result, "warnings": list(result.get("warnings", [])) + [warning]}
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit, refresh and stale-serving counters"""
+        return {**self.counters, "refreshes_in_flight": len(self._tasks)}
+    
+    def _lock_key(self, cache_key: str) -> str:
+        """Redis key of an entry's refresh lock"""
+        return f"refresh:{cache_key}"
+
+# Global stale-while-revalidate policy for query results
+stale_cache = StaleWhileRevalidate()
@@ -0,0 +1,153 @@
+"""
+Table Version Service
+Per-table version counters in Redis, bumped on writes, that key cached query results for exact invalidation
+"""
+
+import select
+import threading
+import time
+import redis
+import redis.asyncio as aioredis
+from typing import Any, Dict, Iterable, Optional
+from app.core.config import settings
+
+# Channel the migration 002 triggers notify on, with the changed table name as payload
+NOTIFY_CHANNEL = "table_changed"
+
+class TableVersions:
+    """Version counters per table and a LISTEN loop that bumps them on Postgres NOTIFY"""
+    
+    def __init__(self):
+        self.redis_client = redis.from_url(settings.REDIS_URL)
+        self.async_redis_client = aioredis.from_url(settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS)
+        self._stop = threading.Event()
+        self._listener: Optional[threading.Thread] = None
+        self.counters = {"bumps": 0, "notifications": 0, "listener_errors": 0}
+    
+    def fingerprint(self, tables: Iterable[str]) -> Optional[str]:
+        """Current versions of the given tables, e.g. "customers=3,orders=17"
+        
+        Returns "" for no tables and None when Redis is unavailable, in which
+        case results must not be cached because they could not be invalidated.
+        """
+        names = sorted(set(tables))
+        if not names:
+            return ""
+        try:
+            values = self.redis_client.mget([self._key(name) for name in names])
+        except Exception:
+            return None
+        return self._format(names, values)
+    
+    async def fingerprint_async(self, tables: Iterable[str]) -> Optional[str]:
+        """Current versions of the given tables without blocking the event loop"""
+        names = sorted(set(tables))
+        if not names:
+            return ""
+        try:
+            values = await self.async_redis_client.mget([self._key(name) for name in names])
+        except Exception:
+            return None
+        return self._format(names, values)
+    
+    def last_changed(self, tables: Iterable[str]) -> Optional[float]:
+        """Unix time of the latest bump of any of the tables (0.0 if never), or None when Redis is unavailable"""
+        names = sorted(set(tables))
+        if not names:
+            return 0.0
+        try:
+            values = self.redis_client.mget([self._changed_key(name) for name in names])
+        except Exception:
+            return None
+        return max(float(value or 0) for value in values)
+    
+    async def last_changed_async(self, tables: Iterable[str]) -> Optional[float]:
+        """Latest bump time of the tables without blocking the event loop"""
+        names = sorted(set(tables))
+        if not names:
+            return 0.0
+        try:
+            values = await self.async_redis_client.mget([self._changed_key(name) for name in names])
+        except Exception:
+            return None
+        return max(float(value or 0) for value in values)
+    
+    def bump(self, tables: Iterable[str]) -> None:
+        """Invalidate every cached result that read any of these tables"""
+        names = sorted(set(tables))
+        if not names:
+            return
+        try:
+            changed_at = time.time()
+            pipeline = self.redis_client.pipeline()
+            for name in names:
+                pipeline.incr(self._key(name))
+                pipeline.set(self._changed_key(name), changed_at)
+            pipeline.execute()
+            self.counters["bumps"] += len(names)
+        except Exception:
+            pass  # Cache failures shouldn't break the app
+    
+    def start_listener(self) -> None:
+        """Start bumping versions from Postgres NOTIFY in a background thread"""
+        if self._listener is not None and self._listener.is_alive():
+            return
+        self._stop.clear()
+        self._listener = threading.Thread(target=self._listen, name="table-version-listener", daemon=True)
+        self._listener.start()
+    
+    def stop_listener(self) -> None:
+        """Stop the NOTIFY listener"""
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.join(timeout=2.0)
+            self._listener = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """Bump counters and listener state"""
+        return {**self.counters, "listening": self._listener is not None and self._listener.is_alive()}
+    
+    def _listen(self) -> None:
+        """LISTEN loop; reconnects after database errors"""
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+        
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(settings.DATABASE_URL)
+                connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                
+                while not self._stop.is_set():
+                    if select.select([connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    tables = set()
+                    while connection.notifies:
+                        tables.add(connection.notifies.pop(0).payload)
+                    if tables:
+                        self.counters["notifications"] += len(tables)
+                        self.bump(tables)
+            except Exception:
+                self.counters["listener_errors"] += 1
+                self._stop.wait(5.0)
+            finally:
+                if connection is not None:
+                    connection.close()
+    
+    def _key(self, table_name: str) -> str:
+        """Redis key holding a table's version"""
+        return f"table_version:{table_name}"
+    
+    def _changed_key(self, table_name: str) -> str:
+        """Redis key holding when a table's version was last bumped"""
+        return f"table_changed_at:{table_name}"
+    
+    def _format(self, names: Iterable[str], values: Iterable[Any]) -> str:
+        """Render names and raw Redis values as a fingerprint"""
+        return ",".join(f"{name}={int(value or 0)}" for name, value in zip(names, values))
+
+# Global table version tracker
+table_versions = TableVersions()
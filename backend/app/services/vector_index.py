@@ -0,0 +1,321 @@
+"""
+Vector Index Service
+In-process hashed n-gram similarity index for grounding prompt terms to schema columns and values
+"""
+
+import os
+import re
+import json
+import zlib
+import hashlib
+import threading
+import numpy as np
+from typing import Dict, List, Any, Optional, Tuple
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services.schema_registry import schema_registry
+
+# Categorical columns whose distinct values are indexed for literal grounding
+VALUE_COLUMNS = [
+    ("orders", "region"),
+    ("customers", "segment"),
+    ("customers", "country"),
+    ("products", "product_line"),
+    ("products", "category")
+]
+
+# Business shorthand -> canonical values it stands for (only indexed when the values exist)
+VALUE_ALIASES = {
+    "emea": ["Europe", "Middle East"],
+    "europe and middle east": ["Europe", "Middle East"],
+    "apac": ["Asia Pacific"],
+    "asia": ["Asia Pacific"],
+    "latam": ["Latin America"],
+    "south america": ["Latin America"],
+    "amer": ["North America"],
+    "nam": ["North America"],
+    "united states": ["USA"],
+    "united kingdom": ["UK"],
+    "britain": ["UK"],
+    "small business": ["SMB"],
+    "small and medium business": ["SMB"],
+    "large enterprise": ["Enterprise"],
+    "server": ["Servers"],
+    "cloud": ["Cloud Services"],
+    "network": ["Networking"],
+    "workstation": ["Workstations"]
+}
+
+# Words never grounded to a value on their own
+GROUNDING_STOPWORDS = {
+    "a", "an", "the", "of", "in", "for", "by", "per", "each", "and", "or", "with", "to", "on", "at",
+    "from", "during", "over", "across", "only", "just", "all", "total", "me", "show", "what", "is",
+    "are", "was", "were", "our", "my", "vs", "versus", "than", "top", "not"
+}
+
+class VectorIndex:
+    """Memory-mapped matrix of L2-normalized hashed n-gram vectors with document metadata"""
+    
+    def __init__(self, path: Optional[str] = None, dim: Optional[int] = None):
+        self.path = path or settings.VECTOR_INDEX_PATH
+        self.dim = dim or settings.VECTOR_INDEX_DIM
+        self.min_score = settings.VECTOR_INDEX_MIN_SCORE
+        self.docs: List[Dict[str, Any]] = []
+        self.matrix: Optional[np.ndarray] = None
+        self._value_rows: Optional[np.ndarray] = None
+        self._value_matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self._builder: Optional[threading.Thread] = None
+        self.last_build = {"documents": 0, "reused": 0, "vectorized": 0}
+    
+    def vectorize(self, text_value: str) -> np.ndarray:
+        """Hash word unigrams and character trigrams into an L2-normalized vector"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text_value):
+            vector[zlib.crc32(feature.encode()) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def build(self, values: Optional[Dict[Tuple[str, str], List[str]]] = None) -> Dict[str, int]:
+        """Rebuild the index, re-vectorizing only documents that are new or changed"""
+        if values is None:
+            values = self._load_distinct_values()
+        docs = self._collect_documents(values)
+        
+        with self._lock:
+            previous_rows = {}
+            if self.matrix is None:
+                self._load()
+            if self.matrix is not None:
+                previous_rows = {doc["fingerprint"]: row for row, doc in enumerate(self.docs)}
+            
+            matrix = np.zeros((len(docs), self.dim), dtype=np.float32)
+            reused = 0
+            for row, doc in enumerate(docs):
+                previous = previous_rows.get(doc["fingerprint"])
+                if previous is not None:
+                    matrix[row] = self.matrix[previous]
+                    reused += 1
+                else:
+                    matrix[row] = self.vectorize(doc["text"])
+            
+            changed = reused != len(docs) or len(previous_rows) != len(docs)
+            if changed and self._persist(matrix, docs):
+                matrix = np.load(f"{self.path}.npy", mmap_mode="r")
+            self._set_index(docs, matrix)
+            self.last_build = {"documents": len(docs), "reused": reused, "vectorized": len(docs) - reused}
+        return self.last_build
+    
+    def ensure_loaded(self) -> bool:
+        """Load the persisted index, or start building it in the background; whether it is ready
+        
+        Callers on the request path (often the event loop) never wait for a
+        build's database reads and file writes: until the build finishes they
+        see an empty index and prompts go ungrounded. The startup hook builds
+        the index before requests arrive, so this only matters without it.
+        """
+        if self.matrix is not None:
+            return True
+        with self._lock:
+            self._load()
+            if self.matrix is None and self._builder is None:
+                self._builder = threading.Thread(target=self._build_in_background, name="vector-index-build", daemon=True)
+                self._builder.start()
+        return self.matrix is not None
+    
+    def search(self, query: str, k: int = 5, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return the k most similar documents, optionally restricted to one kind"""
+        if not self.ensure_loaded() or not self.docs:
+            return []
+        
+        scores = self.matrix @ self.vectorize(query)
+        order = np.argsort(-scores)
+        results = []
+        for row in order:
+            doc = self.docs[row]
+            if kind and doc["kind"] != kind:
+                continue
+            results.append({**self._public(doc), "score": round(float(scores[row]), 4)})
+            if len(results) == k:
+                break
+        return results
+    
+    def ground_values(self, prompt: str, max_span: int = 3) -> List[Dict[str, Any]]:
+        """Map prompt phrases to categorical column literals
+        
+        Every 1-3 word span is scored against the value documents in a single
+        matrix product; the best non-overlapping matches above the similarity
+        threshold are returned in prompt order.
+        """
+        if not self.ensure_loaded() or self._value_rows is None or not len(self._value_rows):
+            return []
+        
+        words = self.tokenize(prompt)
+        spans = [
+            (start, start + length)
+            for length in range(max_span, 0, -1)
+            for start in range(len(words) - length + 1)
+            if words[start] not in GROUNDING_STOPWORDS
+            and words[start + length - 1] not in GROUNDING_STOPWORDS
+            and not words[start].isdigit()
+        ]
+        if not spans:
+            return []
+        
+        queries = np.stack([self.vectorize(" ".join(words[start:end])) for start, end in spans])
+        scores = queries @ self._value_matrix.T
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(spans)), best]
+        
+        # Highest score wins; longer spans first on ties
+        candidates = sorted(
+            range(len(spans)),
+            key=lambda i: (-round(float(best_scores[i]), 4), -(spans[i][1] - spans[i][0]), spans[i][0])
+        )
+        taken = set()
+        matches = []
+        for i in candidates:
+            if best_scores[i] < self.min_score:
+                break
+            start, end = spans[i]
+            if taken.intersection(range(start, end)):
+                continue
+            taken.update(range(start, end))
+            doc = self.docs[self._value_rows[best[i]]]
+            matches.append({
+                "phrase": " ".join(words[start:end]),
+                "table": doc["table"],
+                "column": doc["column"],
+                "values": doc["values"],
+                "score": round(float(best_scores[i]), 4),
+                "position": start
+            })
+        
+        return sorted(matches, key=lambda match: match["position"])
+    
+    def tokenize(self, prompt: str) -> List[str]:
+        """Word tokens; match positions from ground_values index into this list"""
+        return re.findall(r"[a-z0-9]+(?:[\-'][a-z0-9]+)*", prompt.lower())
+    
+    def stats(self) -> Dict[str, Any]:
+        """Index size and last build counters"""
+        return {
+            "documents": len(self.docs),
+            "dim": self.dim,
+            "last_build": self.last_build
+        }
+    
+    def _features(self, text_value: str) -> List[str]:
+        """Word unigrams plus boundary-padded character trigrams"""
+        features = []
+        for word in re.findall(r"[a-z0-9]+", text_value.lower()):
+            features.append(f"w:{word}")
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+    
+    def _collect_documents(self, values: Dict[Tuple[str, str], List[str]]) -> List[Dict[str, Any]]:
+        """Documents for tables, columns, distinct values and value aliases"""
+        docs = []
+        for table in schema_registry.get_all_tables().values():
+            docs.append(self._document("table", table.name, None, [], f"{table.name} {table.description}"))
+            for column in table.columns:
+                docs.append(self._document(
+                    "column", table.name, column.name, [],
+                    f"{table.name} {column.name.replace('_', ' ')} {column.description}"
+                ))
+        
+        value_columns = {}
+        for (table_name, column_name), column_values in sorted(values.items()):
+            for value in sorted(set(column_values)):
+                docs.append(self._document("value", table_name, column_name, [value], value))
+                value_columns[value] = (table_name, column_name)
+        
+        for alias, targets in VALUE_ALIASES.items():
+            columns = {value_columns.get(target) for target in targets}
+            if None in columns or len(columns) != 1:
+                continue  # Alias only applies when all its values live in one indexed column
+            table_name, column_name = columns.pop()
+            docs.append(self._document("value", table_name, column_name, targets, alias))
+        
+        return docs
+    
+    def _document(self, kind: str, table: str, column: Optional[str], values: List[str], text_value: str) -> Dict[str, Any]:
+        """Document metadata with a fingerprint used for incremental rebuilds"""
+        payload = json.dumps([kind, table, column, values, text_value, self.dim])
+        return {
+            "kind": kind,
+            "table": table,
+            "column": column,
+            "values": values,
+            "text": text_value,
+            "fingerprint": hashlib.md5(payload.encode()).hexdigest()
+        }
+    
+    def _public(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Document fields exposed to callers"""
+        return {key: doc[key] for key in ("kind", "table", "column", "values", "text")}
+    
+    def _build_in_background(self) -> None:
+        """Build the index for ensure_loaded, allowing another attempt if it fails"""
+        try:
+            self.build()
+        finally:
+            self._builder = None
+    
+    def _load_distinct_values(self) -> Dict[Tuple[str, str], List[str]]:
+        """Read distinct categorical values for whitelisted columns"""
+        values = {}
+        db = SessionLocal()
+        try:
+            for table_name, column_name in VALUE_COLUMNS:
+                if not schema_registry.validate_column(table_name, column_name):
+                    continue
+                rows = db.execute(text(
+                    f"SELECT DISTINCT {column_name} FROM {table_name} WHERE {column_name} IS NOT NULL LIMIT 1000"
+                )).fetchall()
+                values[(table_name, column_name)] = [str(row[0]) for row in rows]
+        except Exception:
+            pass  # Without a database the index still covers schema documents
+        finally:
+            db.close()
+        return values
+    
+    def _persist(self, matrix: np.ndarray, docs: List[Dict[str, Any]]) -> bool:
+        """Write the matrix and metadata atomically next to each other"""
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_matrix = np.lib.format.open_memmap(f"{self.path}.tmp.npy", mode="w+", dtype=np.float32, shape=matrix.shape)
+            tmp_matrix[:] = matrix
+            tmp_matrix.flush()
+            del tmp_matrix
+            with open(f"{self.path}.tmp.json", "w") as meta_file:
+                json.dump({"dim": self.dim, "docs": docs}, meta_file)
+            os.replace(f"{self.path}.tmp.npy", f"{self.path}.npy")
+            os.replace(f"{self.path}.tmp.json", f"{self.path}.json")
+            return True
+        except OSError:
+            return False  # A read-only filesystem only costs a rebuild on next start
+    
+    def _load(self) -> None:
+        """Memory-map a previously persisted index if it matches the configured dimension"""
+        try:
+            with open(f"{self.path}.json") as meta_file:
+                meta = json.load(meta_file)
+            matrix = np.load(f"{self.path}.npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return
+        if meta.get("dim") != self.dim or matrix.shape != (len(meta["docs"]), self.dim):
+            return
+        self._set_index(meta["docs"], matrix)
+    
+    def _set_index(self, docs: List[Dict[str, Any]], matrix: np.ndarray) -> None:
+        """Swap in a new document list and matrix"""
+        self.docs = docs
+        self.matrix = matrix
+        self._value_rows = np.array([row for row, doc in enumerate(docs) if doc["kind"] == "value"], dtype=np.intp)
+        self._value_matrix = np.ascontiguousarray(matrix[self._value_rows])
+
+# Global vector index instance
+vector_index = VectorIndex()
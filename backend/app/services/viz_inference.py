@@ -5,24 +5,34 @@ Analyzes query results to suggest appropriate chart types
 
 from typing import List, Dict, Any, Optional
 import re
+from app.services.column_profiler import column_profiler
 
 class ChartInferenceEngine:
     """Infers chart types from query results"""
     
     def __init__(self):
         self.chart_types = ["bar", "line", "pie", "scatter"]
+        self.profiler = column_profiler
     
-    def infer_chart_type(self, columns: List[str], rows: List[List[Any]], sql: str) -> Optional[str]:
-        """Infer the best chart type for the given data"""
-        
-        if not rows or len(rows) < 2:
+    def infer_chart_type(
+        self,
+        columns: List[str],
+        rows: List[List[Any]],
+        sql: str,
+        profile: Optional[List[Dict[str, Any]]] = None
+    ) -> Optional[str]:
+        """Infer the best chart type for the given data (profiling the rows unless a column profile is given)"""
+        
+        if profile is None:
+            profile = self.profiler.profile_rows(columns, rows)
+        if not profile or profile[0]["count"] < 2:
             return None
         
         # Analyze SQL to understand query intent
         sql_analysis = self._analyze_sql(sql)
         
         # Analyze data structure
-        data_analysis = self._analyze_data_structure(columns, rows)
+        data_analysis = self._analyze_data_structure(columns, profile)
         
         # Combine analyses to determine chart type
         chart_type = self._determine_chart_type(sql_analysis, data_analysis)
@@ -43,26 +53,19 @@ class ChartInferenceEngine:
         
         return analysis
     
-    def _analyze_data_structure(self, columns: List[str], rows: List[List[Any]]) -> Dict[str, Any]:
-        """Analyze the structure of the data"""
-        
-        numeric_columns = []
-        categorical_columns = []
-        date_columns = []
-        
-        for i, col in enumerate(columns):
-            if self._is_numeric_column(rows, i):
-                numeric_columns.append(i)
-            elif self._is_date_column(rows, i):
-                date_columns.append(i)
-            else:
-                categorical_columns.append(i)
+    def _analyze_data_structure(self, columns: List[str], profile: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Analyze the structure of the data from its column profile"""
+        
+        kinds = self.profiler.kinds(profile)
+        numeric_columns = kinds["numeric"]
+        categorical_columns = kinds["categorical"]
+        date_columns = kinds["date"]
         
         analysis = {
             "numeric_columns": numeric_columns,
             "categorical_columns": categorical_columns,
             "date_columns": date_columns,
-            "row_count": len(rows),
+            "row_count": profile[0]["count"],
             "column_count": len(columns),
             "has_time_series": len(date_columns) > 0,
             "has_categories": len(categorical_columns) > 0,
@@ -99,29 +102,6 @@ class ChartInferenceEngine:
         
         return None
     
-    def _is_numeric_column(self, rows: List[List[Any]], column_index: int) -> bool:
-        """Check if column contains numeric data"""
-        try:
-            for row in rows[:5]:  # Check first 5 rows
-                if row[column_index] is not None:
-                    float(row[column_index])
-            return True
-        except (ValueError, TypeError):
-            return False
-    
-    def _is_date_column(self, rows: List[List[Any]], column_index: int) -> bool:
-        """Check if column contains date data"""
-        try:
-            for row in rows[:3]:  # Check first 3 rows
-                if row[column_index] is not None:
-                    str(row[column_index])
-                    # Simple date pattern check
-                    if re.match(r'\d{4}-\d{2}-\d{2}', str(row[column_index])):
-                        return True
-            return False
-        except (ValueError, TypeError):
-            return False
-    
     def _estimate_row_count(self, sql_upper: str) -> int:
         """Estimate row count from SQL"""
         limit_match = re.search(r'LIMIT\s+(\d+)', sql_upper)
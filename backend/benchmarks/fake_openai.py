@@ -0,0 +1,176 @@
+"""
+Fake OpenAI chat-completions server
+Local stand-in for the OpenAI API with configurable latency, jitter, error rate and canned SQL
+
+Usage (from backend/):
+    python -m benchmarks.fake_openai --port 9100 --latency-ms 800 --jitter-ms 200
+
+Then start the API with OPENAI_BASE_URL=http://localhost:9100/v1 and any OPENAI_API_KEY.
+GET /stats reports request and token counters.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# (keywords that must all appear in the prompt, SQL returned); first match wins
+CANNED_SQL: List[Tuple[Tuple[str, ...], str]] = [
+    (("product line",), "SELECT o.region, p.product_line, SUM(o.quantity * o.unit_price) AS revenue FROM orders o JOIN products p ON o.product_id = p.product_id GROUP BY o.region, p.product_line ORDER BY revenue DESC"),
+    (("month",), "SELECT DATE_TRUNC('month', o.order_date) AS month, SUM(o.quantity * o.unit_price) AS revenue FROM orders o GROUP BY month ORDER BY month"),
+    (("customer",), "SELECT c.name, SUM(o.quantity * o.unit_price) AS revenue FROM orders o JOIN customers c ON o.customer_id = c.customer_id GROUP BY c.customer_id, c.name ORDER BY revenue DESC LIMIT 10"),
+    (("segment",), "SELECT c.segment, SUM(o.quantity * o.unit_price) AS revenue FROM orders o JOIN customers c ON o.customer_id = c.customer_id GROUP BY c.segment"),
+    (("category",), "SELECT p.category, SUM(o.quantity) AS units FROM orders o JOIN products p ON o.product_id = p.product_id GROUP BY p.category ORDER BY units DESC"),
+    (("region",), "SELECT o.region, SUM(o.quantity * o.unit_price) AS revenue FROM orders o GROUP BY o.region ORDER BY revenue DESC")
+]
+
+DEFAULT_SQL = "SELECT o.region, COUNT(*) AS order_count FROM orders o GROUP BY o.region"
+
+class FakeOpenAI:
+    """Chat-completions behaviour and counters for the fake server"""
+
+    def __init__(self, latency_ms: float = 500, jitter_ms: float = 100, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.counters = {"requests": 0, "streamed": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def completion_content(self, messages: List[Dict[str, Any]]) -> str:
+        """JSON body the real model is prompted to return"""
+        prompt = (messages[-1].get("content") or "").lower() if messages else ""
+        sql = next((sql for keywords, sql in CANNED_SQL if all(keyword in prompt for keyword in keywords)), DEFAULT_SQL)
+        return json.dumps({
+            "sql": sql,
+            "explain": {
+                "filters": [],
+                "groupBy": [],
+                "aggregates": [],
+                "sourceTables": ["orders"]
+            }
+        })
+
+    def delay_seconds(self) -> float:
+        """Sampled response latency"""
+        return max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+
+    def should_fail(self) -> bool:
+        """Sample an injected upstream error"""
+        return self.random.random() < self.error_rate
+
+    def count_tokens(self, messages: List[Dict[str, Any]], content: str) -> Dict[str, int]:
+        """Approximate usage (~4 characters per token) and update counters"""
+        prompt_tokens = sum(len(message.get("content") or "") for message in messages) // 4
+        completion_tokens = len(content) // 4
+        self.counters["prompt_tokens"] += prompt_tokens
+        self.counters["completion_tokens"] += completion_tokens
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+def create_app(fake: Optional[FakeOpenAI] = None) -> FastAPI:
+    """Build the fake API application"""
+    fake = fake or FakeOpenAI()
+    app = FastAPI(title="Fake OpenAI")
+    app.state.fake = fake
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "gpt-4")
+        fake.counters["requests"] += 1
+
+        await asyncio.sleep(fake.delay_seconds())
+        if fake.should_fail():
+            fake.counters["errors"] += 1
+            return JSONResponse(
+                status_code=503,
+                content={"error": {"message": "Injected upstream error", "type": "server_error"}}
+            )
+
+        content = fake.completion_content(messages)
+        usage = fake.count_tokens(messages, content)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if body.get("stream"):
+            fake.counters["streamed"] += 1
+            return StreamingResponse(
+                _stream_chunks(completion_id, created, model, content),
+                media_type="text/event-stream"
+            )
+
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        }
+
+    # The OpenAI SDK appends /chat/completions to the configured base URL
+    app.add_api_route("/v1/chat/completions", chat_completions, methods=["POST"])
+    app.add_api_route("/chat/completions", chat_completions, methods=["POST"])
+
+    @app.get("/stats")
+    async def stats():
+        return fake.counters
+
+    return app
+
+async def _stream_chunks(completion_id: str, created: int, model: str, content: str) -> AsyncIterator[str]:
+    """Emit the completion as chat.completion.chunk events"""
+    pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+    for index, piece in enumerate(pieces):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "delta": {"role": "assistant", "content": piece} if index == 0 else {"content": piece},
+                "finish_reason": None
+            }]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(0)
+
+    final = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+    }
+    yield f"data: {json.dumps(final)}\n\n"
+    yield "data: [DONE]\n\n"
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=500, help="mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="standard deviation of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+    fake = FakeOpenAI(args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
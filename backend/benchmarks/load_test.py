@@ -0,0 +1,226 @@
+"""
+End-to-end load test
+Drives /api/nlq/query, /api/conversation/refine and /api/nlq/execute at a target request rate
+and reports p50/p95/p99 latency and throughput per endpoint
+
+Usage (from backend/, with the API running against benchmarks.fake_openai and a seeded database):
+    python -m benchmarks.load_test --rps 20 --duration 60 --mix query=5,refine=3,execute=2
+    python -m benchmarks.load_test --rps 50 --duration 30 --max-p95-ms 1500 --json results.json
+
+Requests are scheduled open-loop: a slow server builds up in-flight requests instead of
+silently lowering the offered rate. Exit status is 1 when a --max-* threshold is exceeded.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import httpx
+from benchmarks.stats import summarize
+
+PROMPTS = [
+    "revenue by region in Q2 2024",
+    "top 10 customers by revenue",
+    "monthly revenue in 2024",
+    "average order value by customer segment",
+    "units sold by product category",
+    "revenue for enterprise customers excluding EMEA",
+    "which products had declining sales quarter over quarter",
+    "revenue by country for SMB customers in 2023"
+]
+
+FOLLOWUPS = [
+    "break it down by product line",
+    "by month",
+    "only for enterprise customers",
+    "show the top 5"
+]
+
+EXECUTE_SQL = [
+    "SELECT region, COUNT(*) AS order_count FROM orders GROUP BY region",
+    "SELECT product_id, SUM(quantity) AS units FROM orders GROUP BY product_id ORDER BY units DESC LIMIT 20",
+    "SELECT order_date, quantity, unit_price FROM orders WHERE order_date >= '2024-06-01' LIMIT 100"
+]
+
+class LoadTest:
+    """Open-loop request generator and latency recorder"""
+
+    def __init__(self, client: httpx.AsyncClient, mix: Dict[str, int], seed: int):
+        self.client = client
+        self.mix = mix
+        self.random = random.Random(seed)
+        self.conversations: Deque[str] = deque(maxlen=200)
+        self.samples: Dict[str, List[float]] = {endpoint: [] for endpoint in mix}
+        self.errors: Dict[str, int] = {endpoint: 0 for endpoint in mix}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def authenticate(self, username: Optional[str], password: str) -> None:
+        """Log in, registering a throwaway user when no username is given"""
+        if username is None:
+            username = f"loadtest_{uuid.uuid4().hex[:8]}"
+            response = await self.client.post("/api/auth/register", json={
+                "username": username,
+                "email": f"{username}@example.com",
+                "password": password
+            })
+        else:
+            response = await self.client.post("/api/auth/login", json={"username": username, "password": password})
+        response.raise_for_status()
+        self.client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+    async def run(self, rps: float, duration: float) -> float:
+        """Offer rps requests per second for duration seconds; returns elapsed wall time"""
+        endpoints = list(self.mix)
+        weights = [self.mix[endpoint] for endpoint in endpoints]
+        total = int(rps * duration)
+        tasks = []
+
+        started = time.perf_counter()
+        for i in range(total):
+            delay = started + i / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            endpoint = self.random.choices(endpoints, weights)[0]
+            tasks.append(asyncio.create_task(self.request(endpoint)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - started
+
+    async def request(self, endpoint: str) -> None:
+        """Issue one request and record its latency under the endpoint actually hit"""
+        if endpoint == "refine" and not self.conversations:
+            endpoint = "query"  # Nothing to refine yet
+        path, payload = self._build_request(endpoint)
+
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(path, json=payload)
+            ok = response.status_code == 200
+            if ok and endpoint == "query":
+                conversation_id = response.json().get("conversation_id")
+                if conversation_id:
+                    self.conversations.append(conversation_id)
+        except httpx.HTTPError:
+            ok = False
+        finally:
+            self.in_flight -= 1
+
+        self.samples.setdefault(endpoint, []).append((time.perf_counter() - start) * 1000)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        """Per-endpoint latency percentiles (ms), error counts and throughput (req/s)"""
+        endpoints = {}
+        for endpoint, samples in self.samples.items():
+            if not samples:
+                continue
+            endpoints[endpoint] = {
+                "requests": len(samples),
+                "errors": self.errors.get(endpoint, 0),
+                "throughput_rps": round(len(samples) / elapsed, 2),
+                **{key: round(value, 1) for key, value in summarize(samples).items()}
+            }
+
+        all_samples = [sample for samples in self.samples.values() for sample in samples]
+        overall = {
+            "requests": len(all_samples),
+            "errors": sum(self.errors.values()),
+            "throughput_rps": round(len(all_samples) / elapsed, 2),
+            "peak_in_flight": self.peak_in_flight,
+            **({key: round(value, 1) for key, value in summarize(all_samples).items()} if all_samples else {})
+        }
+        return {"elapsed_s": round(elapsed, 2), "endpoints": endpoints, "overall": overall}
+
+    def _build_request(self, endpoint: str) -> Tuple[str, Dict[str, Any]]:
+        """Path and JSON body for an endpoint"""
+        if endpoint == "query":
+            return "/api/nlq/query", {"prompt": self.random.choice(PROMPTS)}
+        if endpoint == "refine":
+            return "/api/conversation/refine", {
+                "conversation_id": self.random.choice(self.conversations),
+                "followup": self.random.choice(FOLLOWUPS)
+            }
+        return "/api/nlq/execute", {"sql": self.random.choice(EXECUTE_SQL)}
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """Parse "query=5,refine=3,execute=2" into endpoint weights"""
+    mix = {}
+    for part in value.split(","):
+        endpoint, _, weight = part.partition("=")
+        endpoint = endpoint.strip()
+        if endpoint not in ("query", "refine", "execute"):
+            raise argparse.ArgumentTypeError(f"unknown endpoint '{endpoint}'")
+        mix[endpoint] = int(weight or 1)
+    return mix
+
+def print_report(report: Dict[str, Any]) -> None:
+    """Human-readable summary table"""
+    print(f"{'endpoint':<10} {'reqs':>7} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = list(report["endpoints"].items()) + [("overall", report["overall"])]
+    for endpoint, stats in rows:
+        if "p50" not in stats:
+            continue
+        print(
+            f"{endpoint:<10} {stats['requests']:>7} {stats['errors']:>7} {stats['throughput_rps']:>8.2f} "
+            f"{stats['p50']:>9.1f} {stats['p95']:>9.1f} {stats['p99']:>9.1f} {stats['max']:>9.1f}"
+        )
+    print(f"\nelapsed {report['elapsed_s']}s, peak in-flight {report['overall']['peak_in_flight']}")
+
+async def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    """Authenticate, warm up, then run the measured phase"""
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        load_test = LoadTest(client, args.mix, args.seed)
+        await load_test.authenticate(args.username, args.password)
+
+        if args.warmup > 0:
+            await load_test.run(args.rps, args.warmup)
+            load_test.samples = {endpoint: [] for endpoint in args.mix}
+            load_test.errors = {endpoint: 0 for endpoint in args.mix}
+            load_test.peak_in_flight = 0
+
+        elapsed = await load_test.run(args.rps, args.duration)
+        return load_test.report(elapsed)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--rps", type=float, default=10, help="offered request rate")
+    parser.add_argument("--duration", type=float, default=30, help="measured phase in seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured warm-up phase in seconds")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("query=5,refine=3,execute=2"))
+    parser.add_argument("--username", default=None, help="existing user; a throwaway user is registered otherwise")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--max-connections", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the report to this file")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="fail if overall p95 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=None, help="fail if the error fraction exceeds this")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load_test(args))
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    overall = report["overall"]
+    failures = []
+    if args.max_p95_ms is not None and overall.get("p95", 0) > args.max_p95_ms:
+        failures.append(f"p95 {overall['p95']} ms > {args.max_p95_ms} ms")
+    if args.max_error_rate is not None and overall["requests"] and overall["errors"] / overall["requests"] > args.max_error_rate:
+        failures.append(f"error rate {overall['errors'] / overall['requests']:.3f} > {args.max_error_rate}")
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Parser latency benchmark
+Compares the rule-based fast path with the LLM path and reports which path auto mode picks
+
+Usage (from backend/):
+    python -m benchmarks.parser_latency              # rule path only
+    python -m benchmarks.parser_latency --llm        # also time real LLM calls (needs OPENAI_API_KEY)
+"""
+
+import argparse
+import statistics
+import time
+from typing import Dict, List
+from app.core.config import settings
+from benchmarks.stats import percentile
+from app.services.rule_parser import rule_based_parser
+from app.services.llm_client import llm_client
+
+PROMPTS = [
+    "revenue by region in Q2 2024",
+    "top 10 customers by revenue",
+    "monthly revenue in 2024",
+    "average order value by customer segment",
+    "number of orders by country since 2024-03-01",
+    "revenue by region in Q2 2024. break it down by product line",
+    "bottom 3 categories by units sold in first half of 2024",
+    "revenue for enterprise customers excluding EMEA",
+    "which products had declining sales quarter over quarter",
+    "orders in Q2 2024"
+]
+
+def time_rules(iterations: int) -> Dict[str, List[float]]:
+    """Time the rule-based parser per prompt, in microseconds"""
+    timings = {}
+    for prompt in PROMPTS:
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            rule_based_parser.parse(prompt)
+            samples.append((time.perf_counter() - start) * 1e6)
+        timings[prompt] = samples
+    return timings
+
+def time_llm(prompts: List[str]) -> Dict[str, float]:
+    """Time one LLM round trip per prompt, in microseconds"""
+    timings = {}
+    for prompt in prompts:
+        start = time.perf_counter()
+        llm_client.generate_sql(prompt)
+        timings[prompt] = (time.perf_counter() - start) * 1e6
+    return timings
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--llm", action="store_true", help="also time the LLM path")
+    args = parser.parse_args()
+
+    rule_timings = time_rules(args.iterations)
+    llm_timings = time_llm(PROMPTS) if args.llm else {}
+
+    print(f"{'prompt':<62} {'auto path':<10} {'conf':>5} {'rules p50':>11} {'rules p95':>11} {'llm':>12}")
+    served = {"rules": 0, "llm": 0}
+    for prompt in PROMPTS:
+        result = rule_based_parser.parse(prompt)
+        confidence = result["confidence"] if result else 0.0
+        path = "rules" if confidence >= settings.RULE_PARSER_MIN_CONFIDENCE else "llm"
+        served[path] += 1
+
+        samples = rule_timings[prompt]
+        llm_cell = f"{llm_timings[prompt] / 1000:.0f} ms" if prompt in llm_timings else "-"
+        print(
+            f"{prompt[:60]:<62} {path:<10} {confidence:>5.2f} "
+            f"{percentile(samples, 50):>8.1f} us {percentile(samples, 95):>8.1f} us {llm_cell:>12}"
+        )
+
+    all_samples = [sample for samples in rule_timings.values() for sample in samples]
+    print()
+    print(f"auto mode split: {served['rules']} rules / {served['llm']} llm of {len(PROMPTS)} prompts")
+    print(f"rules overall: mean {statistics.mean(all_samples):.1f} us, p99 {percentile(all_samples, 99):.1f} us")
+    if llm_timings:
+        print(f"llm overall: mean {statistics.mean(llm_timings.values()) / 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Load-test dataset seeder
+Fills Postgres with a deterministic, scalable copy of the sample business data
+
+Usage (from backend/):
+    python -m benchmarks.seed_dataset --orders 100000 --seed 42 --reset
+"""
+
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from sqlalchemy import insert, text
+from app.core.database import engine
+from app.models import Base, Customer, Product, Order
+from app.services.table_versions import table_versions
+
+SEGMENTS = ["Enterprise", "SMB"]
+COUNTRIES = ["USA", "Canada", "UK", "Germany", "Australia", "Japan", "India", "France", "Brazil", "Singapore"]
+PRODUCTS = [
+    ("Software", "Enterprise Software"),
+    ("Hardware", "Servers"),
+    ("Software", "Cloud Services"),
+    ("Hardware", "Storage"),
+    ("Software", "Analytics"),
+    ("Hardware", "Networking"),
+    ("Software", "Security"),
+    ("Hardware", "Workstations")
+]
+REGIONS = ["North America", "Europe", "Asia Pacific", "Latin America", "Middle East"]
+
+def seed(orders: int, customers: int, seed_value: int, reset: bool, chunk_size: int = 5000) -> None:
+    """Insert customers, products and orders in bulk"""
+    rng = random.Random(seed_value)
+    Base.metadata.create_all(bind=engine)
+
+    with engine.begin() as connection:
+        if reset:
+            connection.execute(text("TRUNCATE orders, customers, products RESTART IDENTITY CASCADE"))
+
+        customer_ids = connection.execute(
+            insert(Customer.__table__).returning(Customer.__table__.c.customer_id),
+            [
+                {"name": f"Customer {i:05d}", "segment": rng.choice(SEGMENTS), "country": rng.choice(COUNTRIES)}
+                for i in range(customers)
+            ]
+        ).scalars().all()
+
+        product_ids = connection.execute(
+            insert(Product.__table__).returning(Product.__table__.c.product_id),
+            [{"product_line": line, "category": category} for line, category in PRODUCTS]
+        ).scalars().all()
+
+        start_date = date(2023, 1, 1)
+        span_days = (date(2024, 12, 31) - start_date).days
+        for offset in range(0, orders, chunk_size):
+            connection.execute(insert(Order.__table__), [
+                {
+                    "customer_id": rng.choice(customer_ids),
+                    "product_id": rng.choice(product_ids),
+                    "order_date": start_date + timedelta(days=rng.randint(0, span_days)),
+                    "quantity": rng.randint(1, 100),
+                    "unit_price": round(rng.uniform(10.0, 1000.0), 2),
+                    "region": rng.choice(REGIONS)
+                }
+                for _ in range(min(chunk_size, orders - offset))
+            ])
+
+        connection.execute(text("ANALYZE orders, customers, products"))
+
+    # Invalidate cached results even when the NOTIFY triggers are not installed
+    table_versions.bump(["customers", "products", "orders"])
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="truncate orders, customers and products first")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    seed(args.orders, args.customers, args.seed, args.reset)
+    print(f"Seeded {args.orders} orders / {args.customers} customers in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+Latency statistics shared by the benchmarks
+"""
+
+import statistics
+from typing import Dict, List
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99, mean and max of a non-empty sample"""
+    return {
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+        "mean": statistics.mean(samples),
+        "max": max(samples)
+    }
@@ -0,0 +1,85 @@
+"""
+Test cases for the batch NLQ runner
+"""
+
+import asyncio
+import pytest
+from app.services.batch_runner import BatchRunner
+from app.services.nlq_parser import nlq_parser
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Fake LLM and DB stages that record peak concurrency"""
+    state = {"llm_active": 0, "llm_peak": 0, "db_active": 0, "db_peak": 0, "llm_calls": []}
+    
+    async def fake_generate_sql_async(prompt, context=None, on_token=None):
+        state["llm_calls"].append(prompt)
+        state["llm_active"] += 1
+        state["llm_peak"] = max(state["llm_peak"], state["llm_active"])
+        await asyncio.sleep(0.01)
+        state["llm_active"] -= 1
+        if "boom" in prompt:
+            raise Exception("model unavailable")
+        return {"sql": "SELECT region FROM orders", "explain": {}}
+    
+    async def fake_execute_query_async(sql, result_format="table", user_id=None):
+        state["db_active"] += 1
+        state["db_peak"] = max(state["db_peak"], state["db_active"])
+        await asyncio.sleep(0.01)
+        state["db_active"] -= 1
+        return {"columns": ["region"], "rows": [["Europe"]], "inferred_chart": None}
+    
+    async def fake_cache_get_async(cache_key):
+        return None
+    
+    async def fake_create_conversation_async(user_id):
+        return "conv-batch"
+    
+    async def fake_add_turn_async(conversation_id, prompt, sql, explain):
+        pass
+    
+    monkeypatch.setattr(nlq_parser, "parser_mode", "llm")
+    monkeypatch.setattr(nlq_parser.parse_cache, "get_async", fake_cache_get_async)
+    monkeypatch.setattr(nlq_parser.llm_client, "generate_sql_async", fake_generate_sql_async)
+    monkeypatch.setattr(nlq_parser.query_executor, "execute_query_async", fake_execute_query_async)
+    monkeypatch.setattr(nlq_parser.conversation_manager, "create_conversation_async", fake_create_conversation_async)
+    monkeypatch.setattr(nlq_parser.conversation_manager, "add_turn_async", fake_add_turn_async)
+    return state
+
+class TestBatchRunner:
+    """Test cases for bounded-concurrency batch execution"""
+    
+    @pytest.mark.asyncio
+    async def test_results_in_order_with_isolated_errors(self, pipeline):
+        """Test that one failing prompt does not fail the batch"""
+        items = [{"prompt": f"batch regions {i}"} for i in range(5)] + [{"prompt": "boom regions"}]
+        
+        response = await BatchRunner().run_ordered(items)
+        
+        assert [result["index"] for result in response["results"]] == list(range(6))
+        assert response["summary"]["succeeded"] == 5
+        assert response["summary"]["failed"] == 1
+        assert "model unavailable" in response["results"][5]["error"]
+        assert set(response["results"][0]["timing"]) == {"parse_ms", "execute_ms", "total_ms"}
+    
+    @pytest.mark.asyncio
+    async def test_concurrency_limits_are_separate(self, pipeline):
+        """Test that LLM and DB stages are bounded by their own limits"""
+        items = [{"prompt": f"limited regions {i}"} for i in range(12)]
+        
+        await BatchRunner().run_ordered(items, llm_concurrency=3, db_concurrency=2)
+        
+        assert pipeline["llm_peak"] == 3
+        assert pipeline["db_peak"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_duplicate_prompts_run_once(self, pipeline):
+        """Test that equivalent prompts share one execution"""
+        items = [{"prompt": "dedup regions"}, {"prompt": "Dedup   regions!"}, {"prompt": "other regions"}]
+        
+        response = await BatchRunner().run_ordered(items)
+        
+        assert len(pipeline["llm_calls"]) == 2
+        assert response["results"][1]["duplicate_of"] == 0
+        assert response["results"][1]["result"] == response["results"][0]["result"]
+        assert response["summary"]["deduplicated"] == 1
@@ -0,0 +1,153 @@
+"""
+Test cases for time bucketing and LTTB downsampling of chart results
+"""
+
+import math
+import pytest
+from datetime import date, timedelta
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.services import query_executor as query_executor_module
+from app.services.chart_reduction import ChartReducer
+from app.services.nlq_parser import nlq_parser
+
+class StoredRange:
+    """Executor stand-in answering the date range query"""
+    
+    def __init__(self, first, last):
+        self.rows = [[first, last]]
+        self.queries = []
+    
+    def execute_query(self, sql):
+        self.queries.append(sql)
+        return {"columns": ["first_date", "last_date"], "rows": self.rows}
+
+@pytest.fixture
+def reducer():
+    reducer = ChartReducer()
+    reducer.max_points = 500
+    return reducer
+
+@pytest.fixture
+def executor(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (order_id INTEGER, order_date TEXT, quantity INTEGER)"))
+        for day in range(1200):
+            connection.execute(
+                text("INSERT INTO orders VALUES (:id, :day, :quantity)"),
+                {"id": day, "day": (date(2021, 1, 1) + timedelta(days=day)).isoformat(), "quantity": day % 37}
+            )
+    monkeypatch.setattr(query_executor_module, "SessionLocal", sessionmaker(bind=engine))
+    
+    executor = nlq_parser.query_executor
+    monkeypatch.setattr(executor.rollups, "enabled", False)
+    monkeypatch.setattr(executor.replicas, "replicas", [])
+    monkeypatch.setattr(executor, "_get_from_cache", lambda cache_key: None)
+    monkeypatch.setattr(executor, "_cache_result", lambda cache_key, result, ttl=None: None)
+    return executor
+
+class TestTimeBucketing:
+    """Test cases for rewriting raw order_date series to a coarser grain"""
+    
+    def test_filtered_span_picks_the_finest_grain_that_fits(self, reducer):
+        """Test that two years of days become weeks and qualified references follow"""
+        sql = (
+            "SELECT o.order_date, SUM(o.quantity * o.unit_price) AS revenue FROM orders o "
+            "WHERE o.order_date >= '2023-01-01' AND o.order_date < '2025-01-01' "
+            "GROUP BY o.order_date ORDER BY o.order_date LIMIT 1000"
+        )
+        
+        rewritten, granularity = reducer.bucket(sql)
+        
+        assert granularity == "week"
+        assert rewritten == (
+            "SELECT DATE_TRUNC('week', o.order_date)::date AS order_date, SUM(o.quantity * o.unit_price) AS revenue "
+            "FROM orders o WHERE o.order_date >= '2023-01-01' AND o.order_date < '2025-01-01' "
+            "GROUP BY DATE_TRUNC('week', o.order_date)::date ORDER BY DATE_TRUNC('week', o.order_date)::date LIMIT 1000"
+        )
+    
+    def test_unbounded_query_uses_the_stored_range(self, reducer):
+        """Test that the data's own date span decides the grain when the query has no bounds"""
+        reducer.query_executor = StoredRange("2015-01-01", "2024-12-31")
+        sql = "SELECT order_date AS day, region, COUNT(*) FROM orders GROUP BY 1, region ORDER BY day"
+        
+        rewritten, granularity = reducer.bucket(sql)
+        
+        assert granularity == "month"
+        assert rewritten.startswith("SELECT DATE_TRUNC('month', order_date)::date AS day, region, COUNT(*) FROM orders GROUP BY 1, region")
+        assert reducer.query_executor.queries == ["SELECT MIN(order_date) AS first_date, MAX(order_date) AS last_date FROM orders"]
+    
+    @pytest.mark.parametrize("sql", [
+        "SELECT o.order_date, SUM(o.quantity) FROM orders o WHERE o.order_date >= '2024-01-01' AND o.order_date < '2024-03-01' GROUP BY o.order_date",
+        "SELECT DATE_TRUNC('day', o.order_date) AS day, COUNT(*) FROM orders o WHERE o.order_date >= '2020-01-01' GROUP BY day",
+        "SELECT o.order_date, o.quantity FROM orders o WHERE o.order_date >= '2020-01-01'",
+        "SELECT o.region, MAX(o.order_date) FROM orders o GROUP BY o.region",
+        "SELECT o.order_date, SUM(o.quantity) OVER (ORDER BY o.order_date) FROM orders o GROUP BY o.order_date, o.quantity"
+    ])
+    def test_other_queries_are_left_alone(self, reducer, sql):
+        """Test that short spans, explicit grains, ungrouped rows, aggregated dates and windows are not rewritten"""
+        reducer.query_executor = StoredRange("2015-01-01", "2024-12-31")
+        
+        assert reducer.bucket(sql) == (sql, None)
+
+class TestDownsampling:
+    """Test cases for Largest-Triangle-Three-Buckets reduction"""
+    
+    def test_lttb_keeps_endpoints_and_extremes(self, reducer):
+        """Test that the first, last and peak points survive with exactly threshold points"""
+        xs = [float(x) for x in range(10000)]
+        ys = [math.sin(x / 500) for x in range(10000)]
+        ys[4321] = 50.0
+        
+        selected = reducer.lttb(xs, ys, 200)
+        
+        assert len(selected) == 200
+        assert selected[0] == 0 and selected[-1] == 9999
+        assert 4321 in selected
+        assert selected == sorted(selected)
+    
+    def test_each_series_shares_the_budget(self, reducer):
+        """Test that categorical columns are downsampled as separate lines"""
+        rows = [[(date(2020, 1, 1) + timedelta(days=day)).isoformat(), region, float(day)] for day in range(2000) for region in ("Asia", "Europe")]
+        
+        result, downsampled = reducer.downsample({"columns": ["day", "region", "revenue"], "rows": rows}, "line")
+        
+        assert downsampled == {"method": "lttb", "source_rows": 4000, "rows": 500}
+        assert sum(row[1] == "Europe" for row in result["rows"]) == 250
+        assert result["rows"][0] == rows[0] and result["rows"][-1] == rows[-1]
+    
+    def test_series_results_are_downsampled_by_column(self, reducer):
+        """Test that column-major results keep aligned values and an updated row_count"""
+        days = [date(2020, 1, 1) + timedelta(days=day) for day in range(1000)]
+        
+        result, _ = reducer.downsample({"columns": ["day", "units"], "series": [days, list(range(1000))], "row_count": 1000}, "line")
+        
+        assert result["row_count"] == 500
+        assert [days.index(day) for day in result["series"][0]] == result["series"][1]
+    
+    def test_non_line_or_non_time_results_are_kept(self, reducer):
+        """Test that bar charts and lines without a date column are not reduced"""
+        dated = {"columns": ["day", "units"], "rows": [[date(2020, 1, 1) + timedelta(days=day), day] for day in range(1000)]}
+        labelled = {"columns": ["name", "units"], "rows": [[f"customer {index}", index] for index in range(1000)]}
+        
+        assert reducer.downsample(dated, "bar") == (dated, None)
+        assert reducer.downsample(labelled, "line") == (labelled, None)
+
+class TestResolution:
+    """Test cases for requesting reduced or full-resolution results"""
+    
+    def test_full_resolution_returns_every_row(self, executor):
+        """Test that resolution 'full' skips the reduction that 'auto' applies to a long line chart"""
+        sql = "SELECT order_date, quantity FROM orders ORDER BY order_date"
+        
+        reduced = nlq_parser.execute_sql(sql)
+        full = nlq_parser.execute_sql(sql, resolution="full")
+        
+        assert reduced["inferred_chart"] == "line"
+        assert len(reduced["rows"]) == 500
+        assert reduced["reduction"] == {"time_bucket": None, "downsampled": {"method": "lttb", "source_rows": 1200, "rows": 500}}
+        assert any("resolution 'full'" in warning for warning in reduced["warnings"])
+        assert len(full["rows"]) == 1200
+        assert full["reduction"] is None
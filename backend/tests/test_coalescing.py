@@ -0,0 +1,88 @@
+"""
+Test cases for request coalescing
+"""
+
+import asyncio
+import threading
+import time
+import pytest
+from app.services.coalescing import SingleFlight
+
+class TestSingleFlight:
+    """Test cases for in-process singleflight"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_async_calls_share_one_upstream_call(self):
+        """Test that concurrent duplicates await a single call"""
+        flight = SingleFlight("test")
+        flight.across_workers = False
+        calls = []
+        
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"sql": "SELECT 1"}
+        
+        results = await asyncio.gather(*[flight.do_async("same-key", upstream) for _ in range(10)])
+        
+        assert len(calls) == 1
+        assert all(result == {"sql": "SELECT 1"} for result in results)
+        assert flight.stats()["local_coalesced"] == 9
+    
+    @pytest.mark.asyncio
+    async def test_errors_propagate_to_followers(self):
+        """Test that followers see the leader's failure"""
+        flight = SingleFlight("test")
+        flight.across_workers = False
+        
+        async def upstream():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+        
+        results = await asyncio.gather(*[flight.do_async("key", upstream) for _ in range(3)], return_exceptions=True)
+        
+        assert all(isinstance(result, ValueError) for result in results)
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_leader_does_not_cancel_followers(self):
+        """Test that a follower still gets the result when the first caller is cancelled"""
+        flight = SingleFlight("test")
+        flight.across_workers = False
+        calls = []
+        
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"sql": "SELECT 1"}
+        
+        leader = asyncio.ensure_future(flight.do_async("key", upstream))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do_async("key", upstream))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        
+        assert await follower == {"sql": "SELECT 1"}
+        assert leader.cancelled()
+        assert len(calls) == 1
+        assert flight.stats()["in_flight"] == 0
+    
+    def test_concurrent_threads_share_one_upstream_call(self):
+        """Test that the synchronous path coalesces across threads"""
+        flight = SingleFlight("test")
+        flight.across_workers = False
+        calls = []
+        results = []
+        
+        def upstream():
+            calls.append(1)
+            time.sleep(0.05)
+            return 42
+        
+        threads = [threading.Thread(target=lambda: results.append(flight.do("key", upstream))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert len(calls) == 1
+        assert results == [42] * 5
@@ -0,0 +1,125 @@
+"""
+Test cases for single-pass column profiling
+"""
+
+import pytest
+from datetime import datetime, timezone
+from decimal import Decimal
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.services import query_executor as query_executor_module
+from app.services.column_profiler import ColumnProfiler
+from app.services.nlq_parser import nlq_parser
+from app.services.viz_inference import ChartInferenceEngine
+
+@pytest.fixture
+def profiler():
+    return ColumnProfiler()
+
+@pytest.fixture
+def executor(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (order_date TEXT, region TEXT, revenue REAL)"))
+        connection.execute(
+            text("INSERT INTO orders VALUES (:day, :region, :revenue)"),
+            [{"day": f"2024-01-{day:02d}", "region": "Europe" if day % 2 else "Asia Pacific", "revenue": day * 10.0} for day in range(1, 13)]
+        )
+    monkeypatch.setattr(query_executor_module, "SessionLocal", sessionmaker(bind=engine))
+    
+    executor = nlq_parser.query_executor
+    monkeypatch.setattr(executor.rollups, "enabled", False)
+    monkeypatch.setattr(executor.replicas, "replicas", [])
+    monkeypatch.setattr(executor, "_get_from_cache", lambda cache_key: None)
+    monkeypatch.setattr(executor, "_cache_result", lambda cache_key, result, ttl=None: None)
+    return executor
+
+class TestColumnKinds:
+    """Test cases for telling numeric, date and categorical columns apart"""
+    
+    def test_cursor_type_codes_decide_the_kind(self, profiler):
+        """Test that Postgres types win over how the values look, even with no rows"""
+        text_digits, empty_date = profiler.profile(["zip", "shipped"], [["02139", "94105"], []], [25, 1082])
+        
+        assert text_digits["kind"] == "categorical"
+        assert empty_date["kind"] == "date"
+        assert profiler.counters["typed_columns"] == 2
+    
+    def test_every_value_is_checked_without_type_codes(self, profiler):
+        """Test that a non-number past the leading rows keeps a column categorical"""
+        codes = [str(index) for index in range(10)] + ["N/A"]
+        
+        profile = profiler.profile_rows(["code"], [[code] for code in codes])
+        
+        assert profile[0]["kind"] == "categorical"
+        assert profile[0]["cardinality"] == 11
+    
+    def test_iso_strings_and_timestamps_are_dates(self, profiler):
+        """Test that cached ISO strings and aware timestamps profile as dates with their own min and max"""
+        strings, stamps = profiler.profile(
+            ["day", "at"],
+            [
+                ["2024-03-01", "2024-01-15T08:30:00Z", None],
+                [datetime(2024, 1, 2, tzinfo=timezone.utc), datetime(2024, 1, 1, tzinfo=timezone.utc)]
+            ]
+        )
+        
+        assert strings["kind"] == "date"
+        assert (strings["min"], strings["max"], strings["nulls"]) == ("2024-01-15T08:30:00Z", "2024-03-01", 1)
+        assert stamps["kind"] == "date"
+        assert stamps["monotonic"] == "decreasing"
+
+class TestColumnStats:
+    """Test cases for the statistics computed in the same pass"""
+    
+    def test_numeric_stats_keep_stored_values(self, profiler):
+        """Test that min and max are the stored values and nulls do not break monotonicity"""
+        profile = profiler.profile_column("revenue", [Decimal("1.50"), None, 3, 3, Decimal("7.25")])
+        
+        assert profile == {
+            "name": "revenue",
+            "kind": "numeric",
+            "count": 5,
+            "nulls": 1,
+            "cardinality": 3,
+            "min": Decimal("1.50"),
+            "max": Decimal("7.25"),
+            "monotonic": "increasing"
+        }
+    
+    def test_unordered_and_unhashable_values(self, profiler):
+        """Test that shuffled numbers are not monotonic and JSON values are still counted"""
+        numbers = profiler.profile_column("units", [3, 1, 2])
+        tags = profiler.profile_column("tags", [["a"], ["b"], ["a"]])
+        
+        assert numbers["monotonic"] is None
+        assert tags["kind"] == "categorical"
+        assert tags["cardinality"] == 2
+
+class TestProfileConsumers:
+    """Test cases for chart inference and responses using one profile"""
+    
+    def test_chart_inference_reads_the_profile(self):
+        """Test that the engine uses the given kinds instead of probing the rows"""
+        engine = ChartInferenceEngine()
+        rows = [["2024-01-01", 1.0], ["2024-01-02", 2.0]]
+        profile = [
+            {"name": "label", "kind": "categorical", "count": 2},
+            {"name": "units", "kind": "numeric", "count": 2}
+        ]
+        
+        assert engine.infer_chart_type(["label", "units"], rows, "SELECT label, units FROM t") == "line"
+        assert engine.infer_chart_type(["label", "units"], rows, "SELECT label, units FROM t", profile) == "pie"
+    
+    def test_executed_result_is_profiled_once(self, executor):
+        """Test that the executor's profile reaches the response and chart inference without re-profiling"""
+        before = executor.profiler.counters["profiles"]
+        
+        result = nlq_parser.execute_sql("SELECT order_date, region, revenue FROM orders ORDER BY order_date")
+        
+        assert executor.profiler.counters["profiles"] - before == 1
+        assert [column["kind"] for column in result["profile"]] == ["date", "categorical", "numeric"]
+        assert result["profile"][0]["monotonic"] == "increasing"
+        assert result["profile"][1]["cardinality"] == 2
+        assert result["inferred_chart"] == "line"
@@ -0,0 +1,119 @@
+"""
+Test cases for the EXPLAIN-based cost guard
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.services import query_executor as query_executor_module
+from app.services.query_executor import QueryExecutor
+from app.services.cost_guard import CostGuard
+from app.core.exceptions import QueryCostError
+
+def plan(cost, rows):
+    return {"Node Type": "Nested Loop", "Total Cost": cost, "Plan Rows": rows}
+
+@pytest.fixture
+def guard():
+    guard = CostGuard()
+    guard.max_cost = 1000
+    guard.max_rows = 50
+    guard.downgrade_limit = 5
+    guard.user_thresholds = {"7": {"max_cost": 1_000_000}}
+    return guard
+
+@pytest.fixture
+def executor(monkeypatch, guard):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (order_id INTEGER)"))
+        connection.execute(text("INSERT INTO orders VALUES (:order_id)"), [{"order_id": i} for i in range(20)])
+    monkeypatch.setattr(query_executor_module, "SessionLocal", sessionmaker(bind=engine))
+    
+    executor = QueryExecutor()
+    executor.cost_guard = guard
+    monkeypatch.setattr(executor, "_get_from_cache", lambda cache_key: None)
+    monkeypatch.setattr(executor, "_cache_result", lambda cache_key, result, ttl=None: None)
+    return executor
+
+class TestCostGuard:
+    """Test cases for threshold decisions"""
+    
+    def test_cheap_query_unchanged(self, guard):
+        """Test that queries within both thresholds run as written"""
+        assert guard.review("SELECT 1", plan(10, 1)) == ("SELECT 1", [])
+    
+    def test_expensive_query_refused_with_estimates(self, guard):
+        """Test that the refusal explains the planner estimates"""
+        with pytest.raises(QueryCostError, match="cost 5,000 and 120 rows exceeds the cost limit of 1,000"):
+            guard.review("SELECT * FROM orders, customers", plan(5000, 120))
+    
+    def test_wide_result_downgraded(self, guard):
+        """Test that a cheap query with too many rows gets a tighter LIMIT and a warning"""
+        sql, warnings = guard.review("SELECT * FROM orders LIMIT 1000;", plan(100, 1000))
+        
+        assert sql == "SELECT * FROM (SELECT * FROM orders LIMIT 1000) AS cost_guarded LIMIT 5"
+        assert "Result limited to 5 rows" in warnings[0]
+        assert "1,000 rows" in warnings[0]
+    
+    @pytest.mark.parametrize("sql, expected", [
+        ("SELECT * FROM orders ORDER BY revenue DESC", "SELECT * FROM orders ORDER BY revenue DESC LIMIT 5"),
+        ("SELECT * FROM orders ORDER BY revenue DESC LIMIT 1000;", "SELECT * FROM orders ORDER BY revenue DESC LIMIT 5"),
+        ("SELECT * FROM orders ORDER BY revenue LIMIT 100 OFFSET 20", "SELECT * FROM orders ORDER BY revenue LIMIT 5 OFFSET 20"),
+        ("SELECT * FROM orders ORDER BY revenue OFFSET 20 LIMIT ALL", "SELECT * FROM orders ORDER BY revenue OFFSET 20 LIMIT 5"),
+        ("SELECT * FROM orders ORDER BY revenue LIMIT 3", "SELECT * FROM orders ORDER BY revenue LIMIT 3")
+    ])
+    def test_ordered_result_limited_in_place(self, guard, sql, expected):
+        """Test that an ordered query's own LIMIT is set, so the limited rows are the first in its order"""
+        assert guard.review(sql, plan(100, 1000))[0] == expected
+    
+    def test_subquery_order_by_still_wrapped(self, guard):
+        """Test that an ORDER BY inside parentheses does not count as the query's order"""
+        sql, _ = guard.review("SELECT * FROM (SELECT * FROM orders ORDER BY revenue LIMIT 100) AS recent", plan(100, 1000))
+        
+        assert sql.startswith("SELECT * FROM (SELECT * FROM (SELECT")
+        assert sql.endswith("AS cost_guarded LIMIT 5")
+    
+    def test_per_user_thresholds(self, guard):
+        """Test that user overrides replace only the thresholds they set"""
+        assert guard.review("SELECT 1", plan(5000, 1), user_id=7) == ("SELECT 1", [])
+        assert guard.thresholds(7)["max_rows"] == 50
+        assert guard.profile(7) == "user7"
+        assert guard.profile(8) == ""
+    
+    def test_text_explain_output_decoded(self, guard):
+        """Test that drivers returning the JSON plan as text are handled"""
+        assert guard.read_plan('[{"Plan": {"Total Cost": 1.5, "Plan Rows": 3}}]')["Plan Rows"] == 3
+
+class TestGuardedExecution:
+    """Test cases for the guard inside QueryExecutor"""
+    
+    def test_downgraded_result_carries_warning(self, executor, monkeypatch):
+        """Test that the limited query is what runs, with the estimate in warnings"""
+        monkeypatch.setattr(executor, "_plan", lambda db, sql: plan(100, 500))
+        
+        result = executor.execute_query("SELECT order_id FROM orders")
+        
+        assert len(result["rows"]) == 5
+        assert "Result limited to 5 rows" in result["warnings"][0]
+    
+    def test_refusal_not_wrapped(self, executor, monkeypatch):
+        """Test that QueryCostError reaches the caller with its own message"""
+        monkeypatch.setattr(executor, "_plan", lambda db, sql: plan(10_000, 10))
+        
+        with pytest.raises(QueryCostError, match="^Query refused"):
+            executor.execute_query("SELECT order_id FROM orders")
+    
+    def test_stream_summary_includes_guard_warning(self, executor, monkeypatch):
+        """Test that streamed results report the downgrade in their summary"""
+        monkeypatch.setattr(executor, "_plan", lambda db, sql: plan(100, 500))
+        
+        events = list(executor.stream_query("SELECT order_id FROM orders", batch_size=2))
+        
+        assert events[-1][1]["row_count"] == 5
+        assert "Result limited to 5 rows" in events[-1][1]["warnings"][0]
+    
+    def test_guard_skipped_without_postgres(self, executor):
+        """Test that other dialects run unguarded rather than failing on EXPLAIN"""
+        assert "warnings" not in executor.execute_query("SELECT order_id FROM orders")
@@ -0,0 +1,126 @@
+"""
+Test cases for few-shot example retrieval
+"""
+
+import threading
+import pytest
+from app.core.config import settings
+from app.services.fewshot import FewShotStore
+from app.services.llm_client import llm_client, DEFAULT_EXAMPLES
+from app.services.nlq_parser import nlq_parser
+
+@pytest.fixture
+def store(tmp_path):
+    return FewShotStore(path=str(tmp_path / "examples.jsonl"), max_examples=3)
+
+class TestFewShotStore:
+    """Test cases for storing and retrieving successful pairs"""
+    
+    def test_nearest_pair_ranks_first(self, store):
+        """Test that the most similarly phrased prompt is returned first"""
+        store.record("revenue by region for enterprise customers", "SELECT 1")
+        store.record("units sold by product category", "SELECT 2")
+        
+        results = store.search("enterprise customer revenue per region", k=1)
+        
+        assert [result["sql"] for result in results] == ["SELECT 1"]
+    
+    def test_dissimilar_prompt_returns_nothing(self, store):
+        """Test that the similarity threshold filters unrelated pairs"""
+        store.record("revenue by region", "SELECT 1")
+        
+        assert store.search("xyz qwv") == []
+    
+    def test_persisted_and_reloaded(self, store, tmp_path):
+        """Test that pairs survive a restart and a prompt keeps only its newest SQL"""
+        store.record("revenue by region", "SELECT 1")
+        store.record("Revenue by region", "SELECT 2")
+        store.flush()
+        
+        reloaded = FewShotStore(path=str(tmp_path / "examples.jsonl"))
+        
+        assert reloaded.load() == 1
+        assert reloaded.search("revenue by region")[0]["sql"] == "SELECT 2"
+    
+    def test_oldest_pairs_evicted(self, store, tmp_path):
+        """Test that the store stays within max_examples, on disk too"""
+        for i in range(5):
+            store.record(f"metric number {i} by region", f"SELECT {i}")
+        store.flush()
+        
+        reloaded = FewShotStore(path=str(tmp_path / "examples.jsonl"))
+        
+        assert len(store.examples) == 3
+        assert reloaded.load() == 3
+        assert {example["sql"] for example in reloaded.examples} == {"SELECT 2", "SELECT 3", "SELECT 4"}
+    
+    def test_log_written_off_the_calling_thread(self, store, monkeypatch):
+        """Test that record only updates memory and leaves the file append to the writer thread"""
+        writers = []
+        append = store._append
+        
+        def tracked(example):
+            writers.append(threading.current_thread().name)
+            append(example)
+        monkeypatch.setattr(store, "_append", tracked)
+        
+        store.record("revenue by region", "SELECT 1")
+        store.flush()
+        
+        assert len(writers) == 1
+        assert writers[0].startswith("fewshot-writer")
+        assert writers[0] != threading.current_thread().name
+    
+    def test_compaction_keeps_other_workers_pairs(self, store, tmp_path):
+        """Test that a worker compacting the shared log does not drop pairs another worker appended"""
+        other = FewShotStore(path=str(tmp_path / "examples.jsonl"), max_examples=3)
+        store.record("revenue by region", "SELECT 1")
+        store.flush()
+        other.record("units by category", "SELECT 2")
+        other.flush()
+        for i in range(6):
+            store.record("revenue by region", f"SELECT {i + 3}")  # Replacements until the log needs compacting
+        store.flush()
+        
+        reloaded = FewShotStore(path=str(tmp_path / "examples.jsonl"))
+        reloaded.load()
+        
+        assert {example["sql"] for example in reloaded.examples} == {"SELECT 2", "SELECT 8"}
+        assert reloaded._log_lines == 2
+    
+    def test_default_limit_warning_does_not_block_recording(self, store, monkeypatch):
+        """Test that pairs whose only warning is the added LIMIT are kept, and other warnings still block"""
+        monkeypatch.setattr(nlq_parser, "few_shot_store", store)
+        monkeypatch.setattr(settings, "FEWSHOT_ENABLED", True)
+        
+        nlq_parser._remember_example("revenue by region", {"sql": "SELECT 1", "warnings": ["Query missing LIMIT clause - adding default LIMIT 1000"]})
+        nlq_parser._remember_example("units by category", {"sql": "SELECT 2", "warnings": ["Query may be expensive"]})
+        
+        assert [example["sql"] for example in store.examples] == ["SELECT 1"]
+    
+    def test_render_respects_token_budget(self, store):
+        """Test that examples stop being added once the budget is spent"""
+        store.record("revenue by region", "SELECT region, SUM(revenue) FROM orders GROUP BY region")
+        store.record("revenue by region and month", "SELECT region, month, SUM(revenue) FROM orders GROUP BY region, month")
+        
+        assert len(store.render_examples("revenue by region", token_budget=1000)) == 2
+        assert len(store.render_examples("revenue by region", token_budget=25)) == 1
+
+class TestPromptExamples:
+    """Test cases for example selection in the system prompt"""
+    
+    def test_retrieved_examples_replace_defaults(self, store, monkeypatch):
+        """Test that similar stored pairs are used instead of the built-in examples"""
+        monkeypatch.setattr(llm_client, "few_shot_store", store)
+        store.record("average order value by segment", "SELECT c.segment, AVG(o.quantity * o.unit_price) FROM orders o")
+        
+        system_prompt = llm_client._build_system_prompt("average order value per segment")
+        
+        assert "average order value by segment" in system_prompt
+        assert DEFAULT_EXAMPLES[0] not in system_prompt
+    
+    def test_defaults_used_when_store_empty(self, store, monkeypatch):
+        """Test that the built-in examples remain the fallback"""
+        monkeypatch.setattr(llm_client, "few_shot_store", store)
+        
+        assert DEFAULT_EXAMPLES[0] in llm_client._build_system_prompt("revenue by region")
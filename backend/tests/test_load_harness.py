@@ -0,0 +1,82 @@
+"""
+Test cases for the load-test harness and fake OpenAI server
+"""
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+from app.services.llm_client import llm_client
+from benchmarks.fake_openai import FakeOpenAI, create_app
+from benchmarks.load_test import LoadTest, parse_mix
+
+def fake_openai_client(fake: FakeOpenAI) -> AsyncOpenAI:
+    """AsyncOpenAI client wired to the fake server in-process"""
+    return AsyncOpenAI(
+        api_key="test",
+        base_url="http://fake-openai/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=create_app(fake)))
+    )
+
+class TestFakeOpenAI:
+    """Test cases for the chat-completions stand-in"""
+    
+    @pytest.mark.asyncio
+    async def test_llm_client_round_trip(self, monkeypatch):
+        """Test that LLMClient parses the fake completion and usage is counted"""
+        fake = FakeOpenAI(latency_ms=0, jitter_ms=0)
+        monkeypatch.setattr(llm_client, "async_client", fake_openai_client(fake))
+        
+        result = await llm_client.generate_sql_async("revenue by region")
+        
+        assert "GROUP BY o.region" in result["sql"]
+        assert fake.counters["requests"] == 1
+        assert fake.counters["prompt_tokens"] > 0
+    
+    @pytest.mark.asyncio
+    async def test_streamed_completion(self, monkeypatch):
+        """Test that streamed chunks reassemble into the same completion"""
+        fake = FakeOpenAI(latency_ms=0, jitter_ms=0)
+        monkeypatch.setattr(llm_client, "async_client", fake_openai_client(fake))
+        tokens = []
+        
+        result = await llm_client.generate_sql_async("monthly revenue", on_token=tokens.append)
+        
+        assert len(tokens) > 1
+        assert "DATE_TRUNC('month'" in result["sql"]
+        assert fake.counters["streamed"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_injected_errors(self, monkeypatch):
+        """Test that the configured error rate surfaces as an LLM error"""
+        fake = FakeOpenAI(latency_ms=0, jitter_ms=0, error_rate=1.0)
+        monkeypatch.setattr(llm_client, "async_client", fake_openai_client(fake))
+        
+        with pytest.raises(Exception, match="LLM API error"):
+            await llm_client.generate_sql_async("revenue by region")
+
+class TestLoadTest:
+    """Test cases for the open-loop load generator"""
+    
+    @pytest.mark.asyncio
+    async def test_offered_rate_and_report(self):
+        """Test that the scheduled request count is met and reported per endpoint"""
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path == "/api/nlq/execute":
+                return httpx.Response(500)
+            return httpx.Response(200, json={"conversation_id": "conv-load"})
+        
+        async with httpx.AsyncClient(base_url="http://api", transport=httpx.MockTransport(handler)) as client:
+            load_test = LoadTest(client, parse_mix("query=2,refine=1,execute=1"), seed=1)
+            elapsed = await load_test.run(rps=200, duration=0.1)
+            report = load_test.report(elapsed)
+        
+        assert report["overall"]["requests"] == 20
+        assert report["overall"]["errors"] == report["endpoints"]["execute"]["requests"]
+        assert {"p50", "p95", "p99", "throughput_rps"} <= set(report["endpoints"]["query"])
+    
+    def test_parse_mix_rejects_unknown_endpoint(self):
+        """Test endpoint mix validation"""
+        assert parse_mix("query=3,execute") == {"query": 3, "execute": 1}
+        with pytest.raises(Exception):
+            parse_mix("delete=1")
@@ -0,0 +1,167 @@
+"""
+Test cases for the in-process query result tier
+"""
+
+import json
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.services import query_executor as query_executor_module
+from app.services.local_cache import INVALIDATE_CHANNEL, LocalResultCache
+from app.services.query_executor import QueryExecutor
+from app.services.stale_cache import StaleWhileRevalidate
+from app.services.table_versions import TableVersions
+
+SQL = "SELECT region FROM orders"
+
+class FakeRedis:
+    """Redis stand-in shared by several workers, recording lookups and published messages"""
+    
+    def __init__(self):
+        self.values = {}
+        self.gets = 0
+        self.published = []
+    
+    def get(self, key):
+        self.gets += 1
+        value = self.values.get(key)
+        return value.encode() if isinstance(value, str) else value
+    
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+    
+    def setex(self, key, ttl, value):
+        self.values[key] = value
+    
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+    
+    def delete(self, key):
+        self.values.pop(key, None)
+    
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+    
+    def pipeline(self):
+        return self
+    
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+    
+    def execute(self):
+        pass
+
+def make_cache(redis_client=None, max_bytes=1000):
+    cache = LocalResultCache()
+    cache.redis_client = redis_client or FakeRedis()
+    cache.enabled = True
+    cache.max_bytes = max_bytes
+    cache.max_age = 300
+    return cache
+
+def make_executor(redis_client, engine):
+    versions = TableVersions()
+    versions.redis_client = redis_client
+    stale = StaleWhileRevalidate()
+    stale.redis_client = redis_client
+    stale.beta = 0.0
+    
+    executor = QueryExecutor()
+    executor.redis_client = redis_client
+    executor.table_versions = versions
+    executor.stale_cache = stale
+    executor.local_cache = make_cache(redis_client, max_bytes=1024 * 1024)
+    executor.engine = engine
+    return executor
+
+@pytest.fixture
+def workers(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (region TEXT)"))
+        connection.execute(text("INSERT INTO orders VALUES ('Europe')"))
+    monkeypatch.setattr(query_executor_module, "SessionLocal", sessionmaker(bind=engine))
+    
+    redis_client = FakeRedis()
+    first, second = make_executor(redis_client, engine), make_executor(redis_client, engine)
+    for executor in (first, second):
+        monkeypatch.setattr(executor.rollups, "enabled", False)
+        monkeypatch.setattr(executor.replicas, "replicas", [])
+        monkeypatch.setattr(executor.singleflight, "across_workers", False)
+    return first, second
+
+class TestLocalTier:
+    """Test cases for the byte-bounded LRU"""
+    
+    def test_least_recently_used_entries_are_evicted_past_the_byte_budget(self):
+        """Test that the budget counts bytes and a recent lookup protects an entry"""
+        cache = make_cache(max_bytes=1000)
+        cache.put("a", {"rows": "a"}, 400)
+        cache.put("b", {"rows": "b"}, 400)
+        cache.get("a")
+        cache.put("c", {"rows": "c"}, 400)
+        
+        assert cache.get("a") == {"rows": "a"}
+        assert cache.get("b") is None
+        assert cache.stats()["bytes"] == 800
+        assert cache.counters["evictions"] == 1
+    
+    def test_oversized_and_expired_entries_are_not_served(self):
+        """Test that results bigger than the budget skip the tier and entries past their TTL are dropped"""
+        cache = make_cache(max_bytes=1000)
+        cache.put("big", {"rows": "x"}, 5000)
+        cache.put("short", {"rows": "y"}, 10, ttl=-1)
+        
+        assert cache.get("big") is None
+        assert cache.get("short") is None
+        assert cache.counters["oversized"] == 1
+        assert cache.stats()["bytes"] == 0
+    
+    def test_invalidations_from_other_workers_drop_the_key(self):
+        """Test that a worker applies other workers' messages and ignores its own"""
+        redis_client = FakeRedis()
+        first, second = make_cache(redis_client), make_cache(redis_client)
+        payload = json.dumps({"rows": [["Europe"]]})
+        first.store("query:1", payload)
+        second.store("query:1", payload)
+        
+        for channel, message in redis_client.published:
+            assert channel == INVALIDATE_CHANNEL
+            first.invalidate(message)
+        
+        assert first.get("query:1") is None
+        assert second.get("query:1") == {"rows": [["Europe"]]}
+
+class TestTieredLookups:
+    """Test cases for the executor reading through both tiers"""
+    
+    def test_repeat_lookups_skip_redis(self, workers):
+        """Test that the writer and a second worker answer repeats from memory with the stored form"""
+        first, second = workers
+        
+        computed = first.execute_query(SQL)
+        gets_after_write = first.redis_client.gets
+        repeated = first.execute_query(SQL)
+        promoted = second.execute_query(SQL)
+        second.execute_query(SQL)
+        
+        assert repeated == promoted == computed
+        assert first.redis_client.gets - gets_after_write == 1  # Only the second worker's first lookup
+        assert first.local_cache.stats()["local_hit_ratio"] == 0.5
+        assert second.local_cache.counters["redis_hits"] == 1
+        assert second.local_cache.counters["local_hits"] == 1
+    
+    def test_table_writes_bypass_local_entries(self, workers):
+        """Test that a version bump changes the key, so no worker serves its local copy"""
+        first, second = workers
+        first.execute_query(SQL)
+        second.execute_query(SQL)
+        with first.engine.begin() as connection:
+            connection.execute(text("INSERT INTO orders VALUES ('Asia Pacific')"))
+        first.table_versions.bump(["orders"])
+        
+        assert sorted(second.execute_query(SQL)["rows"]) == [["Asia Pacific"], ["Europe"]]
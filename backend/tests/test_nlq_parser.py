@@ -2,6 +2,7 @@
 Test cases for NLQ Parser
 """
 
+import asyncio
 import pytest
 from app.services.nlq_parser import nlq_parser
 from app.core.exceptions import NLQException, UnsafeQueryError
@@ -45,6 +46,69 @@ class TestSchemaRegistry:
         
         assert schema_registry.validate_column("orders", "order_id") == True
         assert schema_registry.validate_column("orders", "unknown_column") == False
+    
+    def test_prompt_context_prunes_unrelated_tables(self):
+        """Test that only tables relevant to the prompt are serialized"""
+        from app.services.schema_registry import schema_registry
+        
+        context = schema_registry.serialize_for_prompt("revenue by region")
+        
+        assert "orders:" in context
+        assert "customers:" not in context
+        assert "products:" not in context
+        assert len(context) < len(schema_registry.serialize_for_llm())
+    
+    def test_prompt_context_includes_join_path(self):
+        """Test that foreign-key joins between selected tables are included"""
+        from app.services.schema_registry import schema_registry
+        
+        context = schema_registry.serialize_for_prompt("revenue by customer segment")
+        
+        assert "customers:" in context
+        assert "orders:" in context
+        assert "customers.customer_id = orders.customer_id" in context
+    
+    def test_prompt_context_respects_token_budget(self):
+        """Test that low-relevance columns are dropped to fit the budget"""
+        from app.services.schema_registry import schema_registry
+        
+        context = schema_registry.serialize_for_prompt("top customers by revenue", token_budget=60)
+        
+        assert "customer_id" in context
+        assert "unit_price" not in context
+    
+    def test_register_table_changes_schema_hash(self):
+        """Test that registering a table invalidates precompiled serializations"""
+        from app.services.schema_registry import SchemaRegistry, TableMetadata, ColumnMetadata
+        
+        registry = SchemaRegistry()
+        before = registry.schema_hash()
+        registry.register_table(TableMetadata(
+            name="returns",
+            description="Returned orders",
+            columns=[
+                ColumnMetadata(name="return_id", type="int", description="Unique return identifier", primary_key=True),
+                ColumnMetadata(name="order_id", type="int", description="Returned order", foreign_key="orders.order_id")
+            ]
+        ))
+        
+        assert registry.schema_hash() != before
+        context = registry.serialize_for_prompt("returns by region")
+        assert "returns.order_id = orders.order_id" in context or "orders.order_id = returns.order_id" in context
+    
+    def test_foreign_key_change_changes_schema_hash(self):
+        """Test that dropping a foreign key, which removes a join line from prompts, invalidates the schema hash"""
+        from app.services.schema_registry import SchemaRegistry
+        
+        registry = SchemaRegistry()
+        before = registry.schema_hash()
+        orders = registry.get_table("orders")
+        registry.register_table(orders.model_copy(update={"columns": [
+            column.model_copy(update={"foreign_key": None}) if column.name == "customer_id" else column
+            for column in orders.columns
+        ]}))
+        
+        assert registry.schema_hash() != before
 
 class TestSafetyValidator:
     """Test cases for SQL safety validation"""
@@ -78,3 +142,130 @@ class TestSafetyValidator:
         for query in safe_queries:
             warnings = safety_validator.validate_query(query)
             assert isinstance(warnings, list)
+
+class TestAsyncNLQParser:
+    """Test cases for the async NLQ pipeline"""
+    
+    @pytest.mark.asyncio
+    async def test_parse_and_execute_async(self, monkeypatch):
+        """Test that the async pipeline awaits each stage and shapes the response"""
+        async def fake_generate_sql_async(prompt, context=None, on_token=None):
+            return {"sql": "SELECT region FROM orders", "explain": {}}
+        
+        async def fake_execute_query_async(sql, result_format="table", user_id=None):
+            return {"columns": ["region"], "rows": [["Europe"], ["Asia Pacific"]], "inferred_chart": None}
+        
+        async def fake_create_conversation_async(user_id):
+            return "conv-1"
+        
+        turns = []
+        
+        async def fake_add_turn_async(conversation_id, prompt, sql, explain):
+            turns.append((conversation_id, prompt, sql))
+        
+        monkeypatch.setattr(nlq_parser.llm_client, "generate_sql_async", fake_generate_sql_async)
+        monkeypatch.setattr(nlq_parser.query_executor, "execute_query_async", fake_execute_query_async)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "create_conversation_async", fake_create_conversation_async)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "add_turn_async", fake_add_turn_async)
+        
+        result = await nlq_parser.parse_and_execute_async("regions")
+        
+        assert result["columns"] == ["region"]
+        assert result["sql"].endswith("LIMIT 10000")
+        assert result["conversation_id"] == "conv-1"
+        assert turns == [("conv-1", "regions", result["sql"])]
+    
+    @pytest.mark.asyncio
+    async def test_stream_events_follow_stage_order(self, monkeypatch):
+        """Test that streamed events arrive in stage order and merge into the query response"""
+        async def fake_generate_sql_async(prompt, context=None, on_token=None):
+            for token in ['{"sql": "SELECT region', ' FROM orders"}']:
+                on_token(token)
+            return {"sql": "SELECT region FROM orders", "explain": {}}
+        
+        async def fake_execute_query_async(sql, result_format="table", user_id=None):
+            return {"columns": ["region"], "rows": [["Europe"], ["Asia Pacific"], ["Middle East"]], "inferred_chart": None}
+        
+        async def fake_create_conversation_async(user_id):
+            return "conv-2"
+        
+        async def fake_add_turn_async(conversation_id, prompt, sql, explain):
+            pass
+        
+        monkeypatch.setattr(nlq_parser, "parser_mode", "llm")
+        monkeypatch.setattr(nlq_parser.llm_client, "generate_sql_async", fake_generate_sql_async)
+        monkeypatch.setattr(nlq_parser.query_executor, "execute_query_async", fake_execute_query_async)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "create_conversation_async", fake_create_conversation_async)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "add_turn_async", fake_add_turn_async)
+        
+        events = [
+            (event, data) async for event, data in
+            nlq_parser.stream_parse_and_execute("all regions", stream_tokens=True, row_batch_size=2)
+        ]
+        
+        assert [event for event, _ in events] == [
+            "token", "token", "sql", "columns", "rows", "rows", "inferred_chart", "explain", "done"
+        ]
+        assert events[4][1]["rows"] == [["Europe"], ["Asia Pacific"]]
+        assert events[-1][1]["conversation_id"] == "conv-2"
+    
+    @pytest.mark.asyncio
+    async def test_disconnect_cancels_token_generation(self, monkeypatch):
+        """Test that closing the stream mid-generation cancels the LLM call and frees its slot"""
+        llm_limit = asyncio.Semaphore(1)
+        cancelled = asyncio.Event()
+        
+        async def stuck_generate_sql_async(prompt, context=None, on_token=None, llm_limit=None):
+            async with llm_limit:
+                on_token('{"sql": "SELECT')
+                try:
+                    await asyncio.sleep(60)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+        
+        monkeypatch.setattr(nlq_parser, "_generate_sql_async", stuck_generate_sql_async)
+        
+        stream = nlq_parser.stream_parse_and_execute("regions", stream_tokens=True, llm_limit=llm_limit)
+        assert (await stream.__anext__())[0] == "token"
+        await stream.aclose()
+        
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        assert not llm_limit.locked()
+    
+    @pytest.mark.asyncio
+    async def test_paged_stream_drops_default_limit_warning(self):
+        """Test that the sql event of a paged stream does not announce the LIMIT paging removes"""
+        generated = {
+            "sql": "SELECT region FROM orders LIMIT 10000",
+            "warnings": ["Query missing LIMIT clause - adding default LIMIT 1000"],
+            "parse_cache": "miss",
+            "parser": "llm"
+        }
+        
+        stream = nlq_parser.stream_parse_and_execute("regions", pregenerated=generated, page_size=10)
+        event, data = await stream.__anext__()
+        await stream.aclose()
+        
+        assert event == "sql"
+        assert data["warnings"] == []
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_context_lookup_saves_no_turn(self, monkeypatch):
+        """Test that cancellation during the follow-up context lookup stops the request"""
+        async def cancelled_context(conversation_id):
+            raise asyncio.CancelledError()
+        
+        turns = []
+        
+        async def fake_add_turn_async(conversation_id, prompt, sql, explain):
+            turns.append(conversation_id)
+        
+        monkeypatch.setattr(nlq_parser.conversation_manager, "get_context_for_followup_async", cancelled_context)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "add_turn_async", fake_add_turn_async)
+        
+        with pytest.raises(asyncio.CancelledError):
+            await nlq_parser.parse_and_execute_async("regions", "conv-3")
+        
+        assert turns == []
@@ -0,0 +1,225 @@
+"""
+Test cases for keyset pagination
+"""
+
+import pytest
+from decimal import Decimal
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.services import query_executor as query_executor_module
+from app.services.nlq_parser import nlq_parser
+from app.services.pagination import KeysetPaginator
+from app.core.config import settings
+from app.core.exceptions import NLQException, PaginationError
+
+# Ties on revenue and a NULL region exercise the tie-breakers and NULL ordering
+ORDERS = [(i, None if i == 7 else f"region-{i % 4}", float(i % 5) * 10) for i in range(1, 24)]
+
+@pytest.fixture
+def paginator():
+    return KeysetPaginator()
+
+@pytest.fixture
+def database(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (order_id INTEGER, region TEXT, revenue REAL)"))
+        connection.execute(
+            text("INSERT INTO orders VALUES (:order_id, :region, :revenue)"),
+            [{"order_id": order_id, "region": region, "revenue": revenue} for order_id, region, revenue in ORDERS]
+        )
+    monkeypatch.setattr(query_executor_module, "SessionLocal", sessionmaker(bind=engine))
+    # No table versions, so nothing is served from or written to the shared cache
+    monkeypatch.setattr(nlq_parser.query_executor.table_versions, "redis_client", None)
+    return engine
+
+def all_pages(sql, page_size):
+    rows, cursor, pages = [], None, 0
+    while True:
+        page = nlq_parser.execute_sql(sql, page_size=page_size, cursor=cursor)
+        rows += page["rows"]
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return rows, pages
+
+class TestSortKeys:
+    """Test cases for choosing the page ordering"""
+    
+    def test_order_by_then_tie_breakers(self, paginator):
+        """Test that ORDER BY items come first, resolved through aliases and positions"""
+        sql = "SELECT region, SUM(revenue) AS total, COUNT(*) AS n FROM orders GROUP BY region ORDER BY SUM(revenue) DESC, 1"
+        
+        keys, warnings = paginator.sort_keys(sql, ["region", "total", "n"])
+        
+        assert keys == [("total", True), ("region", False), ("n", False)]
+        assert warnings == []
+    
+    def test_unmapped_order_by_falls_back_with_warning(self, paginator):
+        """Test that an ORDER BY on a non-result expression gives a stable synthesized order"""
+        keys, warnings = paginator.sort_keys("SELECT region FROM orders ORDER BY revenue", ["region"])
+        
+        assert keys == [("region", False)]
+        assert "ORDER BY revenue" in warnings[0]
+    
+    def test_inner_order_by_kept_only_under_limit(self, paginator):
+        """Test that the query's own ORDER BY is replaced unless it feeds its LIMIT"""
+        keys = [("region", False)]
+        
+        assert "ORDER BY revenue" not in paginator.page_sql("SELECT region FROM orders ORDER BY revenue", keys, None, 10)
+        assert "ORDER BY revenue DESC LIMIT 5" in paginator.page_sql("SELECT region FROM orders ORDER BY revenue DESC LIMIT 5", keys, None, 10)
+
+class TestCursors:
+    """Test cases for cursor encoding"""
+    
+    def test_round_trip(self, paginator):
+        """Test that keys and values survive encoding"""
+        keys = [("region", False), ("total", True)]
+        cursor = paginator.encode_cursor("SELECT 1", keys, ["O'Brien", 12.5])
+        
+        assert paginator.decode_cursor("SELECT 1", cursor) == (keys, ["O'Brien", 12.5], 1)
+    
+    def test_cursor_tied_to_query(self, paginator):
+        """Test that a cursor from one query is refused for another"""
+        cursor = paginator.encode_cursor("SELECT 1", [("a", False)], [1])
+        
+        with pytest.raises(PaginationError, match="does not belong"):
+            paginator.decode_cursor("SELECT 2", cursor)
+        with pytest.raises(PaginationError, match="Invalid"):
+            paginator.decode_cursor("SELECT 1", "not-a-cursor")
+    
+    def test_cursor_digest_is_keyed(self, paginator, monkeypatch):
+        """Test that a cursor cannot be forged without the server secret"""
+        cursor = paginator.encode_cursor("SELECT 1", [("a", False)], [1])
+        
+        monkeypatch.setattr(settings, "JWT_SECRET_KEY", "another-secret")
+        with pytest.raises(PaginationError, match="does not belong"):
+            paginator.decode_cursor("SELECT 1", cursor)
+    
+    def test_pages_across_a_non_terminating_average(self, paginator):
+        """Test that a numeric average no float can hold stays exact from row to cursor to literal"""
+        average = Decimal("3.3333333333333333")  # AVG over an integer column on Postgres
+        first = paginator.plan_page("SELECT region, AVG(units) AS avg_units FROM orders GROUP BY region", columns=["avg_units"], page_size=2)
+        cursor = paginator.next_cursor(first, ["avg_units"], 2, [average], repeats=2)
+        
+        second = paginator.plan_page(first["base_sql"], cursor, page_size=2)
+        third = paginator.plan_page(first["base_sql"], paginator.next_cursor(second, ["avg_units"], 2, [average], repeats=2), page_size=2)
+        
+        assert second["after"] == [average]
+        assert '"avg_units" = 3.3333333333333333' in second["sql"]
+        assert second["sql"].endswith("OFFSET 2")
+        assert third["sent"] == 4  # The whole second page was more copies of the same average
+    
+    def test_string_values_escaped(self, paginator):
+        """Test that cursor values cannot break out of their literals"""
+        sql = paginator.page_sql("SELECT region FROM orders", [("region", False)], ["x' OR '1'='1"], 10)
+        
+        assert "'x'' OR ''1''=''1'" in sql
+
+class TestPagedExecution:
+    """Test cases for paging through results end to end"""
+    
+    @pytest.mark.parametrize("sql", [
+        "SELECT order_id, region, revenue FROM orders",
+        "SELECT order_id, region, revenue FROM orders ORDER BY revenue DESC",
+        "SELECT order_id, region, revenue FROM orders ORDER BY region, revenue DESC"
+    ])
+    def test_pages_cover_every_row_once(self, database, sql):
+        """Test that walking the cursors returns each row exactly once, NULLs and ties included"""
+        rows, pages = all_pages(sql, page_size=5)
+        
+        assert sorted(tuple(row) for row in rows) == sorted(ORDERS, key=lambda order: order)
+        assert pages == 5
+    
+    @pytest.mark.parametrize("result_format", ["table", "series"])
+    def test_duplicate_rows_across_page_boundaries(self, database, result_format):
+        """Test that identical rows split by, or filling, a page boundary are all returned once"""
+        with database.begin() as connection:
+            connection.execute(text("UPDATE orders SET region = 'region-1' WHERE order_id BETWEEN 8 AND 16"))
+        rows, cursor = [], None
+        while True:
+            page = nlq_parser.execute_sql("SELECT region FROM orders", result_format, page_size=4, cursor=cursor)
+            rows += page["rows"] if result_format == "table" else [[value] for value in page["series"][0]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        
+        with database.connect() as connection:
+            expected = connection.execute(text("SELECT region FROM orders")).fetchall()
+        assert rows == [[region] for region in sorted((row[0] for row in expected), key=lambda region: (region is None, region))]
+        assert rows.count(["region-1"]) > 8
+    
+    def test_repeated_column_names_refused(self, paginator):
+        """Test that results whose rows could tie without being identical are not paged"""
+        with pytest.raises(PaginationError, match="distinct"):
+            paginator.sort_keys("SELECT region, region FROM orders", ["region", "region"])
+    
+    def test_pages_follow_query_order(self, database):
+        """Test that rows arrive in the query's ORDER BY across page boundaries"""
+        rows, _ = all_pages("SELECT order_id, revenue FROM orders ORDER BY revenue DESC, order_id", page_size=4)
+        
+        assert rows == sorted(rows, key=lambda row: (-row[1], row[0]))
+    
+    def test_series_pages(self, database):
+        """Test that columnar results page the same way"""
+        first = nlq_parser.execute_sql("SELECT order_id FROM orders ORDER BY order_id", "series", page_size=10)
+        second = nlq_parser.execute_sql("SELECT order_id FROM orders ORDER BY order_id", "series", page_size=10, cursor=first["next_cursor"])
+        
+        assert first["series"] == [list(range(1, 11))]
+        assert second["series"] == [list(range(11, 21))]
+    
+    def test_page_size_bounded(self, database, monkeypatch):
+        """Test that requests above the maximum page size are clamped"""
+        monkeypatch.setattr(nlq_parser.paginator, "max_page_size", 3)
+        
+        page = nlq_parser.execute_sql("SELECT order_id FROM orders", page_size=100)
+        
+        assert len(page["rows"]) == 3
+        assert page["next_cursor"] is not None
+    
+    def test_arrow_not_paged(self, database):
+        """Test that binary Arrow results reject pagination"""
+        with pytest.raises(NLQException, match="table and series"):
+            nlq_parser.execute_sql("SELECT order_id FROM orders", "arrow", page_size=10)
+
+class TestPagedQuery:
+    """Test cases for paging /query results"""
+    
+    @pytest.mark.asyncio
+    async def test_later_pages_are_not_new_turns(self, monkeypatch):
+        """Test that the generated SQL is paged past its default LIMIT and only the first page is a turn"""
+        engine = create_async_engine("sqlite+aiosqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        async with engine.begin() as connection:
+            await connection.execute(text("CREATE TABLE orders (region TEXT, quantity INTEGER, unit_price REAL)"))
+            await connection.execute(
+                text("INSERT INTO orders VALUES (:region, 1, 10.0)"),
+                [{"region": f"region-{i}"} for i in range(6)]
+            )
+        monkeypatch.setattr(query_executor_module, "AsyncSessionLocal", async_sessionmaker(engine))
+        monkeypatch.setattr(nlq_parser.query_executor.table_versions, "async_redis_client", None)
+        
+        turns = []
+        
+        async def fake_create_conversation_async(user_id):
+            return "conv-p"
+        
+        async def fake_add_turn_async(conversation_id, prompt, sql, explain):
+            turns.append(sql)
+        
+        monkeypatch.setattr(nlq_parser, "parser_mode", "rules")
+        monkeypatch.setattr(settings, "FEWSHOT_ENABLED", False)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "create_conversation_async", fake_create_conversation_async)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "add_turn_async", fake_add_turn_async)
+        
+        monkeypatch.setattr(nlq_parser.prefetcher, "schedule", lambda *args: None)
+        
+        first = await nlq_parser.parse_and_execute_async("revenue by region", page_size=4)
+        second = await nlq_parser.parse_and_execute_async("revenue by region", "conv-p", page_size=4, cursor=first["next_cursor"])
+        await engine.dispose()
+        
+        assert [row[0] for row in first["rows"]] == [f"region-{i}" for i in range(4)]
+        assert [row[0] for row in second["rows"]] == ["region-4", "region-5"]
+        assert second["next_cursor"] is None
+        assert len(turns) == 1
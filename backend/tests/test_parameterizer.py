@@ -0,0 +1,151 @@
+"""
+Test cases for lifting query literals into bind parameters
+"""
+
+import pytest
+from datetime import date
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.services import query_executor as query_executor_module
+from app.services.parameterizer import SQLParameterizer
+from app.services.query_executor import QueryExecutor
+
+@pytest.fixture
+def parameterizer():
+    return SQLParameterizer()
+
+@pytest.fixture
+def executor(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (order_id INTEGER, region TEXT, quantity INTEGER)"))
+        connection.execute(text("INSERT INTO orders VALUES (1, 'Europe', 2), (2, 'Europe', 7), (3, 'Asia Pacific', 4)"))
+    monkeypatch.setattr(query_executor_module, "SessionLocal", sessionmaker(bind=engine))
+    
+    executor = QueryExecutor()
+    executor.parameterizer = SQLParameterizer()
+    monkeypatch.setattr(executor.rollups, "enabled", False)
+    monkeypatch.setattr(executor.replicas, "replicas", [])
+    monkeypatch.setattr(executor, "_get_from_cache", lambda cache_key: None)
+    monkeypatch.setattr(executor, "_cache_result", lambda cache_key, result, ttl=None: None)
+    return executor
+
+class TestParameterize:
+    """Test cases for which literals become parameters"""
+    
+    def test_filter_literals_are_lifted(self, parameterizer):
+        """Test that comparisons, IN lists and BETWEEN bounds are bound with typed values"""
+        sql = (
+            "SELECT o.region, SUM(o.quantity) FROM orders o WHERE o.region IN ('Europe', 'Asia Pacific') "
+            "AND o.order_date BETWEEN '2024-01-01' AND '2024-03-31' AND o.quantity > 2 "
+            "GROUP BY o.region HAVING SUM(o.quantity) >= 10;"
+        )
+        
+        shape, params = parameterizer.parameterize(sql)
+        
+        assert shape == (
+            "SELECT o.region, SUM(o.quantity) FROM orders o WHERE o.region IN (:p0, :p1) "
+            "AND o.order_date BETWEEN :p2 AND :p3 AND o.quantity > :p4 "
+            "GROUP BY o.region HAVING SUM(o.quantity) >= :p5"
+        )
+        assert params == {
+            "p0": "Europe", "p1": "Asia Pacific", "p2": date(2024, 1, 1), "p3": date(2024, 3, 31), "p4": 2, "p5": 10
+        }
+    
+    @pytest.mark.parametrize("sql", [
+        "SELECT DATE_TRUNC('month', o.order_date) AS month, COUNT(*) FROM orders o GROUP BY DATE_TRUNC('month', o.order_date)",
+        "SELECT CASE WHEN o.region = 'Europe' THEN 1 ELSE 0 END FROM orders o",
+        "SELECT * FROM orders o WHERE o.unit_price > 10.5",
+        "SELECT * FROM orders o WHERE o.order_date >= DATE '2024-01-01'",
+        "SELECT * FROM orders o WHERE o.order_date >= '2024-01-01'::date",
+        "SELECT * FROM orders o WHERE o.quantity > 2 * 3",
+        "SELECT * FROM orders o WHERE o.region = 'Eur' || 'ope'"
+    ])
+    def test_literals_outside_plain_filters_stay_inline(self, parameterizer, sql):
+        """Test that select-list, grouping, decimal, typed and computed literals are not lifted"""
+        shape, params = parameterizer.parameterize(sql)
+        
+        assert params == {}
+        assert shape == sql
+    
+    def test_values_take_the_compared_column_type(self, parameterizer):
+        """Test that the registry column, not the literal's look, decides the bound type"""
+        sql = (
+            "SELECT * FROM orders o WHERE o.region = '2024-01-01' AND o.order_date >= '2024-02-01' "
+            "AND o.quantity > '5' AND o.unit_price > 3 AND o.region NOT IN ('Europe')"
+        )
+        
+        shape, params = parameterizer.parameterize(sql)
+        
+        assert params == {"p0": "2024-01-01", "p1": date(2024, 2, 1), "p2": 5, "p3": 3.0, "p4": "Europe"}
+    
+    @pytest.mark.parametrize("sql", [
+        "SELECT * FROM orders o WHERE o.order_date >= 'yesterday'",
+        "SELECT * FROM orders o WHERE o.quantity > 'five'",
+        "SELECT * FROM orders o WHERE o.note = 'Europe'",
+        "SELECT * FROM orders o WHERE LOWER(o.region) = 'europe'"
+    ])
+    def test_literals_without_a_known_type_stay_inline(self, parameterizer, sql):
+        """Test that strings the column type cannot bind, or compared to unknown operands, are not lifted"""
+        shape, params = parameterizer.parameterize(sql)
+        
+        assert params == {}
+        assert shape == sql
+    
+    def test_subquery_filters_are_lifted(self, parameterizer):
+        """Test that literals inside a subquery's WHERE are lifted and the outer clause is restored"""
+        sql = "SELECT c.name FROM customers c WHERE c.customer_id IN (SELECT customer_id FROM orders WHERE region = 'Europe') LIMIT 10"
+        
+        shape, params = parameterizer.parameterize(sql)
+        
+        assert shape.endswith("WHERE region = :p0) LIMIT 10")
+        assert params == {"p0": "Europe"}
+    
+    def test_cache_key_ignores_formatting_but_not_values(self, parameterizer):
+        """Test that whitespace variants share a shape and value changes keep the shape"""
+        first = parameterizer.shape_key(*parameterizer.parameterize("SELECT * FROM orders WHERE region = 'Europe'"))
+        spaced = parameterizer.shape_key(*parameterizer.parameterize("SELECT *\n  FROM orders\n WHERE region   = 'Europe' ;"))
+        other = parameterizer.shape_key(*parameterizer.parameterize("SELECT * FROM orders WHERE region = 'Asia Pacific'"))
+        
+        assert first == spaced
+        assert other[0] == first[0]
+        assert other[1] != first[1]
+    
+    def test_shapes_are_counted(self, parameterizer):
+        """Test that executions of different values count toward one shape"""
+        for sql in ["SELECT * FROM orders WHERE region = 'Europe'", "SELECT * FROM orders WHERE region = 'Asia Pacific'"]:
+            parameterizer.record(parameterizer.parameterize(sql)[0])
+        
+        stats = parameterizer.stats()
+        
+        assert stats["distinct_shapes"] == 1
+        assert stats["top_shapes"][0]["executions"] == 2
+        assert stats["top_shapes"][0]["sql"] == "SELECT * FROM orders WHERE region = :p0"
+
+class TestBoundExecution:
+    """Test cases for executing with bound parameters"""
+    
+    def test_bound_query_returns_literal_results(self, executor):
+        """Test that the parameterized statement returns the same rows and counts its shape"""
+        result = executor.execute_query("SELECT order_id FROM orders WHERE region = 'Europe' AND quantity > 3 ORDER BY order_id")
+        executor.execute_query("SELECT order_id FROM orders WHERE region = 'Asia Pacific' AND quantity > 1 ORDER BY order_id")
+        
+        assert result["rows"] == [[2]]
+        assert executor.parameterizer.stats()["distinct_shapes"] == 1
+    
+    def test_colon_in_string_literal_is_bound(self, executor):
+        """Test that a literal containing a colon is passed as a value, not read as a bind name"""
+        result = executor.execute_query("SELECT COUNT(*) AS orders FROM orders WHERE region = 'Europe:west'")
+        
+        assert result["rows"] == [[0]]
+    
+    def test_query_is_parameterized_once(self, executor, monkeypatch):
+        """Test that the shape and values computed for metrics are reused for the cache key and the statement"""
+        calls = []
+        parameterize = executor.parameterizer.parameterize
+        monkeypatch.setattr(executor.parameterizer, "parameterize", lambda sql: calls.append(sql) or parameterize(sql))
+        
+        executor.execute_query("SELECT order_id FROM orders WHERE region = 'Europe' ORDER BY order_id")
+        
+        assert len(calls) == 1
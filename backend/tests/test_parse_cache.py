@@ -0,0 +1,56 @@
+"""
+Test cases for the parse cache
+"""
+
+from app.services.parse_cache import ParseCache
+
+class TestParseCache:
+    """Test cases for prompt normalization and cache tiers"""
+    
+    def test_equivalent_prompts_share_key(self):
+        """Test that trivially different phrasings normalize to one key"""
+        cache = ParseCache()
+        
+        variants = [
+            "Revenue by region in Q2 2024",
+            "  revenue   by REGION, in 2024-Q2!",
+            "Show me revenue by region in second quarter of 2024"
+        ]
+        
+        keys = {cache.make_key(variant) for variant in variants}
+        assert len(keys) == 1
+    
+    def test_number_and_date_canonicalization(self):
+        """Test that number words and date formats are canonicalized"""
+        cache = ParseCache()
+        
+        assert cache.normalize_prompt("top ten customers") == "top 10 customers"
+        assert cache.normalize_prompt("orders since April 1st, 2024") == "orders since 2024-04-01"
+        assert cache.normalize_prompt("orders since 04/01/2024") == "orders since 2024-04-01"
+    
+    def test_context_changes_key(self):
+        """Test that conversation context is part of the key"""
+        cache = ParseCache()
+        
+        assert cache.make_key("by month") != cache.make_key("by month", "Query: revenue by region")
+    
+    def test_local_tier_hit(self):
+        """Test that stored results are served from the in-process tier"""
+        cache = ParseCache()
+        key = cache.make_key("revenue by region")
+        cache.set(key, {"sql": "SELECT 1", "explain": {}})
+        
+        assert cache.get(key) == {"sql": "SELECT 1", "explain": {}}
+        assert cache.stats()["local_hits"] == 1
+    
+    def test_schema_change_invalidates(self, monkeypatch):
+        """Test that a schema hash change drops cached entries"""
+        cache = ParseCache()
+        key = cache.make_key("revenue by region")
+        cache.set(key, {"sql": "SELECT 1", "explain": {}})
+        
+        monkeypatch.setattr(cache, "schema_hash", lambda: "changed")
+        new_key = cache.make_key("revenue by region")
+        
+        assert new_key != key
+        assert cache.stats()["local_entries"] == 0
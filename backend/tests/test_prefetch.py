@@ -0,0 +1,133 @@
+"""
+Test cases for speculative follow-up prefetch
+"""
+
+import asyncio
+import pytest
+from app.services.prefetch import SpeculativePrefetcher
+from app.services.nlq_parser import nlq_parser
+
+class TestCandidates:
+    """Test cases for candidate selection"""
+    
+    def test_candidates_skip_grouped_dimensions(self):
+        """Test that the current grouping is not suggested again"""
+        prefetcher = SpeculativePrefetcher()
+        
+        candidates = prefetcher.candidates({"groupBy": ["region"], "filters": []}, k=2)
+        
+        assert candidates == ["break it down by product line", "break it down by month"]
+    
+    def test_time_grouping_excludes_other_grains(self):
+        """Test that a monthly result never gets a quarter drill-down"""
+        prefetcher = SpeculativePrefetcher()
+        
+        candidates = prefetcher.candidates({"groupBy": ["month"], "filters": []}, k=10)
+        
+        assert not any("month" in candidate or "quarter" in candidate for candidate in candidates)
+    
+    def test_observed_followups_outrank_prior(self):
+        """Test that frequently requested drill-downs move to the front"""
+        prefetcher = SpeculativePrefetcher()
+        for _ in range(3):
+            prefetcher.record_followup("now by customer segment")
+        
+        assert prefetcher.candidates({"groupBy": ["region"]}, k=1) == ["break it down by customer segment"]
+    
+    def test_drilldown_intent(self):
+        """Test that phrasing variants share an intent and filters are not drill-downs"""
+        prefetcher = SpeculativePrefetcher()
+        
+        assert prefetcher.drilldown_intent("break it down by product line") == "product_line"
+        assert prefetcher.drilldown_intent("by product line please") == "product_line"
+        assert prefetcher.drilldown_intent("monthly") == "month"
+        assert prefetcher.drilldown_intent("only enterprise customers") is None
+
+class TestSpeculativeRefine:
+    """Test cases for warming and serving speculative results"""
+    
+    @pytest.mark.asyncio
+    async def test_refine_served_from_speculative_result(self, monkeypatch):
+        """Test that a prefetched drill-down skips SQL generation on refine"""
+        prefetcher = SpeculativePrefetcher()
+        prefetcher.delay_seconds = 0
+        monkeypatch.setattr(nlq_parser, "prefetcher", prefetcher)
+        monkeypatch.setattr(nlq_parser, "parser_mode", "auto")
+        
+        turns = {"conv-p": []}
+        executed = []
+        
+        async def fake_execute_query_async(sql, result_format="table", user_id=None):
+            executed.append((sql, user_id))
+            return {"columns": ["region", "revenue"], "rows": [["Europe", 10.0]], "inferred_chart": None}
+        
+        async def fake_create_conversation_async(user_id):
+            return "conv-p"
+        
+        async def fake_add_turn_async(conversation_id, prompt, sql, explain):
+            turns[conversation_id].append({"prompt": prompt, "sql": sql, "explain": explain})
+        
+        async def fake_get_context_for_followup_async(conversation_id):
+            return None
+        
+        async def fake_refine_query_async(conversation_id, followup):
+            last = turns[conversation_id][-1]
+            return {"original_query": last["prompt"], "original_sql": last["sql"], "original_explain": last["explain"], "followup": followup}
+        
+        monkeypatch.setattr(nlq_parser.query_executor, "execute_query_async", fake_execute_query_async)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "create_conversation_async", fake_create_conversation_async)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "add_turn_async", fake_add_turn_async)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "get_context_for_followup_async", fake_get_context_for_followup_async)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "refine_query_async", fake_refine_query_async)
+        
+        first = await nlq_parser.parse_and_execute_async("revenue by region in Q2 2024", user_id=7)
+        await asyncio.gather(*prefetcher._tasks)
+        
+        assert prefetcher.counters["prefetched"] == 2
+        assert len(executed) == 3
+        assert {user_id for _, user_id in executed} == {7}  # Speculative queries run as the requesting user
+        
+        refined = await nlq_parser.refine_conversation_async(first["conversation_id"], "by product line")
+        
+        assert refined["speculative"] is True
+        assert "GROUP BY o.region, p.product_line" in refined["sql"]
+        assert prefetcher.counters["served"] == 1
+        await asyncio.gather(*prefetcher._tasks)
+    
+    @pytest.mark.asyncio
+    async def test_llm_budget_limits_speculation(self, monkeypatch):
+        """Test that speculative LLM calls stop when the budget is spent"""
+        prefetcher = SpeculativePrefetcher()
+        prefetcher.delay_seconds = 0
+        prefetcher.llm_budget.tokens = 0
+        llm_calls = []
+        
+        async def fake_generate_sql_async(prompt, context=None, on_token=None):
+            llm_calls.append(prompt)
+            return {"sql": "SELECT region FROM orders", "explain": {}}
+        
+        async def fake_cache_get_async(cache_key):
+            return None
+        
+        async def fake_get_context_for_followup_async(conversation_id):
+            return None
+        
+        monkeypatch.setattr(nlq_parser, "parser_mode", "llm")
+        monkeypatch.setattr(nlq_parser.parse_cache, "get_async", fake_cache_get_async)
+        monkeypatch.setattr(nlq_parser.llm_client, "generate_sql_async", fake_generate_sql_async)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "get_context_for_followup_async", fake_get_context_for_followup_async)
+        
+        task = prefetcher.schedule("conv-b", "budget regions", "SELECT region FROM orders", {"groupBy": ["region"]}, nlq_parser._speculate)
+        await task
+        
+        assert llm_calls == []
+        assert prefetcher.counters["skipped_budget"] == 2
+        assert prefetcher.counters["failed"] == 2
+    
+    def test_busy_foreground_skips_speculation(self):
+        """Test that speculation is not started under foreground load"""
+        prefetcher = SpeculativePrefetcher()
+        prefetcher.foreground_in_flight = prefetcher.max_foreground_in_flight + 1
+        
+        assert prefetcher.schedule("conv-x", "revenue by region", "SELECT 1", {"groupBy": ["region"]}, nlq_parser._speculate) is None
+        assert prefetcher.counters["skipped_busy"] == 1
@@ -0,0 +1,123 @@
+"""
+Test cases for server-side cursor streaming with a response byte budget
+"""
+
+import pytest
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.services import query_executor as query_executor_module
+from app.services.query_executor import QueryExecutor
+from app.services.nlq_parser import nlq_parser
+from app.core.config import settings
+from app.core.serialization import json_dumps
+from app.api.sse import format_sse
+
+@pytest.fixture
+def executor(monkeypatch):
+    # One shared in-memory database, reachable from the worker threads used by the async stream
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (order_id INTEGER, region TEXT)"))
+        connection.execute(
+            text("INSERT INTO orders VALUES (:order_id, :region)"),
+            [{"order_id": i, "region": f"region-{i % 5}"} for i in range(100)]
+        )
+    monkeypatch.setattr(query_executor_module, "SessionLocal", sessionmaker(bind=engine))
+    
+    executor = QueryExecutor()
+    monkeypatch.setattr(executor, "_get_from_cache", lambda cache_key: None)
+    return executor
+
+class TestStreamQuery:
+    """Test cases for batched cursor reads"""
+    
+    def test_rows_arrive_in_batches(self, executor):
+        """Test that the full result is split into batch-sized row events"""
+        events = list(executor.stream_query("SELECT order_id, region FROM orders ORDER BY order_id", batch_size=30))
+        
+        assert events[0] == ("columns", {"columns": ["order_id", "region"]})
+        assert [len(data["rows"]) for event, data in events if event == "rows"] == [30, 30, 30, 10]
+        assert events[-1][0] == "summary"
+        assert events[-1][1]["row_count"] == 100
+        assert not events[-1][1]["truncated"]
+    
+    def test_byte_budget_truncates_with_warning(self, executor):
+        """Test that streaming stops at the budget, keeping the rows that fit"""
+        events = list(executor.stream_query("SELECT order_id, region FROM orders ORDER BY order_id", batch_size=30, byte_budget=500))
+        summary = events[-1][1]
+        sent = [row for event, data in events if event == "rows" for row in data["rows"]]
+        
+        assert summary["truncated"]
+        assert 0 < summary["row_count"] == len(sent) < 100
+        assert summary["bytes"] <= 500
+        assert "truncated" in summary["warnings"][0]
+    
+    def test_cached_result_replayed_in_batches(self, executor, monkeypatch):
+        """Test that a cached result goes through the same batching"""
+        cached = {"columns": ["n"], "rows": [[i] for i in range(5)]}
+        monkeypatch.setattr(executor, "_get_from_cache", lambda cache_key: cached)
+        
+        events = list(executor.stream_query("SELECT n FROM t", batch_size=2))
+        
+        assert [data["rows"] for event, data in events if event == "rows"] == [[[0], [1]], [[2], [3]], [[4]]]
+    
+    @pytest.mark.asyncio
+    async def test_async_stream_closes_cursor_on_early_exit(self, executor):
+        """Test that abandoning the stream releases the underlying generator"""
+        stream = executor.stream_query_async("SELECT order_id FROM orders", batch_size=10)
+        
+        events = []
+        async for event, data in stream:
+            events.append(event)
+            if event == "rows":
+                break
+        await stream.aclose()
+        
+        assert events == ["columns", "rows"]
+
+class TestStreamedPipeline:
+    """Test cases for streaming execution in the NLQ pipeline"""
+    
+    @pytest.mark.asyncio
+    async def test_truncation_adds_warnings_event(self, monkeypatch):
+        """Test that a truncated result is flagged before the chart and explain events"""
+        async def fake_stream_query_async(sql, batch_size=None, byte_budget=None, user_id=None):
+            yield "columns", {"columns": ["region"]}
+            yield "rows", {"rows": [["Europe"], ["Asia Pacific"]]}
+            yield "summary", {"row_count": 2, "bytes": 30, "truncated": True, "warnings": ["Result truncated after 2 rows"]}
+        
+        async def fake_create_conversation_async(user_id):
+            return "conv-s"
+        
+        async def fake_add_turn_async(conversation_id, prompt, sql, explain):
+            pass
+        
+        monkeypatch.setattr(nlq_parser, "parser_mode", "rules")
+        monkeypatch.setattr(settings, "FEWSHOT_ENABLED", False)
+        monkeypatch.setattr(nlq_parser.query_executor, "stream_query_async", fake_stream_query_async)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "create_conversation_async", fake_create_conversation_async)
+        monkeypatch.setattr(nlq_parser.conversation_manager, "add_turn_async", fake_add_turn_async)
+        
+        events = [
+            (event, data) async for event, data in
+            nlq_parser.stream_parse_and_execute("revenue by region", prefetch=False, stream_execution=True)
+        ]
+        
+        assert [event for event, _ in events] == [
+            "sql", "columns", "rows", "warnings", "inferred_chart", "explain", "done"
+        ]
+        assert events[3][1]["truncated"]
+        assert "Result truncated after 2 rows" in events[3][1]["warnings"]
+
+class TestTransportEncoding:
+    """Test cases for how stream events are encoded on the wire"""
+    
+    def test_sse_and_ndjson_encode_values_alike(self):
+        """Test that decimals and dates in an SSE frame match the NDJSON encoding"""
+        data = {"rows": [[Decimal("12.50"), Decimal("3"), date(2024, 1, 31)]]}
+        
+        assert format_sse("rows", data) == f"event: rows\ndata: {json_dumps(data)}\n\n"
+        assert json_dumps(data) == '{"rows": [[12.5, 3, "2024-01-31"]]}'
@@ -0,0 +1,179 @@
+"""
+Test cases for read-replica routing
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.services import query_executor as query_executor_module
+from app.services.query_executor import QueryExecutor
+from app.services.replicas import ReplicaRouter
+from app.services.table_versions import TableVersions
+
+class FakeRedis:
+    """Just enough of the Redis client for version counters and change times"""
+    
+    def __init__(self):
+        self.values = {}
+    
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+    
+    def pipeline(self):
+        return self
+    
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+    
+    def set(self, key, value):
+        self.values[key] = value
+    
+    def execute(self):
+        pass
+
+class AsyncFakeRedis:
+    """Async view of a FakeRedis"""
+    
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+    
+    async def mget(self, keys):
+        return self.redis_client.mget(keys)
+
+class FakePostgresSession:
+    """Session on a Postgres replica that answers the lag query with a fixed row"""
+    
+    def __init__(self, row):
+        self.row = row
+        self.dialect = type("Dialect", (), {"name": "postgresql"})()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        return False
+    
+    def get_bind(self):
+        return self
+    
+    def execute(self, statement):
+        return self
+    
+    def one(self):
+        return self.row
+
+def make_database(path, region):
+    """SQLite file with one order in the given region"""
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (region TEXT)"))
+        connection.execute(text("INSERT INTO orders VALUES (:region)"), {"region": region})
+    engine.dispose()
+    return f"sqlite:///{path}"
+
+@pytest.fixture
+def router(tmp_path):
+    versions = TableVersions()
+    versions.redis_client = FakeRedis()
+    versions.async_redis_client = AsyncFakeRedis(versions.redis_client)
+    router = ReplicaRouter([make_database(tmp_path / "replica1.db", "Replica 1"), make_database(tmp_path / "replica2.db", "Replica 2")])
+    router.table_versions = versions
+    return router
+
+@pytest.fixture
+def executor(monkeypatch, router):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (region TEXT)"))
+        connection.execute(text("INSERT INTO orders VALUES ('Primary')"))
+    monkeypatch.setattr(query_executor_module, "SessionLocal", sessionmaker(bind=engine))
+    
+    executor = QueryExecutor()
+    executor.replicas = router
+    monkeypatch.setattr(executor.rollups, "enabled", False)
+    monkeypatch.setattr(executor, "_get_from_cache", lambda cache_key: None)
+    monkeypatch.setattr(executor, "_cache_result", lambda cache_key, result, ttl=None: None)
+    return executor
+
+class TestReplicaRouter:
+    """Test cases for choosing between replicas and the primary"""
+    
+    def test_unchecked_replicas_are_not_used(self, router):
+        """Test that reads stay on the primary until replica lag has been measured"""
+        assert router.choose(["orders"]) is None
+        assert router.stats()["lag_fallbacks"] == 1
+    
+    def test_reads_round_robin_across_caught_up_replicas(self, router):
+        """Test that healthy replicas take turns"""
+        router.check_lag()
+        
+        chosen = [router.choose(["orders"]).name for _ in range(4)]
+        
+        assert chosen[0] != chosen[1]
+        assert chosen[:2] == chosen[2:]
+    
+    def test_recent_writes_are_read_from_the_primary(self, router):
+        """Test that a table written within the lag bound is not read from a replica"""
+        router.check_lag()
+        router.table_versions.bump(["orders"])
+        
+        assert router.choose(["orders"]) is None
+        assert router.choose(["products"]) is not None
+        assert router.stats()["recent_write_fallbacks"] == 1
+    
+    def test_lagging_or_unreachable_replicas_are_skipped(self, router):
+        """Test that replicas over the lag bound and ones that fail the check are marked unhealthy"""
+        router.max_lag = router.check_interval / 2
+        router.check_lag()
+        
+        assert router.choose(["orders"]) is None
+        
+        router.max_lag = 5.0
+        router.replicas[0].session_factory = lambda: (_ for _ in ()).throw(OSError("connection refused"))
+        router.check_lag()
+        
+        assert [replica.healthy for replica in router.replicas] == [False, True]
+        assert router.replicas[0].errors == 1
+    
+    def test_disconnected_replicas_are_skipped(self, router):
+        """Test that a replica reporting no lag is unhealthy once its WAL receiver stops streaming"""
+        router.replicas[0].session_factory = lambda: FakePostgresSession((0, False))
+        router.replicas[1].session_factory = lambda: FakePostgresSession((0, True))
+        router.check_lag()
+        
+        assert [replica.healthy for replica in router.replicas] == [False, True]
+        assert [replica["streaming"] for replica in router.stats()["replicas"]] == [False, True]
+        assert router.replicas[0].lag == 0.0
+    
+    def test_unavailable_redis_reads_from_the_primary(self, router):
+        """Test that unknown write times are treated as recent"""
+        router.check_lag()
+        router.table_versions.redis_client = None
+        
+        assert router.choose(["orders"]) is None
+
+class TestReplicaExecution:
+    """Test cases for executor reads through the router"""
+    
+    def test_query_runs_on_a_replica(self, executor, router):
+        """Test that executor reads go to a caught-up replica and fall back after a write"""
+        assert executor.execute_query("SELECT region FROM orders")["rows"] == [["Primary"]]
+        
+        router.check_lag()
+        
+        assert executor.execute_query("SELECT region FROM orders")["rows"][0][0].startswith("Replica")
+        
+        router.table_versions.bump(["orders"])
+        
+        assert executor.execute_query("SELECT region FROM orders")["rows"] == [["Primary"]]
+    
+    @pytest.mark.asyncio
+    async def test_async_query_runs_on_a_replica(self, executor, router):
+        """Test that async reads use the replica's async engine"""
+        router.check_lag()
+        
+        result = await executor._run_query_async("SELECT region FROM orders")
+        
+        assert result["rows"][0][0].startswith("Replica")
+        await router.dispose()
@@ -0,0 +1,173 @@
+"""
+Test cases for LLM call hedging, deadlines and the circuit breaker
+"""
+
+import asyncio
+import pytest
+from app.services.resilience import CircuitBreaker, ResilientCaller
+from app.services.nlq_parser import nlq_parser
+from app.core.exceptions import CircuitOpenError, LLMError
+
+def make_caller(**overrides) -> ResilientCaller:
+    """Caller with short timings suitable for tests"""
+    caller = ResilientCaller("test")
+    caller.attempt_timeout = 1.0
+    caller.deadline = 2.0
+    caller.default_hedge_delay = 0.05
+    caller.min_hedge_delay = 0.01
+    for name, value in overrides.items():
+        setattr(caller, name, value)
+    return caller
+
+class TestHedging:
+    """Test cases for hedged attempts"""
+    
+    @pytest.mark.asyncio
+    async def test_hedge_wins_when_primary_is_slow(self):
+        """Test that a duplicate fired after the hedge delay answers first and the primary is cancelled"""
+        caller = make_caller()
+        cancelled = []
+        
+        async def attempt(index):
+            try:
+                await asyncio.sleep(0.5 if index == 0 else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(index)
+                raise
+            return {"sql": f"SELECT {index}"}
+        
+        result = await caller.call(attempt)
+        await asyncio.sleep(0.05)  # let the cancellation reach the primary
+        
+        assert result == {"sql": "SELECT 1"}
+        assert caller.counters["hedges_fired"] == 1
+        assert caller.counters["hedges_won"] == 1
+        assert cancelled == [0]
+    
+    @pytest.mark.asyncio
+    async def test_invalid_response_triggers_hedge(self):
+        """Test that a fast but unusable answer does not win"""
+        caller = make_caller()
+        
+        async def attempt(index):
+            return {"sql": "" if index == 0 else "SELECT 1"}
+        
+        result = await caller.call(attempt, is_valid=lambda response: bool(response["sql"]))
+        
+        assert result == {"sql": "SELECT 1"}
+    
+    @pytest.mark.asyncio
+    async def test_attempt_timeout_raises(self):
+        """Test that the call fails once every attempt has timed out"""
+        caller = make_caller(attempt_timeout=0.05, max_hedges=1)
+        
+        async def attempt(index):
+            await asyncio.sleep(1)
+        
+        with pytest.raises(asyncio.TimeoutError):
+            await caller.call(attempt)
+        assert caller.counters["timeouts"] == 2
+        assert caller.counters["failures"] == 1
+
+class TestCircuitBreaker:
+    """Test cases for the failure-rate breaker"""
+    
+    def test_opens_after_failure_rate_and_probes(self):
+        """Test closed -> open -> half_open -> closed transitions"""
+        breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=4, open_seconds=0)
+        for _ in range(2):
+            breaker.record_success()
+        for _ in range(2):
+            breaker.record_failure()
+        
+        assert breaker.state == "open"
+        assert breaker.allow()  # open_seconds elapsed: one probe
+        assert breaker.state == "half_open"
+        assert not breaker.allow()
+        
+        breaker.record_success()
+        assert breaker.state == "closed"
+    
+    @pytest.mark.asyncio
+    async def test_open_breaker_short_circuits(self):
+        """Test that calls fail fast without reaching the upstream"""
+        caller = make_caller()
+        caller.breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=1, open_seconds=60)
+        calls = []
+        
+        async def failing(index):
+            calls.append(index)
+            raise RuntimeError("upstream down")
+        
+        with pytest.raises(RuntimeError):
+            await caller.call(failing)
+        with pytest.raises(CircuitOpenError):
+            await caller.call(failing)
+        
+        assert caller.counters["short_circuited"] == 1
+        assert len(calls) == 1 + caller.max_hedges
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_is_released(self):
+        """Test that a probe cancelled mid-call lets the next call probe instead of short-circuiting forever"""
+        caller = make_caller()
+        caller.breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=1, open_seconds=0)
+        caller.breaker.record_failure()
+        started = asyncio.Event()
+        
+        async def hanging(index):
+            started.set()
+            await asyncio.sleep(10)
+        
+        async def answering(index):
+            return "ok"
+        
+        probe = asyncio.ensure_future(caller.call(hanging))
+        await started.wait()
+        with pytest.raises(CircuitOpenError):
+            await caller.call(answering)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        
+        assert await caller.call(answering) == "ok"
+        assert caller.breaker.state == "closed"
+
+class TestDegradedParsing:
+    """Test cases for falling back to the rule-based parser"""
+    
+    @pytest.mark.asyncio
+    async def test_rules_answer_when_llm_unavailable(self, monkeypatch):
+        """Test that a low-confidence rule parse is used with a warning when the LLM fails"""
+        monkeypatch.setattr(nlq_parser, "parser_mode", "llm")
+        
+        async def unavailable(prompt, context, on_token=None):
+            raise LLMError("LLM unavailable: llm circuit breaker is open")
+        
+        async def cache_miss(key):
+            return None
+        
+        monkeypatch.setattr(nlq_parser.llm_client, "generate_sql_async", unavailable)
+        monkeypatch.setattr(nlq_parser.parse_cache, "get_async", cache_miss)
+        
+        generated = await nlq_parser._generate_sql_async("revenue by region for our flagship accounts", None)
+        
+        assert generated["parser"] == "rules"
+        assert "LLM unavailable; answered by the rule-based parser" in generated["warnings"]
+    
+    @pytest.mark.asyncio
+    async def test_llm_error_raised_without_rule_parse(self, monkeypatch):
+        """Test that the LLM error surfaces when the rules cannot help either"""
+        monkeypatch.setattr(nlq_parser, "parser_mode", "llm")
+        
+        async def unavailable(prompt, context, on_token=None):
+            raise LLMError("LLM unavailable: llm circuit breaker is open")
+        
+        async def cache_miss(key):
+            return None
+        
+        monkeypatch.setattr(nlq_parser.llm_client, "generate_sql_async", unavailable)
+        monkeypatch.setattr(nlq_parser.parse_cache, "get_async", cache_miss)
+        
+        with pytest.raises(LLMError):
+            await nlq_parser._generate_sql_async("what is the meaning of life", None)
@@ -0,0 +1,77 @@
+"""
+Test cases for table, series and Arrow result formats
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.services import query_executor as query_executor_module
+from app.services.query_executor import QueryExecutor
+from app.core.exceptions import QueryExecutionError
+
+@pytest.fixture
+def executor(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (region TEXT, revenue REAL)"))
+        connection.execute(
+            text("INSERT INTO orders VALUES (:region, :revenue)"),
+            [{"region": f"region-{i}", "revenue": i * 10.0} for i in range(25)]
+        )
+    monkeypatch.setattr(query_executor_module, "SessionLocal", sessionmaker(bind=engine))
+    
+    executor = QueryExecutor()
+    monkeypatch.setattr(executor, "_get_from_cache", lambda cache_key: None)
+    monkeypatch.setattr(executor, "_cache_result", lambda cache_key, result: None)
+    return executor
+
+SQL = "SELECT region, revenue FROM orders ORDER BY revenue"
+
+class TestResultFormats:
+    """Test cases for execute_query result shapes"""
+    
+    def test_series_is_column_major(self, executor):
+        """Test that series holds one value list per column, aligned with columns"""
+        result = executor.execute_query(SQL, result_format="series")
+        
+        assert result["columns"] == ["region", "revenue"]
+        assert "rows" not in result
+        assert result["row_count"] == 25
+        assert result["series"][1][:3] == [0.0, 10.0, 20.0]
+        assert result["series"][0][-1] == "region-24"
+    
+    def test_series_matches_table(self, executor):
+        """Test that both shapes carry the same data and column profile"""
+        table = executor.execute_query(SQL)
+        series = executor.execute_query(SQL, result_format="series")
+        
+        assert [list(row) for row in zip(*series["series"])] == table["rows"]
+        assert series["profile"] == table["profile"]
+    
+    def test_formats_cached_separately(self, executor):
+        """Test that table and series results never share a cache entry"""
+        assert executor._get_cache_key(SQL) != executor._get_cache_key(SQL, "series")
+        assert executor._get_cache_key(SQL) == executor._get_cache_key(SQL, "table")
+    
+    def test_unknown_format_rejected(self, executor):
+        """Test that unsupported formats fail before touching the database"""
+        with pytest.raises(QueryExecutionError, match="Unsupported result_format"):
+            executor.execute_query(SQL, result_format="csv")
+    
+    def test_sample_rows_from_series(self, executor):
+        """Test that chart inference sees leading rows in row-major order"""
+        sample = executor.sample_rows({"series": [["a", "b"], [1, 2]]})
+        
+        assert sample == [["a", 1], ["b", 2]]
+    
+    def test_arrow_ipc_stream(self, executor):
+        """Test that the Arrow stream round-trips with typed columns"""
+        pa = pytest.importorskip("pyarrow")
+        
+        result = executor.execute_query(SQL, result_format="arrow")
+        table = pa.ipc.open_stream(result["arrow"]).read_all()
+        
+        assert table.column_names == ["region", "revenue"]
+        assert table.num_rows == result["row_count"] == 25
+        assert pa.types.is_floating(table.schema.field("revenue").type)
@@ -0,0 +1,166 @@
+"""
+Test cases for aggregate rollup rewriting and freshness
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.services import query_executor as query_executor_module
+from app.services.query_executor import QueryExecutor
+from app.services.rollups import RollupManager
+from app.services.table_versions import TableVersions
+
+class FakeRedis:
+    """Just enough of the Redis client for version counters and the refresh lock"""
+    
+    def __init__(self):
+        self.values = {}
+    
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+    
+    def pipeline(self):
+        return self
+    
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+    
+    def execute(self):
+        pass
+    
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+@pytest.fixture
+def rollups():
+    versions = TableVersions()
+    versions.redis_client = FakeRedis()
+    manager = RollupManager()
+    manager.enabled = True
+    manager.table_versions = versions
+    manager.redis_client = versions.redis_client
+    return manager
+
+@pytest.fixture
+def executor(monkeypatch, rollups):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (order_id INTEGER, quantity INTEGER, unit_price REAL, region TEXT)"))
+        connection.execute(text("CREATE TABLE rollup_orders_region_month (region TEXT, month_start TEXT, revenue REAL, quantity INTEGER, order_count INTEGER)"))
+        connection.execute(text("INSERT INTO orders VALUES (1, 2, 10.0, 'Europe'), (2, 1, 5.0, 'Europe'), (3, 4, 2.5, 'Asia Pacific')"))
+        connection.execute(text(
+            "INSERT INTO rollup_orders_region_month VALUES "
+            "('Europe', '2024-01-01', 20.0, 2, 1), ('Europe', '2024-02-01', 5.0, 1, 1), ('Asia Pacific', '2024-01-01', 10.0, 4, 1)"
+        ))
+    monkeypatch.setattr(query_executor_module, "SessionLocal", sessionmaker(bind=engine))
+    
+    executor = QueryExecutor()
+    executor.rollups = rollups
+    executor.table_versions = rollups.table_versions
+    monkeypatch.setattr(executor, "_get_from_cache", lambda cache_key: None)
+    monkeypatch.setattr(executor, "_cache_result", lambda cache_key, result, ttl=None: None)
+    executor.engine = engine
+    return executor
+
+class TestRollupRewrite:
+    """Test cases for rewriting queries onto rollups"""
+    
+    def test_region_revenue_uses_region_rollup(self, rollups):
+        """Test that a single-dimension aggregate goes to the narrowest rollup"""
+        sql = "SELECT o.region, SUM(o.quantity * o.unit_price) AS revenue FROM orders o GROUP BY o.region ORDER BY revenue DESC LIMIT 1000"
+        
+        rewritten, rollup = rollups.rewrite(sql)
+        
+        assert rollup.name == "rollup_orders_region_month"
+        assert rewritten == (
+            "SELECT r.region, SUM(r.revenue) AS revenue FROM rollup_orders_region_month r "
+            "GROUP BY r.region ORDER BY revenue DESC LIMIT 1000"
+        )
+    
+    def test_time_buckets_and_month_bounds(self, rollups):
+        """Test that quarters and month-aligned date ranges map onto month_start"""
+        sql = (
+            "SELECT DATE_TRUNC('quarter', o.order_date) AS quarter, p.product_line, SUM(o.quantity) AS units "
+            "FROM orders o JOIN products p ON o.product_id = p.product_id "
+            "WHERE o.order_date >= '2024-01-01' AND o.order_date < '2025-01-01' GROUP BY quarter, p.product_line"
+        )
+        
+        rewritten, rollup = rollups.rewrite(sql)
+        
+        assert rollup.name == "rollup_orders_product_month"
+        assert "DATE_TRUNC('quarter', r.month_start) AS quarter" in rewritten
+        assert "SUM(r.quantity)::bigint AS units" in rewritten
+        assert "WHERE r.month_start >= '2024-01-01' AND r.month_start < '2025-01-01'" in rewritten
+    
+    def test_unaliased_measures_keep_their_column_names(self, rollups):
+        """Test that COUNT(*) and AVG(...) still come back as count and avg"""
+        sql = (
+            "SELECT c.segment, COUNT(*), AVG(o.quantity * o.unit_price) FROM orders o "
+            "JOIN customers c ON o.customer_id = c.customer_id WHERE c.country = 'Cote d''Ivoire' GROUP BY c.segment"
+        )
+        
+        rewritten, rollup = rollups.rewrite(sql)
+        
+        assert rollup.name == "rollup_orders_customer_month"
+        assert "COALESCE(SUM(r.order_count), 0)::bigint AS count" in rewritten
+        assert "(SUM(r.revenue) / NULLIF(SUM(r.order_count), 0)) AS avg" in rewritten
+        assert "r.country = 'Cote d''Ivoire'" in rewritten
+    
+    @pytest.mark.parametrize("sql", [
+        "SELECT o.region FROM orders o",
+        "SELECT o.region, COUNT(DISTINCT o.customer_id) FROM orders o GROUP BY o.region",
+        "SELECT c.name, SUM(o.quantity) FROM orders o JOIN customers c ON o.customer_id = c.customer_id GROUP BY c.name",
+        "SELECT COUNT(*) FROM orders o WHERE o.order_date >= '2024-01-15'",
+        "SELECT DATE_TRUNC('week', o.order_date) AS week, COUNT(*) FROM orders o GROUP BY week",
+        "SELECT c.segment, COUNT(*) FROM orders o JOIN customers c ON o.product_id = c.customer_id GROUP BY c.segment",
+        "SELECT o.region, COUNT(*) FROM orders o WHERE o.customer_id IN (SELECT customer_id FROM customers) GROUP BY o.region"
+    ])
+    def test_unanswerable_queries_are_left_alone(self, rollups, sql):
+        """Test that per-order rows, unsupported measures, finer grains and bad joins are not rewritten"""
+        assert rollups.rewrite(sql) is None
+    
+    def test_literals_are_not_rewritten(self, rollups):
+        """Test that column names inside string literals are left untouched"""
+        sql = "SELECT o.region, COUNT(*) AS orders FROM orders o WHERE o.region = 'o.quantity' GROUP BY o.region"
+        
+        rewritten, _ = rollups.rewrite(sql)
+        
+        assert "r.region = 'o.quantity'" in rewritten
+
+class TestRollupRouting:
+    """Test cases for freshness checks and execution"""
+    
+    def test_stale_rollup_is_not_used(self, rollups):
+        """Test that a rollup refreshed at older versions leaves the query on the base tables"""
+        sql = "SELECT o.region, SUM(o.quantity * o.unit_price) AS revenue FROM orders o GROUP BY o.region"
+        rollups.refreshed_versions["rollup_orders_region_month"] = rollups.table_versions.fingerprint(["orders"])
+        
+        assert rollups.route(sql)[1] == "rollup_orders_region_month"
+        
+        rollups.table_versions.bump(["orders"])
+        
+        assert rollups.route(sql) == (sql, None)
+    
+    def test_rollup_answers_like_base_tables(self, executor, rollups):
+        """Test that a fresh rollup returns the base-table result and names itself"""
+        sql = "SELECT o.region, SUM(o.quantity * o.unit_price) AS revenue FROM orders o GROUP BY o.region ORDER BY o.region"
+        expected = executor.execute_query(sql)
+        rollups.refreshed_versions["rollup_orders_region_month"] = rollups.table_versions.fingerprint(["orders"])
+        
+        result = executor.execute_query(sql)
+        
+        assert expected["rows"] == [["Asia Pacific", 10.0], ["Europe", 25.0]]
+        assert "rollup" not in expected
+        assert result["rows"] == expected["rows"]
+        assert result["columns"] == expected["columns"]
+        assert result["rollup"] == "rollup_orders_region_month"
+    
+    def test_refresh_skips_while_another_worker_holds_the_lock(self, rollups):
+        """Test that concurrent refreshes don't both rebuild the rollups"""
+        rollups.redis_client.set("rollup:refresh_lock", "1")
+        
+        assert rollups.refresh(engine=object()) is None
@@ -0,0 +1,59 @@
+"""
+Test cases for the rule-based fast-path parser
+"""
+
+from app.services.rule_parser import rule_based_parser
+from app.services.safety import safety_validator
+from app.services.nlq_parser import nlq_parser
+
+class TestRuleBasedParser:
+    """Test cases for deterministic intent recognition"""
+    
+    def test_metric_dimension_time_range(self):
+        """Test filter + group + aggregate for a quarter"""
+        result = rule_based_parser.parse("revenue by region in Q2 2024")
+        
+        assert result["confidence"] == 1.0
+        assert "SUM(o.quantity * o.unit_price) AS revenue" in result["sql"]
+        assert "o.order_date >= '2024-04-01' AND o.order_date < '2024-07-01'" in result["sql"]
+        assert "GROUP BY o.region" in result["sql"]
+    
+    def test_top_n(self):
+        """Test top-N ranking with a joined dimension"""
+        result = rule_based_parser.parse("top 5 customers by revenue")
+        
+        assert "JOIN customers c ON o.customer_id = c.customer_id" in result["sql"]
+        assert result["sql"].endswith("ORDER BY revenue DESC LIMIT 5")
+    
+    def test_followup_adds_dimension(self):
+        """Test that a refined prompt adds GROUP BY product_line"""
+        result = rule_based_parser.parse("revenue by region in Q2 2024. break it down by product line")
+        
+        assert "GROUP BY o.region, p.product_line" in result["sql"]
+        assert result["explain"]["groupBy"] == ["region", "product_line"]
+    
+    def test_generated_sql_passes_validation(self):
+        """Test that rule output passes the safety validator"""
+        for prompt in ["monthly revenue in 2024", "average order value by customer segment", "number of orders by country"]:
+            result = rule_based_parser.parse(prompt)
+            assert isinstance(safety_validator.validate_query(result["sql"]), list)
+    
+    def test_low_confidence_for_unrecognized_terms(self):
+        """Test that unsupported phrasing lowers confidence"""
+        result = rule_based_parser.parse("revenue for enterprise customers excluding EMEA")
+        
+        assert result["confidence"] < 0.8
+        assert rule_based_parser.parse("why did churn go up") is None
+    
+    def test_auto_mode_reports_rules_path(self, monkeypatch):
+        """Test that auto mode serves simple prompts without the LLM"""
+        def fail_generate_sql(prompt, context=None):
+            raise AssertionError("LLM should not be called")
+        
+        monkeypatch.setattr(nlq_parser.llm_client, "generate_sql", fail_generate_sql)
+        monkeypatch.setattr(nlq_parser, "parser_mode", "auto")
+        
+        result = nlq_parser.parse_only("revenue by region")
+        
+        assert result["parser"] == "rules"
+        assert result["parse_cache"] is None
@@ -0,0 +1,230 @@
+"""
+Test cases for stale-while-revalidate query caching
+"""
+
+import json
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.core.exceptions import QueryExecutionError
+from app.services import query_executor as query_executor_module
+from app.services.local_cache import LocalResultCache
+from app.services.query_executor import QueryExecutor
+from app.services.stale_cache import StaleWhileRevalidate
+from app.services.table_versions import TableVersions
+
+SQL = "SELECT region FROM orders"
+
+class FakeRedis:
+    """Just enough of the Redis client for cache entries, refresh locks and version counters"""
+    
+    def __init__(self):
+        self.values = {}
+    
+    def get(self, key):
+        value = self.values.get(key)
+        return value.encode() if isinstance(value, str) else value
+    
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+    
+    def setex(self, key, ttl, value):
+        self.values[key] = value
+    
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+    
+    def delete(self, key):
+        self.values.pop(key, None)
+    
+    def pipeline(self):
+        return self
+    
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+    
+    def execute(self):
+        pass
+
+class AsyncFakeRedis:
+    """Async view of a FakeRedis"""
+    
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+    
+    async def get(self, key):
+        return self.redis_client.get(key)
+    
+    async def mget(self, keys):
+        return self.redis_client.mget(keys)
+    
+    async def setex(self, key, ttl, value):
+        self.redis_client.setex(key, ttl, value)
+    
+    async def set(self, key, value, nx=False, px=None):
+        return self.redis_client.set(key, value, nx=nx, px=px)
+    
+    async def delete(self, key):
+        self.redis_client.delete(key)
+
+@pytest.fixture
+def executor(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (region TEXT)"))
+        connection.execute(text("INSERT INTO orders VALUES ('Europe')"))
+    monkeypatch.setattr(query_executor_module, "SessionLocal", sessionmaker(bind=engine))
+    
+    redis_client = FakeRedis()
+    versions = TableVersions()
+    versions.redis_client = redis_client
+    versions.async_redis_client = AsyncFakeRedis(redis_client)
+    stale = StaleWhileRevalidate()
+    stale.redis_client = redis_client
+    stale.async_redis_client = AsyncFakeRedis(redis_client)
+    stale.beta = 0.0
+    
+    executor = QueryExecutor()
+    executor.redis_client = redis_client
+    executor.async_redis_client = AsyncFakeRedis(redis_client)
+    executor.table_versions = versions
+    executor.stale_cache = stale
+    executor.local_cache = LocalResultCache()
+    executor.local_cache.enabled = False  # Entries are aged in Redis below
+    executor.engine = engine
+    monkeypatch.setattr(executor.rollups, "enabled", False)
+    monkeypatch.setattr(executor.replicas, "replicas", [])
+    monkeypatch.setattr(executor.singleflight, "across_workers", False)
+    return executor
+
+def add_order(executor, region):
+    """Write a row and bump the orders version, as the NOTIFY listener would"""
+    with executor.engine.begin() as connection:
+        connection.execute(text("INSERT INTO orders VALUES (:region)"), {"region": region})
+    executor.table_versions.bump(["orders"])
+
+def age_entries(executor, seconds):
+    """Make every cached entry look older"""
+    for key, value in executor.redis_client.values.items():
+        if isinstance(value, str) and '"stored_at"' in value:
+            entry = json.loads(value)
+            entry["stored_at"] -= seconds
+            executor.redis_client.values[key] = json.dumps(entry)
+
+class TestSoftExpiry:
+    """Test cases for serving stale entries while one request refreshes them"""
+    
+    def test_soft_expired_entry_is_served_and_refreshed_in_background(self, executor):
+        """Test that an entry past the soft TTL is returned at once and recomputed by one refresh"""
+        executor.execute_query(SQL)
+        with executor.engine.begin() as connection:
+            connection.execute(text("UPDATE orders SET region = 'Asia Pacific'"))  # A write the versions did not see
+        age_entries(executor, executor.stale_cache.soft_ttl + 1)
+        
+        stale = executor.execute_query(SQL)
+        executor.stale_cache._pool.shutdown(wait=True)
+        refreshed = executor.execute_query(SQL)
+        
+        assert stale["rows"] == [["Europe"]]
+        assert refreshed["rows"] == [["Asia Pacific"]]
+        assert executor.stale_cache.counters["background_refreshes"] == 1
+        assert not any(key.startswith("refresh:") for key in executor.redis_client.values)
+    
+    def test_only_the_lock_holder_refreshes(self, executor):
+        """Test that a stale hit whose refresh lock is taken does not recompute"""
+        executor.execute_query(SQL)
+        age_entries(executor, executor.stale_cache.soft_ttl + 1)
+        cache_key = executor._get_cache_key(SQL, versions=executor.table_versions.fingerprint(["orders"]))
+        executor.redis_client.set(f"refresh:{cache_key}", "1")
+        
+        executor.execute_query(SQL)
+        executor.stale_cache._pool.shutdown(wait=True)
+        
+        assert executor.stale_cache.counters["stale_hits"] == 1
+        assert executor.stale_cache.counters["background_refreshes"] == 0
+    
+    def test_expensive_entries_refresh_early(self):
+        """Test that XFetch refreshes costly entries before the soft TTL and cheap ones at it"""
+        stale = StaleWhileRevalidate()
+        stale.soft_ttl = 600
+        
+        assert stale.due(590, compute_seconds=3600)
+        assert not stale.due(590, compute_seconds=0)
+        assert stale.due(600, compute_seconds=0)
+        assert stale.counters["early_refreshes"] == 1
+
+class TestStaleAfterWrite:
+    """Test cases for the pre-write result standing in for a new version"""
+    
+    def test_pre_write_result_served_while_another_request_recomputes(self, executor):
+        """Test that requests that lose the recompute get the previous version's result with a warning"""
+        executor.execute_query(SQL)
+        add_order(executor, "Asia Pacific")
+        cache_key = executor._get_cache_key(SQL, versions=executor.table_versions.fingerprint(["orders"]))
+        executor.redis_client.set(f"refresh:{cache_key}", "1")
+        
+        stale = executor.execute_query(SQL)
+        executor.redis_client.delete(f"refresh:{cache_key}")
+        fresh = executor.execute_query(SQL)
+        
+        assert stale["rows"] == [["Europe"]]
+        assert "may not include the latest writes" in stale["warnings"][0]
+        assert sorted(fresh["rows"]) == [["Asia Pacific"], ["Europe"]]
+        assert "warnings" not in fresh
+    
+    def test_pre_write_result_served_when_database_is_down(self, executor, monkeypatch):
+        """Test that a connection failure falls back to the previous result instead of an error"""
+        executor.execute_query(SQL)
+        add_order(executor, "Asia Pacific")
+        
+        def unavailable(*args):
+            raise OperationalError(SQL, {}, ConnectionRefusedError("connection refused"))
+        monkeypatch.setattr(executor, "_run_query", unavailable)
+        
+        result = executor.execute_query(SQL)
+        
+        assert result["rows"] == [["Europe"]]
+        assert "unavailable" in result["warnings"][0]
+        assert executor.stale_cache.counters["stale_on_error"] == 1
+    
+    def test_query_errors_are_not_masked(self, executor, monkeypatch):
+        """Test that errors in the query itself still fail even with a previous result cached"""
+        executor.execute_query(SQL)
+        add_order(executor, "Asia Pacific")
+        
+        def broken(*args):
+            raise ProgrammingError(SQL, {}, Exception("column does not exist"))
+        monkeypatch.setattr(executor, "_run_query", broken)
+        
+        with pytest.raises(QueryExecutionError):
+            executor.execute_query(SQL)
+    
+    @pytest.mark.asyncio
+    async def test_async_soft_expired_entry_refreshes_on_the_loop(self, executor, monkeypatch):
+        """Test that the async path serves the stale entry and refreshes it in a task"""
+        engine = create_async_engine("sqlite+aiosqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        async with engine.begin() as connection:
+            await connection.execute(text("CREATE TABLE orders (region TEXT)"))
+            await connection.execute(text("INSERT INTO orders VALUES ('Europe')"))
+        monkeypatch.setattr(query_executor_module, "AsyncSessionLocal", async_sessionmaker(engine))
+        
+        await executor.execute_query_async(SQL)
+        async with engine.begin() as connection:
+            await connection.execute(text("UPDATE orders SET region = 'Asia Pacific'"))
+        age_entries(executor, executor.stale_cache.soft_ttl + 1)
+        
+        stale = await executor.execute_query_async(SQL)
+        for task in list(executor.stale_cache._tasks):
+            await task
+        refreshed = await executor.execute_query_async(SQL)
+        await engine.dispose()
+        
+        assert stale["rows"] == [["Europe"]]
+        assert refreshed["rows"] == [["Asia Pacific"]]
+        assert executor.stale_cache.counters["background_refreshes"] == 1
@@ -0,0 +1,117 @@
+"""
+Test cases for table-version based query cache invalidation
+"""
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.services import query_executor as query_executor_module
+from app.services.query_executor import QueryExecutor
+from app.services.table_versions import TableVersions
+from app.services.explain_builder import explain_builder
+
+class FakeRedis:
+    """Just enough of the Redis client for version counters"""
+    
+    def __init__(self):
+        self.values = {}
+    
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+    
+    def pipeline(self):
+        return self
+    
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+    
+    def set(self, key, value):
+        self.values[key] = value
+    
+    def execute(self):
+        pass
+
+@pytest.fixture
+def versions():
+    versions = TableVersions()
+    versions.redis_client = FakeRedis()
+    return versions
+
+@pytest.fixture
+def executor(monkeypatch, versions):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE orders (region TEXT)"))
+        connection.execute(text("CREATE TABLE products (category TEXT)"))
+        connection.execute(text("INSERT INTO orders VALUES ('Europe')"))
+    monkeypatch.setattr(query_executor_module, "SessionLocal", sessionmaker(bind=engine))
+    
+    executor = QueryExecutor()
+    executor.table_versions = versions
+    executor.cache = {}
+    monkeypatch.setattr(executor, "_get_from_cache", lambda cache_key: executor.cache.get(cache_key))
+    monkeypatch.setattr(executor, "_cache_result", lambda cache_key, result, ttl=None: executor.cache.__setitem__(cache_key, result))
+    executor.engine = engine
+    return executor
+
+class TestSourceTables:
+    """Test cases for source table extraction"""
+    
+    def test_joins_subqueries_and_comma_joins(self):
+        """Test that every table read by the query is found"""
+        sql = (
+            "SELECT c.name FROM customers c, products p "
+            "WHERE c.customer_id IN (SELECT customer_id FROM orders)"
+        )
+        
+        assert explain_builder.extract_source_tables(sql) == ["customers", "orders", "products"]
+    
+    def test_ignores_extract_and_unknown_names(self):
+        """Test that EXTRACT(... FROM column) and CTE names are not tables"""
+        sql = "WITH t AS (SELECT * FROM orders) SELECT EXTRACT(YEAR FROM order_date) FROM t"
+        
+        assert explain_builder.extract_source_tables(sql) == ["orders"]
+
+class TestTableVersions:
+    """Test cases for version fingerprints"""
+    
+    def test_bump_changes_only_that_tables_version(self, versions):
+        """Test that a bump is visible in fingerprints that include the table"""
+        before = versions.fingerprint(["orders", "customers"])
+        versions.bump(["orders"])
+        
+        assert before == "customers=0,orders=0"
+        assert versions.fingerprint(["customers", "orders"]) == "customers=0,orders=1"
+        assert versions.fingerprint(["products"]) == "products=0"
+    
+    def test_unavailable_redis_disables_caching(self, versions):
+        """Test that a failed lookup returns None rather than a stale-prone fingerprint"""
+        versions.redis_client = None
+        
+        assert versions.fingerprint(["orders"]) is None
+        assert versions.fingerprint([]) == ""
+
+class TestCacheInvalidation:
+    """Test cases for version-keyed result caching"""
+    
+    def test_write_invalidates_only_dependent_results(self, executor, versions):
+        """Test that bumping a table re-runs queries that read it and keeps others cached"""
+        orders_sql = "SELECT region FROM orders"
+        products_sql = "SELECT category FROM products"
+        
+        assert executor.execute_query(orders_sql)["rows"] == [["Europe"]]
+        executor.execute_query(products_sql)
+        
+        with executor.engine.begin() as connection:
+            connection.execute(text("INSERT INTO orders VALUES ('Asia Pacific')"))
+            connection.execute(text("INSERT INTO products VALUES ('Servers')"))
+        versions.bump(["orders"])
+        
+        assert executor.execute_query(orders_sql)["rows"] == [["Europe"], ["Asia Pacific"]]
+        assert executor.execute_query(products_sql)["rows"] == []  # Still served from cache
+    
+    def test_untagged_queries_use_short_ttl(self, executor):
+        """Test that queries with no recognised table fall back to the legacy TTL"""
+        assert executor._cache_ttl_for("") == executor.untagged_cache_ttl
+        assert executor._cache_ttl_for("orders=1") == executor.cache_ttl
@@ -0,0 +1,135 @@
+"""
+Test cases for the schema and value grounding index
+"""
+
+import threading
+import pytest
+from app.services.vector_index import VectorIndex
+from app.core.exceptions import LLMError
+from app.services.nlq_parser import nlq_parser
+from app.services.rule_parser import rule_based_parser
+
+SAMPLE_VALUES = {
+    ("orders", "region"): ["North America", "Europe", "Asia Pacific", "Latin America", "Middle East"],
+    ("customers", "segment"): ["Enterprise", "SMB"],
+    ("customers", "country"): ["USA", "Canada", "UK", "Germany"],
+    ("products", "product_line"): ["Software", "Hardware"],
+    ("products", "category"): ["Enterprise Software", "Servers", "Storage", "Networking"]
+}
+
+@pytest.fixture
+def index(tmp_path):
+    index = VectorIndex(path=str(tmp_path / "schema"))
+    index.build(SAMPLE_VALUES)
+    return index
+
+class TestVectorIndex:
+    """Test cases for hashed n-gram grounding"""
+    
+    def test_alias_grounds_to_multiple_values(self, index):
+        """Test that business shorthand maps to the stored literals"""
+        matches = index.ground_values("revenue in EMEA by month")
+        
+        assert len(matches) == 1
+        assert matches[0]["phrase"] == "emea"
+        assert (matches[0]["table"], matches[0]["column"]) == ("orders", "region")
+        assert matches[0]["values"] == ["Europe", "Middle East"]
+    
+    def test_longest_match_wins(self, index):
+        """Test that a multi-word value beats its single-word overlap"""
+        matches = index.ground_values("enterprise software units")
+        
+        assert [(match["column"], match["values"]) for match in matches] == [("category", ["Enterprise Software"])]
+    
+    def test_unrelated_prompt_has_no_matches(self, index):
+        """Test that dimension words and noise are not grounded"""
+        assert index.ground_values("revenue by region in q2 2024") == []
+        assert index.ground_values("weather tomorrow") == []
+    
+    def test_search_finds_columns_by_description(self, index):
+        """Test column lookup from description text"""
+        results = index.search("geographic region", k=1, kind="column")
+        
+        assert (results[0]["table"], results[0]["column"]) == ("orders", "region")
+    
+    def test_persisted_index_is_reused_incrementally(self, index, tmp_path):
+        """Test that a reload memory-maps the file and only new values are vectorized"""
+        reloaded = VectorIndex(path=str(tmp_path / "schema"))
+        reloaded.ensure_loaded()
+        assert len(reloaded.docs) == len(index.docs)
+        
+        values = {**SAMPLE_VALUES, ("customers", "country"): SAMPLE_VALUES[("customers", "country")] + ["Japan"]}
+        build = reloaded.build(values)
+        
+        assert build["vectorized"] == 1
+        assert build["reused"] == len(index.docs)
+        assert reloaded.ground_values("orders from japan")[0]["values"] == ["Japan"]
+    
+    def test_first_use_builds_in_the_background(self, tmp_path, monkeypatch):
+        """Test that a missing index is built off the caller's thread while prompts go ungrounded"""
+        index = VectorIndex(path=str(tmp_path / "fresh"))
+        release = threading.Event()
+        
+        def slow_values():
+            release.wait(5)
+            return SAMPLE_VALUES
+        
+        monkeypatch.setattr(index, "_load_distinct_values", slow_values)
+        
+        assert index.ground_values("revenue in EMEA") == []
+        assert index.matrix is None
+        
+        builder = index._builder
+        release.set()
+        builder.join(5)
+        assert index.ground_values("revenue in EMEA")[0]["values"] == ["Europe", "Middle East"]
+
+class TestRuleParserGrounding:
+    """Test cases for value filters in the fast-path parser"""
+    
+    def test_value_filter_adds_where_and_join(self, index, monkeypatch):
+        """Test that grounded literals become WHERE predicates"""
+        monkeypatch.setattr(rule_based_parser, "vector_index", index)
+        
+        result = rule_based_parser.parse("servers revenue in EMEA by month")
+        
+        assert result["confidence"] == 1.0
+        assert "JOIN products p ON o.product_id = p.product_id" in result["sql"]
+        assert "p.category = 'Servers'" in result["sql"]
+        assert "o.region IN ('Europe', 'Middle East')" in result["sql"]
+        assert "region in (Europe, Middle East)" in result["explain"]["filters"]
+    
+    def test_negated_values_become_exclusions(self, index, monkeypatch):
+        """Test that "outside", "excluding", "except" and "not in" exclude the grounded literals"""
+        monkeypatch.setattr(rule_based_parser, "vector_index", index)
+        
+        outside = rule_based_parser.parse("revenue by region for customers outside the USA")
+        excluding = rule_based_parser.parse("revenue by region excluding USA")
+        excepted = rule_based_parser.parse("revenue by category except EMEA")
+        not_in = rule_based_parser.parse("revenue by category not in europe")
+        
+        assert "c.country <> 'USA'" in outside["sql"]
+        assert "c.country = 'USA'" not in outside["sql"]
+        assert "c.country <> 'USA'" in excluding["sql"]
+        assert "JOIN customers c ON o.customer_id = c.customer_id" in excluding["sql"]
+        assert "o.region NOT IN ('Europe', 'Middle East')" in excepted["sql"]
+        assert "region not in (Europe, Middle East)" in excepted["explain"]["filters"]
+        assert "o.region <> 'Europe'" in not_in["sql"]
+        assert excluding["confidence"] == 1.0
+    
+    def test_exclusion_carries_through_a_list(self, index, monkeypatch):
+        """Test that values listed after a cue are all excluded and later positive values are not"""
+        monkeypatch.setattr(rule_based_parser, "vector_index", index)
+        
+        result = rule_based_parser.parse("servers revenue by month excluding USA and Canada")
+        
+        assert "c.country <> 'USA' AND c.country <> 'Canada'" in result["sql"]
+        assert "p.category = 'Servers'" in result["sql"]
+    
+    def test_degraded_parse_keeps_the_exclusion(self, index, monkeypatch):
+        """Test that the LLM-unavailable fallback serves the negated predicate"""
+        monkeypatch.setattr(rule_based_parser, "vector_index", index)
+        
+        result = nlq_parser._degraded_to_rules("revenue by region excluding USA", LLMError("LLM unavailable"))
+        
+        assert "c.country <> 'USA'" in result["sql"]
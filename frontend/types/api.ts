@@ -9,30 +9,77 @@ export interface NLQParseResponse {
   warnings: string[]
   explain: ExplainObject
   conversation_id: string
+  parse_cache?: 'hit' | 'miss' | null
+  parser?: 'rules' | 'llm'
 }
 
 export interface NLQExecuteRequest {
   sql: string
-  result_format?: string
+  result_format?: 'table' | 'series' | 'arrow'
+  // Keyset pagination: set either to get one page; pass next_cursor back for the following page
+  page_size?: number
+  cursor?: string
+  // 'full' skips time bucketing and downsampling of long time series
+  resolution?: 'auto' | 'full'
 }
 
 export interface NLQExecuteResponse {
   columns: string[]
-  rows: any[][]
+  rows?: any[][]
+  // One value array per column (result_format: 'series'), aligned with columns
+  series?: any[][]
+  row_count?: number
   inferred_chart?: string
+  profile?: ColumnProfile[] | null
+  warnings?: string[]
+  next_cursor?: string | null
+  reduction?: ChartReduction | null
 }
 
 export interface NLQQueryRequest {
   prompt: string
   conversation_id?: string
+  page_size?: number
+  cursor?: string
+  resolution?: 'auto' | 'full'
 }
 
 export interface NLQQueryResponse {
   columns: string[]
   rows: any[][]
   inferred_chart?: string
+  profile?: ColumnProfile[] | null
   explain: ExplainObject
   sql: string
+  warnings?: string[]
+  parse_cache?: 'hit' | 'miss' | null
+  parser?: 'rules' | 'llm'
+  conversation_id?: string
+  speculative?: boolean
+  next_cursor?: string | null
+  reduction?: ChartReduction | null
+}
+
+// How a time-series result was reduced for charting
+export interface ChartReduction {
+  time_bucket: 'week' | 'month' | 'quarter' | 'year' | null
+  downsampled: {
+    method: 'lttb'
+    source_rows: number
+    rows: number
+  } | null
+}
+
+// Per-column statistics of the executed result (before any downsampling)
+export interface ColumnProfile {
+  name: string
+  kind: 'numeric' | 'date' | 'categorical'
+  count: number
+  nulls: number
+  cardinality: number
+  min: any
+  max: any
+  monotonic: 'increasing' | 'decreasing' | null
 }
 
 export interface ExplainObject {
@@ -40,6 +87,8 @@ export interface ExplainObject {
   groupBy: string[]
   aggregates: string[]
   sourceTables: string[]
+  // Rollup table that answered the query instead of the base tables
+  rollup?: string
 }
 
 export interface SchemaTable {
@@ -64,8 +113,15 @@ export interface ConversationRefineResponse {
   columns: string[]
   rows: any[][]
   inferred_chart?: string
+  profile?: ColumnProfile[] | null
   explain: ExplainObject
   sql: string
+  warnings?: string[]
+  parse_cache?: 'hit' | 'miss' | null
+  parser?: 'rules' | 'llm'
+  conversation_id?: string
+  speculative?: boolean
+  reduction?: ChartReduction | null
 }
 
 // Auth Types